@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Benchmark of the compression of the user sandbox (see CRABClient.JobType.ParallelGzip).
+
+Makes a synthetic CMSSW-like tree of --size MB (libraries mixing random bytes and
+repeated symbol names, python and data files) and reports the time and the size of:
+  - the tarball written by tarfile.open(mode='w:gz'), as UserTarball does by default,
+  - the tarball written through a ParallelGzipFile, for each number of --threads.
+Each tarball is read back and its content compared with the first one.
+
+Usage (from the repository root):
+    PYTHONPATH=src/python python scripts/benchmark_sandbox_compression.py [--size 1024] [--threads 1,4,16]
+"""
+from __future__ import print_function
+from __future__ import division
+
+import os
+import time
+import shutil
+import hashlib
+import tarfile
+import tempfile
+import multiprocessing
+from optparse import OptionParser
+
+from CRABClient.JobType.ParallelGzip import ParallelGzipFile
+
+
+def makeTree(directory, size):
+    """
+    Write about size bytes of files under directory/lib, directory/python and directory/src.
+    """
+    written, i = 0, 0
+    while written < size:
+        kind = ['lib', 'lib', 'python', 'src/Pkg%d/data' % (i % 10)][i % 4]
+        path = os.path.join(directory, kind)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        if kind == 'lib':
+            data = os.urandom(2 * 1024 * 1024) + ''.join('_ZN3edm8Producer%dsymbolEv\0' % j for j in range(100000))
+            name = 'libPkg%d.so' % i
+        elif kind == 'python':
+            data = ''.join("process.module%d = cms.EDProducer('Producer%d', tag = cms.InputTag('x%d'))\n" % (j, j, i) for j in range(20000))
+            name = 'cfg%d.py' % i
+        else:
+            data = ''.join('%f %f %f\n' % (j * 0.1, j * 0.2, i * 0.3) for j in range(50000))
+            name = 'table%d.txt' % i
+        data = data[:size - written]
+        with open(os.path.join(path, name), 'wb') as fd:
+            fd.write(data)
+        written += len(data)
+        i += 1
+
+
+def contentDigest(filename):
+    hasher = hashlib.sha1()
+    tar = tarfile.open(filename, 'r:gz')
+    for member in tar:
+        hasher.update(member.name)
+        if member.isfile():
+            hasher.update(tar.extractfile(member).read())
+    tar.close()
+    return hasher.hexdigest()
+
+
+def measure(label, openTarball, source, filename, size):
+    start = time.time()
+    tar = openTarball(filename)
+    for directory in sorted(os.listdir(source)):
+        tar.add(os.path.join(source, directory), directory, recursive = True)
+    tar.close()
+    elapsed = time.time() - start
+    print("%-28s %8.2f s %8.1f MB/s %8.1f MB" % (label, elapsed, size / elapsed / 1024 / 1024, os.path.getsize(filename) / 1024 / 1024))
+    return elapsed
+
+
+def parallelTarball(nthreads):
+    def openTarball(filename):
+        tar = tarfile.TarFile(name = filename, mode = 'w', fileobj = ParallelGzipFile(filename, nthreads = nthreads), dereference = True)
+        tar._extfileobj = False
+        return tar
+    return openTarball
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--size', dest = 'size', type = 'int', default = 1024, help = 'The size of the tree, in MB')
+    parser.add_option('--threads', dest = 'threads', default = None,
+                      help = 'Comma separated numbers of threads (default: 1 and the number of CPUs)')
+    options, _ = parser.parse_args()
+    threads = sorted(set([1, multiprocessing.cpu_count()]))
+    if options.threads:
+        threads = [int(n) for n in options.threads.split(',')]
+
+    workdir = tempfile.mkdtemp()
+    try:
+        source = os.path.join(workdir, 'CMSSW')
+        size = options.size * 1024 * 1024
+        makeTree(source, size)
+        print("%d MB tree, %d CPUs" % (options.size, multiprocessing.cpu_count()))
+        filename = os.path.join(workdir, 'sandbox.tar.gz')
+        reference = measure("tarfile w:gz (current)", lambda name: tarfile.open(name, 'w:gz', dereference = True), source, filename, size)
+        digest = contentDigest(filename)
+        for nthreads in threads:
+            elapsed = measure("parallel, %d threads" % nthreads, parallelTarball(nthreads), source, filename, size)
+            print("  speedup %.2f" % (reference / elapsed))
+            if contentDigest(filename) != digest:
+                raise RuntimeError("The content of the parallel tarball differs")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
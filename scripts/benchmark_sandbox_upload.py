@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""
+Benchmark of the streamed upload of the user sandbox (see CRABClient.JobType.SandboxUpload).
+
+Makes a synthetic CMSSW-like tree of --size MB (as benchmark_sandbox_compression.py) and
+uploads it to a local server reading at most --bandwidth MB/s, and reports the time of:
+  - the current upload: write the tarball, compute its hash key, then send it,
+  - the streamed upload: the tarball is sent while it is made, the hash key computed from the same reads.
+The server checks that both uploads give the same content.
+
+Usage (from the repository root):
+    PYTHONPATH=src/python python scripts/benchmark_sandbox_upload.py [--size 256] [--bandwidth 10]
+"""
+from __future__ import print_function
+from __future__ import division
+
+import os
+import json
+import time
+import shutil
+import httplib
+import tarfile
+import tempfile
+import threading
+import BaseHTTPServer
+from urlparse import urlparse
+from optparse import OptionParser
+
+from benchmark_sandbox_compression import makeTree, contentDigest
+from CRABClient.JobType.TreeWalk import walkTree, addEntries
+from CRABClient.JobType.SandboxUpload import StreamPipe, ResultThread, SandboxChecksum, streamUpload, sandboxChecksum, sortedEntries
+
+
+class ThrottledHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Receive a PUT (chunked or not) at server.bandwidth bytes/s, and keep the tarball of the form.
+    """
+
+    def read(self, size):
+        data = self.rfile.read(size)
+        time.sleep(len(data) / self.server.bandwidth)
+        return data
+
+    def do_PUT(self):
+        body = []
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                body.append(self.read(size))
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers['Content-Length'])
+            while remaining:
+                body.append(self.read(min(remaining, 1024 * 1024)))
+                remaining -= len(body[-1])
+        body = ''.join(body)
+        boundary = self.headers['Content-Type'].split('boundary=')[1]
+        fields = {}
+        for part in body.split('--' + boundary)[1:-1]:
+            headers, value = part.split('\r\n\r\n', 1)
+            fields[headers.split('name="')[1].split('"')[0]] = value[:-len('\r\n')]
+        with open(self.server.received, 'wb') as fd:
+            fd.write(fields['inputfile'])
+        response = json.dumps({'result': [{'hashkey': fields['hashkey']}]})
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+def fileUpload(url, filename, hashkey):
+    """
+    Send a file as UserFileCache.upload does: a multipart form with a Content-Length.
+    """
+    parsedurl = urlparse(url)
+    boundary = 'benchmarkboundary'
+    head = ('--%s\r\nContent-Disposition: form-data; name="inputfile"; filename="sandbox.tar.gz"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n' % boundary)
+    tail = '\r\n--%s\r\nContent-Disposition: form-data; name="hashkey"\r\n\r\n%s\r\n--%s--\r\n' % (boundary, hashkey, boundary)
+    conn = httplib.HTTPConnection(parsedurl.netloc)
+    conn.putrequest('PUT', parsedurl.path + '/file')
+    conn.putheader('Content-Type', 'multipart/form-data; boundary=%s' % boundary)
+    conn.putheader('Content-Length', str(len(head) + os.path.getsize(filename) + len(tail)))
+    conn.endheaders()
+    conn.send(head)
+    with open(filename, 'rb') as fd:
+        for piece in iter(lambda: fd.read(1024 * 1024), ''):
+            conn.send(piece)
+    conn.send(tail)
+    response = conn.getresponse()
+    result = json.loads(response.read())['result'][0]
+    conn.close()
+    return result
+
+
+def sequential(url, trees, filename):
+    tar = tarfile.open(filename, 'w:gz')
+    for entries in trees:
+        addEntries(tar, entries)
+    tar.close()
+    return fileUpload(url, filename, sandboxChecksum(trees))
+
+
+def streamed(url, trees, filename):
+    pipe = StreamPipe(filename)
+    checksum = SandboxChecksum()
+    def produce():
+        try:
+            tar = tarfile.open(filename, 'w:gz', fileobj = pipe)
+            addEntries(tar, sortedEntries(trees), checksum)
+            tar.close()
+        finally:
+            pipe.close()
+    producer = ResultThread(produce)
+    return streamUpload(url, pipe, lambda: producer.result() or checksum.hexdigest())
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--size', dest = 'size', type = 'int', default = 256, help = 'The size of the tree, in MB')
+    parser.add_option('--bandwidth', dest = 'bandwidth', type = 'float', default = 10, help = 'The upload bandwidth, in MB/s')
+    options, _ = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), ThrottledHandler)
+    server.bandwidth = options.bandwidth * 1024 * 1024
+    serverThread = threading.Thread(target = server.serve_forever)
+    serverThread.daemon = True
+    serverThread.start()
+    url = 'http://127.0.0.1:%d/crabcache' % server.server_port
+    try:
+        source = os.path.join(workdir, 'CMSSW')
+        makeTree(source, options.size * 1024 * 1024)
+        trees = [walkTree(os.path.join(source, directory), directory) for directory in sorted(os.listdir(source))]
+        print("%d MB tree, %.1f MB/s upload" % (options.size, options.bandwidth))
+        digests = []
+        for label, upload in [("tarball, then upload (current)", sequential), ("streamed upload", streamed)]:
+            server.received = os.path.join(workdir, 'received.tar.gz')
+            start = time.time()
+            result = upload(url, trees, os.path.join(workdir, 'sandbox.tar.gz'))
+            elapsed = time.time() - start
+            print("%-32s %8.2f s %8.1f MB sent" % (label, elapsed, os.path.getsize(server.received) / 1024 / 1024))
+            digests.append((result['hashkey'], contentDigest(server.received)))
+        if digests[0] != digests[1]:
+            raise RuntimeError("The streamed upload differs from the current one")
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Benchmark of the status_cache readers (see CRABClient.StatusCache).
+
+Writes a synthetic status_cache for a task with many jobs in each format, and
+reports the parse time and the peak RSS of reading it, with all the fields
+(as for 'crab status2 --long') and with only the State and Error fields (as for
+the default 'crab status2'). Each measurement is done in a fresh python process
+so that the RSS numbers do not mix.
+
+Usage (from the repository root):
+    PYTHONPATH=src/python python scripts/benchmark_status_cache.py [--jobs 50000]
+"""
+from __future__ import print_function
+from __future__ import division
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import resource
+import tempfile
+import subprocess
+from optparse import OptionParser
+
+from CRABClient.StatusCache import readStatusCache, writeStatusCache, LEGACY, JSON, COLUMNAR
+
+SITES = ['T2_CH_CERN', 'T2_US_Nebraska', 'T2_DE_DESY', 'T2_IT_Pisa', 'T1_US_FNAL', 'T2_UK_London_IC']
+STATES = ['finished'] * 6 + ['running'] * 2 + ['idle', 'failed', 'transferring', 'cooloff']
+
+
+def syntheticStatus(njobs):
+    """
+    Return a status_cache dictionary for njobs jobs with realistic fields.
+    """
+    random.seed(12345)
+    status = {'DagStatus': {'DagStatus': 2, 'NodesTotal': njobs, 'Timestamp': int(time.time())}}
+    for i in xrange(1, njobs + 1):
+        state = random.choice(STATES)
+        retries = random.randint(0, 3)
+        info = {'State': state, 'Retries': retries, 'Restarts': 0, 'JobIds': ['%d.0' % (1000000 + i)],
+                'StartTimes': [1500000000 + i], 'SubmitTimes': [1499990000 + i]}
+        if state != 'idle':
+            info['SiteHistory'] = [random.choice(SITES) for _ in xrange(retries + 1)]
+            info['WallDurations'] = [random.randint(60, 36000) for _ in xrange(retries + 1)]
+            info['ResidentSetSize'] = [random.randint(100000, 2500000) for _ in xrange(retries + 1)]
+            info['TotalUserCpuTimeHistory'] = [random.randint(60, 30000) for _ in xrange(retries + 1)]
+            info['TotalSysCpuTimeHistory'] = [random.randint(1, 600) for _ in xrange(retries + 1)]
+        if state == 'failed':
+            info['Error'] = [random.choice([8021, 50664, 60302, 90000]), 'Error message of job %d\nwith some details' % i]
+        status[str(i)] = info
+    return status
+
+
+def runReader(path, fields):
+    start = time.time()
+    result = readStatusCache(path, fields)
+    end = time.time()
+    return {'jobs': len(result) - 1,
+            'time': end - start,
+            'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def main():
+    parser = OptionParser(usage = "usage: %prog [options]")
+    parser.add_option("--jobs", dest = "jobs", type = "int", default = 50000,
+                      help = "Number of jobs in the synthetic status_cache [default: %default].")
+    parser.add_option("--read", dest = "read", default = None,
+                      help = "Only read this file and print the result as JSON (used internally).")
+    parser.add_option("--fields", dest = "fields", default = None,
+                      help = "Comma separated list of the fields to read (used internally).")
+    options, _ = parser.parse_args()
+
+    if options.read:
+        fields = options.fields.split(',') if options.fields else None
+        print(json.dumps(runReader(options.read, fields)))
+        return 0
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        status = syntheticStatus(options.jobs)
+        print("%-10s %10s %-12s %10s %10s %16s" % ("Format", "Size (MB)", "Fields", "Jobs", "Time (s)", "Peak RSS (MB)"))
+        for fmt in [LEGACY, JSON, COLUMNAR]:
+            path = os.path.join(tmpdir, 'status_cache.%s' % fmt)
+            writeStatusCache(path, status, fmt)
+            size = os.path.getsize(path) / 1024. / 1024.
+            for fields in [None, 'State,Error']:
+                cmd = [sys.executable, os.path.abspath(__file__), '--read', path]
+                if fields:
+                    cmd += ['--fields', fields]
+                res = json.loads(subprocess.check_output(cmd).splitlines()[-1])
+                print("%-10s %10.1f %-12s %10d %10.3f %16.1f" % (fmt, size, fields or 'all', res['jobs'], res['time'], res['maxrss_kb'] / 1024.))
+    finally:
+        shutil.rmtree(tmpdir)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Benchmark of the remote_copy transfer engines (see CRABClient.TransferEngines).
+
+Queues a number of no-op copy commands through each engine and reports the
+startup time, the throughput and the peak RSS. Each engine is measured in a
+fresh python process so that the RSS numbers do not mix.
+
+Usage (from the repository root):
+    PYTHONPATH=src/python python scripts/benchmark_transfer_engines.py [--files 10000] [--parallel 20] [--exec]
+"""
+from __future__ import print_function
+from __future__ import division
+
+import os
+import sys
+import json
+import time
+import resource
+import subprocess
+from optparse import OptionParser
+
+from CRABClient.TransferEngines import ENGINES, getTransferEngine
+
+
+def noopWorker(input_, successfiles, failedfiles, execute):
+    """
+    Same loop as remote_copy.processWorker, but the copy command is a no-op.
+    """
+    while True:
+        myfile, work = input_.get()
+        if work == 'STOP':
+            break
+        fileid = myfile['pfn'].split('/')[-1]
+        if execute:
+            pipe = subprocess.Popen(work, stdout = subprocess.PIPE, stderr = subprocess.PIPE, shell = True)
+            pipe.communicate()
+            if pipe.returncode != 0:
+                failedfiles[fileid] = 'Failed'
+                continue
+        successfiles[fileid] = 'Successfully retrieved'
+
+
+def runEngine(name, nfiles, nparallel, execute):
+    """
+    Run the benchmark for one engine and return the measurements as a dictionary.
+    """
+    start = time.time()
+    engine = getTransferEngine(name, nparallel)
+    successfiles = engine.newResultDict()
+    failedfiles = engine.newResultDict()
+    engine.start(noopWorker, (successfiles, failedfiles, execute))
+    started = time.time()
+    for i in xrange(nfiles):
+        myfile = {'pfn': 'srm://site.example/store/user/file_%d.root' % i, 'size': 0}
+        engine.put((myfile, 'true'))
+    engine.stop()
+    end = time.time()
+    nsuccess = len(successfiles)
+    selfrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    childrss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {'engine': name,
+            'files': nsuccess,
+            'startup': started - start,
+            'throughput': nsuccess / (end - started) if end > started else 0,
+            'total': end - start,
+            'maxrss_self_kb': selfrss,
+            'maxrss_children_kb': childrss}
+
+
+def main():
+    parser = OptionParser(usage = "usage: %prog [options]")
+    parser.add_option("--files", dest = "files", type = "int", default = 10000,
+                      help = "Number of copy commands to queue [default: %default].")
+    parser.add_option("--parallel", dest = "parallel", type = "int", default = 20,
+                      help = "Number of workers [default: %default].")
+    parser.add_option("--exec", dest = "execute", action = "store_true", default = False,
+                      help = "Actually spawn a 'true' shell command per file, as remote_copy does.")
+    parser.add_option("--engine", dest = "engine", default = None,
+                      help = "Only run this engine and print the result as JSON (used internally).")
+    options, _ = parser.parse_args()
+
+    if options.engine:
+        print(json.dumps(runEngine(options.engine, options.files, options.parallel, options.execute)))
+        return 0
+
+    print("%-8s %8s %12s %14s %10s %16s %20s" % ("Engine", "Files", "Startup (s)", "Files/s", "Total (s)", "Peak RSS (MB)", "Peak child RSS (MB)"))
+    for name in sorted(ENGINES):
+        cmd = [sys.executable, os.path.abspath(__file__), '--engine', name,
+               '--files', str(options.files), '--parallel', str(options.parallel)]
+        if options.execute:
+            cmd.append('--exec')
+        res = json.loads(subprocess.check_output(cmd).splitlines()[-1])
+        print("%-8s %8d %12.3f %14.1f %10.2f %16.1f %20.1f" % (res['engine'], res['files'], res['startup'], res['throughput'], res['total'], \
+                                                               res['maxrss_self_kb']/1024., res['maxrss_children_kb']/1024.))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
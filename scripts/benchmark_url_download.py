@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+Benchmark of the downloads of UserUtilities.getFileFromURL (see CRABClient.URLFetcher).
+
+Serves a file of --size MB from a local HTTP/1.1 server (in a separate process)
+and reports the throughput of downloading it --repeat times:
+  - as the previous getFileFromURL did: a new urllib.URLopener per file, 1 KB reads,
+  - with a PersistentURLFetcher (one kept connection), for a few chunk sizes,
+  - with gzip transfer encoding, for a text file (the server sends a pre-compressed copy).
+
+Usage (from the repository root):
+    PYTHONPATH=src/python python scripts/benchmark_url_download.py [--size 100] [--repeat 3]
+"""
+from __future__ import print_function
+from __future__ import division
+
+import os
+import gzip
+import time
+import shutil
+import socket
+import urllib
+import tempfile
+import multiprocessing
+import BaseHTTPServer
+import SocketServer
+from optparse import OptionParser
+
+from CRABClient.URLFetcher import PersistentURLFetcher
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+
+    def do_GET(self):
+        path = os.path.join(self.server.directory, self.path.lstrip('/'))
+        encoding = None
+        if 'gzip' in self.headers.get('Accept-Encoding', '') and os.path.isfile(path + '.gz'):
+            path, encoding = path + '.gz', 'gzip'
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        with open(path, 'rb') as fd:
+            shutil.copyfileobj(fd, self.wfile, 1024 * 1024)
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def serve(directory, port):
+    server = Server(('127.0.0.1', port), Handler)
+    server.directory = directory
+    server.serve_forever()
+
+
+def freePort():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def previousGetFileFromURL(url, filename):
+    """
+    The download loop of getFileFromURL before it used PersistentURLFetcher.
+    """
+    opener = urllib.URLopener()
+    socket = opener.open(url)
+    with open(filename, 'a') as f:
+        f.seek(0)
+        f.truncate()
+        while True:
+            piece = socket.read(1024)
+            if not piece:
+                break
+            f.write(piece)
+
+
+def measure(label, download, url, filename, size, repeat):
+    start = time.time()
+    for _ in xrange(repeat):
+        download(url, filename)
+    elapsed = time.time() - start
+    if os.path.getsize(filename) != size:
+        raise RuntimeError("%s: got %d bytes instead of %d" % (label, os.path.getsize(filename), size))
+    print("%-36s %8.2f s %10.1f MB/s" % (label, elapsed, repeat * size / elapsed / 1024 / 1024))
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--size', dest = 'size', type = 'int', default = 100, help = 'The size of the files, in MB')
+    parser.add_option('--repeat', dest = 'repeat', type = 'int', default = 3, help = 'The number of downloads of each file')
+    options, _ = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        served = os.path.join(workdir, 'served')
+        os.makedirs(served)
+        size = options.size * 1024 * 1024
+        with open(os.path.join(served, 'binary'), 'wb') as fd:
+            for _ in xrange(options.size):
+                fd.write(os.urandom(1024 * 1024))
+        ## A text file, compressible like the logs and the status_cache.
+        line = "2017-01-01 00:00:00 INFO Job %08d finished with exit code 0 on T2_CH_CERN\n"
+        with open(os.path.join(served, 'text'), 'wb') as fd:
+            written, i = 0, 0
+            while written < size:
+                data = line % i
+                data = data[:size - written]
+                fd.write(data)
+                written += len(data)
+                i += 1
+        with open(os.path.join(served, 'text'), 'rb') as fd:
+            with gzip.GzipFile(os.path.join(served, 'text.gz'), 'wb', 6) as gz:
+                shutil.copyfileobj(fd, gz, 1024 * 1024)
+
+        port = freePort()
+        server = multiprocessing.Process(target = serve, args = (served, port))
+        server.daemon = True
+        server.start()
+        time.sleep(0.5)
+        url = 'http://127.0.0.1:%d/' % port
+        filename = os.path.join(workdir, 'downloaded')
+
+        print("%d MB file, %d downloads each" % (options.size, options.repeat))
+        measure("urllib, 1 KB reads (previous)", previousGetFileFromURL, url + 'binary', filename, size, options.repeat)
+        for chunksize in [64 * 1024, 1024 * 1024, 4 * 1024 * 1024]:
+            fetcher = PersistentURLFetcher(chunksize = chunksize)
+            measure("kept connection, %d KB reads" % (chunksize // 1024), fetcher.fetch, url + 'binary', filename, size, options.repeat)
+            fetcher.close()
+        fetcher = PersistentURLFetcher()
+        measure("text file, identity", fetcher.fetch, url + 'text', filename, size, options.repeat)
+        fetcher.close()
+        fetcher = PersistentURLFetcher(gzip = True)
+        measure("text file, gzip", fetcher.fetch, url + 'text', filename, size, options.repeat)
+        print("  transferred %.1f MB for %.1f MB" % (fetcher.metrics['wireBytes'] / 1024 / 1024, fetcher.metrics['bytes'] / 1024 / 1024))
+        fetcher.close()
+        server.terminate()
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
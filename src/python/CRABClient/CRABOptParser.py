@@ -103,3 +103,9 @@ class CRABCmdOptParser(OptionParser):
                                    dest = "instance",
                                    type = "string",
                                    help = "Running instance of CRAB service. Valid values are %s." % str(SERVICE_INSTANCES.keys()))
+            self.add_option("--no-cache",
+                                   dest = "nocache",
+                                   default = False,
+                                   action = "store_true",
+                                   help = "Ask the server information (compatible versions, backend URLs, DNs of the task workers)"
+                                          " to the server, instead of using the values cached in the last hours.")
@@ -69,6 +69,12 @@ parametersMapping = {
                                      {'default': None,       'config': ['JobType.psetName'],                'type': 'StringType',  'required': False},
                                      {'default': False,      'config': ['JobType.sendPythonFolder'],        'type': 'BooleanType', 'required': False},
                                      {'default': False,      'config': ['JobType.sendExternalFolder'],      'type': 'BooleanType', 'required': False},
+                                     ## Keep the compressed sandbox pieces in $CRAB3_SANDBOX_CACHE or ~/.crab3_sandbox, up to
+                                     ## $CRAB3_SANDBOX_CACHE_SIZE MB (default 500 MB), see JobType.SandboxCache.
+                                     {'default': True,       'config': ['JobType.sandboxCache'],            'type': 'BooleanType', 'required': False},
+                                     {'default': 'gzip',     'config': ['JobType.sandboxCompression'],      'type': 'StringType',  'required': False},
+                                     {'default': 'file',     'config': ['JobType.sandboxUpload'],           'type': 'StringType',  'required': False},
+                                     {'default': True,       'config': ['JobType.sandboxLocalCopy'],        'type': 'BooleanType', 'required': False},
                                      {'default': None,       'config': ['JobType.pyCfgParams'],             'type': 'ListType',    'required': False},
                                      {'default': False,      'config': ['JobType.disableAutomaticOutputCollection'],'type': 'BooleanType', 'required': False}
                            ]
@@ -139,9 +145,11 @@ commandsConfiguration = {
     'resubmit2'     : {'acceptsArguments': False, 'requiresREST': True,  'initializeProxy': True,  'requiresDirOption': True,  'useCache': True,  'requiresProxyVOOptions': False, 'doProxyGroupRoleCheck': False, 'requiresLocalCache': True },
     'status'        : {'acceptsArguments': False, 'requiresREST': True,  'initializeProxy': True,  'requiresDirOption': True,  'useCache': True,  'requiresProxyVOOptions': False, 'doProxyGroupRoleCheck': False, 'requiresLocalCache': True },
     'status2'       : {'acceptsArguments': False, 'requiresREST': True,  'initializeProxy': True,  'requiresDirOption': True,  'useCache': True,  'requiresProxyVOOptions': False, 'doProxyGroupRoleCheck': False, 'requiresLocalCache': True },
+    'sandbox_inspect':{'acceptsArguments': True,  'requiresREST': False, 'initializeProxy': False, 'requiresDirOption': False, 'useCache': False, 'requiresProxyVOOptions': False, 'doProxyGroupRoleCheck': False, 'requiresLocalCache': False},
     'submit'        : {'acceptsArguments': True,  'requiresREST': True,  'initializeProxy': True,  'requiresDirOption': False, 'useCache': False, 'requiresProxyVOOptions': False, 'doProxyGroupRoleCheck': True , 'requiresLocalCache': False},
     'tasks'         : {'acceptsArguments': False, 'requiresREST': True,  'initializeProxy': True,  'requiresDirOption': False, 'useCache': False, 'requiresProxyVOOptions': False, 'doProxyGroupRoleCheck': False, 'requiresLocalCache': False},
-    'uploadlog'     : {'acceptsArguments': False, 'requiresREST': True,  'initializeProxy': True,  'requiresDirOption': True,  'useCache': True,  'requiresProxyVOOptions': False, 'doProxyGroupRoleCheck': False, 'requiresLocalCache': False}
+    'uploadlog'     : {'acceptsArguments': False, 'requiresREST': True,  'initializeProxy': True,  'requiresDirOption': True,  'useCache': True,  'requiresProxyVOOptions': False, 'doProxyGroupRoleCheck': False, 'requiresLocalCache': False},
+    'verify_output' : {'acceptsArguments': False, 'requiresREST': False, 'initializeProxy': False, 'requiresDirOption': True,  'useCache': True,  'requiresProxyVOOptions': False, 'doProxyGroupRoleCheck': False, 'requiresLocalCache': True }
 }
 
 
@@ -186,7 +186,7 @@ def getUrl(instance='prod', resource='workflow'):
     raise ConfigurationException('Error: only the following instances can be used: %s' %str(SERVICE_INSTANCES.keys()))
 
 
-def uploadlogfile(logger, proxyfilename, logfilename = None, logpath = None, instance = 'prod', serverurl = None, username = None):
+def uploadlogfile(logger, proxyfilename, logfilename = None, logpath = None, instance = 'prod', serverurl = None, username = None, cacheurl = None):
     ## WMCore dependencies. Moved here to minimize dependencies in the bootstrap script
     from WMCore.Services.UserFileCache.UserFileCache import UserFileCache
 
@@ -230,8 +230,10 @@ def uploadlogfile(logger, proxyfilename, logfilename = None, logpath = None, ins
 
     baseurl = getUrl(instance = instance , resource = 'info')
     if doupload:
-        cacheurl = server_info('backendurls', serverurl, proxyfilename, baseurl)
-        cacheurl = cacheurl['cacheSSL']
+        ## The CRAB cache URL can be given by the command (e.g. from the server information cache).
+        if not cacheurl:
+            cacheurl = server_info('backendurls', serverurl, proxyfilename, baseurl)
+            cacheurl = cacheurl['cacheSSL']
         cacheurldict = {'endpoint': cacheurl, "pycurl": True}
 
         ufc = UserFileCache(cacheurldict)
@@ -1,5 +1,6 @@
 import os
 import re
+import sys
 import imp 
 import json
 import types
@@ -13,6 +14,9 @@ from CRABClient.__init__ import __version__
 from CRABClient.ClientUtilities import colors
 from CRABClient.CRABOptParser import CRABCmdOptParser
 from CRABClient.ClientUtilities import BASEURL, SERVICE_INSTANCES
+from CRABClient.ServerInfoCache import ServerInfoCache
+from CRABClient.TaskSearch import TaskSearch, SEARCH_PARALLEL
+from CRABClient.DelegationLedger import DelegationLedger
 from CRABClient.CredentialInteractions import CredentialInteractions
 from CRABClient.ClientUtilities import loadCache, getWorkArea, server_info, createWorkArea
 from CRABClient.ClientExceptions import ConfigurationException, MissingOptionException, EnvironmentException, CachefileNotFoundException
@@ -233,6 +237,8 @@ class SubCommand(ConfigCommand):
 
         self.proxy = None
         self.restClass = CRABClient.Emulator.getEmulator('rest')
+        ## The server information this command took from the local cache (see serverInfoMayBeStale).
+        self.cachedServerInfo = {}
 
         ## Get the command configuration.
         self.cmdconf = commandsConfiguration.get(self.name)
@@ -382,8 +388,83 @@ class SubCommand(ConfigCommand):
         return instance, serverurl
 
 
+    def serverInfo(self, subresource, baseurl = None, **kwargs):
+        """
+        Get information about the server. The information that changes rarely is taken
+        from the local cache (next to the CRAB cache file), unless --no-cache was given.
+        """
+        baseurl = baseurl or self.getUrl(self.instance, resource = 'info')
+        cache = ServerInfoCache(self.crabcachepath() + '_serverinfo')
+        usecache = not kwargs and cache.cacheable(subresource)
+        if usecache and not getattr(self.options, 'nocache', False):
+            result = cache.get(self.instance, self.serverurl, subresource)
+            if result is not None:
+                self.logger.debug("Using the cached server information '%s'" % (subresource))
+                self.cachedServerInfo[subresource] = result
+                return result
+        result = server_info(subresource, self.serverurl, self.proxyfilename, baseurl, **kwargs)
+        if usecache:
+            cache.set(self.instance, self.serverurl, subresource, result)
+            cache.save()
+        return result
+
+
+    def searchTasks(self, tasknames, columns = None, instance = None, serverurl = None, nparallel = SEARCH_PARALLEL):
+        """
+        Get the task database rows of the given tasks, with only the given columns, in as few
+        requests as possible (see TaskSearch). Return the TaskSearch object, with the rows in
+        its results and the tasks that could not be retrieved in its errors. Whether the server
+        has the bulk search is remembered in the server information cache.
+        """
+        instance = instance or self.instance
+        serverurl = serverurl or self.serverurl
+        cache = ServerInfoCache(self.crabcachepath() + '_serverinfo')
+        bulk = cache.get(instance, serverurl, 'bulksearch')
+        serverFactory = lambda: self.restClass(serverurl, self.proxyfilename, self.proxyfilename, version=__version__)
+        search = TaskSearch(serverFactory, self.getUrl(instance, resource = 'task'), bulk is not False, nparallel, self.logger)
+        search.search(tasknames, columns)
+        if search.bulk != bulk:
+            cache.set(instance, serverurl, 'bulksearch', search.bulk)
+            cache.save()
+        return search
+
+
+    def serverInfoMayBeStale(self, ex):
+        """
+        Whether the cached server information could be the cause of the HTTPException ex:
+        the failed URL was taken from the cached backend URLs, or the server complained
+        about the client version while the compatible versions were taken from the cache.
+        """
+        cached = getattr(self, 'cachedServerInfo', {})
+        url = getattr(ex, 'url', None) or ''
+        backendurls = cached.get('backendurls') or {}
+        for backendurl in backendurls.values():
+            if isinstance(backendurl, basestring) and backendurl.startswith('http') and url.startswith(backendurl.rstrip('/')):
+                return True
+        if 'version' in cached:
+            headers = getattr(ex, 'headers', None) or {}
+            reason = ' '.join(str(headers.get(name, '')) for name in ['X-Error-Info', 'X-Error-Detail'])
+            if 'version' in reason.lower():
+                return True
+        return False
+
+
+    def invalidateServerInfo(self):
+        """
+        Forget the cached information about the server and the delegations recorded for it,
+        e.g. because it answered with an error caused by that information.
+        """
+        if getattr(self, 'serverurl', None):
+            cache = ServerInfoCache(self.crabcachepath() + '_serverinfo')
+            cache.invalidate(self.instance, self.serverurl)
+            cache.save()
+            ledger = DelegationLedger(self.crabcachepath() + '_delegations')
+            ledger.forget(self.serverurl)
+            ledger.save()
+
+
     def checkversion(self, baseurl = None):
-        compatibleVersions = server_info('version', self.serverurl, self.proxyfilename, baseurl)
+        compatibleVersions = self.serverInfo('version', baseurl)
         for item in compatibleVersions:
             if re.match(item, __version__):
                 self.logger.debug("CRABClient version: %s" % (__version__))
@@ -411,12 +492,17 @@ class SubCommand(ConfigCommand):
                     self.proxy.myproxyAccount = self.serverurl
                     baseurl = self.getUrl(self.instance, resource = 'info')
                     ## Get the DN of the task workers from the server.
-                    all_task_workers_dns = server_info('delegatedn', self.serverurl, self.proxyfilename, baseurl)
-                    for serverdn in all_task_workers_dns['services']:
-                        self.proxy.setServerDN(serverdn)
-                        self.proxy.setMyProxyServer('myproxy.cern.ch')
-                        self.logger.debug("Registering user credentials for server %s" % serverdn)
-                        self.proxy.createNewMyProxy(timeleftthreshold = 60 * 60 * 24 * RENEW_MYPROXY_THRESHOLD, nokey = True)
+                    all_task_workers_dns = self.serverInfo('delegatedn', baseurl)
+                    ## The delegations done by the previous commands, to skip the myproxy queries.
+                    ledger = DelegationLedger(self.crabcachepath() + '_delegations')
+                    try:
+                        for serverdn in all_task_workers_dns['services']:
+                            self.proxy.setServerDN(serverdn)
+                            self.proxy.setMyProxyServer('myproxy.cern.ch')
+                            self.logger.debug("Registering user credentials for server %s" % serverdn)
+                            self.proxy.createNewMyProxy(timeleftthreshold = 60 * 60 * 24 * RENEW_MYPROXY_THRESHOLD, nokey = True, ledger = ledger)
+                    finally:
+                        ledger.save()
         else:
             self.proxyfilename = self.options.proxy
             os.environ['X509_USER_PROXY'] = self.options.proxy
@@ -514,6 +600,11 @@ class SubCommand(ConfigCommand):
 
 
     def terminate(self, exitcode):
+        ## Report how many connections the REST calls needed (if they went through the session pool).
+        restSessions = sys.modules.get('CRABClient.RESTSessions')
+        if restSessions:
+            requests, handshakes = restSessions.getSessionManager().totals()
+            self.logger.debug("REST requests: %s, new connections (handshakes): %s" % (requests, handshakes))
         #We do not want to print logfile for each command...
         if exitcode < 2000:
             if getattr(self.options, 'dump', False) or getattr(self.options, 'xroot', False):
@@ -2,6 +2,8 @@ from CRABClient.Commands.remote_copy import remote_copy
 from CRABClient.Commands.SubCommand import SubCommand
 from CRABClient.ClientExceptions import ConfigurationException , RESTCommunicationException
 from CRABClient.ClientUtilities import validateJobids, colors
+from CRABClient.TransferJournal import JOURNAL_NAME
+from CRABClient.PFNRules import PFNRuleCache
 from CRABClient import __version__
 
 from WMCore.Services.PhEDEx.PhEDEx import PhEDEx
@@ -11,7 +13,18 @@ import CRABClient.Emulator
 import os
 import re
 import copy
+import Queue
 import urllib
+import threading
+
+## Number of LFNs resolved by each PhEDEx lfn2pfn query.
+LFN2PFN_BATCH = 100
+## Maximum number of sites resolved in parallel.
+LFN2PFN_PARALLEL = 5
+## Number of jobs per page when the files are listed page by page, and number
+## of pages listed in advance of the copies.
+FILEINFO_PAGE_JOBS = 100
+FILEINFO_PREFETCH = 2
 
 class getcommand(SubCommand):
     """
@@ -37,16 +50,15 @@ class getcommand(SubCommand):
             configparam = "General.transferOutputs"
 
         transferFlag = 'unknown'
-        inputlist = {'subresource': 'search', 'workflow': self.cachedinfo['RequestName']}
-        serverFactory = CRABClient.Emulator.getEmulator('rest')
-        server = serverFactory(self.serverurl, self.proxyfilename, self.proxyfilename, version=__version__)
-        uri = self.getUrl(self.instance, resource = 'task')
-        dictresult, status, _ =  server.get(uri, data = inputlist)
-        self.logger.debug('Server result: %s' % dictresult)
-        if status == 200:
-            if 'desc' in dictresult and 'columns' in dictresult['desc']:
-                position = dictresult['desc']['columns'].index(taskdbparam)
-                transferFlag = dictresult['result'][position] #= 'T' or 'F'
+        ## Only the columns needed here are retrieved from the task database.
+        taskname = self.cachedinfo['RequestName']
+        columns = [taskdbparam, 'tm_edm_outfiles', 'tm_tfile_outfiles', 'tm_outfiles']
+        search = self.searchTasks([taskname], columns)
+        task = search.results.get(taskname)
+        self.logger.debug('Server result: %s' % (task or search.errors.get(taskname)))
+        if task:
+            if taskdbparam in task:
+                transferFlag = task[taskdbparam] #= 'T' or 'F'
             else:
                 self.logger.debug("Unable to locate %s in server result." % (taskdbparam))
         ## If transferFlag = False, there is nothing to retrieve.
@@ -56,15 +68,8 @@ class getcommand(SubCommand):
             return {'success': {}, 'failed': {}}
 
         ## Retrieve tm_edm_outfiles, tm_tfile_outfiles and tm_outfiles from the task database and check if they are empty.
-        if argv.get('subresource') in ['data', 'data2'] and status == 200:
-            if 'desc' in dictresult and 'columns' in dictresult['desc']:
-                position = dictresult['desc']['columns'].index('tm_edm_outfiles')
-                tm_edm_outfiles = dictresult['result'][position]
-                position = dictresult['desc']['columns'].index('tm_tfile_outfiles')
-                tm_tfile_outfiles = dictresult['result'][position]
-                position = dictresult['desc']['columns'].index('tm_outfiles')
-                tm_outfiles = dictresult['result'][position]
-            if tm_edm_outfiles == '[]' and tm_tfile_outfiles == '[]' and tm_outfiles == '[]':
+        if argv.get('subresource') in ['data', 'data2'] and task:
+            if all(task.getLiteral(column) == [] for column in ['tm_edm_outfiles', 'tm_tfile_outfiles', 'tm_outfiles']):
                 msg  = "%sWarning%s:" % (colors.RED, colors.NORMAL)
                 msg += " There are no output files to retrieve, because CRAB could not detect any in the CMSSW configuration"
                 msg += " nor was any explicitly specified in the CRAB configuration."
@@ -72,32 +77,34 @@ class getcommand(SubCommand):
 
         #Retrieving output files location from the server
         self.logger.debug('Retrieving locations for task %s' % self.cachedinfo['RequestName'])
-        inputlist =  [('workflow', self.cachedinfo['RequestName'])]
-        inputlist.extend(list(argv.iteritems()))
         if getattr(self.options, 'quantity', None):
             self.logger.debug('Retrieving %s file locations' % self.options.quantity)
-            inputlist.append(('limit', self.options.quantity))
+            limit = int(self.options.quantity)
         else:
             self.logger.debug('Retrieving all file locations')
-            inputlist.append(('limit', -1))
-        if getattr(self.options, 'jobids', None):
-            self.logger.debug('Retrieving jobs %s' % self.options.jobids)
-            inputlist.extend(self.options.jobids)
-        serverFactory = CRABClient.Emulator.getEmulator('rest')
-        server = serverFactory(self.serverurl, self.proxyfilename, self.proxyfilename, version=__version__)
-        dictresult, status, reason = server.get(self.uri, data = urllib.urlencode(inputlist))
-        self.logger.debug('Server result: %s' % dictresult)
-
-        if status != 200:
-            msg = "Problem retrieving information from the server:\ninput:%s\noutput:%s\nreason:%s" % (str(inputlist), str(dictresult), str(reason))
-            raise RESTCommunicationException(msg)
-
-        totalfiles = len(dictresult['result'])
-        fileInfoList = dictresult['result']
+            limit = -1
 
         # TODO: remove this 'if' once transition to status2 is complete
-        if argv.get('subresource') in ['data2', 'logs2']:
-            self.insertPfns(fileInfoList)
+        if argv.get('subresource') in ['data2', 'logs2'] and getattr(self.options, 'jobids', None) \
+           and not self.options.dump and not self.options.xroot:
+            ## The copies start while the next files are being listed and their pfns resolved.
+            self.logger.debug('Retrieving jobs %s' % self.options.jobids)
+            self.setDestination()
+            self.logger.info("Setting the destination to %s " % self.dest)
+            self.logger.info("Retrieving the files of %s jobs" % len(self.options.jobids))
+            self.totalfiles = 0
+            returndict = self.copyFiles(self.iterFileInfo(argv, limit))
+            totalfiles = self.totalfiles
+            fileInfoList = []
+        else:
+            if getattr(self.options, 'jobids', None):
+                self.logger.debug('Retrieving jobs %s' % self.options.jobids)
+            fileInfoList = self.getFileInfo(argv, getattr(self.options, 'jobids', None), limit)
+            totalfiles = len(fileInfoList)
+
+            # TODO: remove this 'if' once transition to status2 is complete
+            if argv.get('subresource') in ['data2', 'logs2']:
+                self.insertPfns(fileInfoList)
 
         if len(fileInfoList) > 0:
             if self.options.dump or self.options.xroot:
@@ -127,13 +134,7 @@ class getcommand(SubCommand):
                 returndict = {'pfn': [pfn for _, pfn, _ in jobid_pfn_lfn_list], 'lfn': [lfn for _, _, lfn in jobid_pfn_lfn_list]}
             else:
                 self.logger.info("Retrieving %s files" % (totalfiles))
-                arglist = ['--destination', self.dest, '--input', fileInfoList, '--dir', self.options.projdir, \
-                           '--proxy', self.proxyfilename, '--parallel', self.options.nparallel, '--wait', self.options.waittime, \
-                           '--checksum', self.checksum, '--command', self.command]
-                copyoutput = remote_copy(self.logger, arglist)
-                successdict, faileddict = copyoutput()
-                #need to use deepcopy because successdict and faileddict are dict that is under the a manage dict, accessed multithreadly
-                returndict = {'success': copy.deepcopy(successdict) , 'failed': copy.deepcopy(faileddict)}
+                returndict = self.copyFiles(fileInfoList)
         if totalfiles == 0:
             self.logger.info("No files to retrieve.")
             returndict = {'success': {} , 'failed': {}}
@@ -146,6 +147,85 @@ class getcommand(SubCommand):
 
         return returndict
 
+    def getFileInfo(self, argv, jobids, limit):
+        """
+        Retrieve from the server the metadata of at most limit (-1 for all) files of the
+        given jobs (of all the jobs if jobids is empty).
+        """
+        inputlist =  [('workflow', self.cachedinfo['RequestName'])]
+        inputlist.extend(list(argv.iteritems()))
+        inputlist.append(('limit', limit))
+        if jobids:
+            inputlist.extend(jobids)
+        serverFactory = CRABClient.Emulator.getEmulator('rest')
+        server = serverFactory(self.serverurl, self.proxyfilename, self.proxyfilename, version=__version__)
+        dictresult, status, reason = server.get(self.uri, data = urllib.urlencode(inputlist))
+        self.logger.debug('Server result: %s' % dictresult)
+
+        if status != 200:
+            msg = "Problem retrieving information from the server:\ninput:%s\noutput:%s\nreason:%s" % (str(inputlist), str(dictresult), str(reason))
+            raise RESTCommunicationException(msg)
+
+        return dictresult['result']
+
+    def iterFileInfo(self, argv, limit):
+        """
+        Yield the metadata of the files, with their pfns. The files are listed for FILEINFO_PAGE_JOBS
+        jobs at a time, and their pfns resolved, by a background thread which works at most
+        FILEINFO_PREFETCH pages in advance. self.totalfiles counts the files yielded.
+        """
+        pages = Queue.Queue(FILEINFO_PREFETCH)
+        jobids = self.options.jobids
+        def listPages():
+            remaining = limit
+            try:
+                for i in xrange(0, len(jobids), FILEINFO_PAGE_JOBS):
+                    if remaining == 0:
+                        break
+                    fileInfoList = self.getFileInfo(argv, jobids[i:i+FILEINFO_PAGE_JOBS], remaining)
+                    if remaining > 0:
+                        remaining = max(remaining - len(fileInfoList), 0)
+                    self.insertPfns(fileInfoList)
+                    self.logger.debug("Listed %s files of jobs %s to %s" % (len(fileInfoList), jobids[i][1], jobids[min(i+FILEINFO_PAGE_JOBS, len(jobids))-1][1]))
+                    pages.put((fileInfoList, None))
+            except Exception as ex:
+                pages.put((None, ex))
+                return
+            pages.put((None, None))
+        lister = threading.Thread(target = listPages)
+        lister.daemon = True
+        lister.start()
+        while True:
+            fileInfoList, error = pages.get()
+            if error is not None:
+                raise error
+            if fileInfoList is None:
+                return
+            for fileInfo in fileInfoList:
+                self.totalfiles += 1
+                yield fileInfo
+
+    def copyFiles(self, fileInfoList):
+        """
+        Copy the files (an iterable of file metadata) with remote_copy.
+        """
+        arglist = ['--destination', self.dest, '--input', fileInfoList, '--dir', self.options.projdir, \
+                   '--proxy', self.proxyfilename, '--parallel', self.options.nparallel, '--max-parallel', self.options.maxparallel, \
+                   '--wait', self.options.waittime, \
+                   '--checksum', self.checksum, '--command', self.command]
+        ## The journal is kept in the results directory even if the files are copied somewhere else.
+        resultsdir = os.path.join(self.requestarea, 'results')
+        if os.path.isdir(resultsdir):
+            arglist.extend(['--journal', os.path.join(resultsdir, JOURNAL_NAME)])
+        if self.options.resume:
+            arglist.append('--resume')
+        if self.verify:
+            arglist.append('--verify')
+        copyoutput = remote_copy(self.logger, arglist)
+        successdict, faileddict = copyoutput()
+        #need to use deepcopy because with the process engine successdict and faileddict are dict that is under the a manage dict, accessed multithreadly
+        return {'success': copy.deepcopy(successdict) , 'failed': copy.deepcopy(faileddict)}
+
     def processAndStoreJobIds(self):
         """
         Call the status command to check that the jobids passed by the user are in a valid
@@ -178,20 +258,69 @@ class getcommand(SubCommand):
     def insertPfns(self, fileInfoList):
         """
         Query phedex to retrieve the pfn for each file and store it in the passed fileInfoList.
+        The lfns are grouped by site and resolved with bulk lfn2pfn queries of LFN2PFN_BATCH lfns,
+        up to LFN2PFN_PARALLEL sites in parallel. The lfns that match a rule of the local PFN rule
+        cache (see CRABClient.PFNRules) are resolved without any query.
         """
-        phedex = PhEDEx({'cert': self.proxyfilename, 'key': self.proxyfilename, 'logger': self.logger, 'pycurl': True})
+        rulecache = PFNRuleCache(self.crabcachepath() + '_pfnrules')
 
         # Pick out the correct lfns and sites
-        if len(fileInfoList) > 0:
-            for fileInfo in fileInfoList:
-                if str(fileInfo['jobid']) in self.transferringIds:
-                    lfn = fileInfo['tmplfn']
-                    site = fileInfo['tmpsite']
-                else:
-                    lfn = fileInfo['lfn']
-                    site = fileInfo['site']
-                pfn = phedex.getPFN(site, lfn)[(site, lfn)]
+        sitelfns = {}
+        for fileInfo in fileInfoList:
+            if str(fileInfo['jobid']) in self.transferringIds:
+                lfn = fileInfo['tmplfn']
+                site = fileInfo['tmpsite']
+            else:
+                lfn = fileInfo['lfn']
+                site = fileInfo['site']
+            pfn = rulecache.lookup(site, lfn)
+            if pfn:
+                fileInfo['pfn'] = pfn
+            else:
+                sitelfns.setdefault(site, []).append((lfn, fileInfo))
+        ncached = len(fileInfoList) - sum(len(lfns) for lfns in sitelfns.itervalues())
+        self.logger.debug("Resolved %s pfns with the local rule cache, querying PhEDEx for %s lfns at %s sites" \
+                          % (ncached, len(fileInfoList) - ncached, len(sitelfns)))
+        if not sitelfns:
+            return
+
+        sitequeue = Queue.Queue()
+        for site in sitelfns:
+            sitequeue.put(site)
+        results, errors = {}, []
+        def resolveSites():
+            ## A PhEDEx object (and so a curl handle) per thread.
+            phedex = PhEDEx({'cert': self.proxyfilename, 'key': self.proxyfilename, 'logger': self.logger, 'pycurl': True})
+            while True:
+                try:
+                    site = sitequeue.get_nowait()
+                except Queue.Empty:
+                    return
+                lfns = sorted(set(lfn for lfn, _ in sitelfns[site]))
+                try:
+                    for i in xrange(0, len(lfns), LFN2PFN_BATCH):
+                        results.update(phedex.getPFN(site, lfns[i:i+LFN2PFN_BATCH]))
+                except Exception as ex:
+                    errors.append(ex)
+                    return
+        threads = [threading.Thread(target = resolveSites) for _ in xrange(min(LFN2PFN_PARALLEL, len(sitelfns)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+        for site, lfns in sitelfns.iteritems():
+            for lfn, fileInfo in lfns:
+                pfn = results[(site, lfn)]
                 fileInfo['pfn'] = pfn
+                if pfn:
+                    rulecache.learn(site, lfn, pfn)
+        try:
+            rulecache.save()
+        except (IOError, OSError) as ex:
+            self.logger.debug("Cannot save the PFN rule cache: %s" % ex)
 
     def setDestination(self):
         #Setting default destination if -o is not provided
@@ -242,11 +371,25 @@ class getcommand(SubCommand):
                                 dest = 'checksum',
                                 default = 'yes',
                                 help = 'Set it to yes if needed. It will use ADLER32 checksum' +\
-                                       'Allowed values are yes/no. Default is yes.')
+                                       'Allowed values are yes/no/local. Default is yes. With local, the checksums are' +\
+                                       ' not computed by the copy command but afterwards, locally and in parallel,' +\
+                                       ' and the files with a wrong checksum are retrieved again.')
         self.parser.add_option('--command',
                                 dest = 'command',
                                 default = None,
-                                help = 'A command which to use. Available commands are LCG or GFAL.')
+                                help = 'A command which to use. Available commands are GFALPY (gfal2 python bindings), GFAL or LCG.' +\
+                                       ' By default the first one available is used, in this order.')
+        self.parser.add_option('--resume',
+                                dest = 'resume',
+                                default = False,
+                                action = 'store_true',
+                                help = 'Skip the files already retrieved according to the transfer journal of the project' +\
+                                       ' (results/%s) without checking them on disk, and retry only the others.' % JOURNAL_NAME)
+        self.parser.add_option('--max-parallel',
+                                dest = 'maxparallel',
+                                default = None,
+                                help = 'Maximum number of parallel download. The number of parallel download starts from' +\
+                                       ' the --parallel value and is adapted to the measured throughput up to this value. Default is 50.')
 
     def validateOptions(self):
         #Figuring out the destination directory
@@ -263,13 +406,18 @@ class getcommand(SubCommand):
         #convert all to -1
         if getattr(self.options, 'quantity', None) == 'all':
             self.options.quantity = -1
+        elif getattr(self.options, 'quantity', None) is not None:
+            try:
+                int(self.options.quantity)
+            except ValueError:
+                raise ConfigurationException("The quantity must be an integer or 'all', got '%s'." % self.options.quantity)
 
         #check the format of jobids
         if getattr(self.options, 'jobids', None):
             self.options.jobids = validateJobids(self.options.jobids)
 
         if hasattr(self.options, 'command') and self.options.command != None:
-            AvailableCommands = ['LCG', 'GFAL']
+            AvailableCommands = ['LCG', 'GFAL', 'GFALPY']
             self.command = self.options.command.upper()
             if self.command not in AvailableCommands:
                 msg = "You specified to use %s command and it is not allowed. Available commands are: %s " % (self.command, str(AvailableCommands))
@@ -277,10 +425,12 @@ class getcommand(SubCommand):
                 raise ex
         else:
             self.command = None
+        self.verify = False
         if hasattr(self.options, 'checksum'):
-            if re.match('^yes$|^no$', self.options.checksum):
+            if re.match('^yes$|^no$|^local$', self.options.checksum):
                 self.checksum = 'ADLER32' if self.options.checksum == 'yes' else None
+                self.verify = self.options.checksum == 'local'
             else:
-                msg = "You specified to use %s checksum. Only lowercase yes/no is accepted to turn ADLER32 checksum" % self.options.checksum
+                msg = "You specified to use %s checksum. Only lowercase yes/no/local is accepted to turn ADLER32 checksum" % self.options.checksum
                 ex = ConfigurationException(msg)
                 raise ex
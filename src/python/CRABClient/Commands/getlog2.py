@@ -1,15 +1,25 @@
 from __future__ import print_function
 from __future__ import division
 
+import os
+
 import CRABClient.Emulator
 from CRABClient import __version__
 from CRABClient.ClientUtilities import colors
-from CRABClient.UserUtilities import getFileFromURL
+from CRABClient.StatusCache import LocalStatusCache
+from CRABClient.TransferEngines import ThreadEngine, STOP_MESSAGE
+from CRABClient.URLFetcher import PersistentURLFetcher
+from CRABClient.UserUtilities import getFileFromURLIfModified
 from CRABClient.Commands.getcommand import getcommand
-from CRABClient.ClientExceptions import RESTCommunicationException, ClientException, MissingOptionException
+from CRABClient.ClientExceptions import RESTCommunicationException, ClientException, MissingOptionException, ConfigurationException
 
 from ServerUtilities import getProxiedWebDir
 
+## The default number of short log files retrieved at the same time with --short.
+SHORT_LOG_PARALLEL = 10
+## The fields of the status_cache needed to know which short log files exist.
+SHORT_LOG_FIELDS = ['State', 'Retries']
+
 
 class getlog2(getcommand):
     """
@@ -95,34 +105,101 @@ class getlog2(getcommand):
                 ex = MissingOptionException(msg)
                 ex.missingOption = "jobids"
                 raise ex
+            if self.options.nparallel is not None:
+                try:
+                    if int(self.options.nparallel) < 1:
+                        raise ValueError
+                except ValueError:
+                    raise ConfigurationException("The number of parallel downloads must be a positive integer, got '%s'." % self.options.nparallel)
+
+
+    def shortLogRetries(self, webdir, proxyfilename):
+        """
+        Return {jobid: number of retries} from the status_cache of the task (the short log of
+        each retry is job_out.<jobid>.<retry>.txt; the restarts of a retry overwrite its file),
+        or {} if the status_cache can not be retrieved. The jobs that were never submitted have
+        no short log, and are given -1 retries.
+        """
+        url = webdir + '/' + "status_cache"
+        def fetch(url, filename, etag, lastmodified):
+            return getFileFromURLIfModified(url, filename, proxyfilename, etag, lastmodified)
+        try:
+            statusCacheInfo = LocalStatusCache(self.requestarea).get(url, fetch, SHORT_LOG_FIELDS)
+        except ClientException as ce:
+            self.logger.debug("Cannot retrieve the status_cache file, the retries of the jobs will be probed: %s" % ce)
+            return {}
+        retries = {}
+        for jobid, info in statusCacheInfo.iteritems():
+            if jobid == 'DagStatus':
+                continue
+            retries[jobid] = -1 if info.get('State') == 'unsubmitted' else info.get('Retries', 0)
+        return retries
 
 
     def retrieveShortLogs(self, webdir, proxyfilename):
+        """
+        Retrieve the short logs of the requested jobs, several files at a time, each worker
+        keeping its connection to the web server open. Which retries have a log is known from
+        the status_cache; for the jobs that are not in it (or if it is not available), the
+        retries are tried in turn until one is not found, as before.
+        """
         self.logger.info("Retrieving...")
+        retries = self.shortLogRetries(webdir, proxyfilename)
+        jobs = [(jobid, retries.get(jobid)) for _, jobid in self.options.jobids]
+        nparallel = int(self.options.nparallel) if self.options.nparallel else SHORT_LOG_PARALLEL
+        results = {}
+        engine = ThreadEngine(max(1, min(nparallel, len(jobs))))
+        engine.start(self.shortLogWorker, (webdir, proxyfilename, results))
+        for job in jobs:
+            engine.put(job)
+        if engine.stop():
+            raise KeyboardInterrupt
+
         success = []
         failed = []
-        for _, jobid in self.options.jobids:
-            ## We don't know a priori how many retries the job had. So we start with retry 0
-            ## and increase it by 1 until we are unable to retrieve a log file (interpreting
-            ## this as the fact that we reached the highest retry already).
-            retry = 0
-            succeded = True
-            while succeded:
-                filename = 'job_out.%s.%s.txt' % (jobid, retry)
-                url = webdir + '/' + filename
-                try:
-                    getFileFromURL(url, self.dest + '/' + filename, proxyfilename)
-                    self.logger.info('Retrieved %s' % (filename))
+        for jobid, _ in jobs:
+            for filename, error in results.get(jobid, []):
+                if error is None:
                     success.append(filename)
-                    retry += 1 #To retrieve retried job log, if there is any.
-                except ClientException as ex:
-                    succeded = False
-                    ## Ignore the exception if the HTTP status code is 404. Status 404 means file
-                    ## not found (see http://www.w3.org/Protocols/rfc2616/rfc2616-sec10.html). File
-                    ## not found error is expected, since we try all the job retries.
-                    if not hasattr(ex, "status") or ex.status!=404:
-                        self.logger.debug(str(ex))
-                        failed.append(filename)
-
+                else:
+                    failed.append(filename)
         return failed, success
 
+
+    def shortLogWorker(self, inputq, webdir, proxyfilename, results):
+        """
+        Retrieve the short logs of the jobs put in inputq, (jobid, number of retries or None
+        if not known), and store in results[jobid] the list of (filename, error or None).
+        A file which is not found is not reported (the job did not start that retry yet).
+        """
+        fetcher = PersistentURLFetcher(proxyfilename)
+        try:
+            while True:
+                job = inputq.get()
+                if job == STOP_MESSAGE:
+                    break
+                jobid, maxretry = job
+                jobresults = []
+                retry = 0
+                while maxretry is None or retry <= maxretry:
+                    filename = 'job_out.%s.%s.txt' % (jobid, retry)
+                    try:
+                        fetcher.fetchIfModified(webdir + '/' + filename, os.path.join(self.dest, filename))
+                        self.logger.info('Retrieved %s' % (filename))
+                        jobresults.append((filename, None))
+                    except ClientException as ex:
+                        ## Status 404 means file not found (see http://www.w3.org/Protocols/rfc2616/rfc2616-sec10.html).
+                        ## When probing, it is expected after the last retry.
+                        if getattr(ex, 'status', None) == 404:
+                            if maxretry is None:
+                                break
+                        else:
+                            self.logger.debug(str(ex))
+                            jobresults.append((filename, str(ex)))
+                            ## Without the number of retries, the next ones can not be told from a failure.
+                            if maxretry is None:
+                                break
+                    retry += 1
+                results[jobid] = jobresults
+        finally:
+            fetcher.close()
@@ -21,19 +21,17 @@ class purge(SubCommand):
     def __call__(self):
 
         self.logger.info('Getting the tarball hash key')
-        inputlist = {'subresource': 'search', 'workflow': self.cachedinfo['RequestName']}
-        serverFactory = CRABClient.Emulator.getEmulator('rest')
-        server = serverFactory(self.serverurl, self.proxyfilename, self.proxyfilename, version=__version__)
-        uri = self.getUrl(self.instance, resource = 'task')
-        dictresult, status, reason =  server.get(uri, data = inputlist)
-        if status == 200:
-            if 'desc' in dictresult and 'columns' in dictresult['desc']:
-                position = dictresult['desc']['columns'].index('tm_user_sandbox')
-                tm_user_sandbox = dictresult['result'][position]
-                hashkey = tm_user_sandbox.replace(".tar.gz","")
-            else:
-                self.logger.info('%sError%s: Could not find tarball or there is more than one tarball'% (colors.RED, colors.NORMAL))
-                raise ConfigurationException
+        taskname = self.cachedinfo['RequestName']
+        search = self.searchTasks([taskname], ['tm_user_sandbox'])
+        if taskname in search.errors:
+            msg = "Problem retrieving the task information:\ninput: %s\nreason: %s" % (taskname, search.errors[taskname])
+            raise RESTCommunicationException(msg)
+        tm_user_sandbox = search.results[taskname].get('tm_user_sandbox')
+        if tm_user_sandbox:
+            hashkey = tm_user_sandbox.replace(".tar.gz","")
+        else:
+            self.logger.info('%sError%s: Could not find tarball or there is more than one tarball'% (colors.RED, colors.NORMAL))
+            raise ConfigurationException
 
         #checking task status
 
@@ -60,7 +58,7 @@ class purge(SubCommand):
         gsisshdict = {}
         if not self.options.scheddonly:
             baseurl = getUrl(self.instance, resource='info')
-            cacheurl = server_info('backendurls', self.serverurl, self.proxyfilename, baseurl)
+            cacheurl = self.serverInfo('backendurls', baseurl)
             cacheurl = cacheurl['cacheSSL']
             cacheurldict = {'endpoint': cacheurl, 'pycurl': True}
 
@@ -1,16 +1,25 @@
 from __future__ import division
 from __future__ import print_function
 import os
-import subprocess
-import multiprocessing
 import time
 import re
+import Queue
+import traceback
 from math import ceil
 import logging
-from multiprocessing import Manager
 
 from CRABClient.Commands.SubCommand import SubCommand
-from CRABClient.ClientUtilities import colors, cmd_exist, logfilter
+from CRABClient.ClientUtilities import colors, logfilter
+from CRABClient.TransferEngines import ENGINES, DEFAULT_ENGINE, getTransferEngine, AdaptiveConcurrency
+from CRABClient.TransferBackends import BACKENDS, getTransferBackend
+from CRABClient.TransferJournal import TransferJournal, DONE, FAILED, catalogAdler32
+from CRABClient.TransferVerification import VerificationPool
+
+## Default and highest accepted values for the maximum number of parallel downloads.
+DEFAULT_MAX_PARALLEL = 50
+MAX_PARALLEL = 200
+## How many times the files failing the checksum verification are copied again.
+VERIFY_RETRIES = 1
 
 
 class remote_copy(SubCommand):
@@ -44,6 +53,9 @@ class remote_copy(SubCommand):
         self.parser.add_option("--parallel",
                                dest = "nparallel")
 
+        self.parser.add_option("--max-parallel",
+                               dest = "maxparallel")
+
         self.parser.add_option("--wait",
                                dest = "waittime")
 
@@ -51,16 +63,49 @@ class remote_copy(SubCommand):
                                dest = "checksum")
 
         self.parser.add_option("--command",
-                               dest = "command")
+                               dest = "command",
+                               help = "Transfer backend: %s [default: the first one available]." % " or ".join(sorted(BACKENDS)))
+
+        self.parser.add_option("--engine",
+                               dest = "engine",
+                               default = DEFAULT_ENGINE,
+                               help = "Worker pool used for the transfers: %s [default: %%default]." % " or ".join(sorted(ENGINES)))
+
+        self.parser.add_option("--journal",
+                               dest = "journal",
+                               default = None,
+                               help = "Transfer journal where the result of each copy is recorded.")
+
+        self.parser.add_option("--resume",
+                               dest = "resume",
+                               default = False,
+                               action = "store_true",
+                               help = "Skip the files recorded as retrieved in the transfer journal, without checking them on disk." \
+                                      " With --verify, the ones not verified yet are verified, but not copied again.")
+
+        self.parser.add_option("--verify",
+                               dest = "verify",
+                               default = False,
+                               action = "store_true",
+                               help = "Verify the ADLER32 checksum of the retrieved files locally, against the one given by the server.")
 
 
     def __call__(self):
         """
         Copying locally files staged remotely.
-         * using a subprocess to encapsulate the copy command.
-         * maximum parallel download is 10
+         * using a transfer backend (see CRABClient.TransferBackends): the gfal2 python bindings
+           with bulk requests, or a subprocess per file to encapsulate the gfal-copy/lcg-cp command.
+         * the copies are run by a pool of threads (default) or of processes (--engine=process)
+         * with threads, the number of parallel downloads starts from --parallel (default is 10) and
+           is adapted to the measured throughput up to --max-parallel; with processes it is fixed
+         * the timeout of each copy is based on the download speed measured from the completed copies
+         * the result of each copy is recorded in the transfer journal (--journal), which allows
+           to skip the files already retrieved with --resume
+         * with --verify the ADLER32 checksums are computed locally by a pool of processes, while
+           the other files are being copied, and the files with a wrong checksum are copied again
         """
         ## This is the log gilename that is going to be used by the subprocesses that copy the file
+        ## (only with the process engine, threads log directly to the crab.log file).
         ## Using the same logfile is not supported automatically, see:
         ## https://docs.python.org/2/howto/logging-cookbook.html#logging-to-a-single-file-from-multiple-processes
         self.remotecpLogile = "%s/remote_copy.log" % os.path.dirname(self.logger.logfile)
@@ -72,54 +117,164 @@ class remote_copy(SubCommand):
         else:
             nsubprocess = int(self.options.nparallel)
 
-        if nsubprocess <= 0 or nsubprocess > 20:
-            self.logger.info("Inappropriate number of parallel download, must between 0 to 20 ")
-            return -1
-        command = ""
-        if cmd_exist("gfal-copy") and self.options.command not in ["LCG"]:
-            self.logger.info("Will use `gfal-copy` command for file transfers")
-            command = "env -i X509_USER_PROXY=%s gfal-copy -v " % os.path.abspath(self.proxyfilename)
-            if self.options.checksum:
-                command += "-K %s " % self.options.checksum
-            command += " -T "
-        elif cmd_exist("lcg-cp") and self.options.command not in ["GFAL"]:
-            self.logger.info("Will use `lcg-cp` command for file transfers")
-            command = "lcg-cp --connect-timeout 20 --verbose -b -D srmv2"
-            if self.options.checksum:
-                command += " --checksum-type %s " % self.options.checksum
-            command += " --sendreceive-timeout "
+        if self.options.maxparallel == None:
+            maxparallel = max(nsubprocess, DEFAULT_MAX_PARALLEL)
         else:
+            maxparallel = int(self.options.maxparallel)
+
+        if maxparallel <= 0 or maxparallel > MAX_PARALLEL:
+            self.logger.info("Inappropriate maximum number of parallel download, must between 0 to %s " % MAX_PARALLEL)
+            return -1
+        if nsubprocess <= 0 or nsubprocess > maxparallel:
+            self.logger.info("Inappropriate number of parallel download, must between 0 to %s " % maxparallel)
+            return -1
+        if self.options.engine not in ENGINES:
+            self.logger.info("Inappropriate transfer engine %s, must be one of %s" % (self.options.engine, sorted(ENGINES)))
+            return -1
+        if self.options.command and self.options.command not in BACKENDS:
+            self.logger.info("Inappropriate transfer command %s, must be one of %s" % (self.options.command, sorted(BACKENDS)))
+            return -1
+        backend = getTransferBackend(self.options.command, self.proxyfilename, self.options.checksum, self.options.waittime, self.logger)
+        if backend is None:
             # This should not happen. If it happens, Site Admin have to install GFAL2 (yum install gfal2-util gfal2-all)
             self.logger.info("%sError%s: Can`t find command `gfal-copy` or `lcg-ls`, Please contact the site administrator." % (colors.RED, colors.NORMAL))
             return [], []
+        self.logger.info("Will use %s for file transfers" % backend.description)
 
-        command += "1800" if self.options.waittime == None else str(1800 + int(self.options.waittime))
+        journal = TransferJournal(self.options.journal) if self.options.journal else None
+        if self.options.resume and journal is None:
+            self.logger.info("No transfer journal given, --resume is ignored")
+        ## The verification pool forks, so it is created before the transfer workers.
+        verifier = VerificationPool() if self.options.verify else None
 
-        # timeout = 20 + 240 + 60 #giving 1 extra minute: 5min20"
-        srmtimeout = 900 # default transfer timeout in case the file size is unknown: 15min
-        minsrmtimeout = 60 # timeout cannot be less then 1min
-        downspeed = float(250*1024) # default speed assumes a download of 250KB/s
-        mindownspeed = 20*1024.
+        successfiles, failedfiles = {}, {}
+        tocopy = dicttocopy
+        try:
+            for attempt in range(1 + (VERIFY_RETRIES if verifier else 0)):
+                if attempt:
+                    self.logger.info("Retrying the %s files that failed the checksum verification" % len(tocopy))
+                roundsuccess, roundfailed, keybInt = self.copyFiles(tocopy, nsubprocess, maxparallel, backend, journal, verifier, \
+                                                                    resume = self.options.resume and attempt == 0)
+                if keybInt:
+                    ## if ctrl-C was hit we wont find anything interesting in the subprocesses out
+                    ## that means that successfiles and failedfiles will not be dict as normally expected
+                    return [], []
+                successfiles.update(roundsuccess.items())
+                failedfiles.update(roundfailed.items())
+                for fileid in roundsuccess.keys():
+                    failedfiles.pop(fileid, None)
+                if verifier is None:
+                    break
+                tocopy = self.checkVerification(verifier.wait(), successfiles, failedfiles, journal)
+                if not tocopy:
+                    break
+        finally:
+            if verifier:
+                verifier.close()
+            if journal:
+                journal.close()
 
-        manager = Manager()
-        successfiles = manager.dict()
-        failedfiles = manager.dict()
+        if len(successfiles) == 0:
+            self.logger.info("No file retrieved")
+        elif len(failedfiles) != 0:
+            self.logger.info(colors.GREEN+"Number of files successfully retrieved: %s" % len(successfiles)+colors.NORMAL)
+            self.logger.info(colors.RED+"Number of files failed to be retrieved: %s" % len(failedfiles)+colors.NORMAL)
+            #self.logger.debug("List of failed file and reason: %s" % failedfiles)
+        else:
+            self.logger.info("%sSuccess%s: All files successfully retrieved" % (colors.GREEN,colors.NORMAL))
 
+        return successfiles , failedfiles
 
-        self.logger.debug("Starting ChildProcess with %s ChildProcess" % nsubprocess)
-        inputq, processarray = self.startchildproc(self.processWorker, nsubprocess, successfiles, failedfiles)
+    def copyFiles(self, dicttocopy, nsubprocess, maxparallel, backend, journal, verifier, resume):
+        """
+        Start the transfer workers, queue the files that are not retrieved yet and wait for the copies.
+        The successful copies are sent to the verifier, if any.
+        Return the dictionaries of the successful and failed files, and whether ctrl-C has been hit.
+        """
+        ## With threads the workers share one controller, which limits the copies in flight.
+        ## Each process gets its own copy of the controller, only used to measure the speed.
+        if ENGINES[self.options.engine].inProcess:
+            nworkers = maxparallel
+            controller = AdaptiveConcurrency(nsubprocess, maxparallel)
+        else:
+            nworkers = nsubprocess
+            controller = AdaptiveConcurrency(nsubprocess, nsubprocess)
+
+        engine = getTransferEngine(self.options.engine, nworkers)
+        successfiles = engine.newResultDict()
+        failedfiles = engine.newResultDict()
+
+        self.logger.debug("Starting %s transfer workers using the %s engine" % (nworkers, engine.name))
+        ## Threads can log through the command logger and submit the verifications as soon as
+        ## the copies are done, processes set up their own logger and the verifications are
+        ## submitted at the end.
+        workerlogger = self.logger if engine.inProcess else None
+        workerverifier = verifier if engine.inProcess else None
+        engine.start(self.processWorker, (successfiles, failedfiles, workerlogger, controller, backend, journal, workerverifier))
+
+        ## dicttocopy can be a generator which lists the files while the first ones are copied:
+        ## the workers must be stopped also if it fails.
+        try:
+            resumed, queued = self.queueFiles(engine, dicttocopy, journal, verifier, resume)
+        except Exception:
+            engine.stop()
+            raise
 
-        for myfile in dicttocopy:
-            if downspeed < mindownspeed:
-                downspeed = mindownspeed
+        if resumed:
+            self.logger.info("Skipping %s files already retrieved according to the transfer journal" % resumed)
+        self.logger.info("Please wait")
 
+        keybInt = engine.stop()
+        if keybInt:
+            self.logger.info("Master process keyboard interrupted while waiting")
+        if engine.inProcess:
+            self.logger.debug("Parallel downloads: %s at the end, %s at most. Measured download speed: %.0f B/s" \
+                              % (controller.limit, controller.maxlimit, controller.speed()))
+
+        if engine.inProcess:
+            if keybInt or failedfiles:
+                self.logger.info("For more details about the errors please open the logfile")
+        else:
+            self.saveSubprocessesOut(failedfiles, keybInt)
+            ## Read the records written by the worker processes.
+            if journal:
+                journal.load()
+            if verifier and not keybInt:
+                for fileid in successfiles.keys():
+                    self.submitVerification(verifier, *queued[fileid])
+
+        return successfiles, failedfiles, keybInt
+
+    def queueFiles(self, engine, dicttocopy, journal, verifier, resume):
+        """
+        Put in the engine queue the files that are not retrieved yet.
+        Return the number of files skipped thanks to the journal, and the queued files
+        that are verified at the end (only with the process engine). With a verifier, the
+        files already retrieved (according to the journal or on disk) but not verified yet
+        are sent to it, without being copied again.
+        """
+        resumed = 0
+        queued = {}
+        for myfile in dicttocopy:
             fileid = myfile['pfn'].split('/')[-1]
 
             dirpath = os.path.join(self.options.destination, myfile['suffix'] if 'suffix' in myfile else '')
             url_input = bool(re.match("^[a-z]+://", dirpath))
+            localFilename = os.path.join(dirpath,  str(fileid))
+
+            ##### Files already retrieved according to the journal: no need to look at the disk
+            if resume and journal and journal.isDone(myfile['pfn'], localFilename, myfile.get('size')):
+                resumed += 1
+                ## E.g. copied just before the client was stopped: verify it, without copying it again.
+                if verifier and not journal.isDone(myfile['pfn'], localFilename, myfile.get('size'), verified = True):
+                    self.logger.debug("Verifying %s as it is recorded as retrieved, but not verified, in the transfer journal" % fileid)
+                    self.submitVerification(verifier, myfile, localFilename)
+                else:
+                    self.logger.debug("Skipping %s as it is recorded as retrieved in the transfer journal" % fileid)
+                continue
+
             if not url_input and not os.path.isdir(dirpath):
                 os.makedirs(dirpath)
-            localFilename = os.path.join(dirpath,  str(fileid))
 
             ##### Handling the "already existing file" use case
             if not url_input and os.path.isfile(localFilename):
@@ -137,81 +292,71 @@ class remote_copy(SubCommand):
             # if the file still exists skip it
             if not url_input and os.path.isfile(localFilename):
                 self.logger.info("Skipping %s as file already exists in %s" % (fileid, localFilename))
+                if journal and not journal.isDone(myfile['pfn'], localFilename, myfile.get('size')):
+                    journal.record(myfile['pfn'], localFilename, DONE, myfile.get('size'), catalogAdler32(myfile), attempted = False)
+                if verifier and not (journal and journal.isDone(myfile['pfn'], localFilename, myfile.get('size'), verified = True)):
+                    self.submitVerification(verifier, myfile, localFilename)
                 continue
 
-            ##### Creating the command
-            # timeout based on file size and download speed * 2
-            maxtime = srmtimeout if not 'size' in myfile or myfile['size'] == 0 else int(ceil(2*myfile['size']/downspeed))
-            localsrmtimeout = minsrmtimeout if maxtime < minsrmtimeout else maxtime # do not want a too short timeout
-
-            timeout = " --srm-timeout "
-            if cmd_exist("gfal-copy") and self.options.command not in ["LCG"]:
-                timeout = " -t "
-            cmd = '%s %s %s %%s' % (command, timeout + str(localsrmtimeout) + ' ', myfile['pfn'])
-            if url_input:
-                cmd = cmd % localFilename
-            else:
-                cmd = cmd % ("file://%s" % localFilename)
+            ##### The timeout is set by the worker, when the download speed is known better
+            destination = localFilename if url_input else "file://%s" % localFilename
 
             self.logger.info("Placing file '%s' in retrieval queue " % fileid)
-            inputq.put((myfile, cmd))
-
-        self.logger.info("Please wait")
+            engine.put((myfile, destination))
+            if verifier and not engine.inProcess:
+                queued[fileid] = (myfile, localFilename)
 
-        keybInt = self.stopchildproc(inputq, processarray, nsubprocess)
+        return resumed, queued
 
-        self.saveSubprocessesOut(failedfiles, keybInt)
-
-        if keybInt:
-            ## if ctrl-C was hit we wont find anything interesting in the subprocesses out
-            ## that means that successfiles and failedfiles will not be dict as normally expected
-            return [], []
-        elif len(successfiles) == 0:
-            self.logger.info("No file retrieved")
-        elif len(failedfiles) != 0:
-            self.logger.info(colors.GREEN+"Number of files successfully retrieved: %s" % len(successfiles)+colors.NORMAL)
-            self.logger.info(colors.RED+"Number of files failed to be retrieved: %s" % len(failedfiles)+colors.NORMAL)
-            #self.logger.debug("List of failed file and reason: %s" % failedfiles)
-        else:
-            self.logger.info("%sSuccess%s: All files successfully retrieved" % (colors.GREEN,colors.NORMAL))
-
-        return successfiles , failedfiles
-
-    def startchildproc(self, childprocess, nsubprocess, successfiles, failedfiles):
+    def submitVerification(self, verifier, myfile, localFilename):
         """
-        starting sub process and creating the queue
+        Queue the verification of a retrieved file, if it is local and its checksum is known.
         """
-        inputq  = multiprocessing.Queue()
-        subprocessarray = []
-
-        for i in xrange(nsubprocess):
-            p = multiprocessing.Process(target = childprocess, args = (inputq, successfiles, failedfiles))
-            subprocessarray.append(p)
-            subprocessarray[i].start()
-
-        return inputq, subprocessarray
-
+        expected = catalogAdler32(myfile)
+        if expected and not re.match("^[a-z]+://", localFilename):
+            verifier.submit(myfile['pfn'].split('/')[-1], localFilename, expected, myfile)
 
-    def stopchildproc(self, inputq, processarray, nsubprocess):
-        """ Simply sending a STOP message to the sub process
-            Return True if ctrl-C has been hit
+    def checkVerification(self, results, successfiles, failedfiles, journal):
         """
-        result = False #using variable instead of direct return to make pylint happy. See W0150
-        self.logger.debug("stopchildproc() method has been called")
-        try:
-            for _ in range(nsubprocess):
-                inputq.put(('-1', 'STOP'))
-        #except Exception, ex:
-        #   pass
-        finally:
-            # giving the time to the sub-process to exit
-            for process in processarray:
-                try:
-                    process.join()
-                except KeyboardInterrupt:
-                    self.logger.info("Master process keyboard interrupted while waiting")
-                    result = True
-        return result
+        Record the results of the checksum verifications. The files with a wrong checksum
+        are removed and moved from successfiles to failedfiles.
+        Return the list of files to copy again.
+        """
+        toretry = []
+        for fileid, result in results.iteritems():
+            myfile = result['payload']
+            if result['ok']:
+                self.logger.debug("Checksum of %s verified: %s" % (fileid, result['adler32']))
+                if journal:
+                    journal.record(myfile['pfn'], result['path'], DONE, myfile.get('size'), result['expected'], attempted = False, verified = True)
+                continue
+            if result['error']:
+                msg = "Cannot compute the checksum: %s" % result['error']
+            else:
+                msg = "Checksum mismatch: local %s, expected %s" % (result['adler32'], result['expected'])
+            self.logger.info("%sWarning%s: Verification of %s failed. %s" % (colors.RED, colors.NORMAL, fileid, msg))
+            try:
+                os.remove(result['path'])
+            except OSError as ex:
+                self.logger.debug("%sWarning%s: Cannot remove the file because of: %s" % (colors.RED, colors.NORMAL, ex))
+            successfiles.pop(fileid, None)
+            failedfiles[fileid] = msg
+            if journal:
+                journal.record(myfile['pfn'], result['path'], FAILED, myfile.get('size'), result['expected'], attempted = False)
+            toretry.append(myfile)
+        if results:
+            self.logger.info("Checksum verified for %s files, %s failed" % (len(results) - len(toretry), len(toretry)))
+        return toretry
+
+    def transferTimeout(self, myfile, downspeed):
+        """
+        Timeout of the copy of a file, based on its size and the download speed * 2.
+        """
+        # timeout = 20 + 240 + 60 #giving 1 extra minute: 5min20"
+        srmtimeout = 900 # default transfer timeout in case the file size is unknown: 15min
+        minsrmtimeout = 60 # timeout cannot be less then 1min
+        maxtime = srmtimeout if not 'size' in myfile or myfile['size'] == 0 else int(ceil(2*myfile['size']/downspeed))
+        return minsrmtimeout if maxtime < minsrmtimeout else maxtime # do not want a too short timeout
 
     def saveSubprocessesOut(self, failedfiles, keybInt):
         """ Get the logfile produced by the subprocesses and put it into
@@ -255,15 +400,22 @@ class remote_copy(SubCommand):
         return logger
 
 
-    def processWorker(self, input_, successfiles, failedfiles):
+    def processWorker(self, input_, successfiles, failedfiles, logger, controller, backend, journal, verifier):
         """
         _processWorker_
 
-        Runs a subprocessed command.
+        Copies the files from the input queue with the transfer backend.
+        The logger is given when running in a thread, otherwise a dedicated one is set up.
+        The controller limits the copies in flight and measures the download speed.
+        Backends supporting bulk copies get the files already waiting in the queue
+        together, up to backend.bulkSize. The results are recorded in the journal, if any,
+        and the successful copies are sent to the verifier, if any.
         """
-        logger = self.setSubprocessLog()
+        if logger is None:
+            logger = self.setSubprocessLog()
+        stop = False
         # Get this started
-        while True:
+        while not stop:
             try:
                 myfile, work = input_.get()
             except (EOFError, IOError):
@@ -274,62 +426,106 @@ class remote_copy(SubCommand):
 
             if work == 'STOP':
                 break
-            else:
+            batch = [(myfile, work)]
+            while len(batch) < backend.bulkSize:
+                try:
+                    myfile, work = input_.get_nowait()
+                except Queue.Empty:
+                    break
+                except (EOFError, IOError):
+                    stop = True
+                    break
+                if work == 'STOP':
+                    ## This is the STOP message for this worker: copy what we have and exit.
+                    stop = True
+                    break
+                batch.append((myfile, work))
+
+            localFilenames = []
+            for myfile, work in batch:
                 fileid = myfile['pfn'].split('/')[-1]
                 dirpath = os.path.join(self.options.destination, myfile['suffix'] if 'suffix' in myfile else '')
                 url_input = bool(re.match("^[a-z]+://", dirpath))
                 if not os.path.isdir(dirpath) and not url_input:
                     os.makedirs(dirpath)
-                localFilename = os.path.join(dirpath,  str(fileid))
-                command = work
-
-            logger.info("Retrieving %s " % fileid)
-            logger.debug("Executing %s" % command)
-            pipe = subprocess.Popen(command, stdout = subprocess.PIPE,
-                                     stderr = subprocess.PIPE, shell = True)
+                localFilenames.append(os.path.join(dirpath,  str(fileid)))
+            timeout = max(self.transferTimeout(myfile, controller.speed()) for myfile, _ in batch)
+
+            controller.acquire()
+            for myfile, _ in batch:
+                logger.info("Retrieving %s " % myfile['pfn'].split('/')[-1])
+            starttime = time.time()
+            success = False
+            ## Always give back the slot taken above, or the other workers would wait for it forever.
             try:
-                stdout, stderr = pipe.communicate()
-            except KeyboardInterrupt:
-                logger.info("Subprocess exit due to keyboard interrupt")
-                break
-            error = simpleOutputCheck(stderr)
-
-            logger.debug("Finish executing for file %s" % fileid)
-
-            if pipe.returncode != 0 or len(error) > 0:
-                logger.info("%sWarning%s: Failed retrieving %s" % (colors.RED, colors.NORMAL, fileid))
-                #logger.debug(colors.RED +"Stderr: %s " %stderr+ colors.NORMAL)
-                for x in error:
-                    logger.info(colors.RED +"\t %s" % x + colors.NORMAL)
-                failedfiles[fileid] = str(error)
-                logger.debug("Full stderr follows:\n%s" % stderr)
-
-                if "timed out" in stderr or "timed out" in stdout:
-                    logger.info("%sWarning%s: Failed due to connection timeout" % (colors.RED, colors.NORMAL ))
-                    logger.info("Please use the '--wait=<#seconds>' option to increase the connection timeout")
-
-                if "checksum" in stderr:
-                    logger.info("%sWarning%s: as of 3.3.1510 CRAB3 is using an option to validate the checksum with lcg-cp/gfal-cp commands."
-                                " You might get false positives since for some site this is not working."
-                                " In that case please use the option --checksum=no"% (colors.RED, colors.NORMAL ))
-
-                if os.path.isfile(localFilename) and os.path.getsize(localFilename) != myfile['size']:
-                    logger.debug("File %s has the wrong size, deleting it" % fileid)
-                    try:
-                        os.remove(localFilename)
-                    except OSError as ex:
-                        logger.debug("%sWarning%s: Cannot remove the file because of: %s" % (colors.RED, colors.NORMAL, ex))
+                try:
+                    results = backend.copy([(myfile['pfn'], work) for myfile, work in batch], timeout, logger)
+                    errors = [simpleOutputCheck(stderr) for _, _, stderr in results]
+                except KeyboardInterrupt:
+                    logger.info("Subprocess exit due to keyboard interrupt")
+                    break
+                except Exception as ex:
+                    ## The backend itself failed (e.g. the copy command could not be started): the whole batch failed.
+                    message = "%s: %s" % (ex.__class__.__name__, ex)
+                    logger.debug("The transfer backend failed:\n%s" % traceback.format_exc())
+                    results = [(1, '', message)] * len(batch)
+                    errors = [[message]] * len(batch)
+                success = all(returncode == 0 and len(error) == 0 for (returncode, _, _), error in zip(results, errors))
+            finally:
+                controller.release(sum(myfile.get('size', 0) for myfile, _ in batch), time.time() - starttime, success)
+
+            for (myfile, _), localFilename, (returncode, stdout, stderr), error in zip(batch, localFilenames, results, errors):
+                transferred = self.checkTransfer(logger, myfile, localFilename, returncode, stdout, stderr, error, successfiles, failedfiles)
+                if journal:
+                    journal.record(myfile['pfn'], localFilename, DONE if transferred else FAILED, myfile.get('size'), catalogAdler32(myfile))
+                if transferred and verifier:
+                    self.submitVerification(verifier, myfile, localFilename)
+            if not success:
                 try:
                     time.sleep(60)
                 except KeyboardInterrupt:
                     logger.info("Subprocess exit due to keyboard interrupt")
                     break
-            else:
-                logger.info("%sSuccess%s: Success in retrieving %s " % (colors.GREEN, colors.NORMAL, fileid))
-                successfiles[fileid] = 'Successfully retrieved'
         return
 
 
+    def checkTransfer(self, logger, myfile, localFilename, returncode, stdout, stderr, error, successfiles, failedfiles):
+        """
+        Log the result of the copy of a file and record it in successfiles or failedfiles.
+        Return True if the copy succeeded.
+        """
+        fileid = myfile['pfn'].split('/')[-1]
+        logger.debug("Finish executing for file %s" % fileid)
+
+        if returncode != 0 or len(error) > 0:
+            logger.info("%sWarning%s: Failed retrieving %s" % (colors.RED, colors.NORMAL, fileid))
+            #logger.debug(colors.RED +"Stderr: %s " %stderr+ colors.NORMAL)
+            for x in error:
+                logger.info(colors.RED +"\t %s" % x + colors.NORMAL)
+            failedfiles[fileid] = str(error)
+            logger.debug("Full stderr follows:\n%s" % stderr)
+
+            if "timed out" in stderr or "timed out" in stdout:
+                logger.info("%sWarning%s: Failed due to connection timeout" % (colors.RED, colors.NORMAL ))
+                logger.info("Please use the '--wait=<#seconds>' option to increase the connection timeout")
+
+            if "checksum" in stderr:
+                logger.info("%sWarning%s: as of 3.3.1510 CRAB3 is using an option to validate the checksum with lcg-cp/gfal-cp commands."
+                            " You might get false positives since for some site this is not working."
+                            " In that case please use the option --checksum=no"% (colors.RED, colors.NORMAL ))
+
+            if os.path.isfile(localFilename) and os.path.getsize(localFilename) != myfile['size']:
+                logger.debug("File %s has the wrong size, deleting it" % fileid)
+                try:
+                    os.remove(localFilename)
+                except OSError as ex:
+                    logger.debug("%sWarning%s: Cannot remove the file because of: %s" % (colors.RED, colors.NORMAL, ex))
+            return False
+        logger.info("%sSuccess%s: Success in retrieving %s " % (colors.GREEN, colors.NORMAL, fileid))
+        successfiles[fileid] = 'Successfully retrieved'
+        return True
+
+
 def simpleOutputCheck(outlines):
     """
     paree line by line the outlines text lookng for Exceptions
@@ -2,28 +2,36 @@ from __future__ import print_function, division
 
 import os
 import json
+import shutil
+import logging
 import tempfile
-import pycurl
-import StringIO
 import tarfile
 
-import CRABClient.Emulator
-
 from ast import literal_eval
 
 from WMCore.DataStructs.LumiList import LumiList
 from WMCore.Services.DBS.DBSReader import DBSReader
-from WMCore.Services.pycurl_manager import ResponseHeader
 
 from CRABClient import __version__
 from CRABClient.ClientUtilities import colors
 from CRABClient.Commands.SubCommand import SubCommand
+from CRABClient.Commands.status2 import status2
 from CRABClient.JobType.BasicJobType import BasicJobType
-from CRABClient.UserUtilities import getMutedStatusInfo
+from CRABClient.TaskRow import TaskRow
+from CRABClient.DependencyGraph import DependencyGraph
+from CRABClient.UserUtilities import getFileFromURL
 from CRABClient.ClientExceptions import RESTCommunicationException, ConfigurationException, \
     UnknownOptionException, ClientException
 
-from ServerUtilities import FEEDBACKMAIL, getColumn
+from ServerUtilities import FEEDBACKMAIL
+
+## The number of requests done at the same time to collect the report information.
+REPORT_PARALLEL = 8
+## The columns of the task database needed to retrieve the files in the webdir.
+REPORT_TASK_COLUMNS = ['tm_user_webdir', 'tm_publication', 'tm_input_dataset']
+## The files of the webdir with the lumis of the input dataset: (step, file name, description).
+INPUT_DATASET_FILES = [('inputDatasetLumis', 'input_dataset_lumis.json', 'input dataset lumis'),
+                       ('inputDatasetDuplicateLumis', 'input_dataset_duplicate_lumis.json', 'input dataset duplicate lumis')]
 
 class report2(SubCommand):
     """
@@ -280,21 +288,54 @@ class report2(SubCommand):
     def collectReportData(self):
         """
         Gather information from the server, status2, DBS and files in the webdir that is needed for the report.
+
+        The requests are done concurrently, each one as soon as what it needs is known:
+            report (REST)          status2 (REST + status_cache)          task (REST, a few columns)
+                 |                                                        /      |       \
+                 |                                      run_and_lumis.tar.gz  input_dataset_lumis.json  input_dataset_duplicate_lumis.json
+                  \______________________ publication _________________/
+                                               |
+                                  one DBS query per output dataset
+        so the report takes about the time of the slowest chain instead of the sum of all the requests.
         """
         reportData = {}
+        taskname = self.cachedinfo['RequestName']
 
-        serverFactory = CRABClient.Emulator.getEmulator('rest')
-        server = serverFactory(self.serverurl, self.proxyfilename, self.proxyfilename, version=__version__)
-
-        self.logger.debug('Looking up report for task %s' % self.cachedinfo['RequestName'])
+        self.logger.debug('Looking up report for task %s' % taskname)
+        self.logger.info("Running crab status2 to fetch necessary information.")
 
+        tmpdir = tempfile.mkdtemp()
+        graph = DependencyGraph(REPORT_PARALLEL)
         # Query server for information from the taskdb, intput/output file metadata from metadatadb
-        dictresult, status, reason = server.get(self.uri, data = {'workflow': self.cachedinfo['RequestName'], 'subresource': 'report2'})
+        graph.add('report', lambda results: self.getReport(taskname))
+        # Get job statuses
+        graph.add('status', lambda results: self.getMutedStatus())
+        # The columns of the task needed to find the files in the webdir, without waiting for status2
+        graph.add('task', lambda results: self.getTaskInfo(taskname))
+        graph.add('lumisToProcess', lambda results: \
+                  self.getLumisToProcess(results['task'].get('tm_user_webdir'), None, taskname, tmpdir), ['task'])
+        for key, filename, description in INPUT_DATASET_FILES:
+            graph.add(key, lambda results, filename = filename, description = description: \
+                      self.getInputDatasetFile(results['task'], filename, description, tmpdir), ['task'])
+        def publication(results):
+            ## The DBS queries can only be added once the output datasets are known.
+            outputDatasets = results['report']['result'][0]['taskDBInfo']['outputDatasets']
+            if results['task'].getBool('tm_publication', False):
+                for outputDataset in outputDatasets:
+                    graph.add('dbs ' + outputDataset, lambda results, outputDataset = outputDataset: \
+                              self.getDBSDatasetInfo(outputDataset))
+            return outputDatasets
+        graph.add('publication', publication, ['report', 'task'])
+        try:
+            results = graph.run()
+        finally:
+            shutil.rmtree(tmpdir)
+        self.logger.debug("Time to get the report information: %s" \
+                          % ", ".join("%s %.2f s" % (name, end - start) for name, (start, end) in sorted(graph.timings.iteritems())))
 
+        dictresult = results['report']
         self.logger.debug("Result: %s" % dictresult)
-        self.logger.info("Running crab status2 first to fetch necessary information.")
-        # Get job statuses
-        crabDBInfo, shortResult = getMutedStatusInfo(self.logger)
+        crabDBInfo, shortResult = results['status']
 
         if not shortResult:
             # No point in continuing if the job list is empty.
@@ -315,23 +356,55 @@ class report2(SubCommand):
             if jobStatusDict.get(jobId) in ['finished']:
                 reportData['runsAndLumis'][jobId] = dictresult['result'][0]['runsAndLumis'][jobId]
 
-        reportData['publication'] = True if getColumn(crabDBInfo, 'tm_publication') == "T" else False
-        userWebDirURL = getColumn(crabDBInfo, 'tm_user_webdir')
+        task = TaskRow.fromResult(crabDBInfo)
+        reportData['publication'] = task.getBool('tm_publication', False)
         numJobs = len(shortResult['jobList'])
 
-        reportData['lumisToProcess'] = self.getLumisToProcess(userWebDirURL, numJobs, self.cachedinfo['RequestName'])
-        reportData['inputDataset'] = getColumn(crabDBInfo, 'tm_input_dataset')
+        reportData['lumisToProcess'] = results['lumisToProcess']['lumisToProcess']
+        if results['lumisToProcess']['retrieved']:
+            for jobid in xrange(1, numJobs+1):
+                if str(jobid) not in reportData['lumisToProcess']:
+                    self.logger.warning("File job_lumis_%d.json not found in run_and_lumis.tar.gz for task %s" % (jobid, taskname))
+        reportData['inputDataset'] = task.get('tm_input_dataset')
 
-        inputDatasetInfo = self.getInputDatasetLumis(reportData['inputDataset'], userWebDirURL)['inputDataset']
-        reportData['inputDatasetLumis'] = inputDatasetInfo['lumis']
-        reportData['inputDatasetDuplicateLumis'] = inputDatasetInfo['duplicateLumis']
-        reportData['outputDatasets'] = dictresult['result'][0]['taskDBInfo']['outputDatasets']
+        reportData['inputDatasetLumis'] = results['inputDatasetLumis']
+        reportData['inputDatasetDuplicateLumis'] = results['inputDatasetDuplicateLumis']
+        reportData['outputDatasets'] = results['publication']
 
         if reportData['publication']:
-            reportData['outputDatasetsInfo'] = self.getDBSPublicationInfo(reportData['outputDatasets'])
+            reportData['outputDatasetsInfo'] = {'outputDatasets': dict((outputDataset, results['dbs ' + outputDataset]) \
+                                                                       for outputDataset in reportData['outputDatasets'])}
 
         return reportData
 
+    def getReport(self, taskname):
+        """
+        The report2 subresource: the task information and the metadata of the files of the jobs.
+        """
+        server = self.restClass(self.serverurl, self.proxyfilename, self.proxyfilename, version=__version__)
+        dictresult, _, _ = server.get(self.uri, data = {'workflow': taskname, 'subresource': 'report2'})
+        return dictresult
+
+    def getTaskInfo(self, taskname):
+        """
+        The columns of the task database needed to look for the files in the webdir.
+        """
+        search = self.searchTasks([taskname], REPORT_TASK_COLUMNS)
+        if taskname not in search.results:
+            raise RESTCommunicationException("Cannot retrieve the information of task %s from the server: %s" \
+                                             % (taskname, search.errors.get(taskname)))
+        return search.results[taskname]
+
+    def getMutedStatus(self):
+        """
+        Same as UserUtilities.getMutedStatusInfo, but status2 logs to the log file only (through a
+        logger which is not the console one) instead of muting the console, which would also mute
+        the messages of the other requests running at the same time.
+        """
+        mutedLogger = logging.getLogger('CRAB3.report2.status2')
+        mutedLogger.logfile = self.logger.logfile
+        return status2(mutedLogger)()
+
     def compactLumis(self, datasetInfo):
         """ Help function that allow to convert from runLumis divided per file (result of listDatasetFileDetails)
             to an aggregated result.
@@ -342,93 +415,87 @@ class report2(SubCommand):
                 lumilist.setdefault(str(run), []).extend(lumis)
         return lumilist
 
-    def getLumisToProcess(self, userWebDirURL, numJobs, workflow):
+    def getWebdirFile(self, url, filename):
+        """
+        Retrieve a file from the webdir of the task. Return False if the server answered
+        with an error (e.g. the file does not exist), raise ClientException if it can not be contacted.
+        """
+        try:
+            getFileFromURL(url, filename, self.proxyfilename)
+        except ClientException as ex:
+            if hasattr(ex, 'status'):
+                self.logger.debug("Cannot retrieve %s: HTTP status code %s" % (url, ex.status))
+                return False
+            raise ClientException(("Failed to contact Grid scheduler when getting URL %s. "
+                                   "This might be a temporary error, please retry later and "
+                                   "contact %s if the error persist. Error: %s"
+                                   % (url, FEEDBACKMAIL, str(ex))))
+        return True
+
+    def getLumisToProcess(self, userWebDirURL, numJobs, workflow, tmpdir = None):
         """
         What each job was requested to process
 
-        Get the lumis to process by each job in the workflow.
+        Get the lumis to process by each job in the workflow (by all the jobs in
+        run_and_lumis.tar.gz if numJobs is None). 'retrieved' tells whether the
+        tarball could be retrieved.
         """
         res = {}
         res['lumisToProcess'] = {}
+        res['retrieved'] = False
         if userWebDirURL:
-            curl = self.prepareCurl()
-            fp = tempfile.NamedTemporaryFile()
-            curl.setopt(pycurl.WRITEFUNCTION, fp.write)
-            hbuf = StringIO.StringIO()
-            curl.setopt(pycurl.HEADERFUNCTION, hbuf.write)
+            fd, filename = tempfile.mkstemp(dir = tmpdir)
+            os.close(fd)
             try:
                 url = userWebDirURL + "/run_and_lumis.tar.gz"
-                curl.setopt(pycurl.URL, url)
-                self.myPerform(curl, url)
-                header = ResponseHeader(hbuf.getvalue())
-                if header.status == 200:
-                    fp.seek(0)
-                    tarball = tarfile.open(fp.name)
+                if self.getWebdirFile(url, filename):
+                    res['retrieved'] = True
+                    tarball = tarfile.open(filename)
                     try:
-                        for jobid in xrange(1, numJobs+1):
-                            filename = "job_lumis_%d.json" % (jobid)
+                        if numJobs is None:
+                            members = [(name[len('job_lumis_'):-len('.json')], name) for name in tarball.getnames() \
+                                       if name.startswith('job_lumis_') and name.endswith('.json')]
+                        else:
+                            members = [(str(jobid), "job_lumis_%d.json" % (jobid)) for jobid in xrange(1, numJobs+1)]
+                        for jobid, name in members:
                             try:
-                                member = tarball.getmember(filename)
+                                member = tarball.getmember(name)
                             except KeyError:
-                                self.logger.warning("File %s not found in run_and_lumis.tar.gz for task %s" % (filename, workflow))
+                                self.logger.warning("File %s not found in run_and_lumis.tar.gz for task %s" % (name, workflow))
                             else:
                                 fd = tarball.extractfile(member)
                                 try:
-                                    res['lumisToProcess'][str(jobid)] = json.load(fd)
+                                    res['lumisToProcess'][jobid] = json.load(fd)
                                 finally:
                                     fd.close()
                     finally:
                         tarball.close()
             finally:
-                fp.close()
-                hbuf.close()
+                if os.path.isfile(filename):
+                    os.remove(filename)
         return res
 
-    def getInputDatasetLumis(self, inputDataset, userWebDirURL):
+    def getInputDatasetFile(self, task, filename, description, tmpdir = None):
         """
         What the input dataset had in DBS when the task was submitted
 
-        Get the lumis (and the lumis split across files) in the input dataset. Files
-        containing this information were created at data discovery time and then
-        copied to the schedd.
+        Get one of the files with the lumis (or the lumis split across files) in the input
+        dataset. These files were created at data discovery time and then copied to the schedd.
         """
-        res = {}
-        res['inputDataset'] = {'lumis': {}, 'duplicateLumis': {}}
-        if inputDataset and userWebDirURL:
-            curl = self.prepareCurl()
-            fp = tempfile.TemporaryFile()
-            curl.setopt(pycurl.WRITEFUNCTION, fp.write)
-            hbuf = StringIO.StringIO()
-            curl.setopt(pycurl.HEADERFUNCTION, hbuf.write)
-            try:
-                ## Retrieve the lumis in the input dataset.
-                url = userWebDirURL + "/input_dataset_lumis.json"
-                curl.setopt(pycurl.URL, url)
-                self.myPerform(curl, url)
-                header = ResponseHeader(hbuf.getvalue())
-                if header.status == 200:
-                    fp.seek(0)
-                    res['inputDataset']['lumis'] = json.load(fp)
-                else:
-                    self.logger.error("Failed to retrieve input dataset lumis.")
-                ## Clean temp file and buffer.
-                fp.seek(0)
-                fp.truncate(0)
-                hbuf.truncate(0)
-                ## Retrieve the lumis split across files in the input dataset.
-                url = userWebDirURL + "/input_dataset_duplicate_lumis.json"
-                curl.setopt(pycurl.URL, url)
-                self.myPerform(curl, url)
-                header = ResponseHeader(hbuf.getvalue())
-                if header.status == 200:
-                    fp.seek(0)
-                    res['inputDataset']['duplicateLumis'] = json.load(fp)
-                else:
-                    self.logger.error("Failed to retrieve input dataset duplicate lumis.")
-            finally:
-                fp.close()
-                hbuf.close()
-        return res
+        inputDataset, userWebDirURL = task.get('tm_input_dataset'), task.get('tm_user_webdir')
+        if not inputDataset or not userWebDirURL:
+            return {}
+        fd, localfile = tempfile.mkstemp(dir = tmpdir)
+        os.close(fd)
+        try:
+            if not self.getWebdirFile(userWebDirURL + "/" + filename, localfile):
+                self.logger.error("Failed to retrieve %s." % (description))
+                return {}
+            with open(localfile) as fd:
+                return json.load(fd)
+        finally:
+            if os.path.isfile(localfile):
+                os.remove(localfile)
 
     def getDBSPublicationInfo(self, outputDatasets):
         """
@@ -438,44 +505,32 @@ class report2(SubCommand):
         """
         res = {}
         res['outputDatasets'] = {}
-
         for outputDataset in outputDatasets:
-            res['outputDatasets'][outputDataset] = {'lumis': {}, 'numEvents': 0}
-            try:
-                dbs = DBSReader("https://cmsweb.cern.ch/dbs/prod/phys03/DBSReader",
-                                cfg_dict = {"cert": self.proxyfilename, "key": self.proxyfilename,
-                                            "logger": self.logger, "pycurl" : True}) #We can only publish here with DBS3
-                outputDatasetDetails = dbs.listDatasetFileDetails(outputDataset)
-            except Exception as ex:
-                msg  = "Failed to retrieve information from DBS for output dataset %s." % (outputDataset)
-                msg += " Exception while contacting DBS: %s" % (str(ex))
-                self.logger.exception(msg)
-            else:
-                outputDatasetLumis = self.compactLumis(outputDatasetDetails)
-                outputDatasetLumis = LumiList(runsAndLumis=outputDatasetLumis).getCompactList()
-                res['outputDatasets'][outputDataset]['lumis'] = outputDatasetLumis
-                for outputFileDetails in outputDatasetDetails.values():
-                    res['outputDatasets'][outputDataset]['numEvents'] += outputFileDetails['NumberOfEvents']
-
+            res['outputDatasets'][outputDataset] = self.getDBSDatasetInfo(outputDataset)
         return res
 
-    def prepareCurl(self):
-        curl = pycurl.Curl()
-        curl.setopt(pycurl.NOSIGNAL, 0)
-        curl.setopt(pycurl.TIMEOUT, 30)
-        curl.setopt(pycurl.CONNECTTIMEOUT, 30)
-        curl.setopt(pycurl.FOLLOWLOCATION, 0)
-        curl.setopt(pycurl.MAXREDIRS, 0)
-        return curl
-
-    def myPerform(self, curl, url):
+    def getDBSDatasetInfo(self, outputDataset):
+        """
+        The lumis and number of events in one published output dataset.
+        """
+        res = {'lumis': {}, 'numEvents': 0}
         try:
-            curl.perform()
-        except pycurl.error as e:
-            raise ClientException(("Failed to contact Grid scheduler when getting URL %s. "
-                             "This might be a temporary error, please retry later and "
-                             "contact %s if the error persist. Error from curl: %s"
-                             % (url, FEEDBACKMAIL, str(e))))
+            dbs = DBSReader("https://cmsweb.cern.ch/dbs/prod/phys03/DBSReader",
+                            cfg_dict = {"cert": self.proxyfilename, "key": self.proxyfilename,
+                                        "logger": self.logger, "pycurl" : True}) #We can only publish here with DBS3
+            outputDatasetDetails = dbs.listDatasetFileDetails(outputDataset)
+        except Exception as ex:
+            msg  = "Failed to retrieve information from DBS for output dataset %s." % (outputDataset)
+            msg += " Exception while contacting DBS: %s" % (str(ex))
+            self.logger.exception(msg)
+        else:
+            outputDatasetLumis = self.compactLumis(outputDatasetDetails)
+            outputDatasetLumis = LumiList(runsAndLumis=outputDatasetLumis).getCompactList()
+            res['lumis'] = outputDatasetLumis
+            for outputFileDetails in outputDatasetDetails.values():
+                res['numEvents'] += outputFileDetails['NumberOfEvents']
+        return res
+
     def setOptions(self):
         """
         __setOptions__
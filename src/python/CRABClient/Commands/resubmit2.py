@@ -8,7 +8,8 @@ import CRABClient.Emulator
 from CRABClient import __version__
 from CRABClient.Commands.SubCommand import SubCommand
 from CRABClient.ClientExceptions import ConfigurationException
-from CRABClient.UserUtilities import getMutedStatusInfo, getColumn
+from CRABClient.TaskRow import TaskRow
+from CRABClient.UserUtilities import getMutedStatusInfo
 from CRABClient.ClientUtilities import validateJobids, checkStatusLoop, colors
 
 class resubmit2(SubCommand):
@@ -41,7 +42,7 @@ class resubmit2(SubCommand):
             self.logger.info(msg)
             return None
 
-        publicationEnabled = getColumn(crabDBInfo, "tm_publication")
+        publicationEnabled = TaskRow.fromResult(crabDBInfo).get("tm_publication")
         jobsPerStatus = jobList['jobsPerStatus']
 
         if self.options.publication:
@@ -0,0 +1,79 @@
+import re
+
+from CRABClient.Commands.SubCommand import SubCommand
+from CRABClient.ClientUtilities import colors
+from CRABClient.JobType.UserTarball import listSandboxFiles
+from CRABClient.JobType.ScramEnvironment import ScramEnvironment
+from CRABClient.JobType.SandboxEstimator import SandboxEstimate, sandboxLimit, knownSandboxLimit, ESTIMATE_MARGIN, REPORT_TOP, DEFAULT_SANDBOX_LIMIT
+from CRABClient.ClientExceptions import ClientException, ConfigurationException
+
+
+class sandbox_inspect(SubCommand):
+    """
+    Show what the input sandbox of a task submitted with the given CRAB configuration
+    would contain (the biggest files and the size by file type) and its estimated
+    compressed size, without making nor uploading it. Fails if the estimate is above
+    the maximum sandbox size told by the CRAB cache (or given with --limit), as
+    'crab submit' would; only warns against the default limit.
+    The pset files made by 'crab submit' (a few kB) are not included.
+    """
+    name = 'sandbox_inspect'
+    shortnames = ['sandbox-inspect']
+
+    def __call__(self):
+        self.loadConfig(self.options.crabconfig, self.args)
+        scram = ScramEnvironment(logger=self.logger)
+        inputFiles = [re.sub(r'^file:', '', file) for file in getattr(self.configuration.JobType, 'inputFiles', [])]
+        trees = listSandboxFiles(self.configuration, self.logger, scram.getCmsswBase(), inputFiles)
+        estimate = SandboxEstimate(trees)
+        limit = self.options.limit * 1024 * 1024 if self.options.limit else sandboxLimit()
+        self.logger.info(estimate.report(limit, self.options.top))
+
+        returndict = {'files': len(estimate.files), 'size': estimate.totalSize, 'estimatedSize': estimate.estimatedSize,
+                      'limit': limit, 'types': dict((ftype, {'ratio': ratio, 'size': size}) for ftype, (ratio, size) in estimate.types.iteritems())}
+        if estimate.estimatedSize > limit * (1 + ESTIMATE_MARGIN) and (self.options.limit or knownSandboxLimit()):
+            raise ClientException("%sError%s: The input sandbox would be bigger than the maximum allowed size." % (colors.RED, colors.NORMAL))
+        if estimate.estimatedSize > limit:
+            self.logger.info("%sWarning%s: The input sandbox may be bigger than the maximum allowed size." % (colors.RED, colors.NORMAL))
+        else:
+            self.logger.info("%sSuccess%s: The input sandbox is below the maximum allowed size." % (colors.GREEN, colors.NORMAL))
+        return returndict
+
+
+    def setOptions(self):
+        """
+        __setOptions__
+
+        This allows to set specific command options
+        """
+        self.parser.add_option('-c', '--config',
+                               dest = 'crabconfig',
+                               default = None,
+                               help = "CRAB configuration file (default: the first argument, or crabConfig.py).",
+                               metavar = 'FILE')
+        self.parser.add_option('--top',
+                               dest = 'top',
+                               type = 'int',
+                               default = REPORT_TOP,
+                               help = "The number of biggest files to show (default: %s)." % REPORT_TOP)
+        self.parser.add_option('--limit',
+                               dest = 'limit',
+                               type = 'float',
+                               default = None,
+                               help = "The maximum sandbox size, in MB (default: as last told by the CRAB cache,"
+                                      " or %d MB, only warned about, if it did not tell)." % (DEFAULT_SANDBOX_LIMIT // (1024 * 1024)))
+
+
+    def validateOptions(self):
+        SubCommand.validateOptions(self)
+        ## As for 'crab submit', the configuration file can be the first argument.
+        if self.options.crabconfig is None:
+            if len(self.args) and '=' not in self.args[0] and self.args[0][-3:] == '.py':
+                self.options.crabconfig = self.args[0]
+                del self.args[0]
+            else:
+                self.options.crabconfig = 'crabConfig.py'
+        if self.options.top <= 0:
+            raise ConfigurationException("The --top option must be a positive integer.")
+        if self.options.limit is not None and self.options.limit <= 0:
+            raise ConfigurationException("The --limit option must be a positive number.")
@@ -1,17 +1,27 @@
 from __future__ import division # I want floating points
 from __future__ import print_function
 
+import os
 import math
 import json
+import time
 import urllib
-from ast import literal_eval
+import cPickle
+import logging
+from collections import defaultdict
 
 import CRABClient.Emulator
 from CRABClient import __version__
 from CRABClient.ClientUtilities import colors
-from CRABClient.UserUtilities import getFileFromURL
+from CRABClient.TransferEngines import ThreadEngine, STOP_MESSAGE
+from CRABClient.TaskDashboard import findProjectDirs, newRow, aggregate, formatDashboard
+from CRABClient.TaskRow import TaskRow
+from CRABClient.StatusCache import LocalStatusCache
+from CRABClient.JobTable import JobTable, stateSnapshot, stateTransitions, PROBE, JOB, COMPLETING
+from CRABClient.URLFetcher import PersistentURLFetcher, sharedFetcher
+from CRABClient.UserUtilities import getFileFromURLIfModified
 from CRABClient.Commands.SubCommand import SubCommand
-from CRABClient.ClientExceptions import ClientException
+from CRABClient.ClientExceptions import ClientException, ConfigurationException
 
 from ServerUtilities import TASKDBSTATUSES_TMP
 
@@ -23,6 +33,38 @@ PUBLICATION_STATES = {
     'publishing': 'running',
 }
 
+## The DAG statuses as reported in the status_cache.
+DAGMAN_CODES = {1:'SUBMITTED', 2:'SUBMITTED', 3:'SUBMITTED', 4:'SUBMITTED', 5:'COMPLETED', 6:'FAILED'}
+
+## The default number of tasks queried at the same time with --dirs.
+DASHBOARD_PARALLEL = 10
+## The columns of the task database needed by --dirs.
+DASHBOARD_COLUMNS = ['tm_task_status', 'tm_schedd', 'tm_user_webdir']
+
+## Default and minimum polling interval of --watch (seconds). The status_cache is
+## updated on the schedd every few minutes, so polling faster only adds load.
+WATCH_INTERVAL = 60
+MIN_WATCH_INTERVAL = 10
+## In --watch mode, the task information is asked to the CRAB server at most this often (seconds).
+WATCH_TASKINFO_INTERVAL = 300
+## The DAG statuses (see printDAGStatus) after which the task does not change anymore.
+FINAL_DAG_STATUSES = [5, 6]
+## The maximum number of job ids printed for a state transition in --watch mode.
+WATCH_MAX_JOBIDS = 20
+
+
+def expandWatchOption(cmdargs):
+    """
+    Return cmdargs with a '--watch' not followed by a number replaced by
+    '--watch=WATCH_INTERVAL', as optparse has no option with an optional value.
+    """
+    cmdargs = list(cmdargs or [])
+    for i, arg in enumerate(cmdargs):
+        if arg == '--watch' and (i+1 == len(cmdargs) or not str(cmdargs[i+1]).isdigit()):
+            cmdargs[i] = '--watch=%d' % WATCH_INTERVAL
+    return cmdargs
+
+
 class status2(SubCommand):
     """
     Query the status of your tasks, or detailed information of one or more tasks
@@ -31,33 +73,50 @@ class status2(SubCommand):
 
     shortnames = ['st2']
 
+    def __init__(self, logger, cmdargs = None):
+        SubCommand.__init__(self, logger, expandWatchOption(cmdargs))
 
-    def getColumn(self, dictresult, columnName):
-        columnIndex = dictresult['desc']['columns'].index(columnName)
-        value = dictresult['result'][columnIndex]
-        if value=='None':
-            return None
-        else:
-            return value
 
     def __call__(self):
-        # Get all of the columns from the database for a certain task
-        taskname = self.cachedinfo['RequestName']
-        uri = self.getUrl(self.instance, resource = 'task')
+        if self.options.dirs:
+            return self.dashboard()
         serverFactory = CRABClient.Emulator.getEmulator('rest')
         server = serverFactory(self.serverurl, self.proxyfilename, self.proxyfilename, version=__version__)
-        crabDBInfo, _, _ =  server.get(uri, data = {'subresource': 'search', 'workflow': taskname})
+        crabDBInfo, shortResult, statusCacheInfo = self.printStatus(server)
+        if self.options.watch:
+            crabDBInfo, shortResult = self.watch(server, crabDBInfo, shortResult, statusCacheInfo)
+        return crabDBInfo, shortResult
+
+    def searchTask(self, server):
+        """ Get all of the columns from the database for the task.
+        """
+        uri = self.getUrl(self.instance, resource = 'task')
+        crabDBInfo, _, _ =  server.get(uri, data = {'subresource': 'search', 'workflow': self.cachedinfo['RequestName']})
         self.logger.debug("Got information from server oracle database: %s", crabDBInfo)
+        return crabDBInfo
+
+    def statusCacheUrl(self, task):
+        """ The URL of the status_cache file of the task (a TaskRow), or None if the schedd did not report the webdir yet.
+        """
+        webdir = task.get('tm_user_webdir')
+        return webdir + '/' + "status_cache" if webdir else None
+
+    def printStatus(self, server):
+        """ Print the status of the task. Return the information of the task from the database,
+            the result of printShort and the status_cache information (None when not available).
+        """
+        crabDBInfo = self.searchTask(server)
+        task = TaskRow.fromResult(crabDBInfo)
 
-        user = self.getColumn(crabDBInfo, 'tm_username')
-        webdir = self.getColumn(crabDBInfo, 'tm_user_webdir')
-        rootDagId = self.getColumn(crabDBInfo, 'clusterid') #that's the condor id from the TW
+        user = task.get('tm_username')
+        webdir = task.get('tm_user_webdir')
+        rootDagId = task.get('clusterid') #that's the condor id from the TW
 
         #Print information from the database
-        self.printTaskInfo(crabDBInfo, user)
+        self.printTaskInfo(task, user)
         if not rootDagId:
             self.logger.debug("The task has not been submitted to the Grid scheduler yet. Not printing job information.")
-            return crabDBInfo, None
+            return crabDBInfo, None, None
 
         self.logger.debug("The CRAB server submitted your task to the Grid scheduler (cluster ID: %s)" % rootDagId)
 
@@ -66,43 +125,233 @@ class status2(SubCommand):
             # and upload the webdir location to the server
             self.logger.info("Waiting for the Grid scheduler to bootstrap your task")
             self.logger.debug("Schedd has not reported back the webdir (yet)")
-            return crabDBInfo, None
+            return crabDBInfo, None, None
 
         self.logger.debug("Webdir is located at %s", webdir)
         # Download status_cache file
         self.logger.debug("Retrieving 'status_cache' file from webdir")
-        url = webdir + '/' + "status_cache"
+        url = self.statusCacheUrl(task)
+
+        ## The file is kept in the project directory, and it is retrieved (and parsed) again only if it changed.
+        def fetch(url, filename, etag, lastmodified):
+            changed, etag, lastmodified = getFileFromURLIfModified(url, filename, self.proxyfilename, etag, lastmodified)
+            if not changed:
+                self.logger.debug("The 'status_cache' file did not change since the last retrieval")
+            return changed, etag, lastmodified
 
         statusCacheInfo = None
         try:
-            statusCacheFilename = getFileFromURL(url, proxyfilename=self.proxyfilename)
+            statusCacheInfo = LocalStatusCache(self.requestarea).get(url, fetch, self.statusCacheFields())
         except ClientException as ce:
             self.logger.info("Waiting for the Grid scheduler to report back the status of your task")
             self.logger.debug("Cannot retrieve the status_cache file. Maybe the task process has not run yet?")
             self.logger.debug("Got: %s" % ce)
-            return crabDBInfo, None
-        else:
-            with open(statusCacheFilename) as fd:
-                # Skip first line of the file (it contains info for the caching script) and load job_report summary
-                fd.readline()
-                statusCacheInfo = literal_eval(fd.readline())
-            self.logger.debug("Got information from status cache file: %s", statusCacheInfo)
+            return crabDBInfo, None, None
+        self.logger.debug("Got information from status cache file: %s", statusCacheInfo)
 
-        self.printDAGStatus(crabDBInfo, statusCacheInfo)
+        self.printDAGStatus(task, statusCacheInfo)
+        # This record is no longer necessary and makes parsing more difficult.
+        dagStatus = statusCacheInfo.pop('DagStatus', None)
 
-        shortResult = self.printShort(statusCacheInfo)
-        self.printErrors(statusCacheInfo)
+        table = JobTable(statusCacheInfo)
+        shortResult = self.printShort(table)
+        self.printErrors(table)
         if self.options.summary:
-            self.printSummary(statusCacheInfo)
-        if self.options.long or self.options.sort:
-            sortdict = self.printLong(statusCacheInfo, quiet = (not self.options.long))
-            if self.options.sort:
-                self.printSort(sortdict, self.options.sort)
+            self.printSummary(table)
+        if self.options.long:
+            self.printLong(table)
+        if self.options.sort:
+            self.printSort(table, self.options.sort)
         if self.options.json:
             self.logger.info(json.dumps(statusCacheInfo))
 
+        if dagStatus is not None:
+            statusCacheInfo['DagStatus'] = dagStatus
+        return crabDBInfo, shortResult, statusCacheInfo
+
+    def watch(self, server, crabDBInfo, shortResult, statusCacheInfo):
+        """ Poll the status of the task every self.options.watch seconds, and print only what changed:
+            the jobs that changed state and the updated number of jobs per state. Each poll is a
+            conditional request of the status_cache over a kept-alive connection (the file is
+            transferred and parsed only if it changed), and the task information is asked to the
+            CRAB server at most every WATCH_TASKINFO_INTERVAL seconds, so the number of requests
+            does not depend on the size of the task or on how many jobs change.
+            Stop when the DAG of the task is done, or on Ctrl-C.
+        """
+        self.logger.info("\nWatching the task every %d seconds, printing only the changes (Ctrl-C to stop)." % self.options.watch)
+        ## The same fetcher as getFileFromURLIfModified in printStatus, to keep its connection.
+        fetcher = sharedFetcher(self.proxyfilename)
+        cache = LocalStatusCache(self.requestarea)
+        task = TaskRow.fromResult(crabDBInfo)
+        taskStatus = task.get('tm_task_status')
+        taskInfoTime = time.time()
+        previous = {}
+        if statusCacheInfo:
+            previous = stateSnapshot(JobTable(statusCacheInfo))
+        try:
+            while not self.watchDone(statusCacheInfo):
+                time.sleep(self.options.watch)
+                url = self.statusCacheUrl(task)
+                if url is None or time.time() - taskInfoTime >= WATCH_TASKINFO_INTERVAL:
+                    crabDBInfo = self.searchTask(server)
+                    task = TaskRow.fromResult(crabDBInfo)
+                    taskInfoTime = time.time()
+                    if task.get('tm_task_status') != taskStatus:
+                        taskStatus = task.get('tm_task_status')
+                        self.logger.info("\n[%s] Status on the CRAB server:\t%s" % (time.strftime('%H:%M:%S'), taskStatus))
+                    url = self.statusCacheUrl(task)
+                    if url is None:
+                        continue
+                try:
+                    current = cache.get(url, fetcher.fetchIfModified, ['State'], unchanged = statusCacheInfo)
+                except ClientException as ce:
+                    self.logger.debug("Cannot retrieve the status_cache file: %s" % ce)
+                    continue
+                if current is statusCacheInfo:
+                    self.logger.debug("The 'status_cache' file did not change since the last retrieval")
+                    continue
+                statusCacheInfo = current
+                table = JobTable(statusCacheInfo)
+                snapshot = stateSnapshot(table)
+                self.printTransitions(stateTransitions(previous, snapshot), previous, snapshot)
+                previous = snapshot
+                shortResult = {'jobsPerStatus': dict(self.countStates(snapshot)),
+                               'jobList': [(snapshot[jobid], jobid) for jobid in table.jobids]}
+        except KeyboardInterrupt:
+            self.logger.info("")
+        finally:
+            fetcher.close()
         return crabDBInfo, shortResult
 
+    def watchDone(self, statusCacheInfo):
+        """ Whether the task will not change anymore (its DAG is completed or failed).
+        """
+        if not statusCacheInfo or 'DagStatus' not in statusCacheInfo:
+            return False
+        return statusCacheInfo['DagStatus'].get('DagStatus') in FINAL_DAG_STATUSES
+
+    def countStates(self, snapshot):
+        counts = defaultdict(int)
+        for state in snapshot.itervalues():
+            counts[state] += 1
+        return counts
+
+    def printTransitions(self, transitions, previous, current):
+        """ Print the jobs that changed state since the last poll, and the number of jobs per state
+            with the change since the last poll.
+        """
+        if not transitions:
+            return
+        msg = "\n[%s] %d jobs changed state:" % (time.strftime('%H:%M:%S'), sum(len(jobids) for jobids in transitions.itervalues()))
+        for (old, new), jobids in sorted(transitions.iteritems(), key = lambda item: (-len(item[1]), item[0])):
+            if len(jobids) == 1:
+                msg += "\n\tjob %s: %s -> %s" % (jobids[0], old or 'new', self._printState(new, 0))
+            else:
+                shown = ", ".join(jobids[:WATCH_MAX_JOBIDS]) + (", ..." if len(jobids) > WATCH_MAX_JOBIDS else "")
+                msg += "\n\t%d jobs: %s -> %s (%s)" % (len(jobids), old or 'new', self._printState(new, 0), shown)
+        before, after = self.countStates(previous), self.countStates(current)
+        states = []
+        for state in sorted(set(before) | set(after)):
+            delta = after[state] - before[state]
+            states.append("%s %d%s" % (self._printState(state, 0), after[state], " (%+d)" % delta if delta else ""))
+        msg += "\n\tJobs per state: " + ", ".join(states)
+        self.logger.info(msg)
+
+    def dashboard(self):
+        """ Get the status of all the tasks in the directories given with --dirs, and print one
+            table for all of them. The proxy (and delegation) is handled once, the task database
+            rows of the tasks of each CRAB server are retrieved together (see searchTasks), and
+            the status_cache files are retrieved by up to --parallel threads at the same time.
+        """
+        self.logger.info("Getting the status of %d tasks (%d at a time)" % (len(self.projdirs), self.options.nparallel))
+        rows = dict((projdir, newRow(projdir)) for projdir in self.projdirs)
+        ## The tasks of each CRAB server: {(instance, serverurl): {taskname: projdir}}.
+        tasks = defaultdict(dict)
+        for projdir in self.projdirs:
+            try:
+                with open(os.path.join(projdir, '.requestcache')) as fd:
+                    cachedinfo = cPickle.load(fd)
+                rows[projdir]['taskname'] = cachedinfo['RequestName']
+                port = ':' + cachedinfo['Port'] if cachedinfo['Port'] else ''
+                tasks[(cachedinfo['instance'], cachedinfo['Server'] + port)][cachedinfo['RequestName']] = projdir
+            except Exception as ex:
+                rows[projdir]['error'] = "Cannot load the request cache: %s" % ex
+        taskRows = {}
+        for (instance, serverurl), projdirs in tasks.iteritems():
+            start = time.time()
+            try:
+                search = self.searchTasks(projdirs.keys(), DASHBOARD_COLUMNS, instance, serverurl, self.options.nparallel)
+            except Exception as ex:
+                logging.getLogger('CRAB3').exception(ex)
+                for projdir in projdirs.itervalues():
+                    rows[projdir]['error'] = str(ex).split('\n')[0]
+                continue
+            for taskname, projdir in projdirs.iteritems():
+                rows[projdir]['restLatency'] = time.time() - start
+                if taskname in search.errors:
+                    rows[projdir]['error'] = search.errors[taskname]
+                else:
+                    taskRows[projdir] = search.results[taskname]
+        engine = ThreadEngine(max(1, min(self.options.nparallel, len(taskRows))))
+        engine.start(self.dashboardWorker, (rows,))
+        for projdir, task in sorted(taskRows.iteritems()):
+            engine.put((projdir, task))
+        if engine.stop():
+            self.logger.info("Interrupted, showing the tasks queried so far.")
+        rows = [rows[projdir] for projdir in self.projdirs]
+        totals = aggregate(rows)
+        self.logger.info("\n" + "\n".join(formatDashboard(rows, totals)) + "\n")
+        result = {'tasks': rows, 'totals': totals}
+        if self.options.json:
+            self.logger.info(json.dumps(result))
+        return result
+
+    def dashboardWorker(self, inputq, rows):
+        """ Thread of the dashboard: get the status of the jobs of the tasks put in the input
+            queue. Each worker keeps its connections to the schedds.
+        """
+        fetcher = PersistentURLFetcher(self.proxyfilename)
+        try:
+            while True:
+                item = inputq.get()
+                if item == STOP_MESSAGE:
+                    break
+                projdir, task = item
+                self.dashboardRow(rows[projdir], task, fetcher)
+        finally:
+            fetcher.close()
+
+    def dashboardRow(self, row, task, fetcher):
+        """ Fill the row of a task with its information in the task database and the
+            number of jobs in each state, and how long it took to get them from the schedd.
+        """
+        try:
+            row['taskStatus'] = task.get('tm_task_status')
+            row['schedd'] = task.get('tm_schedd')
+            url = self.statusCacheUrl(task)
+            if url:
+                start = time.time()
+                statusCacheInfo = LocalStatusCache(row['projdir']).get(url, fetcher.fetchIfModified, ['State'])
+                row['scheddLatency'] = time.time() - start
+                dagStatus = statusCacheInfo.pop('DagStatus', None) or {}
+                row['dagStatus'] = DAGMAN_CODES.get(dagStatus.get('DagStatus'))
+                row['jobsPerStatus'] = dict(self.countStates(stateSnapshot(JobTable(statusCacheInfo))))
+        except Exception as ex:
+            logging.getLogger('CRAB3').exception(ex)
+            row['error'] = str(ex).split('\n')[0]
+
+    def statusCacheFields(self):
+        """
+        Return the fields of the job records needed by the printers that will run
+        (None means all of them).
+        """
+        if self.options.long or self.options.sort or self.options.json:
+            return None
+        fields = ['State', 'Error']
+        if self.options.summary:
+            fields += ['SiteHistory', 'WallDurations']
+        return fields
+
     def _percentageString(self, state, value, total):
         state = PUBLICATION_STATES.get(state, state)
         digit_count = int(math.ceil(math.log(max(value, total)+1, 10)))
@@ -124,13 +373,12 @@ class status2(SubCommand):
         else:
             return colors.NORMAL
 
-    def printDAGStatus(self, crabDBInfo, statusCacheInfo):
+    def printDAGStatus(self, task, statusCacheInfo):
         # Get dag status from the node_state/job_log summary
-        dagman_codes = {1:'SUBMITTED', 2:'SUBMITTED', 3:'SUBMITTED', 4:'SUBMITTED', 5:'COMPLETED', 6:'FAILED'}
-        dag_status = dagman_codes.get(statusCacheInfo['DagStatus']['DagStatus'])
+        dag_status = DAGMAN_CODES.get(statusCacheInfo['DagStatus']['DagStatus'])
         #Unfortunately DAG code for killed task is 6, just as like for finished DAGs with failed jobs
         #Relabeling the status from 'FAILED' to 'FAILED (KILLED)'     if a successful kill command was issued
-        dbstatus = self.getColumn(crabDBInfo, 'tm_task_status')
+        dbstatus = task.get('tm_task_status')
         if dag_status=='FAILED' and dbstatus=='KILLED':
             dag_status = 'FAILED (KILLED)'
 
@@ -138,15 +386,15 @@ class status2(SubCommand):
         self.logger.info(msg)
         return msg
 
-    def printTaskInfo(self, crabDBInfo, username):
+    def printTaskInfo(self, task, username):
         """ Print general information like project directory, task name, scheduler, task status (in the database),
             dashboard URL, warnings and failire messages in the database.
         """
-        schedd = self.getColumn(crabDBInfo, 'tm_schedd')
-        status = self.getColumn(crabDBInfo, 'tm_task_status')
-        command = self.getColumn(crabDBInfo, 'tm_task_command')
-        warnings = literal_eval(self.getColumn(crabDBInfo, 'tm_task_warnings'))
-        failure = self.getColumn(crabDBInfo, 'tm_task_failure')
+        schedd = task.get('tm_schedd')
+        status = task.get('tm_task_status')
+        command = task.get('tm_task_command')
+        warnings = task.getLiteral('tm_task_warnings')
+        failure = task.get('tm_task_failure')
 
         self.logger.info("CRAB project directory:\t\t%s" % (self.requestarea))
         self.logger.info("Task name:\t\t\t%s" % self.cachedinfo['RequestName'])
@@ -181,157 +429,105 @@ class status2(SubCommand):
             msg += "\t\t%s" % (failure.replace('\n', '\n\t\t\t\t'))
             self.logger.error(msg)
 
-    def printLong(self, dictresult, quiet = False):
+    def printLong(self, table):
         """ Print detailed information about a task and each job.
         """
-        sortdict = {}
         outputMsg  = "\nExtended Job Status Table:\n"
         outputMsg += "\n%4s %-12s %-20s %10s %10s %10s %10s %10s %10s %15s" \
                    % ("Job", "State", "Most Recent Site", "Runtime", "Mem (MB)", "CPU %", "Retries", "Restarts", "Waste", "Exit Code")
-        mem_cnt = 0
-        mem_min = -1
-        mem_max = 0
-        mem_sum = 0
-        run_cnt = 0
-        run_min = -1
-        run_max = 0
-        run_sum = 0
-        cpu_min = -1
-        cpu_max = 0
-        cpu_sum = 0
-        wall_sum = 0
-        def compareFunction(j1 ,j2):
-            # j's can be '1' or '1-1'.
-            x1 = map(int, j1.split('-'))
-            x2 = map(int, j2.split('-'))
-            return cmp(x1, x2) #using list comparison
-
-        for jobid in sorted(dictresult.keys(), cmp=compareFunction):
-            info = dictresult[str(jobid)]
-            state = info['State']
-            site = ''
-            if info.get('SiteHistory'):
-                site = info['SiteHistory'][-1]
-            wall = 0
-            if info.get('WallDurations'):
-                wall = info['WallDurations'][-1]
-                run_cnt += 1
-                if (run_min == -1) or (wall < run_min): run_min = wall
-                if wall > run_max: run_max = wall
-            run_sum += wall
-            wall_str = to_hms(wall)
-            waste = 0
-            if info.get('WallDurations'):
-                for run in info['WallDurations'][:-1]:
-                    waste += run
-            wall_sum += waste + wall
-            waste = to_hms(waste)
-            mem = 'Unknown'
-            if info.get('ResidentSetSize'):
-                mem = info['ResidentSetSize'][-1]/1024
-                mem_cnt += 1
-                if (mem_min == -1) or (wall < mem_min): mem_min = mem
-                if mem > mem_max: mem_max = mem
-                mem_sum += mem
-                mem = '%d' % mem
-            cpu = 'Unknown'
-            if (state in ['cooloff', 'failed', 'finished']) and not wall:
-                cpu = 0
-                if (cpu_min == -1) or cpu < cpu_min: cpu_min = cpu
-                if cpu > cpu_max: cpu_max = cpu
-                cpu = "%.0f" % cpu
-            elif wall and ('TotalSysCpuTimeHistory' in info) and ('TotalUserCpuTimeHistory' in info):
-                cpu = info['TotalSysCpuTimeHistory'][-1] + info['TotalUserCpuTimeHistory'][-1]
-                cpu_sum += cpu
-                if not wall: cpu = 0
-                else: cpu = (cpu / float(wall)) * 100
-                if (cpu_min == -1) or cpu < cpu_min: cpu_min = cpu
-                if cpu > cpu_max: cpu_max = cpu
-                cpu = "%.0f" % cpu
-            ec = 'Unknown'
-            if 'Error' in info:
-                ec = str(info['Error'][0]) #exit code of this failed job
-            elif state in ['finished']:
-                ec = '0'
-            sortdict[str(jobid)] = {'state': state, 'site': site, 'runtime': wall_str, 'memory': mem, 'cpu': cpu, \
-                                    'retries': info.get('Retries', 0), 'restarts': info.get('Restarts', 0), 'waste': waste, 'exitcode': ec}
+        exitcodes = self.exitCodeColumn(table)
+        mems = self.memoryColumn(table)
+        cpus = self.cpuColumn(table)
+        for row, jobid in enumerate(table.jobids):
+            site = table.sites[table.site[row]] if table.site[row] is not None else ''
+            mem = '%d' % mems[row] if mems[row] is not None else 'Unknown'
+            cpu = "%.0f" % cpus[row] if cpus[row] is not None else 'Unknown'
+            ec = exitcodes[row]
             outputMsg += "\n%4s %-12s %-20s %10s %10s %10s %10s %10s %10s %15s" \
-                       % (jobid, state, site, wall_str, mem, cpu, info.get('Retries', 0), info.get('Restarts', 0), waste, ' Postprocessing failed' if ec == '90000' else ec)
-        if not quiet:
-            self.logger.info(outputMsg)
+                       % (jobid, table.states[table.state[row]], site, to_hms(table.wall[row] or 0), mem, cpu, \
+                          table.retries[row], table.restarts[row], to_hms(table.waste[row]), ' Postprocessing failed' if ec == '90000' else ec)
+        self.logger.info(outputMsg)
 
         # Print (to the log file) a table with the HTCondor cluster id for each job.
         msg = "\n%4s %-10s" % ("Job", "Cluster Id")
-        for jobid in dictresult.keys():
-            info = dictresult[str(jobid)]
-            clusterid = str(info.get('JobIds', 'Unknown'))
-            msg += "\n%4s %10s" % (jobid, clusterid)
-        if not quiet:
-            self.logger.debug(msg)
+        for jobid, clusterid in zip(table.jobids, table.clusterids):
+            msg += "\n%4s %10s" % (jobid, str(clusterid))
+        self.logger.debug(msg)
 
         # Print a summary with memory/cpu usage.
+        walls = [wall for wall in table.wall if wall]
+        run_sum = sum(wall or 0 for wall in table.wall)
+        wall_sum = run_sum + sum(table.waste)
+        mems = [mem for mem in mems if mem is not None]
+        cpus = [cpu for cpu in cpus if cpu is not None]
+        cpu_sum = sum(cpu for cpu, wall in zip(table.cpu, table.wall) if wall and cpu is not None)
         summaryMsg = "\nSummary:"
-        if mem_cnt:
-            summaryMsg += "\n * Memory: %dMB min, %dMB max, %.0fMB ave" % (mem_min, mem_max, mem_sum/mem_cnt)
-        if run_cnt:
-            summaryMsg += "\n * Runtime: %s min, %s max, %s ave" % (to_hms(run_min), to_hms(run_max), to_hms(run_sum/run_cnt))
-        if run_sum and cpu_min >= 0:
-            summaryMsg += "\n * CPU eff: %.0f%% min, %.0f%% max, %.0f%% ave" % (cpu_min, cpu_max, (cpu_sum / run_sum)*100)
+        if mems:
+            summaryMsg += "\n * Memory: %dMB min, %dMB max, %.0fMB ave" % (min(mems), max(mems), sum(mems)/len(mems))
+        if walls:
+            summaryMsg += "\n * Runtime: %s min, %s max, %s ave" % (to_hms(min(walls)), to_hms(max(walls)), to_hms(run_sum/len(walls)))
+        if run_sum and cpus:
+            summaryMsg += "\n * CPU eff: %.0f%% min, %.0f%% max, %.0f%% ave" % (min(cpus), max(cpus), (cpu_sum / run_sum)*100)
         if wall_sum or run_sum:
             waste = wall_sum - run_sum
             summaryMsg += "\n * Waste: %s (%.0f%% of total)" % (to_hms(waste), (waste / float(wall_sum))*100)
         summaryMsg += "\n"
-        if not quiet:
-            self.logger.info(summaryMsg)
+        self.logger.info(summaryMsg)
 
-        return sortdict
+    def exitCodeColumn(self, table):
+        """ The exit code of each job as a string: the one of the error, '0' for finished jobs, otherwise 'Unknown'.
+        """
+        finished = table.states.indices.get('finished')
+        return [str(ec) if ec is not None else ('0' if state == finished else 'Unknown') \
+                for ec, state in zip(table.exitcode, table.state)]
+
+    def memoryColumn(self, table):
+        """ The memory used by each job in MB (None if unknown).
+        """
+        return [rss/1024 if rss else None for rss in table.rss]
 
-    def printShort(self, statusCacheInfo):
+    def cpuColumn(self, table):
+        """ The CPU efficiency of each job in % (None if unknown).
+        """
+        ended = set(table.states.indices[state] for state in ['cooloff', 'failed', 'finished'] if state in table.states.indices)
+        cpus = []
+        for state, wall, cpu in zip(table.state, table.wall, table.cpu):
+            if state in ended and not wall:
+                cpus.append(0)
+            elif wall and cpu is not None:
+                cpus.append((cpu / float(wall)) * 100)
+            else:
+                cpus.append(None)
+        return cpus
+
+    def printShort(self, table):
         """ Give a summary of the job statuses, keeping in mind that:
                 - If there is a job with id 0 then this is the probe job for the estimation
                   This is the so called automatic splitting
                 - Then you have normal jobs
                 - Jobs that are line 1-1, 1-2 and so on are completing
         """
-
-        # This record is no longer necessary and makes parsing more difficult.
-        if 'DagStatus' in statusCacheInfo:
-            del statusCacheInfo['DagStatus']
-
-        jobsPerStatus = {}
-        jobList = []
-        result= {}
-        for job, info in statusCacheInfo.items():
-            status = info['State']
-            jobsPerStatus.setdefault(status, 0)
-            jobsPerStatus[status] += 1
-            jobList.append((status, job))
-        result['jobsPerStatus'] = jobsPerStatus
-        result['jobList'] = jobList
+        counts = table.count([table.kind, table.state])
+        stateNames = table.states.values
+        result = {}
+        result['jobsPerStatus'] = {}
+        for (_, state), count in counts.iteritems():
+            result['jobsPerStatus'][stateNames[state]] = result['jobsPerStatus'].get(stateNames[state], 0) + count
+        result['jobList'] = [(stateNames[state], jobid) for state, jobid in zip(table.state, table.jobids)]
 
         # Print information  about the single splitting job
-        if '0' in statusCacheInfo:
-            statusSplJob = statusCacheInfo['0']['State']
+        if table.jobids and table.kind[0] == PROBE:
+            statusSplJob = table.states[table.state[0]]
             self.logger.info("\nSplitting job status:\t\t{0}".format(self._printState(statusSplJob, 13)))
 
-        # Collect information about jobs
-        # Create a dictionary like { 'finished' : 1, 'running' : 3}
-        states = {}
-        for jobid, statusDict in statusCacheInfo.iteritems():
-            status = statusDict['State']
-            if jobid == '0' or '-' in jobid: #skip splitting and completing jobs
-                continue
-            states[status] = states.setdefault(status, 0) + 1
-
-
-        # Collect information about subjobs
-        # Create a dictionary like { 'finished' : 1, 'running' : 3}
-        statesSJ = {}
-        for jobid, statusDict in statusCacheInfo.iteritems():
-            status = statusDict['State']
-            if jobid == '0' or '-' not in jobid: #skip splitting and normal jobs
-                continue
-            statesSJ[status] = statesSJ.setdefault(status, 0) + 1
+        # Collect information about jobs and subjobs
+        # Create dictionaries like { 'finished' : 1, 'running' : 3}
+        states, statesSJ = {}, {}
+        for (kind, state), count in counts.iteritems():
+            if kind == JOB:
+                states[table.states[state]] = count
+            elif kind == COMPLETING:
+                statesSJ[table.states[state]] = count
 
         # And if the dictionary is not empty, print it
         for jobtype, currStates in [('Jobs', states), ('Completing jobs', statesSJ)]:
@@ -343,274 +539,147 @@ class status2(SubCommand):
                     self.logger.info("\t\t\t\t{0} {1}".format(self._printState(status, 13), self._percentageString(status, currStates[status], total)))
         return result
 
-    def printErrors(self, dictresult):
-        """ Iterate over dictresult['jobs'] if present, which is a dictionary like:
-                {'10': {'State': 'running'}, '1': {'State': 'failed', 'Error' : [10,'error message']}, '3': {'State': 'failed', 'Error' : [10,'error message']} ...
-            and group the errors per exit code counting how many jobs exited with a certain exit code, and print the summary
+    def printErrors(self, table):
+        """ Group the failed jobs per exit code and error message, counting how many jobs exited
+            with a certain exit code, and print the summary.
         """
-        ## In general, there are N_{ec}_{em} jobs that failed with exit code ec and
-        ## error message em.
-        ## Since there may be different error messages for a given exit code, we use a
-        ## map containing the exit code as key and as value a list with the different
-        ## exit messages. For example:
-        ## ec_errors = { '1040' : ["Failed due to bla", "Failed due to blabla"],
-        ##              '60302' : ["File X does not exist", "File Y does not exist"]
-        ##             }
+        if 'failed' not in table.states.indices:
+            return
+        failed = table.rows(table.state, table.states.indices['failed'])
+        ## {(exit code, error message index): [rows of the jobs that failed with them]}
+        errors = table.group([table.exitcode, table.error], failed)
+        unknown = len(errors.pop((None, None), []))
+        ## For each exit code, the list of (number of jobs, error message index, rows), from the
+        ## most frequent error message to the less frequent one.
         ec_errors = {}
-        ## We also want a map containing again the exit code as key, but as value a list
-        ## with the lists of job ids that failed with given exit code and error message.
-        ## For example:
-        ## ec_jobids = { '1040' : [[1, 2, 3, 4, 5], [10, 12, 14]],
-        ##              '60302' : [[6, 7, 8, 9, 10], [11, 13, 15]]
-        ##             }
-        ## where jobs [1, 2, 3, 4, 5] failed with error message "Failed due to bla",
-        ## jobs [10, 12, 14] with "Failed due to blabla", jobs [6, 7, 8, 9, 10] with
-        ## "File X does not exist" and jobs [11, 13, 15] with "File Y does not exist".
-        ec_jobids = {}
-        ## We also want a map containing again the exit code as key, but as value a list
-        ## with the numbers N_{ec}_{em}. For example:
-        ## ec_numjobs = { '1040' : [N_{1040}_{"Failed due to bla"}, N_{1040}_{"Failed due to blabla"}],
-        ##               '60302' : [N_{60302}_{"File X does not exist"}, N_{60302}_{"File Y does not exist"}]
-        ##              }
-        ## Actually, for later convenience when sorting by most frequent error messages
-        ## for each exit code (i.e. sorting by N_{ec}_{em}), we add a second number
-        ## representing the position of the error message em in the corresponding list
-        ## in ec_errors[ec]. For example:
-        ## ec_numjobs = { '1040' : [(N_{1040}_{"Failed due to bla"}, 1), (N_{1040}_{"Failed due to blabla"}, 2)],
-        ##               '60302' : [(N_{60302}_{"File X does not exist"}, 1), (N_{60302}_{"File Y does not exist"}, 2)]
-        ##              }
-        ## We will later sort ec_numjobs[ec], which sorts according to the first number
-        ## in the 2-tuples. So the sorted ec_numjobs dictionary could be for example:
-        ## ec_numjobs = { '1040' : [(N_{1040}_{"Failed due to bla"}, 1), (N_{1040}_{"Failed due to blabla"}, 2)],
-        ##               '60302' : [(N_{60302}_{"File Y does not exist"}, 2), (N_{60302}_{"File X does not exist"}, 1)]
-        ##              }
-        ## The second number in the 2-tuples allows to get the error message from
-        ## ec_errors[ec]: given the sorted ec_numjobs dictionary, for each exit code
-        ## (i.e. for each key) ec in the dictionary, the most frequent error messages
-        ## are ec_errors[ec][ec_numjobs[ec][0][1]], ec_errors[ec][ec_numjobs[ec][1][1]], etc.
-        ec_numjobs = {}
-        unknown = 0
-        are_failed_jobs = False
-        for jobid, status in dictresult.iteritems():
-            if status['State'] == 'failed':
-                are_failed_jobs = True
-                if 'Error' in status:
-                    ec = status['Error'][0] #exit code of this failed job
-                    em = status['Error'][1] #exit message of this failed job
-                    if ec not in ec_errors:
-                        ec_errors[ec] = []
-                    if ec not in ec_jobids:
-                        ec_jobids[ec] = []
-                    if ec not in ec_numjobs:
-                        ec_numjobs[ec] = []
-                    if em not in ec_errors[ec]:
-                        ec_numjobs[ec].append((1, len(ec_errors[ec])))
-                        ec_errors[ec].append(em)
-                        ec_jobids[ec].append([jobid])
-                    else:
-                        i = ec_errors[ec].index(em)
-                        ec_jobids[ec][i].append(jobid)
-                        ec_numjobs[ec][i] = (ec_numjobs[ec][i][0] + 1, ec_numjobs[ec][i][1])
-                else:
-                    unknown += 1
-        if are_failed_jobs:
-            ## If option --sort=exitcodes was specified, show the error summary with the
-            ## exit codes sorted. Otherwise show it sorted from most frequent exit code to
-            ## less frequent.
-            exitCodes = []
-            if self.options.sort == "exitcode":
-                for ec in ec_numjobs.keys():
-                    if ec not in exitCodes:
-                        exitCodes.append(ec)
-                exitCodes.sort()
+        for (ec, em), rows in errors.iteritems():
+            ec_errors.setdefault(ec, []).append((len(rows), em, rows))
+        for ec in ec_errors:
+            ec_errors[ec].sort(key = lambda error: (-error[0], error[1]))
+        ec_count = dict((ec, sum(nj for nj, _, _ in ecerrors)) for ec, ecerrors in ec_errors.iteritems())
+
+        ## If option --sort=exitcodes was specified, show the error summary with the
+        ## exit codes sorted. Otherwise show it sorted from most frequent exit code to
+        ## less frequent.
+        if self.options.sort == "exitcode":
+            exitCodes = sorted(ec_errors)
+        else:
+            exitCodes = [ec for _, ec in sorted(((count, ec) for ec, count in ec_count.iteritems()), reverse = True)]
+        ## Error summary header.
+        msg = "\nError Summary:"
+        if not self.options.verboseErrors:
+            msg += " (use crab status --verboseErrors for details about the errors)"
+        ## Auxiliary variable for the layout of the error summary messages.
+        totnumjobs = len(table)
+        ndigits = int(math.ceil(math.log(totnumjobs+1, 10)))
+        ## For each exit code:
+        for ec in exitCodes:
+            count = ec_count[ec]
+            ## Exit code 90000 means failure in postprocessing stage.
+            if ec == 90000:
+                msg += ("\n\n%" + str(ndigits) + "s jobs failed in postprocessing step%s") \
+                     % (count, ":" if self.options.verboseErrors else "")
             else:
-                numjobsec = []
-                for ec, numjobs in ec_numjobs.iteritems():
-                    count = 0
-                    for nj, _ in numjobs:
-                        count += nj
-                    numjobsec.append((count, ec))
-                numjobsec.sort()
-                numjobsec.reverse()
-                for _, ec in numjobsec:
-                    if ec not in exitCodes:
-                        exitCodes.append(ec)
-            ## Sort the job ids in ec_jobids. Remember that ec_jobids[ec] is a list of lists
-            ## of job ids, and that each job id is a string.
-            for ec in ec_jobids.keys():
-                for i in range(len(ec_jobids[ec])):
-                    ec_jobids[ec][i] = [str(y) for y in sorted([int(x) for x in ec_jobids[ec][i]])]
-            ## Error summary header.
-            msg = "\nError Summary:"
-            if not self.options.verboseErrors:
-                msg += " (use crab status --verboseErrors for details about the errors)"
-            ## Auxiliary variable for the layout of the error summary messages.
-            totnumjobs = len(dictresult)
-            ndigits = int(math.ceil(math.log(totnumjobs+1, 10)))
-            ## For each exit code:
-            for i, ec in enumerate(exitCodes):
-                ## Sort the error messages for this exit code from most frequent one to less
-                ## frequent one.
-                numjobs = sorted(ec_numjobs[ec])
-                numjobs.reverse()
-                ## Count the total number of failed jobs with this exit code.
-                count = 0
-                for nj, _ in numjobs:
-                    count += nj
-                ## Exit code 90000 means failure in postprocessing stage.
-                if ec == 90000:
-                    msg += ("\n\n%" + str(ndigits) + "s jobs failed in postprocessing step%s") \
-                         % (count, ":" if self.options.verboseErrors else "")
-                else:
-                    msg += ("\n\n%" + str(ndigits) + "s jobs failed with exit code %s%s") \
-                         % (count, ec, ":" if self.options.verboseErrors else "")
-                if self.options.verboseErrors:
-                    ## Costumize the message depending on whether there is only one error message or
-                    ## more than one.
-                    if len(ec_errors[ec]) == 1:
-                        error_msg = ec_errors[ec][0]
-                        msg += ("\n\n\t%" + str(ndigits) + "s jobs failed with following error message:") % (nj)
-                        msg += " (for example, job %s)" % (ec_jobids[ec][0][0])
-                        msg += "\n\n\t\t" + "\n\t\t".join([line for line in error_msg.split('\n') if line])
-                    else:
-                        ## Show up to three different error messages.
-                        remainder = count
-                        if len(ec_errors[ec]) > 3:
-                            msg += "\n\t(Showing only the 3 most frequent errors messages for this exit code)"
-                        for nj, i in numjobs[:3]:
-                            error_msg = ec_errors[ec][i]
-                            msg += ("\n\n\t%" + str(ndigits) + "s jobs failed with following error message:") % (nj)
-                            msg += " (for example, job %s)" % (ec_jobids[ec][i][0])
-                            msg += "\n\n\t\t" + "\n\t\t".join([line for line in error_msg.split('\n') if line])
-                            remainder -= nj
-                        if remainder > 0:
-                            msg += "\n\n\tFor the error messages of the other %s jobs," % (remainder)
-                            msg += " please have a look at the dashboard task monitoring web page."
-            if unknown:
-                msg += "\n\nCould not find exit code details for %s jobs." % (unknown)
-            msg += "\n\nHave a look at https://twiki.cern.ch/twiki/bin/viewauth/CMSPublic/JobExitCodes for a description of the exit codes."
-            self.logger.info(msg)
+                msg += ("\n\n%" + str(ndigits) + "s jobs failed with exit code %s%s") \
+                     % (count, ec, ":" if self.options.verboseErrors else "")
+            if self.options.verboseErrors:
+                ## Show up to three different error messages.
+                if len(ec_errors[ec]) > 3:
+                    msg += "\n\t(Showing only the 3 most frequent errors messages for this exit code)"
+                remainder = count
+                for nj, em, rows in ec_errors[ec][:3]:
+                    msg += ("\n\n\t%" + str(ndigits) + "s jobs failed with following error message:") % (nj)
+                    msg += " (for example, job %s)" % (table.jobids[rows[0]])
+                    msg += "\n\n\t\t" + "\n\t\t".join([line for line in table.errors[em].split('\n') if line])
+                    remainder -= nj
+                if remainder > 0:
+                    msg += "\n\n\tFor the error messages of the other %s jobs," % (remainder)
+                    msg += " please have a look at the dashboard task monitoring web page."
+        if unknown:
+            msg += "\n\nCould not find exit code details for %s jobs." % (unknown)
+        msg += "\n\nHave a look at https://twiki.cern.ch/twiki/bin/viewauth/CMSPublic/JobExitCodes for a description of the exit codes."
+        self.logger.info(msg)
 
-    def printSummary(self, dictresult):
+    def printSummary(self, table):
         """ Print the information about jobs on each site:
                 - How many jobs are or were running on the site and in which state,
                 - Runtime for each site.
         """
-
-        sites = {}
-        default_info = {"Runtime": 0, "Waste": 0, "Running": 0, "Success": 0, "Failed": 0, "Stageout": 0}
-        for i in range(1, len(dictresult)+1):
-            info = dictresult[str(i)]
-            state = info['State']
-            site_history = info.get("SiteHistory")
-            if not site_history:
+        ## The columns of the table: Runtime, Waste, Running, Success, Stageout, Failed.
+        sites = defaultdict(lambda: [0, 0, 0, 0, 0, 0])
+        failedStates = set(table.states.indices[state] for state in ['failed', 'cooloff', 'held', 'killed'] if state in table.states.indices)
+        stateColumns = {'transferring': 4, 'running': 2, 'finished': 3}
+        stateColumns = dict((table.states.indices[state], column) for state, column in stateColumns.iteritems() if state in table.states.indices)
+        idle = table.states.indices.get('idle')
+        for kind, state, history, walls in zip(table.kind, table.state, table.siteHistory, table.walls):
+            if kind != JOB or not history:
                 continue
-            walls = info['WallDurations']
-            cur_site = info['SiteHistory'][-1]
-            cur_info = sites.setdefault(cur_site, dict(default_info))
-            for site, wall in zip(site_history[:-1], walls[:-1]):
-                info = sites.setdefault(site, dict(default_info))
-                info['Failed'] += 1
-                info['Waste'] += wall
-            if state in ['failed', 'cooloff', 'held', 'killed'] or (state == 'idle' and cur_site != 'Unknown'):
-                cur_info['Failed'] += 1
-                cur_info['Waste'] += walls[-1]
-            elif state == 'transferring':
-                cur_info['Stageout'] += 1
-                cur_info['Runtime'] += walls[-1]
-            elif state == 'running':
-                cur_info['Running'] += 1
-                cur_info['Runtime'] += walls[-1]
-            elif state == 'finished':
-                cur_info['Success'] += 1
-                cur_info['Runtime'] += walls[-1]
+            walls = walls or [0] * len(history)
+            for site, wall in zip(history[:-1], walls[:-1]):
+                sites[site][5] += 1
+                sites[site][1] += wall
+            cur_info = sites[history[-1]]
+            if state in failedStates or (state == idle and history[-1] != 'Unknown'):
+                cur_info[5] += 1
+                cur_info[1] += walls[-1]
+            elif state in stateColumns:
+                cur_info[stateColumns[state]] += 1
+                cur_info[0] += walls[-1]
 
         self.logger.info("\nSite Summary Table (including retries):\n")
         self.logger.info("%-20s %10s %10s %10s %10s %10s %10s" % ("Site", "Runtime", "Waste", "Running", "Successful", "Stageout", "Failed"))
 
-        sorted_sites = sorted(sites.keys())
-        for site in sorted_sites:
-            info = sites[site]
+        for site, info in sorted(sites.iteritems()):
             if site == 'Unknown': continue
-            self.logger.info("%-20s %10s %10s %10s %10s %10s %10s" % (site, to_hms(info['Runtime']), to_hms(info['Waste']), str(info['Running']), str(info['Success']), str(info['Stageout']), str(info['Failed'])))
+            self.logger.info("%-20s %10s %10s %10s %10s %10s %10s" % (site, to_hms(info[0]), to_hms(info[1]), str(info[2]), str(info[3]), str(info[4]), str(info[5])))
 
         self.logger.info("")
 
-    def printSort(self, sortdict, sortby):
+    def printSort(self, table, sortby):
         """ Print information about jobs sorted by a certain attribute.
         """
-        sortmatrix = []
-        valuedict = {}
         self.logger.info('')
-        for jobid in sortdict:
-            if sortby in ['exitcode']:
-                if sortdict[jobid][sortby] != 'Unknown':
-                    value = int(sortdict[jobid][sortby])
-                else:
-                    value = 999999
-                if value not in sortmatrix:
-                    sortmatrix.append(value)
-                sortmatrix.sort()
-                if value not in valuedict:
-                    valuedict[value] = [jobid]
-                else:
-                    valuedict[value].append(jobid)
-            elif sortby in ['state' , 'site']:
-                value = sortdict[jobid][sortby]
-                if value not in valuedict:
-                    valuedict[value] = [jobid]
-                else:
-                    valuedict[value].append(jobid)
-            elif sortby in ['memory', 'cpu', 'retries']:
-                if sortdict[jobid][sortby] != 'Unknown':
-                    value = int(sortdict[jobid][sortby])
-                else:
-                    value = 999999
-                sortmatrix.append((value, jobid))
-                sortmatrix.sort()
-            elif sortby in ['runtime', 'waste']:
-                value = sortdict[jobid][sortby]
-                realvaluematrix = value.split(':')
-                realvalue = 3600*int(realvaluematrix[0]) + 60*int(realvaluematrix[1]) + int(realvaluematrix[2])
-                sortmatrix.append((realvalue, value, jobid))
-                sortmatrix.sort()
         if sortby in ['exitcode']:
+            values = [int(ec) if ec != 'Unknown' else 999999 for ec in self.exitCodeColumn(table)]
             msg  = "Jobs sorted by exit code:\n"
             msg += "\n%-20s %-20s\n" % ('Exit Code', 'Job Id(s)')
-            for value in sortmatrix:
-                if value == 999999:
-                    esignvalue = 'Unknown'
-                else:
-                    esignvalue = str(value)
-                jobids = [str(jobid) for jobid in sorted([int(jobid) for jobid in valuedict[value]])]
-                msg += "\n%-20s %-s" % (esignvalue, ", ".join(jobids))
+            for (value,), rows in sorted(table.group([values]).iteritems()):
+                esignvalue = 'Unknown' if value == 999999 else str(value)
+                msg += "\n%-20s %-s" % (esignvalue, ", ".join(table.jobids[row] for row in rows))
             self.logger.info(msg)
         elif sortby in ['state' , 'site']:
+            if sortby == 'state':
+                values = [table.states[state] for state in table.state]
+            else:
+                values = [table.sites[site] if site is not None else '' for site in table.site]
             msg  = "Jobs sorted by %s:\n" % (sortby)
             msg += "\n%-20s %-20s\n" % (sortby.title(), 'Job Id(s)')
-            for value in valuedict:
-                msg += "\n%-20s %-s" % (value, ", ".join(valuedict[value]))
+            for (value,), rows in sorted(table.group([values]).iteritems()):
+                msg += "\n%-20s %-s" % (value, ", ".join(table.jobids[row] for row in rows))
             self.logger.info(msg)
         elif sortby in ['memory', 'cpu', 'retries']:
-            msg = "Jobs sorted by %s used:\n" % (sortby)
             if sortby == 'memory':
-                msg += "%-10s %-10s" % ("Memory (MB)".center(10), "Job Id".center(10))
+                values = self.memoryColumn(table)
+                header = "Memory (MB)"
             elif sortby == 'cpu':
-                msg += "%-10s %-10s" % ("CPU".center(10), "Job Id".center(10))
-            elif sortby == 'retries':
-                msg += "%-10s %-10s" % ("Retries".center(10), "Job Id".center(10))
-            for value in sortmatrix:
-                if value[0] == 999999:
-                    esignvalue = 'Unknown'
-                else:
-                    esignvalue = value[0]
-                msg += "%10s %10s" % (str(esignvalue).center(10), value[1].center(10))
+                values = [int("%.0f" % cpu) if cpu is not None else None for cpu in self.cpuColumn(table)]
+                header = "CPU"
+            else:
+                values = table.retries
+                header = "Retries"
+            values = [int(value) if value is not None else 999999 for value in values]
+            msg = "Jobs sorted by %s used:\n" % (sortby)
+            msg += "%-10s %-10s" % (header.center(10), "Job Id".center(10))
+            for value, row in sorted(zip(values, table.rows())):
+                esignvalue = 'Unknown' if value == 999999 else value
+                msg += "\n%10s %10s" % (str(esignvalue).center(10), table.jobids[row].center(10))
             self.logger.info(msg)
         elif sortby in ['runtime' ,'waste']:
+            values = [wall or 0 for wall in table.wall] if sortby == 'runtime' else table.waste
             msg  = "Jobs sorted by %s used:\n" % (sortby)
-            msg += "%-10s %-5s\n" % (sortby.title(), "Job Id")
-            for value in sortmatrix:
-                msg += "%-10s %-5s" % (value[1], value[2].center(5))
+            msg += "%-10s %-5s" % (sortby.title(), "Job Id")
+            for value, row in sorted(zip(values, table.rows())):
+                msg += "\n%-10s %-5s" % (to_hms(value), table.jobids[row].center(5))
             self.logger.info(msg)
 
         self.logger.info('')
@@ -647,10 +716,46 @@ class status2(SubCommand):
                                default = False,
                                action = "store_true",
                                help = "Expand error summary, showing error messages for all failed jobs.")
+        self.parser.add_option("--dirs",
+                               dest = "dirs",
+                               default = None,
+                               metavar = "PATTERN",
+                               help = "Print one table with the status of all the CRAB project directories matching the"
+                                      " (quoted) glob pattern, e.g. --dirs='campaign/crab_*'. Directories given as arguments are added.")
+        self.parser.add_option("--parallel",
+                               dest = "nparallel",
+                               default = DASHBOARD_PARALLEL,
+                               type = "int",
+                               help = "With --dirs, the number of tasks queried at the same time. Default is %d." % DASHBOARD_PARALLEL)
+        self.parser.add_option("--watch",
+                               dest = "watch",
+                               default = None,
+                               type = "int",
+                               metavar = "SECONDS",
+                               help = "After printing the status, keep polling it every SECONDS seconds (--watch alone: %d)"
+                                      " and print only the jobs that changed state, until the task is done." % WATCH_INTERVAL)
 
 
     def validateOptions(self):
+        if self.options.dirs:
+            ## The project directories can also be given as arguments (e.g. if the shell expanded the pattern).
+            self.projdirs = findProjectDirs([self.options.dirs] + self.args)
+            self.args = []
+            if not self.projdirs:
+                msg = "%sError%s: No CRAB project directory matches %s." % (colors.RED, colors.NORMAL, self.options.dirs)
+                raise ConfigurationException(msg)
+            if self.options.long or self.options.sort or self.options.summary or self.options.watch:
+                msg = "%sError%s: The --dirs option can not be used together with --long, --sort, --summary or --watch." % (colors.RED, colors.NORMAL)
+                raise ConfigurationException(msg)
+            if self.options.nparallel < 1:
+                msg = "%sError%s: The --parallel option must be a positive number." % (colors.RED, colors.NORMAL)
+                raise ConfigurationException(msg)
+            ## The server and the proxy options are taken from the first task.
+            self.options.projdir = self.projdirs[0]
         SubCommand.validateOptions(self)
+        if self.options.watch is not None and self.options.watch < MIN_WATCH_INTERVAL:
+            msg = "%sError%s: The --watch interval must be at least %d seconds." % (colors.RED, colors.NORMAL, MIN_WATCH_INTERVAL)
+            raise ConfigurationException(msg)
 
 def to_hms(val):
     s = val % 60
@@ -19,7 +19,7 @@ from CRABClient.ClientUtilities import DBSURLS
 from CRABClient.Commands.SubCommand import SubCommand
 from CRABClient.ClientMapping import parametersMapping, getParamDefaultValue
 from CRABClient.ClientExceptions import ClientException, RESTCommunicationException
-from CRABClient.ClientUtilities import getJobTypes, createCache, addPlugin, server_info, colors, getUrl, setSubmitParserOptions, validateSubmitOptions, checkStatusLoop
+from CRABClient.ClientUtilities import getJobTypes, createCache, addPlugin, colors, getUrl, setSubmitParserOptions, validateSubmitOptions, checkStatusLoop
 
 
 class submit(SubCommand):
@@ -89,7 +89,7 @@ class submit(SubCommand):
 
         jobconfig = {}
         #get the backend URLs from the server external configuration
-        serverBackendURLs = server_info('backendurls', self.serverurl, self.proxyfilename, getUrl(self.instance, resource='info'))
+        serverBackendURLs = self.serverInfo('backendurls', getUrl(self.instance, resource='info'))
         #if cacheSSL is specified in the server external configuration we will use it to upload the sandbox
         filecacheurl = serverBackendURLs['cacheSSL'] if 'cacheSSL' in serverBackendURLs else None
         pluginParams = [self.configuration, self.logger, os.path.join(self.requestarea, 'inputs')]
@@ -1,6 +1,5 @@
 from datetime import datetime, date, timedelta
 
-from RESTInteractions import HTTPRequests
 from ServerUtilities import TASKDBSTATUSES
 
 from CRABClient import __version__
@@ -12,7 +11,7 @@ class tasks(SubCommand):
     """Give back all user tasks starting from a specific date. Default is last 30 days.
     """
     def __call__(self):
-        server = HTTPRequests(self.serverurl, self.proxyfilename, self.proxyfilename, version=__version__)
+        server = self.restClass(self.serverurl, self.proxyfilename, self.proxyfilename, version=__version__)
         dictresult, status, reason = server.get(self.uri, data = {'timestamp': self.date})
         dictresult = dictresult['result'] #take just the significant part
 
@@ -43,9 +43,11 @@ class uploadlog(SubCommand):
             raise ConfigurationException
 
         self.logger.info("Will upload file %s." % (self.logfile))
+        cacheurl = self.serverInfo('backendurls')
+        cacheurl = cacheurl['cacheSSL']
         logfileurl = uploadlogfile(self.logger, self.proxyfilename, logfilename = logfilename, \
                                    logpath = str(self.logfile), instance = self.instance, \
-                                   serverurl = self.serverurl)
+                                   serverurl = self.serverurl, cacheurl = cacheurl)
         return {'result' : {'status' : 'SUCCESS' , 'logurl' : logfileurl}}
 
 
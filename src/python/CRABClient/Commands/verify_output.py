@@ -0,0 +1,102 @@
+import os
+
+from CRABClient.Commands.SubCommand import SubCommand
+from CRABClient.ClientUtilities import colors
+from CRABClient.ClientExceptions import ConfigurationException
+from CRABClient.TransferJournal import TransferJournal, JOURNAL_NAME, DONE, FAILED
+from CRABClient.TransferVerification import VerificationPool
+
+
+class verify_output(SubCommand):
+    """
+    Verify the ADLER32 checksum of the files retrieved by getoutput2/getlog2 against the
+    checksums given by the server, as recorded in the transfer journal of the project
+    (results/.transfers.journal). The checksums are computed in parallel, on all the cores.
+    The files with a wrong checksum are removed and marked as failed in the journal, so that
+    'crab getoutput2 --resume' retrieves them again.
+    """
+    name = 'verify_output'
+    shortnames = ['verify-output']
+
+    def __call__(self):
+        journalpath = os.path.join(self.requestarea, 'results', JOURNAL_NAME)
+        returndict = {'verified': [], 'failed': [], 'missing': [], 'unknown': []}
+        if not os.path.isfile(journalpath):
+            self.logger.info("No transfer journal found in %s. Nothing to verify." % os.path.dirname(journalpath))
+            return returndict
+        journal = TransferJournal(journalpath)
+
+        entries = [entry for entry in journal.entries.itervalues() if entry['state'] == DONE]
+        if not self.options.all:
+            entries = [entry for entry in entries if not entry.get('verified')]
+        self.logger.info("Verifying %s files" % len(entries))
+
+        verifier = VerificationPool(self.options.nprocs)
+        try:
+            for entry in entries:
+                if not os.path.isfile(entry['destination']):
+                    self.logger.info("%sWarning%s: %s is missing" % (colors.RED, colors.NORMAL, entry['destination']))
+                    journal.record(entry['pfn'], entry['destination'], FAILED, attempted = False)
+                    returndict['missing'].append(entry['destination'])
+                elif not entry.get('adler32'):
+                    self.logger.debug("The checksum of %s is not known" % entry['destination'])
+                    returndict['unknown'].append(entry['destination'])
+                else:
+                    verifier.submit(entry['pfn'], entry['destination'], entry['adler32'])
+            results = verifier.wait()
+        finally:
+            verifier.close()
+
+        for pfn, result in results.iteritems():
+            if result['ok']:
+                journal.record(pfn, result['path'], DONE, attempted = False, verified = True)
+                returndict['verified'].append(result['path'])
+                continue
+            if result['error']:
+                msg = "cannot compute the checksum: %s" % result['error']
+            else:
+                msg = "checksum mismatch: local %s, expected %s" % (result['adler32'], result['expected'])
+            self.logger.info("%sError%s: %s %s" % (colors.RED, colors.NORMAL, result['path'], msg))
+            try:
+                os.remove(result['path'])
+            except OSError as ex:
+                self.logger.debug("Cannot remove the file because of: %s" % ex)
+            journal.record(pfn, result['path'], FAILED, attempted = False)
+            returndict['failed'].append(result['path'])
+        journal.close()
+
+        if returndict['failed'] or returndict['missing']:
+            msg = "%sWarning%s: %s files failed the verification and %s files are missing." \
+                  % (colors.RED, colors.NORMAL, len(returndict['failed']), len(returndict['missing']))
+            msg += " Use 'crab getoutput2 --resume' (or 'crab getlog2 --resume') to retrieve them again."
+            self.logger.info(msg)
+        else:
+            self.logger.info("%sSuccess%s: %s files verified" % (colors.GREEN, colors.NORMAL, len(returndict['verified'])))
+        if returndict['unknown']:
+            self.logger.info("The checksum of %s files is not known, they have not been verified." % len(returndict['unknown']))
+
+        return returndict
+
+
+    def setOptions(self):
+        """
+        __setOptions__
+
+        This allows to set specific command options
+        """
+        self.parser.add_option('--parallel',
+                               dest = 'nprocs',
+                               default = None,
+                               type = 'int',
+                               help = 'Number of processes computing the checksums. Default is the number of cores.')
+        self.parser.add_option('--all',
+                               dest = 'all',
+                               default = False,
+                               action = 'store_true',
+                               help = 'Verify again also the files already verified.')
+
+
+    def validateOptions(self):
+        SubCommand.validateOptions(self)
+        if self.options.nprocs is not None and self.options.nprocs <= 0:
+            raise ConfigurationException("%sError%s: --parallel must be a positive number." % (colors.RED, colors.NORMAL))
@@ -8,6 +8,7 @@ from WMCore.Credential.Proxy import Proxy, CredentialException
 from WMCore.Services.SiteDB.SiteDB import SiteDBJSON
 from CRABClient.ClientExceptions import ProxyCreationException, EnvironmentException
 from CRABClient.ClientUtilities import colors, StopExecution
+from CRABClient.DelegationLedger import credentialHash
 
 
 class CredentialInteractions(object):
@@ -274,7 +275,7 @@ class CredentialInteractions(object):
         return proxy.getProxyFilename()
 
 
-    def createNewMyProxy(self, timeleftthreshold=0, nokey=False):
+    def createNewMyProxy(self, timeleftthreshold=0, nokey=False, ledger=None):
         """
         Handles the MyProxy creation
 
@@ -293,7 +294,19 @@ class CredentialInteractions(object):
         usercertDaysLeft ~= myproxytimeleft and we don't need to delegate it at every command even though myproxytimeleft < timeleftthreshold).
 
         Note that a warning message is printed at every command it usercertDaysLeft < timeleftthreshold
+
+        If a DelegationLedger is given, myproxy is not contacted at all while the ledger says that the
+        credential is valid for more than timeleftthreshold, and the time left found in myproxy is recorded.
         """
+        ledgerkey = (self.defaultDelegation['myProxySvr'], self.defaultDelegation['myproxyAccount'], self.defaultDelegation['serverDN'])
+        proxyhash = None
+        if ledger is not None:
+            proxyhash = credentialHash(self.certLocation, self.defaultDelegation['group'], self.defaultDelegation['role'])
+            ledgertimeleft = ledger.timeLeft(*(ledgerkey + (proxyhash,)))
+            if ledgertimeleft > timeleftthreshold and not self.proxyChanged:
+                self.logger.debug("Myproxy is valid: %i (from the delegation ledger)" % ledgertimeleft)
+                return
+
         myproxy = Proxy ( self.defaultDelegation )
         myproxy.userDN = myproxy.getSubjectFromCert(self.certLocation)
 
@@ -327,6 +340,8 @@ class CredentialInteractions(object):
                                  % (colors.RED, usercertDaysLeft, colors.NORMAL) )
                 #check if usercertDaysLeft ~= myproxytimeleft which means we already delegated the proxy for as long as we could
                 if abs(usercertDaysLeft*60*60*24 - myproxytimeleft) < 60*60*24 and not trustRetrListChanged: #less than one day between usercertDaysLeft and myproxytimeleft
+                    if ledger is not None:
+                        ledger.record(*(ledgerkey + (proxyhash, myproxytimeleft)))
                     return
                 #adjust the myproxy delegation time accordingly to the user cert validity
                 self.logger.info("%sDelegating your proxy for %s days instead of %s %s"\
@@ -346,4 +361,6 @@ class CredentialInteractions(object):
             except Exception as ex:
                 msg = ex._message if hasattr(ex, '_message') else str(ex)
                 raise ProxyCreationException("Problems delegating My-proxy. %s" % msg)
+        if ledger is not None:
+            ledger.record(*(ledgerkey + (proxyhash, myproxytimeleft)))
 
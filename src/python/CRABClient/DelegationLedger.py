@@ -0,0 +1,105 @@
+"""
+Ledger of the credentials delegated to myproxy.
+
+Before every command that initializes a proxy, the client asks myproxy how
+long the credential of each task worker (server DN) is still valid, and
+delegates a new one if needed. Each successful check or delegation is
+recorded here (server DN, hash of the user credential, expiration time), next
+to the CRAB cache file (~/.crab3), so that the next commands can skip the
+myproxy query while the recorded credential is valid for long enough.
+
+The hash identifies the user certificate and the VO group/role: a new
+certificate or different VOMS attributes make the record useless.
+"""
+
+import os
+import json
+import time
+import hashlib
+
+
+def credentialHash(certfile, group, role):
+    """
+    Return a hash of the user certificate and of the VO group/role, or None if
+    the certificate can not be read.
+    """
+    try:
+        with open(os.path.expanduser(certfile), 'rb') as fd:
+            certificate = fd.read()
+    except (IOError, OSError):
+        return None
+    return hashlib.sha1('%s\n%s\n%s' % (certificate, group, role)).hexdigest()
+
+
+class DelegationLedger(object):
+    """
+    On-disk ledger of the delegated credentials, stored as JSON:
+    {'myproxyserver|account|serverdn': {'serverdn': ..., 'proxyhash': ..., 'expires': ..., 'time': ...}}.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.delegations = {}
+        self.changed = False
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path) as fd:
+                    self.delegations = json.load(fd)
+            except (IOError, ValueError):
+                ## A broken ledger is just ignored, and overwritten by save().
+                self.delegations = {}
+
+
+    @staticmethod
+    def key(myproxyserver, account, serverdn):
+        return '%s|%s|%s' % (myproxyserver, account, serverdn)
+
+
+    def timeLeft(self, myproxyserver, account, serverdn, proxyhash):
+        """
+        Return the seconds left before the recorded credential expires, or 0 if there
+        is no record for this credential.
+        """
+        if proxyhash is None:
+            return 0
+        entry = self.delegations.get(self.key(myproxyserver, account, serverdn))
+        if entry is None or entry['proxyhash'] != proxyhash:
+            return 0
+        return max(0, int(entry['expires'] - time.time()))
+
+
+    def record(self, myproxyserver, account, serverdn, proxyhash, timeleft):
+        """
+        Record that the credential is valid for timeleft seconds.
+        """
+        if proxyhash is None:
+            return
+        now = int(time.time())
+        self.delegations[self.key(myproxyserver, account, serverdn)] = {'serverdn': serverdn,
+                                                                       'proxyhash': proxyhash,
+                                                                       'expires': now + int(timeleft),
+                                                                       'time': now}
+        self.changed = True
+
+
+    def forget(self, account = None):
+        """
+        Forget the delegations to the given account (or all of them).
+        """
+        for key in list(self.delegations):
+            if account is None or key.split('|')[1] == account:
+                del self.delegations[key]
+                self.changed = True
+
+
+    def save(self):
+        """
+        Write the ledger, if it changed.
+        """
+        if not self.changed:
+            return
+        tmppath = "%s.%s" % (self.path, os.getpid())
+        with open(tmppath, 'w') as fd:
+            json.dump(self.delegations, fd)
+        os.rename(tmppath, self.path)
+        self.changed = False
@@ -0,0 +1,136 @@
+"""
+Run a set of steps (typically requests to different services) concurrently,
+each one as soon as the steps it depends on are done.
+
+    graph = DependencyGraph(nworkers = 4)
+    graph.add('task', lambda results: searchTask())
+    graph.add('report', lambda results: getReport())
+    graph.add('lumis', lambda results: getLumis(results['task']), ['task'])
+    results = graph.run()    # {'task': ..., 'report': ..., 'lumis': ...}
+
+Each step is called with the dictionary of the results of the steps already
+done (it should only read the ones it depends on). A running step can add
+more steps (e.g. one per output dataset once the datasets are known); they
+can depend on any step added before them.
+
+If a step raises an exception, the steps depending on it are not run, the
+independent ones are completed, and run() raises the first exception.
+"""
+
+import sys
+import time
+import Queue
+import threading
+
+from CRABClient.TransferEngines import ThreadEngine, STOP_MESSAGE
+
+NEW = 'new'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class DependencyGraph(object):
+    """
+    Steps with dependencies, run by a pool of nworkers threads.
+    After run(), timings holds {step: (start, end)} for the steps that were run.
+    """
+
+    def __init__(self, nworkers):
+        self.nworkers = nworkers
+        self.steps = {}
+        ## The steps in the order they were added, to schedule them in that order.
+        self.order = []
+        self.states = {}
+        self.results = {}
+        self.errors = {}
+        self.timings = {}
+        self.lock = threading.Lock()
+
+
+    def add(self, name, function, depends = None):
+        depends = list(depends or [])
+        with self.lock:
+            if name in self.steps:
+                raise ValueError("Step %s already added" % name)
+            for dependency in depends:
+                if dependency not in self.steps:
+                    raise ValueError("Step %s depends on the unknown step %s" % (name, dependency))
+            self.steps[name] = (function, depends)
+            self.order.append(name)
+            self.states[name] = NEW
+
+
+    def _schedule(self, engine):
+        """
+        Start the steps whose dependencies are done, skip the ones with a failed
+        dependency. Return the number of steps started.
+        """
+        started = 0
+        with self.lock:
+            changed = True
+            while changed:
+                changed = False
+                for name in self.order:
+                    if self.states[name] != NEW:
+                        continue
+                    depstates = [self.states[dependency] for dependency in self.steps[name][1]]
+                    if any(state in [FAILED, SKIPPED] for state in depstates):
+                        self.states[name] = SKIPPED
+                        ## The steps depending on this one may be skipped too.
+                        changed = True
+                    elif all(state == DONE for state in depstates):
+                        self.states[name] = RUNNING
+                        engine.put(name)
+                        started += 1
+        return started
+
+
+    def _worker(self, inputq, doneq):
+        while True:
+            name = inputq.get()
+            if name == STOP_MESSAGE:
+                break
+            start = time.time()
+            try:
+                value, error = self.steps[name][0](self.results), None
+            except Exception:
+                value, error = None, sys.exc_info()
+            doneq.put((name, value, error, start, time.time()))
+
+
+    def run(self):
+        """
+        Run all the steps and return {step: result}. Raise the exception of the first
+        step that failed (with its traceback), after the other steps are done.
+        """
+        doneq = Queue.Queue()
+        engine = ThreadEngine(max(1, min(self.nworkers, len(self.steps))))
+        engine.start(self._worker, (doneq,))
+        try:
+            running = self._schedule(engine)
+            firstError = None
+            while running:
+                try:
+                    ## With a timeout, so that ctrl-C is not blocked.
+                    name, value, error, start, end = doneq.get(True, 1)
+                except Queue.Empty:
+                    continue
+                running -= 1
+                self.timings[name] = (start, end)
+                with self.lock:
+                    if error is None:
+                        self.results[name] = value
+                        self.states[name] = DONE
+                    else:
+                        self.errors[name] = error[1]
+                        self.states[name] = FAILED
+                        firstError = firstError or error
+                running += self._schedule(engine)
+        finally:
+            if engine.stop():
+                raise KeyboardInterrupt
+        if firstError:
+            raise firstError[0], firstError[1], firstError[2]
+        return self.results
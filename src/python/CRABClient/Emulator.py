@@ -23,8 +23,8 @@ def setEmulator(name, value):
     overrideDict[name] = value
 
 def getDefaults():
-    import RESTInteractions
+    from CRABClient.RESTSessions import PooledHTTPRequests
     from WMCore.Services.UserFileCache.UserFileCache import UserFileCache
-    return {'rest' : RESTInteractions.HTTPRequests,
+    return {'rest' : PooledHTTPRequests,
                 'ufc' : UserFileCache}
 
@@ -0,0 +1,247 @@
+"""
+Column-oriented table of the jobs of a task, built once from the status_cache.
+
+The status printers of status2 need to group and count the jobs by state, site,
+exit code, error message, ... Walking the per-job dictionaries once per printer
+(and doing list lookups inside those loops) is slow for tasks with 100k jobs.
+The table holds one list per field, in job id order, and the strings that
+repeat over the jobs (states, sites, error messages) are stored as indices in
+the list of their distinct values, so that the group-bys work on small
+integers and each printer needs a single pass over the rows.
+"""
+
+from collections import defaultdict
+
+from CRABClient.StatusCache import NON_JOB_RECORDS
+
+## Kinds of jobs.
+PROBE = 0       ## the probe job of the automatic splitting (id '0')
+JOB = 1         ## the normal jobs ('1', '2', ...)
+COMPLETING = 2  ## the completing jobs of the automatic splitting ('1-1', '1-2', ...)
+
+
+def jobIdKey(jobid):
+    """
+    Sorting key of the job ids ('1' or '1-1').
+    """
+    return tuple(int(x) for x in jobid.split('-'))
+
+
+def sortJobIds(jobids):
+    """
+    Sort the job ids, each completing job after its parent job ('1', '1-1', '1-2', '2', ...).
+    Faster than sorted(jobids, key = jobIdKey) when most of the jobs are normal jobs.
+    """
+    jobs = sorted(int(jobid) for jobid in jobids if '-' not in jobid)
+    completing = sorted((jobIdKey(jobid), jobid) for jobid in jobids if '-' in jobid)
+    if not completing:
+        return [str(jobid) for jobid in jobs]
+    result = []
+    i = 0
+    for jobid in jobs:
+        while i < len(completing) and completing[i][0][0] < jobid:
+            result.append(completing[i][1])
+            i += 1
+        result.append(str(jobid))
+        while i < len(completing) and completing[i][0][0] == jobid:
+            result.append(completing[i][1])
+            i += 1
+    result.extend(jobid for _, jobid in completing[i:])
+    return result
+
+
+class Values(object):
+    """
+    The distinct values of a column and their indices.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.indices = {}
+
+
+    def index(self, value):
+        try:
+            return self.indices[value]
+        except KeyError:
+            self.indices[value] = len(self.values)
+            self.values.append(value)
+            return self.indices[value]
+
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+
+class JobTable(object):
+    """
+    The columns are lists with one item per job (None if the job does not have the field):
+        jobids, kind, state (index in states), site (index in sites, of the last site),
+        siteHistory (the names of all the sites), walls (the wall durations of all the runs),
+        wall (of the last run), waste (the wall time of the previous runs), rss (the last
+        resident set size, in KB), cpu (the last user+system CPU time), exitcode,
+        error (index in errors, of the error message), retries, restarts, clusterids.
+    Each column is built the first time it is used, so the printers only pay for the
+    columns they need.
+    """
+
+    def __init__(self, statusCacheInfo):
+        self.jobids = sortJobIds([jobid for jobid in statusCacheInfo if jobid not in NON_JOB_RECORDS])
+        self.infos = [statusCacheInfo[jobid] for jobid in self.jobids]
+        self._states = Values()
+        self._sites = Values()
+        self._errors = Values()
+
+
+    def __getattr__(self, name):
+        builder = COLUMN_BUILDERS.get(name)
+        if builder is None:
+            raise AttributeError(name)
+        column = builder(self)
+        setattr(self, name, column)
+        return column
+
+
+    @property
+    def states(self):
+        self.state
+        return self._states
+
+
+    @property
+    def sites(self):
+        self.site
+        return self._sites
+
+
+    @property
+    def errors(self):
+        self.error
+        return self._errors
+
+
+    def _kind(self):
+        return [PROBE if jobid == '0' else (COMPLETING if '-' in jobid else JOB) for jobid in self.jobids]
+
+
+    def _state(self):
+        index = self._states.index
+        return [index(info['State']) for info in self.infos]
+
+
+    def _site(self):
+        index = self._sites.index
+        return [index(history[-1]) if history else None for history in (info.get('SiteHistory') for info in self.infos)]
+
+
+    def _siteHistory(self):
+        return [info.get('SiteHistory') or None for info in self.infos]
+
+
+    def _walls(self):
+        return [info.get('WallDurations') or None for info in self.infos]
+
+
+    def _wall(self):
+        return [walls[-1] if walls else None for walls in self.walls]
+
+
+    def _waste(self):
+        return [sum(walls[:-1]) if walls else 0 for walls in self.walls]
+
+
+    def _rss(self):
+        return [rss[-1] if rss else None for rss in (info.get('ResidentSetSize') for info in self.infos)]
+
+
+    def _cpu(self):
+        return [info['TotalSysCpuTimeHistory'][-1] + info['TotalUserCpuTimeHistory'][-1] \
+                if 'TotalSysCpuTimeHistory' in info and 'TotalUserCpuTimeHistory' in info else None for info in self.infos]
+
+
+    def _exitcode(self):
+        return [info['Error'][0] if 'Error' in info else None for info in self.infos]
+
+
+    def _error(self):
+        index = self._errors.index
+        return [index(info['Error'][1]) if 'Error' in info else None for info in self.infos]
+
+
+    def _retries(self):
+        return [info.get('Retries', 0) for info in self.infos]
+
+
+    def _restarts(self):
+        return [info.get('Restarts', 0) for info in self.infos]
+
+
+    def _clusterids(self):
+        return [info.get('JobIds', 'Unknown') for info in self.infos]
+
+
+    def __len__(self):
+        return len(self.jobids)
+
+
+    def rows(self, column = None, value = None):
+        """
+        Return the row numbers (all, or the ones where column has value).
+        """
+        if column is None:
+            return range(len(self.jobids))
+        return [row for row, val in enumerate(column) if val == value]
+
+
+    def group(self, columns, rows = None):
+        """
+        Group the rows by the values of the given columns. Return a dictionary
+        {(value1, value2, ...): [row, ...]}, where the rows are in job id order.
+        """
+        groups = defaultdict(list)
+        if rows is None:
+            rows = xrange(len(self.jobids))
+        for row in rows:
+            groups[tuple(column[row] for column in columns)].append(row)
+        return dict(groups)
+
+
+    def count(self, columns, rows = None):
+        """
+        Count the rows by the values of the given columns. Return a dictionary
+        {(value1, value2, ...): count}.
+        """
+        counts = defaultdict(int)
+        if rows is None:
+            for key in zip(*columns):
+                counts[key] += 1
+        else:
+            for row in rows:
+                counts[tuple(column[row] for column in columns)] += 1
+        return dict(counts)
+
+
+COLUMN_BUILDERS = dict((name, getattr(JobTable, '_' + name)) for name in \
+                       ['kind', 'state', 'site', 'siteHistory', 'walls', 'wall', 'waste', 'rss', 'cpu', \
+                        'exitcode', 'error', 'retries', 'restarts', 'clusterids'])
+
+
+def stateSnapshot(table):
+    """
+    Return the state of each job, {jobid: state}, to be compared with a later table.
+    """
+    return dict(zip(table.jobids, (table.states[state] for state in table.state)))
+
+
+def stateTransitions(previous, current):
+    """
+    Compare two snapshots of the job states. Return {(old state, new state): [jobid, ...]}
+    for the jobs that changed state (old state is None for the jobs that were not there),
+    with the job ids in job id order.
+    """
+    transitions = defaultdict(list)
+    for jobid in sortJobIds(current.keys()):
+        old, new = previous.get(jobid), current[jobid]
+        if old != new:
+            transitions[(old, new)].append(jobid)
+    return dict(transitions)
@@ -19,7 +19,11 @@ import PandaServerInterface as PandaInterface
 from ServerUtilities import BOOTSTRAP_CFGFILE_DUMP
 
 from CRABClient.ClientUtilities import colors, LOGGERS
-from CRABClient.JobType.UserTarball import UserTarball
+from CRABClient.JobType.UserTarball import UserTarball, listSandboxFiles
+from CRABClient.JobType.SandboxCache import defaultCacheDir
+from CRABClient.JobType.ParallelGzip import SANDBOX_COMPRESSIONS
+from CRABClient.JobType.SandboxUpload import SANDBOX_UPLOADS
+from CRABClient.JobType.SandboxEstimator import SandboxEstimate, sandboxLimit, knownSandboxLimit, recordSandboxLimit, ESTIMATE_MARGIN
 from CRABClient.JobType.CMSSWConfig import CMSSWConfig
 from CRABClient.JobType.BasicJobType import BasicJobType
 from CRABClient.ClientMapping import getParamDefaultValue
@@ -144,9 +148,31 @@ class Analysis(BasicJobType):
         ## Since ScramEnvironment is already called above and the exception is not
         ## handled, we are sure that if we reached this point it will not raise EnvironmentException.
         ## But otherwise we should take this into account.
-        with UserTarball(name=tarFilename, logger=self.logger, config=self.config) as tb:
+        sandboxCacheDir = None
+        if getattr(self.config.JobType, 'sandboxCache', getParamDefaultValue('JobType.sandboxCache')):
+            sandboxCacheDir = defaultCacheDir()
+        streamed = getattr(self.config.JobType, 'sandboxUpload', getParamDefaultValue('JobType.sandboxUpload')) == 'stream'
+        with UserTarball(name=tarFilename, logger=self.logger, config=self.config, cachedir=sandboxCacheDir, streamed=streamed) as tb:
             inputFiles = [re.sub(r'^file:', '', file) for file in getattr(self.config.JobType, 'inputFiles', [])]
-            tb.addFiles(userFiles=inputFiles, cfgOutputName=cfgOutputName)
+            trees = listSandboxFiles(self.config, self.logger, scram.getCmsswBase(), inputFiles, cfgOutputName)
+            ## Stop before compressing and uploading a sandbox that the CRAB cache would refuse.
+            ## Only if the CRAB cache told its limit: the default one is a guess, and the
+            ## CRAB cache can only tell a different limit if the sandbox is sent to it.
+            estimate = SandboxEstimate(trees)
+            knownLimit = knownSandboxLimit(filecacheurl)
+            limit = sandboxLimit(filecacheurl)
+            self.logger.debug("Estimated sandbox size: %s B (the limit is %s B)" % (estimate.estimatedSize, limit))
+            if estimate.estimatedSize > limit * (1 + ESTIMATE_MARGIN):
+                if knownLimit:
+                    msg  = "%sError%s: The input sandbox would be bigger than the maximum allowed size." % (colors.RED, colors.NORMAL)
+                    msg += "\n" + estimate.report(limit)
+                    msg += "\nUse 'crab sandbox-inspect' to check the sandbox content without submitting."
+                    raise ClientException(msg)
+                msg  = "%sWarning%s: The input sandbox may be bigger than the maximum size accepted by the CRAB cache." % (colors.RED, colors.NORMAL)
+                msg += " Uploading it anyway."
+                msg += "\n" + estimate.report(limit)
+                self.logger.warning(msg)
+            tb.addFiles(trees=trees)
             configArguments['adduserfiles'] = [os.path.basename(f) for f in inputFiles]
             try:
                 # convert from unicode to ascii to make it work with older pycurl versions
@@ -159,6 +185,7 @@ class Analysis(BasicJobType):
                     if re_match:
                         ISBSize = int(re_match.group(1))
                         ISBSizeLimit = int(re_match.group(2))
+                        recordSandboxLimit(filecacheurl, ISBSizeLimit)
                         reason  = "%sError%s:" % (colors.RED, colors.NORMAL)
                         reason += " Input sanbox size is ~%sMB. This is bigger than the maximum allowed size of %sMB." % (ISBSize/1024/1024, ISBSizeLimit/1024/1024)
                         ISBContent = sorted(tb.content, reverse=True)
@@ -330,6 +357,18 @@ class Analysis(BasicJobType):
             msg = "Invalid CRAB configuration: Parameter JobType.psetName not specified."
             return False, msg
 
+        compression = getattr(config.JobType, 'sandboxCompression', getParamDefaultValue('JobType.sandboxCompression'))
+        if compression not in SANDBOX_COMPRESSIONS:
+            msg  = "Invalid CRAB configuration: Parameter JobType.sandboxCompression has an invalid value ('%s')." % (compression)
+            msg += "\nAllowed values are: %s." % (SANDBOX_COMPRESSIONS)
+            return False, msg
+
+        upload = getattr(config.JobType, 'sandboxUpload', getParamDefaultValue('JobType.sandboxUpload'))
+        if upload not in SANDBOX_UPLOADS:
+            msg  = "Invalid CRAB configuration: Parameter JobType.sandboxUpload has an invalid value ('%s')." % (upload)
+            msg += "\nAllowed values are: %s." % (SANDBOX_UPLOADS)
+            return False, msg
+
         return True, "Valid configuration"
 
 
@@ -0,0 +1,133 @@
+"""
+A gzip writer that compresses on several cores, for the user sandbox (see UserTarball).
+
+The data is cut into blocks of BLOCK_SIZE bytes which are deflated independently by a
+pool of threads (zlib releases the GIL while compressing). Each block but the last one
+ends with a sync flush, so that the compressed blocks can be put one after the other
+in a single deflate stream. The result is one standard gzip member, as written by
+pigz --independent, and is read by gzip, tar and tarfile as usual. The blocks do not
+share their dictionary, which costs a fraction of a percent in size with 1 MB blocks.
+
+    gz = ParallelGzipFile('sandbox.tar.gz')
+    tar = tarfile.TarFile(fileobj = gz, mode = 'w')
+"""
+
+import zlib
+import gzip
+import struct
+import collections
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+## The size of the blocks compressed independently.
+BLOCK_SIZE = 1024 * 1024
+## The values of JobType.sandboxCompression.
+SANDBOX_COMPRESSIONS = ['gzip', 'parallel']
+
+
+def compressBlock(data, compresslevel, last):
+    """
+    Deflate a block, ending at a byte boundary (or the end of the stream if last).
+    """
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def gzipWriter(fileobj, compression = 'gzip', compresslevel = 9):
+    """
+    A gzip file writing into fileobj, compressed by one thread (GzipFile) or by
+    several ('parallel'), without file name and modification time in the header.
+    """
+    if compression == 'parallel':
+        return ParallelGzipFile(fileobj = fileobj, compresslevel = compresslevel)
+    return gzip.GzipFile(filename = '', mode = 'wb', compresslevel = compresslevel, fileobj = fileobj, mtime = 0)
+
+
+class ParallelGzipFile(object):
+    """
+    A write-only gzip file, with the blocks compressed by nthreads threads
+    (by default as many as the CPUs). The header has no file name and no
+    modification time, so that the same data gives the same file.
+    """
+
+    def __init__(self, filename = None, fileobj = None, compresslevel = 9, nthreads = None, blocksize = BLOCK_SIZE):
+        self.myfileobj = None
+        if fileobj is None:
+            fileobj = self.myfileobj = open(filename, 'wb')
+        self.fileobj = fileobj
+        self.name = filename or getattr(fileobj, 'name', '')
+        self.compresslevel = compresslevel
+        self.blocksize = blocksize
+        self.nthreads = nthreads or multiprocessing.cpu_count()
+        self.pool = ThreadPool(self.nthreads)
+        ## The blocks being compressed, in order.
+        self.pending = collections.deque()
+        self.buffer = []
+        self.buffered = 0
+        self.crc = zlib.crc32('') & 0xffffffff
+        self.size = 0
+        self.closed = False
+        ## Magic, deflate, no flags, no modification time, extra flags, unknown OS, as GzipFile.
+        self.fileobj.write('\037\213\010\000' + struct.pack('<I', 0) + ('\002' if compresslevel == 9 else '\000') + '\377')
+
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write() on closed ParallelGzipFile object")
+        if not data:
+            return
+        self.crc = zlib.crc32(data, self.crc) & 0xffffffff
+        self.size += len(data)
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.blocksize:
+            data = ''.join(self.buffer)
+            start = 0
+            while len(data) - start >= self.blocksize:
+                self._submit(data[start:start + self.blocksize], False)
+                start += self.blocksize
+            self.buffer = [data[start:]] if start < len(data) else []
+            self.buffered = len(data) - start
+
+
+    def _submit(self, block, last):
+        self.pending.append(self.pool.apply_async(compressBlock, (block, self.compresslevel, last)))
+        ## Keep the memory bounded: at most two blocks per thread in flight.
+        while len(self.pending) > 2 * self.nthreads:
+            self.fileobj.write(self.pending.popleft().get())
+
+
+    def tell(self):
+        """
+        The number of bytes written, before compression (as GzipFile).
+        """
+        return self.size
+
+
+    def flush(self):
+        pass
+
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._submit(''.join(self.buffer), True)
+            self.buffer = []
+            while self.pending:
+                self.fileobj.write(self.pending.popleft().get())
+            self.fileobj.write(struct.pack('<II', self.crc, self.size & 0xffffffff))
+        finally:
+            self.pool.close()
+            self.pool.join()
+            if self.myfileobj:
+                self.myfileobj.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, excType, excValue, excTrace):
+        self.close()
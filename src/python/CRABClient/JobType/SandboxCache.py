@@ -0,0 +1,337 @@
+"""
+Cache of the compressed pieces of the user sandbox (see UserTarball), to build the
+sandbox of a new task without reading and compressing again the directories that did
+not change since a previous submission, and to skip the upload of a sandbox that the
+CRAB cache already has.
+
+The sandbox is a tar archive compressed with gzip. A gzip file can be made of several
+members, one after the other, and a tar archive can be cut between any two entries, so
+the sandbox is assembled as the concatenation of
+    gzip(tar entries of lib/) gzip(tar entries of src/A/B/data/) ... gzip(end of archive)
+and it is read by tar and tarfile as any other .tar.gz.
+
+The piece of each directory (or file) added to the sandbox is kept in the cache directory
+under the fingerprint of its input: the sha1 of the name in the tarball, size, mtime,
+ctime, inode and mode of all its files and subdirectories. Building the sandbox of an
+unchanged CMSSW area then only needs a stat() of each file and a copy of the cached
+pieces. Inputs smaller than CACHE_MIN_SIZE (the user input files, the pset, ...) are
+compressed directly into the sandbox; they are fingerprinted by their content.
+
+The cache also remembers the hash key given by the CRAB cache to each sandbox uploaded
+(by the fingerprint of the whole sandbox), so that the same sandbox is not uploaded
+again as long as the CRAB cache has it.
+
+The cache directory is ~/.crab3_sandbox (next to the CRAB cache file), or the directory
+given by the CRAB3_SANDBOX_CACHE environment variable, e.g. to keep it out of a home
+directory with a small quota. It is kept below CACHE_MAX_SIZE, or the size in MB given by
+the CRAB3_SANDBOX_CACHE_SIZE environment variable. The cache is disabled by
+config.JobType.sandboxCache = False.
+"""
+
+import os
+import json
+import stat
+import time
+import shutil
+import hashlib
+import tarfile
+from urlparse import urlparse
+
+import CRABClient.Emulator
+from CRABClient import __version__
+from CRABClient.JobType.ParallelGzip import gzipWriter
+from CRABClient.JobType.TreeWalk import walkTree, addEntries
+
+## Inputs with less than this many bytes are not cached.
+CACHE_MIN_SIZE = 1024 * 1024
+## The pieces not used for this long are removed from the cache (seconds).
+PIECE_TTL = 30 * 24 * 3600
+## The default maximum size of the cache; the least recently used pieces are removed above it
+## (bytes). Kept well below the usual home directory quotas.
+CACHE_MAX_SIZE = 500 * 1024 * 1024
+## The file of the cache directory with the hash keys of the uploaded sandboxes.
+UPLOADS_FILE = 'uploads.json'
+## The compression level of the pieces, as tarfile uses for 'w:gz'.
+COMPRESS_LEVEL = 9
+
+
+def crabCacheFile():
+    """
+    The CRAB cache file, as SubCommand.crabcachepath (for the code that runs outside of a command).
+    """
+    return os.environ.get('CRAB3_CACHE_FILE', os.path.join(os.path.expanduser('~'), '.crab3'))
+
+
+def defaultCacheDir():
+    """
+    The cache directory: $CRAB3_SANDBOX_CACHE, or next to the CRAB cache file.
+    """
+    return os.environ.get('CRAB3_SANDBOX_CACHE') or crabCacheFile() + '_sandbox'
+
+
+def cacheMaxSize():
+    """
+    The maximum size of the cache in bytes: $CRAB3_SANDBOX_CACHE_SIZE (in MB), or CACHE_MAX_SIZE.
+    """
+    try:
+        return int(float(os.environ['CRAB3_SANDBOX_CACHE_SIZE']) * 1024 * 1024)
+    except (KeyError, ValueError):
+        return CACHE_MAX_SIZE
+
+
+def inputKey(entries):
+    """
+    The fingerprint of the entries of walkTree(), from the name in the tarball, size,
+    mtime, ctime, inode and mode of each one.
+    """
+    keys = sorted((entry.arcname, entry.stat.st_size, entry.stat.st_mtime, entry.stat.st_ctime,
+                   entry.stat.st_ino, entry.stat.st_mode) for entry in entries)
+    return hashlib.sha1(repr(keys)).hexdigest()
+
+
+def contentFingerprint(entries):
+    """
+    The fingerprint of a small input, from the names and the content of its files.
+    """
+    hasher = hashlib.sha1()
+    for entry in entries:
+        hasher.update("%s\0%d\0%o\0" % (entry.arcname, entry.stat.st_size, entry.stat.st_mode))
+        if stat.S_ISREG(entry.stat.st_mode):
+            with open(entry.path, 'rb') as fd:
+                for piece in iter(lambda: fd.read(1024 * 1024), ''):
+                    hasher.update(piece)
+    return hasher.hexdigest()
+
+
+def inputSize(entries):
+    return sum(entry.stat.st_size for entry in entries if stat.S_ISREG(entry.stat.st_mode))
+
+
+def pieceFingerprint(entries):
+    """
+    The fingerprint of an input of the sandbox, as CachedTarFile.addEntries takes it:
+    by its content if it is small, by inputKey() otherwise.
+    """
+    if inputSize(entries) < CACHE_MIN_SIZE:
+        return contentFingerprint(entries)
+    return inputKey(entries)
+
+
+def sandboxFingerprint(trees):
+    """
+    The fingerprint of the sandbox made of trees (a list of walkTree() results), as
+    CachedTarFile.fingerprint, without making it.
+    """
+    return hashlib.sha1(' '.join(pieceFingerprint(entries) for entries in trees)).hexdigest()
+
+
+def userProxyFile():
+    return os.environ.get('X509_USER_PROXY') or '/tmp/x509up_u%d' % os.getuid()
+
+
+def writePiece(fileobj, entries, compression = 'gzip'):
+    """
+    Write the entries of walkTree() as a gzip member with their tar entries (without the
+    end of archive) into fileobj. Return the list of (name, size) of the tar entries.
+    """
+    gz = gzipWriter(fileobj, compression, COMPRESS_LEVEL)
+    tar = tarfile.TarFile(fileobj = gz, mode = 'w')
+    addEntries(tar, entries)
+    ## Not tar.close(), which would write the end of archive.
+    gz.close()
+    return [(member.name, member.size) for member in tar.getmembers()]
+
+
+class SandboxCache(object):
+    """
+    The pieces of the sandboxes, and the hash keys of the uploaded sandboxes.
+    The pieces are kept below maxsize bytes (by default cacheMaxSize()).
+    """
+
+    def __init__(self, directory, logger, maxsize = None):
+        self.directory = directory
+        self.logger = logger
+        self.maxsize = cacheMaxSize() if maxsize is None else maxsize
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+
+    def piece(self, entries, compression = 'gzip'):
+        """
+        Return (piece file, list of (name, size) of its tar entries, fingerprint, whether it
+        was already in the cache) for an input of the sandbox, given by its walkTree() entries.
+        The piece is created if needed, compressed as given by compression (see
+        ParallelGzip.gzipWriter).
+        """
+        fingerprint = inputKey(entries)
+        piecefile = os.path.join(self.directory, fingerprint + '.tgz')
+        membersfile = os.path.join(self.directory, fingerprint + '.members')
+        try:
+            with open(membersfile) as fd:
+                members = json.load(fd)
+            if os.path.isfile(piecefile):
+                now = time.time()
+                os.utime(piecefile, (now, now))
+                return piecefile, members, fingerprint, True
+        except (IOError, ValueError):
+            pass
+        tmpfile = "%s.%s" % (piecefile, os.getpid())
+        try:
+            with open(tmpfile, 'wb') as fd:
+                members = writePiece(fd, entries, compression)
+            with open(membersfile + '.%s' % os.getpid(), 'w') as fd:
+                json.dump(members, fd)
+            os.rename(membersfile + '.%s' % os.getpid(), membersfile)
+            os.rename(tmpfile, piecefile)
+        finally:
+            for leftover in [tmpfile, membersfile + '.%s' % os.getpid()]:
+                if os.path.isfile(leftover):
+                    os.remove(leftover)
+        return piecefile, members, fingerprint, False
+
+
+    def prune(self):
+        """
+        Remove the pieces not used for PIECE_TTL, and the least recently used ones above maxsize.
+        """
+        pieces = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.tgz'):
+                path = os.path.join(self.directory, name)
+                st = os.stat(path)
+                pieces.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in pieces)
+        now = time.time()
+        for mtime, size, path in sorted(pieces):
+            if now - mtime < PIECE_TTL and total <= self.maxsize:
+                break
+            self.logger.debug("Removing %s from the sandbox cache" % path)
+            for filename in [path, path[:-len('.tgz')] + '.members']:
+                if os.path.isfile(filename):
+                    os.remove(filename)
+            total -= size
+
+
+    def _loadUploads(self):
+        try:
+            with open(os.path.join(self.directory, UPLOADS_FILE)) as fd:
+                return json.load(fd)
+        except (IOError, ValueError):
+            return {}
+
+
+    def uploadedHashkey(self, filecacheurl, fingerprint):
+        """
+        The hash key given by the CRAB cache to the sandbox with this fingerprint, if it was uploaded there.
+        """
+        return self._loadUploads().get(filecacheurl, {}).get(fingerprint)
+
+
+    def recordUpload(self, filecacheurl, fingerprint, hashkey):
+        uploads = self._loadUploads()
+        uploads.setdefault(filecacheurl, {})[fingerprint] = hashkey
+        filename = os.path.join(self.directory, UPLOADS_FILE)
+        with open(filename + '.%s' % os.getpid(), 'w') as fd:
+            json.dump(uploads, fd)
+        os.rename(filename + '.%s' % os.getpid(), filename)
+
+
+    def existsInCRABCache(self, filecacheurl, hashkey, proxyfilename = None):
+        """
+        Ask the CRAB cache whether it has the file with this hash key (the 'fileinfo'
+        subresource of its info resource). Return False if it can not be asked.
+        """
+        proxyfilename = proxyfilename or userProxyFile()
+        parsedurl = urlparse(filecacheurl)
+        try:
+            server = CRABClient.Emulator.getEmulator('rest')(parsedurl.netloc, proxyfilename, proxyfilename, version = __version__)
+            dictresult, _, _ = server.get(parsedurl.path.rstrip('/') + '/info', data = {'subresource': 'fileinfo', 'hashkey': hashkey})
+            result = dictresult['result'][0] if dictresult.get('result') else {}
+            return bool(result.get('exists'))
+        except Exception as ex:
+            self.logger.debug("Cannot ask the CRAB cache whether it has the sandbox %s: %s" % (hashkey, ex))
+            return False
+
+
+class CachedTarFile(object):
+    """
+    A .tar.gz written piece by piece, with the pieces of the big inputs taken from
+    (or added to) a SandboxCache. It has the part of the TarFile interface used by
+    UserTarball (add, getmembers, getnames, close, name, closed, format), and
+    addEntries() for the entries already listed by walkTree().
+    fingerprint is the fingerprint of the whole tarball, once closed.
+    The pieces added to the cache are compressed as given by compression
+    (see ParallelGzip.gzipWriter); the small ones always with one thread.
+    The tarball is written into fileobj instead of the file name, if given.
+    """
+
+    format = tarfile.GNU_FORMAT
+
+    def __init__(self, name, cache, logger, compression = 'gzip', fileobj = None):
+        self.name = os.path.abspath(name)
+        self.cache = cache
+        self.logger = logger
+        self.compression = compression
+        self.fileobj = fileobj or open(self.name, 'wb')
+        self.closed = False
+        self.members = []
+        self.fingerprints = []
+        self.fingerprint = None
+        ## {'cached': number of pieces taken from the cache, 'new': pieces added to the cache, 'direct': not cached}.
+        self.stats = {'cached': 0, 'new': 0, 'direct': 0}
+
+
+    def add(self, name, arcname = None, recursive = True):
+        if arcname is None:
+            arcname = os.path.basename(name)
+        self.addEntries(walkTree(name, arcname, recursive))
+
+
+    def addEntries(self, entries):
+        """
+        Add the entries of walkTree(), as one piece.
+        """
+        if self.closed:
+            raise IOError("CachedTarFile is closed")
+        if inputSize(entries) < CACHE_MIN_SIZE:
+            self.fingerprints.append(contentFingerprint(entries))
+            self.members.extend(writePiece(self.fileobj, entries))
+            self.stats['direct'] += 1
+            return
+        piecefile, members, fingerprint, cached = self.cache.piece(entries, self.compression)
+        self.logger.debug("%s %s in the sandbox cache" % ("Found" if cached else "Added", entries[0].arcname))
+        with open(piecefile, 'rb') as fd:
+            shutil.copyfileobj(fd, self.fileobj, 1024 * 1024)
+        self.members.extend(members)
+        self.fingerprints.append(fingerprint)
+        self.stats['cached' if cached else 'new'] += 1
+
+
+    def getmembers(self):
+        members = []
+        for name, size in self.members:
+            member = tarfile.TarInfo(name)
+            member.size = size
+            members.append(member)
+        return members
+
+
+    def getnames(self):
+        return [name for name, _ in self.members]
+
+
+    def close(self):
+        if self.closed:
+            return
+        ## The end of the archive, in its own gzip member.
+        gz = gzipWriter(self.fileobj, 'gzip', COMPRESS_LEVEL)
+        tarfile.TarFile(fileobj = gz, mode = 'w').close()
+        gz.close()
+        self.fileobj.close()
+        self.closed = True
+        self.fingerprint = hashlib.sha1(' '.join(self.fingerprints)).hexdigest()
+        self.logger.debug("Sandbox pieces: %(cached)d from the cache, %(new)d added to the cache, %(direct)d not cached" % self.stats)
+        try:
+            self.cache.prune()
+        except OSError as ex:
+            self.logger.debug("Cannot clean the sandbox cache: %s" % ex)
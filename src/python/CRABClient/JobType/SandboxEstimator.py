@@ -0,0 +1,166 @@
+"""
+Estimate the size of the user sandbox before making it, to stop a submission whose
+sandbox would be refused by the CRAB cache before spending the time to compress and
+upload it (see Analysis.run and the sandbox_inspect command).
+
+The files are listed by UserTarball.listSandboxFiles (a stat() of each, no read). The files
+are grouped by type (their extension), samples of SAMPLE_SIZE bytes of the few
+biggest files of each type are compressed, and the compressed size of each file is
+estimated with the compression ratio of its type.
+
+The maximum size of the sandbox is told by the CRAB cache when it refuses one. It is
+remembered in the server information cache (next to the CRAB cache file ~/.crab3),
+and DEFAULT_SANDBOX_LIMIT is used as long as it is not known. A submission is only
+stopped by the estimate against a limit told by the CRAB cache: against the default
+one it is only warned, so that a CRAB cache accepting more still gets the sandbox.
+"""
+
+from __future__ import division
+
+import os
+import zlib
+import stat
+
+from CRABClient.ServerInfoCache import ServerInfoCache
+from CRABClient.JobType.SandboxCache import crabCacheFile, COMPRESS_LEVEL
+
+## The size of the samples compressed to estimate the compression ratio of a file type,
+## taken in SAMPLE_SLICES slices spread over the file.
+SAMPLE_SIZE = 64 * 1024
+SAMPLE_SLICES = 8
+## The number of files of each type sampled (the biggest ones).
+SAMPLES_PER_TYPE = 8
+## The size of a compressed tar header (512 bytes with mostly zeros).
+COMPRESSED_HEADER_SIZE = 100
+## The maximum sandbox size of the CRAB cache, until the CRAB cache tells another one.
+DEFAULT_SANDBOX_LIMIT = 100 * 1024 * 1024
+## Only stop a submission if the estimate is above the limit by this fraction.
+ESTIMATE_MARGIN = 0.1
+## The number of files listed in the reports.
+REPORT_TOP = 20
+## The 'instance' under which the limits of the CRAB caches are kept in the server information cache.
+CRABCACHE_INSTANCE = 'crabcache'
+
+
+def fileType(name):
+    """
+    The type of a file for the compression ratio: its extension, also for versioned
+    libraries (libA.so.1 is a .so).
+    """
+    name = os.path.basename(name).lower()
+    if '.so.' in name:
+        return '.so'
+    return os.path.splitext(name)[1] or '(none)'
+
+
+def sampleRatio(paths):
+    """
+    The compression ratio of a sample of each file (the whole file if small), made of
+    slices spread from its beginning to its end (libraries mix code, symbols and data).
+    """
+    raw, compressed = 0, 0
+    slicesize = SAMPLE_SIZE // SAMPLE_SLICES
+    for path, size in paths:
+        try:
+            with open(path, 'rb') as fd:
+                if size <= SAMPLE_SIZE:
+                    data = fd.read()
+                else:
+                    slices = []
+                    for i in range(SAMPLE_SLICES):
+                        fd.seek((size - slicesize) * i // (SAMPLE_SLICES - 1))
+                        slices.append(fd.read(slicesize))
+                    data = ''.join(slices)
+        except IOError:
+            continue
+        raw += len(data)
+        compressed += len(zlib.compress(data, COMPRESS_LEVEL))
+    return compressed / raw if raw else 1.0
+
+
+class SandboxEstimate(object):
+    """
+    The estimated compressed size of the sandbox made of trees (a list of walkTree() results).
+    files is the list of (size, name in the tarball, path) of the files, biggest first.
+    """
+
+    def __init__(self, trees):
+        self.files = []
+        self.nentries = 0
+        for entries in trees:
+            for entry in entries:
+                self.nentries += 1
+                if stat.S_ISREG(entry.stat.st_mode):
+                    self.files.append((entry.stat.st_size, entry.arcname, entry.path))
+        self.files.sort(reverse = True)
+        self.totalSize = sum(size for size, _, _ in self.files)
+        byType = {}
+        for size, arcname, path in self.files:
+            byType.setdefault(fileType(arcname), []).append((path, size))
+        ## {type: (compression ratio, total size of the files of that type)}.
+        self.types = {}
+        for ftype, paths in byType.iteritems():
+            self.types[ftype] = (sampleRatio(paths[:SAMPLES_PER_TYPE]), sum(size for _, size in paths))
+        self.estimatedSize = int(sum(ratio * size for ratio, size in self.types.itervalues()) + self.nentries * COMPRESSED_HEADER_SIZE)
+
+
+    def estimatedFileSize(self, size, arcname):
+        return int(size * self.types[fileType(arcname)][0])
+
+
+    def report(self, limit = None, top = REPORT_TOP):
+        """
+        The estimate, the file types, and the top biggest files, as text.
+        """
+        mb = 1024 * 1024
+        lines = ["Sandbox: %d files, %.1f MB, estimated %.1f MB compressed" % (len(self.files), self.totalSize / mb, self.estimatedSize / mb)]
+        if limit:
+            lines[0] += " (the limit is %.1f MB)" % (limit / mb)
+        lines.append("Size by file type [MB] (uncompressed, estimated compressed):")
+        for ratio, size, ftype in sorted(((ratio, size, ftype) for ftype, (ratio, size) in self.types.iteritems()),
+                                         key = lambda typeinfo: typeinfo[0] * typeinfo[1], reverse = True)[:top]:
+            lines.append("%10.1f %10.1f  %s" % (size / mb, ratio * size / mb, ftype))
+        lines.append("Biggest files [MB] (uncompressed, estimated compressed):")
+        for size, arcname, _ in self.files[:top]:
+            lines.append("%10.1f %10.1f  %s" % (size / mb, self.estimatedFileSize(size, arcname) / mb, arcname))
+        if len(self.files) > top:
+            lines.append("... and %d more files" % (len(self.files) - top))
+        return "\n".join(lines)
+
+
+def sandboxLimitCache():
+    return ServerInfoCache(crabCacheFile() + '_serverinfo')
+
+
+def knownSandboxLimit(filecacheurl = None):
+    """
+    The maximum sandbox size told by the CRAB cache at filecacheurl (or the smallest one
+    of the CRAB caches known, if filecacheurl is not given), or None if it was not told.
+    """
+    cache = sandboxLimitCache()
+    if filecacheurl:
+        limits = [cache.get(CRABCACHE_INSTANCE, filecacheurl, 'sandboxlimit')]
+    else:
+        limits = [cache.get(CRABCACHE_INSTANCE, url, 'sandboxlimit') for url in cache.info.get(CRABCACHE_INSTANCE, {})]
+    limits = [limit for limit in limits if limit]
+    return min(limits) if limits else None
+
+
+def sandboxLimit(filecacheurl = None):
+    """
+    As knownSandboxLimit, with DEFAULT_SANDBOX_LIMIT if the limit is not known.
+    """
+    limit = knownSandboxLimit(filecacheurl)
+    return DEFAULT_SANDBOX_LIMIT if limit is None else limit
+
+
+def recordSandboxLimit(filecacheurl, limit):
+    """
+    Remember the maximum sandbox size told by the CRAB cache at filecacheurl (if the cache can be written).
+    """
+    cache = sandboxLimitCache()
+    cache.set(CRABCACHE_INSTANCE, filecacheurl, 'sandboxlimit', limit)
+    try:
+        cache.save()
+    except (IOError, OSError):
+        pass
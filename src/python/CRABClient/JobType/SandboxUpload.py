@@ -0,0 +1,284 @@
+"""
+Streamed upload of the user sandbox to the CRAB cache (config.JobType.sandboxUpload = 'stream').
+
+With the default upload, the whole sandbox is written to the task directory, then read
+again to compute its hash key, then read again to be sent. In the streamed upload the
+sandbox is sent while it is made, so that the submission takes about the longest of
+the compression and of the transfer instead of their sum:
+
+    producer thread:  tar entries -> gzip -> StreamPipe --(bounded queue)--> main thread: PUT, chunked
+                           \-> SandboxChecksum (or a checksum thread, with the sandbox cache)
+
+The hash key of the sandbox is computed from the data read by the producer, which writes
+the members sorted by name (the order of the hash key), and sent as the last field of the
+multipart form, after the sandbox. When the tarball is assembled from the pieces of the
+sandbox cache, whose files are not read again, it is computed from the listing of its
+files (walkTree results) by another thread.
+The pipe keeps at most STREAM_QUEUE_CHUNKS chunks of STREAM_CHUNK_SIZE bytes, so that
+a slow transfer slows down the compression instead of filling the memory. A local copy
+of the sandbox can be written on the way (config.JobType.sandboxLocalCopy).
+"""
+
+import os
+import sys
+import json
+import uuid
+import Queue
+import httplib
+import hashlib
+import threading
+from urlparse import urlparse
+
+from CRABClient import __version__
+from CRABClient.JobType.TreeWalk import tarInfo
+from CRABClient.JobType.SandboxCache import userProxyFile
+
+## The size of the chunks sent to the CRAB cache.
+STREAM_CHUNK_SIZE = 1024 * 1024
+## The number of chunks made and not yet sent after which the compression waits.
+STREAM_QUEUE_CHUNKS = 8
+## The timeout of the socket of the upload (seconds).
+UPLOAD_TIMEOUT = 300
+## The values of JobType.sandboxUpload.
+SANDBOX_UPLOADS = ['file', 'stream']
+
+
+def sandboxChecksum(trees, excludeList = None):
+    """
+    The hash key of the sandbox made of trees (a list of walkTree() results), as
+    calculateChecksum of WMCore computes it from the tarball: the sha256 of the name,
+    and of the content for a file, of each member sorted by name, except the members
+    in excludeList.
+    """
+    excludeList = excludeList or []
+    members = []
+    for entries in trees:
+        for entry in entries:
+            info = tarInfo(entry)
+            if info is not None and info.name not in excludeList:
+                members.append((info.name, entry.path, info.isreg()))
+    hasher = hashlib.sha256()
+    for name, path, isfile in sorted(members, key = lambda member: member[0]):
+        hasher.update(name)
+        if isfile:
+            with open(path, 'rb') as fd:
+                for piece in iter(lambda: fd.read(1024 * 1024), ''):
+                    hasher.update(piece)
+    return hasher.hexdigest()
+
+
+def sortedEntries(trees):
+    """
+    The entries of trees (a list of walkTree() results) in one list, sorted by the name
+    of their member in the tarball, as the hash key is computed (a directory is still
+    before its content).
+    """
+    entries = [entry for tree in trees for entry in tree]
+    return sorted(entries, key = lambda entry: entry.arcname.replace(os.sep, '/').lstrip('/'))
+
+
+class SandboxChecksum(object):
+    """
+    The hash key of the sandbox, as sandboxChecksum(), computed from the members and the
+    data given by addEntries() while the tarball is made, from sortedEntries().
+    """
+
+    def __init__(self, excludeList = None):
+        self.excludeList = excludeList or []
+        self.hasher = hashlib.sha256()
+        self.last = None
+        self.included = False
+
+
+    def member(self, info):
+        if self.last is not None and info.name < self.last:
+            raise ValueError("The sandbox members are not sorted by name: %s after %s" % (info.name, self.last))
+        self.last = info.name
+        self.included = info.name not in self.excludeList
+        if self.included:
+            self.hasher.update(info.name)
+
+
+    def update(self, data):
+        if self.included:
+            self.hasher.update(data)
+
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+
+class ResultThread(threading.Thread):
+    """
+    A thread running function(*args), whose result (or exception) is given by result().
+    """
+
+    def __init__(self, function, *args):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.function = function
+        self.args = args
+        self.value = None
+        self.excInfo = None
+        self.start()
+
+
+    def run(self):
+        try:
+            self.value = self.function(*self.args)
+        except BaseException:
+            self.excInfo = sys.exc_info()
+
+
+    def result(self):
+        ## join() with a timeout, to keep Ctrl-C working in the main thread.
+        while self.isAlive():
+            self.join(1)
+        if self.excInfo:
+            raise self.excInfo[0], self.excInfo[1], self.excInfo[2]
+        return self.value
+
+
+class StreamPipe(object):
+    """
+    A file object for the writer (a TarFile or gzip file) whose data is read by chunks()
+    in another thread. close() ends the data; abort() makes the writes fail (when
+    nothing reads them any more). With copyname, the data is also written to that file,
+    and detach() lets the writer finish that copy when nothing reads the data any more.
+    """
+
+    def __init__(self, copyname = None, chunksize = STREAM_CHUNK_SIZE, maxchunks = STREAM_QUEUE_CHUNKS):
+        self.name = copyname or ''
+        self.chunksize = chunksize
+        self.queue = Queue.Queue(maxchunks)
+        self.copy = open(copyname, 'wb') if copyname else None
+        self.buffer = []
+        self.buffered = 0
+        self.size = 0
+        self.closed = False
+        self.aborted = False
+        self.detached = False
+
+
+    def _put(self, chunk):
+        while True:
+            if self.aborted:
+                raise IOError("The streamed upload of the sandbox was interrupted")
+            if self.detached:
+                return
+            try:
+                self.queue.put(chunk, True, 1)
+                return
+            except Queue.Full:
+                pass
+
+
+    def write(self, data):
+        if self.closed:
+            raise IOError("StreamPipe is closed")
+        if self.aborted:
+            raise IOError("The streamed upload of the sandbox was interrupted")
+        if self.copy:
+            self.copy.write(data)
+        self.size += len(data)
+        if self.detached:
+            return
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.chunksize:
+            self._put(''.join(self.buffer))
+            self.buffer, self.buffered = [], 0
+
+
+    def tell(self):
+        return self.size
+
+
+    def flush(self):
+        pass
+
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.copy:
+            self.copy.close()
+        if self.aborted or self.detached:
+            return
+        if self.buffer:
+            self._put(''.join(self.buffer))
+            self.buffer, self.buffered = [], 0
+        self._put(None)
+
+
+    def abort(self):
+        self.aborted = True
+
+
+    def detach(self):
+        self.detached = True
+
+
+    def chunks(self):
+        """
+        The data written, by chunks, until close().
+        """
+        while True:
+            try:
+                chunk = self.queue.get(True, 1)
+            except Queue.Empty:
+                continue
+            if chunk is None:
+                return
+            yield chunk
+
+
+def streamUpload(filecacheurl, pipe, hashkey, filename = 'sandbox.tar.gz', proxyfilename = None, logger = None):
+    """
+    Send the data of pipe to the file resource of the CRAB cache at filecacheurl, as
+    UserFileCache.upload does with a file: a PUT of a multipart form with the 'inputfile'
+    and the 'hashkey' fields, here with a chunked transfer encoding. hashkey is called
+    once all the data is sent, and gives the hash key (so that it can be computed meanwhile).
+    Return the result of the CRAB cache (a dictionary with the 'hashkey'), or raise
+    httplib.HTTPException (with status, reason, headers, result and url) if it fails.
+    """
+    parsedurl = urlparse(filecacheurl)
+    url = filecacheurl.rstrip('/') + '/file'
+    if parsedurl.scheme == 'https':
+        proxyfilename = proxyfilename or userProxyFile()
+        conn = httplib.HTTPSConnection(parsedurl.netloc, key_file = proxyfilename, cert_file = proxyfilename, timeout = UPLOAD_TIMEOUT)
+    else:
+        conn = httplib.HTTPConnection(parsedurl.netloc, timeout = UPLOAD_TIMEOUT)
+    boundary = uuid.uuid4().hex
+    def send(data):
+        conn.send('%x\r\n%s\r\n' % (len(data), data))
+    try:
+        conn.putrequest('PUT', parsedurl.path.rstrip('/') + '/file', skip_accept_encoding = True)
+        conn.putheader('Content-Type', 'multipart/form-data; boundary=%s' % boundary)
+        conn.putheader('Transfer-Encoding', 'chunked')
+        conn.putheader('Accept', 'application/json')
+        conn.putheader('User-Agent', 'CRABClient/%s' % __version__)
+        conn.endheaders()
+        send('--%s\r\nContent-Disposition: form-data; name="inputfile"; filename="%s"\r\n'
+             'Content-Type: application/octet-stream\r\n\r\n' % (boundary, filename))
+        size = 0
+        for chunk in pipe.chunks():
+            send(chunk)
+            size += len(chunk)
+        send('\r\n--%s\r\nContent-Disposition: form-data; name="hashkey"\r\n\r\n%s\r\n--%s--\r\n' % (boundary, hashkey(), boundary))
+        conn.send('0\r\n\r\n')
+        if logger:
+            logger.debug("Sent %d bytes to %s" % (size, url))
+        response = conn.getresponse()
+        body = response.read()
+    finally:
+        conn.close()
+    if response.status != 200:
+        ex = httplib.HTTPException("The CRAB cache refused the sandbox: %s %s" % (response.status, response.reason))
+        ex.status, ex.reason, ex.result, ex.url = response.status, response.reason, body, url
+        ex.headers = dict((name.title(), value) for name, value in response.getheaders())
+        ex.req_data = None
+        raise ex
+    result = json.loads(body)['result']
+    return result[0] if result else {}
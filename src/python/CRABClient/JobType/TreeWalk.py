@@ -0,0 +1,150 @@
+"""
+The traversal of the directories added to the user sandbox (see UserTarball).
+
+walkTree() lists a directory with one stat() per file or subdirectory, following
+the symbolic links as the sandbox is made with dereference=True, and detects the
+symbolic link loops by the (device, inode) of the directories above each one.
+The tar entries are then written from these stat() results by addEntries(),
+instead of tarfile.add() walking and stat()ing the whole tree again.
+"""
+
+import os
+import pwd
+import grp
+import stat
+import tarfile
+from collections import namedtuple
+
+from CRABClient.ClientUtilities import colors
+from CRABClient.ClientExceptions import EnvironmentException
+
+TreeEntry = namedtuple('TreeEntry', ['path', 'arcname', 'stat'])
+
+
+def loopError(path, msg):
+    err = '%sError%s: Infinite directory loop found in: %s \nStderr: %s' % (colors.RED, colors.NORMAL, path, msg)
+    return EnvironmentException(err)
+
+
+def walkTree(path, arcname, recursive = True):
+    """
+    Return the TreeEntry of path and, if it is a directory and recursive, of
+    everything below it, in the order of the tarball (a directory before its content).
+    Raise EnvironmentException if a symbolic link makes a loop or can not be followed.
+    """
+    st = os.stat(path)
+    entries = [TreeEntry(path, arcname, st)]
+    if recursive and stat.S_ISDIR(st.st_mode):
+        _walkDirectory(path, arcname, set([(st.st_dev, st.st_ino)]), entries)
+    return entries
+
+
+def _walkDirectory(path, arcname, ancestors, entries):
+    for name in sorted(os.listdir(path)):
+        fullpath = os.path.join(path, name)
+        try:
+            st = os.stat(fullpath)
+        except OSError as ex:
+            raise loopError(path, ex)
+        entries.append(TreeEntry(fullpath, arcname + '/' + name, st))
+        if stat.S_ISDIR(st.st_mode):
+            inode = (st.st_dev, st.st_ino)
+            if inode in ancestors:
+                raise loopError(path, "%s links to one of its parent directories" % fullpath)
+            _walkDirectory(fullpath, arcname + '/' + name, ancestors | set([inode]), entries)
+
+
+def findDirectories(path, arcname, names):
+    """
+    Return the (path, arcname) of the directories called as one of names below path,
+    without following the symbolic links (as os.walk) and without looking inside the
+    directories found, whose content is added to the sandbox anyway.
+    """
+    found = []
+    for name in sorted(os.listdir(path)):
+        fullpath = os.path.join(path, name)
+        try:
+            st = os.lstat(fullpath)
+        except OSError:
+            continue
+        if not stat.S_ISDIR(st.st_mode):
+            continue
+        if name in names:
+            found.append((fullpath, arcname + '/' + name))
+        else:
+            found.extend(findDirectories(fullpath, arcname + '/' + name, names))
+    return found
+
+
+_owners = {}
+
+def _ownerNames(uid, gid):
+    if (uid, gid) not in _owners:
+        uname = gname = ''
+        try:
+            uname = pwd.getpwuid(uid)[0]
+        except KeyError:
+            pass
+        try:
+            gname = grp.getgrgid(gid)[0]
+        except KeyError:
+            pass
+        _owners[(uid, gid)] = (uname, gname)
+    return _owners[(uid, gid)]
+
+
+def tarInfo(entry):
+    """
+    The TarInfo of an entry, as TarFile.gettarinfo with dereference=True would make it.
+    None for what is neither a file nor a directory (tarfile.add skips them too).
+    """
+    st = entry.stat
+    info = tarfile.TarInfo(entry.arcname.replace(os.sep, '/').lstrip('/'))
+    if stat.S_ISREG(st.st_mode):
+        info.type = tarfile.REGTYPE
+        info.size = st.st_size
+    elif stat.S_ISDIR(st.st_mode):
+        info.type = tarfile.DIRTYPE
+        info.size = 0
+    else:
+        return None
+    info.mode = stat.S_IMODE(st.st_mode)
+    info.uid = st.st_uid
+    info.gid = st.st_gid
+    info.mtime = st.st_mtime
+    info.uname, info.gname = _ownerNames(st.st_uid, st.st_gid)
+    return info
+
+
+class _ChecksumReader(object):
+    """
+    A file object giving what it reads from fd to checksum.update() too.
+    """
+
+    def __init__(self, fd, checksum):
+        self.fd = fd
+        self.checksum = checksum
+
+    def read(self, size = -1):
+        data = self.fd.read(size)
+        self.checksum.update(data)
+        return data
+
+
+def addEntries(tar, entries, checksum = None):
+    """
+    Write the entries of walkTree() into the TarFile tar. If checksum is given, it
+    is told each member written (checksum.member(info)) and the data read from the
+    files (checksum.update(data)), so that the files are read only once.
+    """
+    for entry in entries:
+        info = tarInfo(entry)
+        if info is None:
+            continue
+        if checksum:
+            checksum.member(info)
+        if info.isreg():
+            with open(entry.path, 'rb') as fd:
+                tar.addfile(info, _ChecksumReader(fd, checksum) if checksum else fd)
+        else:
+            tar.addfile(info)
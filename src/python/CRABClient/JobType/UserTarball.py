@@ -8,16 +8,82 @@ import os
 import glob
 import tarfile
 import tempfile
+from httplib import HTTPException
 
 import CRABClient.Emulator
 from CRABClient.ClientMapping import configParametersInfo
 from CRABClient.JobType.ScramEnvironment import ScramEnvironment
-from CRABClient.ClientUtilities import colors, BOOTSTRAP_CFGFILE, BOOTSTRAP_CFGFILE_PKL
-from CRABClient.ClientExceptions import EnvironmentException, InputFileNotFoundException, CachefileNotFoundException
+from CRABClient.JobType.SandboxCache import SandboxCache, CachedTarFile, sandboxFingerprint
+from CRABClient.JobType.SandboxUpload import StreamPipe, ResultThread, SandboxChecksum, streamUpload, sandboxChecksum, sortedEntries
+from CRABClient.JobType.ParallelGzip import ParallelGzipFile
+from CRABClient.JobType.TreeWalk import walkTree, addEntries, findDirectories
+from CRABClient.ClientUtilities import BOOTSTRAP_CFGFILE, BOOTSTRAP_CFGFILE_PKL
+from CRABClient.ClientExceptions import InputFileNotFoundException, CachefileNotFoundException
 
 from ServerUtilities import NEW_USER_SANDBOX_EXCLUSIONS, BOOTSTRAP_CFGFILE_DUMP
 
 
+def listSandboxFiles(config, logger, cmsswBase, userFiles=None, cfgOutputName=None):
+    """
+    List what goes in the user sandbox, without reading the files: the user libraries
+    from lib, module, the data/ and interface/ sections of the src/ area, the user
+    specified files, and the pset files. Return a list of walkTree results (which also
+    checks for infinite symbolic link loops), one per directory or file to add.
+    """
+    directories = ['lib', 'biglib', 'module']
+    if getattr(config.JobType, 'sendPythonFolder', configParametersInfo['JobType.sendPythonFolder']['default']):
+        directories.append('python')
+        directories.append('cfipython')
+    if getattr(config.JobType, 'sendExternalFolder', configParametersInfo['JobType.sendExternalFolder']['default']):
+        externalDirPath = os.path.join(cmsswBase, 'external')
+        if os.path.exists(externalDirPath) and os.listdir(externalDirPath) != []:
+            directories.append('external')
+        else:
+            logger.info("The config.JobType.sendExternalFolder parameter is set to True but the external directory "\
+                        "doesn't exist or is empty, not adding to tarball. Path: %s" % externalDirPath)
+
+    # Note that dataDirs are only looked-for and added under the src/ folder.
+    # /data/ subdirs contain data files needed by the code
+    # /interface/ subdirs contain C++ header files needed e.g. by ROOT6
+    dataDirs    = ['data','interface']
+    userFiles = userFiles or []
+    trees = []
+
+    # Whole directories
+    for directory in directories:
+        fullPath = os.path.join(cmsswBase, directory)
+        logger.debug("Checking directory %s" % fullPath)
+        if os.path.exists(fullPath):
+            trees.append(walkTree(fullPath, directory))
+
+    # "data" directories in src/
+    srcPath = os.path.join(cmsswBase, 'src')
+    if os.path.isdir(srcPath):
+        for root, directory in findDirectories(srcPath, 'src', dataDirs):
+            trees.append(walkTree(root, directory))
+
+    # Extra files the user needs
+    for globName in userFiles:
+        fileNames = glob.glob(globName)
+        if not fileNames:
+            raise InputFileNotFoundException("The input file '%s' taken from parameter config.JobType.inputFiles cannot be found." % globName)
+        for filename in fileNames:
+            trees.append(walkTree(filename, os.path.basename(filename)))
+
+    scriptExe = getattr(config.JobType, 'scriptExe', None)
+    if scriptExe:
+        trees.append(walkTree(scriptExe, os.path.basename(scriptExe)))
+
+    # The pset files
+    if cfgOutputName:
+        basedir = os.path.dirname(cfgOutputName)
+        trees.append(walkTree(cfgOutputName, BOOTSTRAP_CFGFILE))
+        trees.append(walkTree(os.path.join(basedir, BOOTSTRAP_CFGFILE_PKL), BOOTSTRAP_CFGFILE_PKL))
+        trees.append(walkTree(os.path.join(basedir, BOOTSTRAP_CFGFILE_DUMP), BOOTSTRAP_CFGFILE_DUMP))
+
+    return trees
+
+
 class UserTarball(object):
     """
         _UserTarball_
@@ -27,77 +93,63 @@ class UserTarball(object):
             and the data/ and interface/ sections of the src/ area.
 
             Also adds user specified files in the right place.
+
+            With a cachedir, the tarball is assembled from the pieces kept
+            there by the previous submissions (see SandboxCache).
+            With config.JobType.sandboxCompression = 'parallel', it is
+            compressed on all the cores (see ParallelGzip).
+            With streamed=True, the files are only listed by addFiles, and the
+            tarball is made while it is uploaded (see SandboxUpload).
     """
 
-    def __init__(self, name=None, mode='w:gz', config=None, logger=None):
+    def __init__(self, name=None, mode='w:gz', config=None, logger=None, cachedir=None, streamed=False):
         self.config = config
         self.logger = logger
         self.scram = ScramEnvironment(logger=self.logger)
         self.logger.debug("Making tarball in %s" % name)
-        self.tarfile = tarfile.open(name=name , mode=mode, dereference=True)
+        self.cache = None
+        if cachedir and mode == 'w:gz':
+            try:
+                self.cache = SandboxCache(cachedir, self.logger)
+            except OSError as ex:
+                self.logger.debug("Not using the sandbox cache %s: %s" % (cachedir, ex))
+        compression = 'gzip'
+        localCopy = True
+        if self.config:
+            compression = getattr(self.config.JobType, 'sandboxCompression', configParametersInfo['JobType.sandboxCompression']['default'])
+            localCopy = getattr(self.config.JobType, 'sandboxLocalCopy', configParametersInfo['JobType.sandboxLocalCopy']['default'])
+        ## The tarball is written into the pipe read by the upload, and to a file only if localCopy.
+        self.pipe = None
+        if streamed and mode == 'w:gz':
+            self.pipe = StreamPipe(name if localCopy else None)
+        if self.cache:
+            self.tarfile = CachedTarFile(name, self.cache, self.logger, compression, fileobj=self.pipe)
+        elif mode == 'w:gz' and compression == 'parallel':
+            gz = ParallelGzipFile(fileobj=self.pipe) if self.pipe else ParallelGzipFile(name)
+            self.tarfile = tarfile.TarFile(name=name, mode='w', fileobj=gz, dereference=True)
+            ## Close the ParallelGzipFile with the TarFile, as tarfile.open does with its GzipFile.
+            self.tarfile._extfileobj = False
+        else:
+            self.tarfile = tarfile.open(name=name , mode=mode, fileobj=self.pipe, dereference=True)
+        self.trees = []
+        self.content = []
+        self.localCopy = localCopy
         self.checksum = None
 
-    def addFiles(self, userFiles=None, cfgOutputName=None):
-        """
-        Add the necessary files to the tarball
-        """
-        directories = ['lib', 'biglib', 'module']
-        if getattr(self.config.JobType, 'sendPythonFolder', configParametersInfo['JobType.sendPythonFolder']['default']):
-            directories.append('python')
-            directories.append('cfipython')
-        if getattr(self.config.JobType, 'sendExternalFolder', configParametersInfo['JobType.sendExternalFolder']['default']):
-            externalDirPath = os.path.join(self.scram.getCmsswBase(), 'external')
-            if os.path.exists(externalDirPath) and os.listdir(externalDirPath) != []:
-                directories.append('external')
-            else:
-                self.logger.info("The config.JobType.sendExternalFolder parameter is set to True but the external directory "\
-                                  "doesn't exist or is empty, not adding to tarball. Path: %s" % externalDirPath)
-
-        # Note that dataDirs are only looked-for and added under the src/ folder.
-        # /data/ subdirs contain data files needed by the code
-        # /interface/ subdirs contain C++ header files needed e.g. by ROOT6
-        dataDirs    = ['data','interface']
-        userFiles = userFiles or []
-
-        # Tar up whole directories
-        for directory in directories:
-            fullPath = os.path.join(self.scram.getCmsswBase(), directory)
-            self.logger.debug("Checking directory %s" % fullPath)
-            if os.path.exists(fullPath):
-                self.logger.debug("Adding directory %s to tarball" % fullPath)
-                self.checkdirectory(fullPath)
-                self.tarfile.add(fullPath, directory, recursive=True)
-
-        # Search for and tar up "data" directories in src/
-        srcPath = os.path.join(self.scram.getCmsswBase(), 'src')
-        for root, _, _ in os.walk(srcPath):
-            if os.path.basename(root) in dataDirs:
-                directory = root.replace(srcPath,'src')
-                self.logger.debug("Adding data directory %s to tarball" % root)
-                self.checkdirectory(root)
-                self.tarfile.add(root, directory, recursive=True)
-
-        # Tar up extra files the user needs
-        for globName in userFiles:
-            fileNames = glob.glob(globName)
-            if not fileNames:
-                raise InputFileNotFoundException("The input file '%s' taken from parameter config.JobType.inputFiles cannot be found." % globName)
-            for filename in fileNames:
-                self.logger.debug("Adding file %s to tarball" % filename)
-                self.checkdirectory(filename)
-                self.tarfile.add(filename, os.path.basename(filename), recursive=True)
-
-
-        scriptExe = getattr(self.config.JobType, 'scriptExe', None)
-        if scriptExe:
-            self.tarfile.add(scriptExe, arcname=os.path.basename(scriptExe))
-
-        # Adding the pset files to the tarfile
-        if cfgOutputName:
-            basedir = os.path.dirname(cfgOutputName)
-            self.tarfile.add(cfgOutputName, arcname=BOOTSTRAP_CFGFILE)
-            self.tarfile.add(os.path.join(basedir, BOOTSTRAP_CFGFILE_PKL), arcname=BOOTSTRAP_CFGFILE_PKL)
-            self.tarfile.add(os.path.join(basedir, BOOTSTRAP_CFGFILE_DUMP), arcname=BOOTSTRAP_CFGFILE_DUMP)
+    def addFiles(self, userFiles=None, cfgOutputName=None, trees=None):
+        """
+        Add the necessary files to the tarball, as listed by listSandboxFiles
+        (or given in trees, if they were already listed).
+        With a streamed upload, they are added when uploading.
+        """
+        if trees is None:
+            trees = listSandboxFiles(self.config, self.logger, self.scram.getCmsswBase(), userFiles, cfgOutputName)
+        if self.pipe:
+            self.trees.extend(trees)
+            return
+        for entries in trees:
+            self.logger.debug("Adding %s to tarball" % entries[0].path)
+            self.addTree(entries)
 
     def addMonFiles(self):
         """
@@ -137,27 +189,103 @@ class UserTarball(object):
         """
         Upload the tarball to the File Cache
         """
+        if self.pipe:
+            return self.streamUpload(filecacheurl)
         self.close()
         archiveName = self.tarfile.name
+        fingerprint = getattr(self.tarfile, 'fingerprint', None)
+        if self.cache and fingerprint:
+            hashkey = self.cache.uploadedHashkey(filecacheurl, fingerprint)
+            if hashkey and self.cache.existsInCRABCache(filecacheurl, hashkey):
+                self.logger.debug("The CRAB cache already has the archive %s as %s, not uploading it" % (archiveName, hashkey))
+                return str(hashkey)
         self.logger.debug("Uploading archive %s to the CRAB cache. Using URI %s" % (archiveName, filecacheurl))
         ufc = CRABClient.Emulator.getEmulator('ufc')({'endpoint' : filecacheurl, "pycurl": True})
         result = ufc.upload(archiveName, excludeList = NEW_USER_SANDBOX_EXCLUSIONS)
         if 'hashkey' not in result:
             self.logger.error("Failed to upload source files: %s" % str(result))
             raise CachefileNotFoundException
+        if self.cache and fingerprint:
+            self.cache.recordUpload(filecacheurl, fingerprint, str(result['hashkey']))
         return str(result['hashkey'])
 
 
-    def checkdirectory(self, dir_):
-        #checking for infinite symbolic link loop
+    def streamUpload(self, filecacheurl):
+        """
+        Make the tarball in a thread while uploading it, and compute its hash key in
+        another thread. If the upload fails and there is a local copy, upload that copy.
+        """
+        fingerprint = None
+        if self.cache:
+            fingerprint = sandboxFingerprint(self.trees)
+            hashkey = self.cache.uploadedHashkey(filecacheurl, fingerprint)
+            if hashkey and self.cache.existsInCRABCache(filecacheurl, hashkey):
+                self.logger.debug("The CRAB cache already has the archive %s as %s, not uploading it" % (self.tarfile.name, hashkey))
+                self.pipe.abort()
+                self.pipe.close()
+                ## Nothing was written to the local copy.
+                if self.localCopy and os.path.isfile(self.pipe.name):
+                    os.remove(self.pipe.name)
+                self.content = []
+                return str(hashkey)
+
+        ## Without the cache every file is read for the tarball: the hash key is computed from
+        ## that data, with the members written in its order. The pieces of the cache are not
+        ## read again, so the files are read by another thread for the hash key.
+        checksum = None if self.cache else SandboxChecksum(NEW_USER_SANDBOX_EXCLUSIONS)
+        def produce():
+            try:
+                if checksum:
+                    self.logger.debug("Adding %s to tarball" % ', '.join(entries[0].path for entries in self.trees))
+                    addEntries(self.tarfile, sortedEntries(self.trees), checksum)
+                else:
+                    for entries in self.trees:
+                        self.logger.debug("Adding %s to tarball" % entries[0].path)
+                        self.addTree(entries)
+                self.close()
+            finally:
+                ## Let the upload end, also if the tarball could not be made.
+                self.pipe.close()
+
+        producer = ResultThread(produce)
+        checksumThread = None if checksum else ResultThread(sandboxChecksum, self.trees, NEW_USER_SANDBOX_EXCLUSIONS)
+        def hashkey():
+            ## Do not end the upload of a tarball that could not be made.
+            producer.result()
+            return checksum.hexdigest() if checksum else checksumThread.result()
+
+        self.logger.debug("Streaming archive %s to the CRAB cache. Using URI %s" % (self.tarfile.name, filecacheurl))
         try:
-            for root , _ , files in os.walk(dir_, followlinks = True):
-                for file_ in files:
-                    os.stat(os.path.join(root, file_ ))
-        except OSError as msg:
-            err = '%sError%s: Infinite directory loop found in: %s \nStderr: %s' % \
-                    (colors.RED, colors.NORMAL, dir_ , msg)
-            raise EnvironmentException(err)
+            result = streamUpload(filecacheurl, self.pipe, hashkey, os.path.basename(self.tarfile.name), logger=self.logger)
+        except Exception as ex:
+            ## A sandbox refused by the CRAB cache would be refused again.
+            refused = isinstance(ex, HTTPException) and hasattr(ex, 'headers')
+            if refused or not self.localCopy:
+                self.pipe.abort()
+                producer.join()
+                raise
+            ## Finish the local copy (or raise why the tarball could not be made), and upload it.
+            self.pipe.detach()
+            producer.result()
+            self.logger.debug("The streamed upload failed (%s), uploading the local copy instead" % ex)
+            ufc = CRABClient.Emulator.getEmulator('ufc')({'endpoint' : filecacheurl, "pycurl": True})
+            result = ufc.upload(self.tarfile.name, excludeList = NEW_USER_SANDBOX_EXCLUSIONS)
+        if 'hashkey' not in result:
+            self.logger.error("Failed to upload source files: %s" % str(result))
+            raise CachefileNotFoundException
+        if self.cache and fingerprint:
+            self.cache.recordUpload(filecacheurl, fingerprint, str(result['hashkey']))
+        return str(result['hashkey'])
+
+
+    def addTree(self, entries):
+        """
+        Add a path and everything below it, as listed by walkTree.
+        """
+        if self.cache:
+            self.tarfile.addEntries(entries)
+        else:
+            addEntries(self.tarfile, entries)
 
 
     def __getattr__(self, *args):
@@ -179,6 +307,15 @@ class UserTarball(object):
         """
         Allow use as context manager
         """
-        self.tarfile.close()
+        if self.pipe:
+            ## Nothing reads the pipe any more: make the writes fail instead of waiting.
+            self.pipe.abort()
+            try:
+                self.tarfile.close()
+            except IOError:
+                pass
+            self.pipe.close()
+        else:
+            self.tarfile.close()
         if excType:
             return False
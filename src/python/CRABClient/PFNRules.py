@@ -0,0 +1,111 @@
+"""
+Cache of the LFN to PFN mapping of the storage sites.
+
+Every LFN resolved by PhEDEx gives a rule 'LFN prefix -> PFN prefix' for the
+site (the LFN and the PFN have the same path after the prefixes). The rules are
+stored on disk, next to the CRAB cache file (~/.crab3), so that the LFNs of the
+next getoutput2/getlog2 commands on the same site are resolved without asking
+PhEDEx. To avoid applying a rule to a namespace with a different mapping (e.g.
+/store/temp/ and /store/user/), the LFN prefixes have at least MIN_LFN_DEPTH
+directories.
+"""
+
+import os
+import json
+import time
+
+## The rules older than this are not used (in seconds).
+RULES_TTL = 7 * 24 * 3600
+## Minimum number of directories in the LFN prefix of a rule ('/store/user/' has 2).
+MIN_LFN_DEPTH = 2
+
+
+def deriveRule(lfn, pfn):
+    """
+    Return the (LFN prefix, PFN prefix) rule such that pfn = PFN prefix + lfn[len(LFN prefix):],
+    or None if lfn and pfn do not have a common path.
+    """
+    ## Longest common suffix, starting at a directory boundary.
+    suffixlen = 0
+    maxlen = min(len(lfn), len(pfn))
+    while suffixlen < maxlen and lfn[-suffixlen-1] == pfn[-suffixlen-1]:
+        suffixlen += 1
+    lfnprefixlen = len(lfn) - suffixlen
+    while lfnprefixlen < len(lfn) and lfn[lfnprefixlen-1:lfnprefixlen] != '/':
+        lfnprefixlen += 1
+    ## Keep the first MIN_LFN_DEPTH directories in the LFN prefix.
+    minprefixlen = 0
+    for _ in range(MIN_LFN_DEPTH + 1):
+        minprefixlen = lfn.find('/', minprefixlen) + 1
+        if minprefixlen == 0:
+            return None
+    lfnprefixlen = max(lfnprefixlen, minprefixlen)
+    if lfnprefixlen >= len(lfn):
+        return None
+    suffix = lfn[lfnprefixlen:]
+    return lfn[:lfnprefixlen], pfn[:len(pfn)-len(suffix)]
+
+
+class PFNRuleCache(object):
+    """
+    On-disk cache of the LFN prefix -> PFN prefix rules of each site, stored as JSON:
+    {site: {lfnprefix: [pfnprefix, time]}}.
+    """
+
+    def __init__(self, path, ttl = RULES_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.rules = {}
+        self.changed = False
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path) as fd:
+                    self.rules = json.load(fd)
+            except (IOError, ValueError):
+                ## A broken cache is just ignored, and overwritten by save().
+                self.rules = {}
+
+
+    def lookup(self, site, lfn):
+        """
+        Return the PFN of lfn at site according to the cached rules, or None.
+        The longest matching LFN prefix wins.
+        """
+        now = time.time()
+        best = None
+        for lfnprefix, (pfnprefix, created) in self.rules.get(site, {}).iteritems():
+            if now - created > self.ttl or not lfn.startswith(lfnprefix):
+                continue
+            if best is None or len(lfnprefix) > len(best[0]):
+                best = (lfnprefix, pfnprefix)
+        if best is None:
+            return None
+        return best[1] + lfn[len(best[0]):]
+
+
+    def learn(self, site, lfn, pfn):
+        """
+        Add (or refresh) the rule given by a resolved LFN.
+        """
+        rule = deriveRule(lfn, pfn)
+        if rule is None:
+            return
+        lfnprefix, pfnprefix = rule
+        siterules = self.rules.setdefault(site, {})
+        current = siterules.get(lfnprefix)
+        if current is None or current[0] != pfnprefix or time.time() - current[1] > self.ttl / 2:
+            siterules[lfnprefix] = [pfnprefix, int(time.time())]
+            self.changed = True
+
+
+    def save(self):
+        """
+        Write the cache, if it changed.
+        """
+        if not self.changed:
+            return
+        tmppath = "%s.%s" % (self.path, os.getpid())
+        with open(tmppath, 'w') as fd:
+            json.dump(self.rules, fd)
+        os.rename(tmppath, self.path)
+        self.changed = False
@@ -0,0 +1,143 @@
+"""
+Process-wide pool of the HTTPS sessions used by the REST calls of a crab command.
+
+RESTInteractions.HTTPRequests creates a new curl handle for every request, so
+every request (and every HTTPRequests object built by the commands, the
+version check, the proxy delegation, ...) pays a full TCP and TLS handshake
+against the server. Here the curl handles of the requests to the same
+(host, certificate) pair are attached to the same pycurl.CurlShare object, that
+keeps the DNS cache, the TLS sessions and (with libcurl >= 7.57) the keep-alive
+connections, so the following requests reuse the connection opened by the
+first one. With an older libcurl only the TLS sessions are reused, which still
+avoids the expensive part of the handshake.
+
+The sessions count the requests and the new connections (handshakes) they did,
+see getSessionManager().stats().
+"""
+
+import threading
+import urlparse
+
+import pycurl
+
+from RESTInteractions import HTTPRequests
+from WMCore.Services.pycurl_manager import RequestHandler
+
+## What is shared among the requests of a session.
+SHARED_DATA = ['LOCK_DATA_DNS', 'LOCK_DATA_SSL_SESSION', 'LOCK_DATA_CONNECT']
+
+
+class Session(object):
+    """
+    The requests to one host with one certificate.
+    """
+
+    def __init__(self, host, cert):
+        self.host = host
+        self.cert = cert
+        self.share = pycurl.CurlShare()
+        for name in SHARED_DATA:
+            if hasattr(pycurl, name):
+                self.share.setopt(pycurl.SH_SHARE, getattr(pycurl, name))
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.handshakes = 0
+        self.handler = PooledRequestHandler(self)
+
+
+    def count(self, connects):
+        with self.lock:
+            self.requests += 1
+            self.handshakes += connects
+
+
+class SessionManager(object):
+    """
+    Keep one session per (host, certificate) pair.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}
+
+
+    def getSession(self, host, cert):
+        with self.lock:
+            key = (host, cert)
+            if key not in self.sessions:
+                self.sessions[key] = Session(host, cert)
+            return self.sessions[key]
+
+
+    def stats(self):
+        """
+        Return a dictionary {(host, cert): {'requests': n, 'handshakes': m}}.
+        """
+        with self.lock:
+            return dict((key, {'requests': session.requests, 'handshakes': session.handshakes})
+                        for key, session in self.sessions.iteritems())
+
+
+    def totals(self):
+        """
+        Return the number of requests and of handshakes of all the sessions.
+        """
+        stats = self.stats().values()
+        return sum(s['requests'] for s in stats), sum(s['handshakes'] for s in stats)
+
+
+_sessionManager = SessionManager()
+
+def getSessionManager():
+    return _sessionManager
+
+
+class PooledRequestHandler(RequestHandler):
+    """
+    RequestHandler attaching its curl handles to the share object of a session.
+    """
+
+    def __init__(self, session, config = None):
+        RequestHandler.__init__(self, config or {'timeout': 300, 'connecttimeout': 300})
+        self.session = session
+        self.local = threading.local()
+
+
+    def set_opts(self, curl, *args, **kwargs):
+        result = RequestHandler.set_opts(self, curl, *args, **kwargs)
+        curl.setopt(pycurl.SHARE, self.session.share)
+        curl.setopt(pycurl.FORBID_REUSE, 0)
+        curl.setopt(pycurl.FRESH_CONNECT, 0)
+        self.local.curl = curl
+        return result
+
+
+    def request(self, *args, **kwargs):
+        self.local.curl = None
+        try:
+            return RequestHandler.request(self, *args, **kwargs)
+        finally:
+            connects = 0
+            if self.local.curl is not None:
+                try:
+                    connects = self.local.curl.getinfo(pycurl.NUM_CONNECTS)
+                except pycurl.error:
+                    pass
+                self.local.curl = None
+            self.session.count(connects)
+
+
+class PooledHTTPRequests(HTTPRequests):
+    """
+    HTTPRequests sending its requests through the session of its (host, certificate) pair.
+    """
+
+    def __init__(self, url = 'localhost', localcert = None, localkey = None, *args, **kwargs):
+        ## The session is needed by getUrlOpener, that HTTPRequests can call while initializing.
+        host = urlparse.urlparse(url).netloc if '://' in url else url
+        self.session = getSessionManager().getSession(host, localcert)
+        HTTPRequests.__init__(self, url, localcert, localkey, *args, **kwargs)
+
+
+    def getUrlOpener(self):
+        return self.session.handler
@@ -0,0 +1,94 @@
+"""
+Cache of the server information (the 'info' resource of the REST interface).
+
+The compatible client versions, the backend URLs and the DNs of the task
+workers change rarely, but they are asked to the server by almost every crab
+command. They are stored on disk, next to the CRAB cache file (~/.crab3), for
+SERVER_INFO_TTL seconds, so that the next commands against the same instance
+and server do not need to ask them again.
+"""
+
+import os
+import json
+import time
+
+## Time after which the cached information is asked again to the server (in seconds).
+SERVER_INFO_TTL = {'version': 6 * 3600,
+                   'backendurls': 24 * 3600,
+                   'delegatedn': 24 * 3600,
+                   ## Not asked to the server: whether it answered to the bulk search of the tasks (see TaskSearch).
+                   'bulksearch': 24 * 3600,
+                   ## Not asked to the server: the maximum sandbox size told by a CRAB cache (see SandboxEstimator).
+                   'sandboxlimit': 7 * 24 * 3600,
+                  }
+
+
+class ServerInfoCache(object):
+    """
+    On-disk cache of the server information, stored as JSON:
+    {instance: {serverurl: {subresource: [value, time]}}}.
+    Only the subresources in ttls are cached.
+    """
+
+    def __init__(self, path, ttls = None):
+        self.path = path
+        self.ttls = SERVER_INFO_TTL if ttls is None else ttls
+        self.info = {}
+        self.changed = False
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path) as fd:
+                    self.info = json.load(fd)
+            except (IOError, ValueError):
+                ## A broken cache is just ignored, and overwritten by save().
+                self.info = {}
+
+
+    def cacheable(self, subresource):
+        return subresource in self.ttls
+
+
+    def get(self, instance, serverurl, subresource):
+        """
+        Return the cached value, or None if it is not cached or too old.
+        """
+        if not self.cacheable(subresource):
+            return None
+        cached = self.info.get(instance, {}).get(serverurl, {}).get(subresource)
+        if cached is None or time.time() - cached[1] > self.ttls[subresource]:
+            return None
+        return cached[0]
+
+
+    def set(self, instance, serverurl, subresource, value):
+        if not self.cacheable(subresource):
+            return
+        self.info.setdefault(instance, {}).setdefault(serverurl, {})[subresource] = [value, int(time.time())]
+        self.changed = True
+
+
+    def invalidate(self, instance = None, serverurl = None):
+        """
+        Forget the information of a server (or of all the servers of the instance,
+        or of all the instances).
+        """
+        if instance is None:
+            self.changed = self.changed or bool(self.info)
+            self.info = {}
+        elif serverurl is None:
+            self.changed = self.info.pop(instance, None) is not None or self.changed
+        else:
+            self.changed = self.info.get(instance, {}).pop(serverurl, None) is not None or self.changed
+
+
+    def save(self):
+        """
+        Write the cache, if it changed.
+        """
+        if not self.changed:
+            return
+        tmppath = "%s.%s" % (self.path, os.getpid())
+        with open(tmppath, 'w') as fd:
+            json.dump(self.info, fd)
+        os.rename(tmppath, self.path)
+        self.changed = False
@@ -0,0 +1,229 @@
+"""
+Readers (and writers) of the status_cache file of a task, as found in the webdir of the task on the schedd.
+
+The legacy file has some information for the caching script on the first line,
+and the status of all the jobs as a python dictionary literal on the second one:
+    {'1': {'State': 'finished', 'SiteHistory': [...], ...}, ..., 'DagStatus': {...}}
+Parsing it needs ast.literal_eval, which builds the whole syntax tree first and
+is slow and memory hungry for big tasks.
+
+The versioned formats start with a header line
+    #CRAB_STATUS_CACHE <format> <version> <information for the caching script>
+and are parsed with the json module, reading only what is needed:
+  - 'json': one JSON record [id, {field: value, ...}] per line (the jobs and
+    the other records like 'DagStatus'). The records are parsed one at a time,
+    and only the requested fields are kept.
+  - 'columnar': one line per column, '<kind> <name>\t<JSON>', where kind is
+    'ids' (the job ids, once, first), 'col' (the values of a field for all the
+    jobs, null if the job does not have it) or 'rec' (a whole non-job record).
+    The columns of the fields that are not requested are not parsed at all.
+
+Records that are not jobs (like 'DagStatus') are always returned whole.
+
+LocalStatusCache keeps the last status_cache of a task in the project
+directory, with the validators (ETag/Last-Modified) of the answer and a pickle
+of the parsed dictionary, so that when the file did not change on the schedd
+it is neither transferred nor parsed again.
+"""
+
+import os
+import json
+import cPickle
+from ast import literal_eval
+
+from CRABClient.ClientExceptions import ClientException
+
+HEADER = '#CRAB_STATUS_CACHE'
+LEGACY = 'legacy'
+JSON = 'json'
+COLUMNAR = 'columnar'
+## The versions of each format that this client can read.
+SUPPORTED_VERSIONS = {JSON: [1], COLUMNAR: [1]}
+## The records of the status cache that are not jobs.
+NON_JOB_RECORDS = ['DagStatus']
+
+
+def parseHeader(line):
+    """
+    Return (format, version, checkpoint) for the first line of a status_cache file.
+    """
+    if not line.startswith(HEADER):
+        return LEGACY, 0, line.rstrip('\n')
+    parts = line.rstrip('\n').split(' ', 3)
+    if len(parts) < 3:
+        raise ClientException("Malformed status_cache header: %s" % line.strip())
+    fmt, version = parts[1], parts[2]
+    try:
+        version = int(version)
+    except ValueError:
+        raise ClientException("Malformed status_cache header: %s" % line.strip())
+    if version not in SUPPORTED_VERSIONS.get(fmt, []):
+        raise ClientException("The status_cache format %s version %s is not supported by this client version."
+                              " Please update the CRAB client." % (fmt, version))
+    return fmt, version, parts[3] if len(parts) > 3 else ''
+
+
+def _project(info, fields):
+    if fields is None:
+        return info
+    return dict((field, info[field]) for field in fields if field in info)
+
+
+def readLegacy(fd, fields = None):
+    statusCacheInfo = literal_eval(fd.readline())
+    if fields is not None:
+        for jobid, info in statusCacheInfo.iteritems():
+            if jobid not in NON_JOB_RECORDS:
+                statusCacheInfo[jobid] = _project(info, fields)
+    return statusCacheInfo
+
+
+def readJSON(fd, fields = None):
+    statusCacheInfo = {}
+    for line in fd:
+        if not line.strip():
+            continue
+        jobid, info = json.loads(line)
+        if jobid not in NON_JOB_RECORDS:
+            info = _project(info, fields)
+        statusCacheInfo[str(jobid)] = info
+    return statusCacheInfo
+
+
+def readColumnar(fd, fields = None):
+    statusCacheInfo = {}
+    jobids = []
+    for line in fd:
+        if not line.strip():
+            continue
+        key, data = line.split('\t', 1)
+        kind, name = key.split(' ', 1)
+        if kind == 'ids':
+            jobids = [str(jobid) for jobid in json.loads(data)]
+            for jobid in jobids:
+                statusCacheInfo[jobid] = {}
+        elif kind == 'col':
+            if fields is not None and name not in fields:
+                continue
+            for jobid, value in zip(jobids, json.loads(data)):
+                if value is not None:
+                    statusCacheInfo[jobid][name] = value
+        elif kind == 'rec':
+            statusCacheInfo[name] = json.loads(data)
+    return statusCacheInfo
+
+
+READERS = {LEGACY: readLegacy, JSON: readJSON, COLUMNAR: readColumnar}
+
+
+def readStatusCache(filename, fields = None):
+    """
+    Read a status_cache file in any known format and return the dictionary
+    {jobid: {field: value}, 'DagStatus': {...}}. If fields is given, the job
+    records only have those fields (the ones that the job has).
+    """
+    with open(filename) as fd:
+        fmt, _, _ = parseHeader(fd.readline())
+        return READERS[fmt](fd, fields)
+
+
+def writeStatusCache(filename, statusCacheInfo, fmt = JSON, checkpoint = ''):
+    """
+    Write a status_cache file in the given format (used for the tests and benchmarks).
+    """
+    with open(filename, 'w') as fd:
+        if fmt == LEGACY:
+            fd.write("%s\n" % checkpoint)
+            fd.write("%s\n" % str(statusCacheInfo))
+            return
+        fd.write("%s %s %s %s\n" % (HEADER, fmt, max(SUPPORTED_VERSIONS[fmt]), checkpoint))
+        if fmt == JSON:
+            for jobid, info in statusCacheInfo.iteritems():
+                fd.write(json.dumps([jobid, info]) + '\n')
+        elif fmt == COLUMNAR:
+            jobids = [jobid for jobid in statusCacheInfo if jobid not in NON_JOB_RECORDS]
+            fd.write("ids jobids\t%s\n" % json.dumps(jobids))
+            names = set()
+            for jobid in jobids:
+                names.update(statusCacheInfo[jobid])
+            for name in sorted(names):
+                fd.write("col %s\t%s\n" % (name, json.dumps([statusCacheInfo[jobid].get(name) for jobid in jobids])))
+            for name in NON_JOB_RECORDS:
+                if name in statusCacheInfo:
+                    fd.write("rec %s\t%s\n" % (name, json.dumps(statusCacheInfo[name])))
+        else:
+            raise ValueError("Unknown status_cache format %s" % fmt)
+
+
+class LocalStatusCache(object):
+    """
+    The last status_cache of a task, kept in a directory of the project:
+        .status_cache             the file as retrieved,
+        .status_cache.validators  the URL, ETag and Last-Modified of the retrieved file (JSON),
+        .status_cache.pickle      the parsed file and the fields it was parsed with.
+    """
+
+    def __init__(self, directory):
+        self.filename = os.path.join(directory, '.status_cache')
+        self.validatorsfile = self.filename + '.validators'
+        self.picklefile = self.filename + '.pickle'
+
+
+    def _loadValidators(self, url):
+        try:
+            with open(self.validatorsfile) as fd:
+                validators = json.load(fd)
+        except (IOError, ValueError):
+            return None, None
+        if validators.get('url') != url or not os.path.isfile(self.filename):
+            return None, None
+        return validators.get('etag'), validators.get('lastmodified')
+
+
+    def _loadParsed(self, fields):
+        """
+        Return the pickled status if it has (at least) the requested fields, otherwise None.
+        """
+        try:
+            with open(self.picklefile, 'rb') as fd:
+                parsed = cPickle.load(fd)
+        except (IOError, EOFError, cPickle.UnpicklingError, ValueError, TypeError):
+            return None
+        if parsed['fields'] is not None and (fields is None or not set(fields) <= set(parsed['fields'])):
+            return None
+        info = parsed['info']
+        if fields is not None and parsed['fields'] != fields:
+            for jobid in info:
+                if jobid not in NON_JOB_RECORDS:
+                    info[jobid] = _project(info[jobid], fields)
+        return info
+
+
+    def _write(self, path, dump):
+        tmppath = "%s.%s" % (path, os.getpid())
+        with open(tmppath, 'wb') as fd:
+            dump(fd)
+        os.rename(tmppath, path)
+
+
+    def get(self, url, fetch, fields = None, unchanged = None):
+        """
+        Return the status of the task, reading it with readStatusCache(filename, fields).
+        fetch(url, filename, etag, lastmodified) must retrieve the file only if it changed, and
+        return (changed, etag, lastmodified) (see UserUtilities.getFileFromURLIfModified).
+        If the file did not change and unchanged is given, unchanged is returned instead of
+        the pickled status (for the callers that still have the status they got last time).
+        """
+        etag, lastmodified = self._loadValidators(url)
+        changed, etag, lastmodified = fetch(url, self.filename, etag, lastmodified)
+        if not changed and unchanged is not None:
+            return unchanged
+        if not changed:
+            info = self._loadParsed(fields)
+            if info is not None:
+                return info
+        info = readStatusCache(self.filename, fields)
+        self._write(self.picklefile, lambda fd: cPickle.dump({'fields': fields, 'info': info}, fd, cPickle.HIGHEST_PROTOCOL))
+        if changed:
+            self._write(self.validatorsfile, lambda fd: json.dump({'url': url, 'etag': etag, 'lastmodified': lastmodified}, fd))
+        return info
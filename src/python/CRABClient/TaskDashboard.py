@@ -0,0 +1,101 @@
+"""
+Overview of many CRAB project directories at once (crab status2 --dirs).
+
+status2 fetches one row per task (see status2.dashboardRow) with a pool of
+worker threads; this module finds the project directories, and aggregates
+and formats the rows:
+    {'projdir': ..., 'taskname': ..., 'taskStatus': ..., 'schedd': ..., 'dagStatus': ...,
+     'jobsPerStatus': {state: count}, 'restLatency': seconds, 'scheddLatency': seconds,
+     'error': None or the error message}
+"""
+
+import os
+import glob
+from collections import defaultdict
+
+## The order of the job states in the dashboard table (other states follow, sorted).
+STATES_ORDER = ['unsubmitted', 'idle', 'running', 'transferring', 'cooloff', 'held', 'failed', 'killed', 'finished']
+
+
+def findProjectDirs(patterns):
+    """
+    Expand the given paths/glob patterns into the list of CRAB project directories
+    (the directories with a .requestcache file), sorted and without duplicates.
+    """
+    projdirs = set()
+    for pattern in patterns:
+        for path in glob.glob(os.path.expanduser(pattern)) or [pattern]:
+            if os.path.isfile(os.path.join(path, '.requestcache')):
+                projdirs.add(os.path.normpath(path))
+    return sorted(projdirs)
+
+
+def newRow(projdir):
+    return {'projdir': projdir, 'taskname': None, 'taskStatus': None, 'schedd': None, 'dagStatus': None,
+            'jobsPerStatus': {}, 'restLatency': None, 'scheddLatency': None, 'error': None}
+
+
+def dashboardStates(rows):
+    states = set()
+    for row in rows:
+        states.update(row['jobsPerStatus'])
+    return [state for state in STATES_ORDER if state in states] + sorted(states - set(STATES_ORDER))
+
+
+def aggregate(rows):
+    """
+    Return the totals over the tasks: {'tasks': number of tasks, 'failedQueries': number of tasks
+    that could not be queried, 'jobs': number of jobs, 'jobsPerStatus': {state: count},
+    'taskStatus': {task status: number of tasks}, 'schedds': {schedd: {'tasks': n, 'maxLatency': s,
+    'aveLatency': s}}}.
+    """
+    jobsPerStatus = defaultdict(int)
+    taskStatus = defaultdict(int)
+    latencies = defaultdict(list)
+    for row in rows:
+        for state, count in row['jobsPerStatus'].iteritems():
+            jobsPerStatus[state] += count
+        taskStatus[row['taskStatus'] or 'UNKNOWN'] += 1
+        if row['schedd'] and row['scheddLatency'] is not None:
+            latencies[row['schedd']].append(row['scheddLatency'])
+    schedds = dict((schedd, {'tasks': len(values), 'maxLatency': max(values), 'aveLatency': sum(values)/len(values)}) \
+                   for schedd, values in latencies.iteritems())
+    return {'tasks': len(rows), 'failedQueries': len([row for row in rows if row['error']]),
+            'jobs': sum(jobsPerStatus.values()), 'jobsPerStatus': dict(jobsPerStatus),
+            'taskStatus': dict(taskStatus), 'schedds': schedds}
+
+
+def _seconds(value):
+    return "%.2f" % value if value is not None else '-'
+
+
+def formatDashboard(rows, totals):
+    """
+    Return the dashboard as a list of lines: one line per task with the number of jobs in
+    each state and the time it took to query the CRAB server and the schedd, a line with the
+    totals, the schedds from the slowest to the fastest and the tasks that could not be queried.
+    """
+    states = dashboardStates(rows)
+    dirwidth = max([len('Project directory')] + [len(row['projdir']) for row in rows])
+    rowformat = "%-" + str(dirwidth) + "s %-18s %-16s %7s" + " %12s" * len(states) + " %10s %10s"
+    lines = [rowformat % (('Project directory', 'Task status', 'Scheduler status', 'Jobs') + tuple(states) + ('REST (s)', 'Schedd (s)'))]
+    for row in rows:
+        counts = row['jobsPerStatus']
+        lines.append(rowformat % ((row['projdir'], row['taskStatus'] or '-', row['dagStatus'] or '-', sum(counts.values())) \
+                                  + tuple(counts.get(state, '') for state in states) \
+                                  + (_seconds(row['restLatency']), _seconds(row['scheddLatency']))))
+    lines.append(rowformat % (('Total (%d tasks)' % totals['tasks'], '', '', totals['jobs']) \
+                              + tuple(totals['jobsPerStatus'].get(state, '') for state in states) + ('', '')))
+    if totals['schedds']:
+        lines.append("")
+        lines.append("Time to retrieve the status from each scheduler (slowest first):")
+        lines.append("%-40s %6s %10s %10s" % ('Schedd', 'Tasks', 'Max (s)', 'Ave (s)'))
+        for schedd, info in sorted(totals['schedds'].iteritems(), key = lambda item: -item[1]['maxLatency']):
+            lines.append("%-40s %6d %10.2f %10.2f" % (schedd, info['tasks'], info['maxLatency'], info['aveLatency']))
+    failed = [row for row in rows if row['error']]
+    if failed:
+        lines.append("")
+        lines.append("Could not get the status of %d tasks:" % len(failed))
+        for row in failed:
+            lines.append("  %s: %s" % (row['projdir'], row['error']))
+    return lines
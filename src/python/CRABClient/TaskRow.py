@@ -0,0 +1,139 @@
+"""
+A row of the task database, as returned by the task resource of the REST interface:
+    {'desc': {'columns': ['tm_taskname', 'tm_task_status', ...]}, 'result': ['...', 'SUBMITTED', ...]}
+
+Looking up a column with columns.index(name) scans the ~100 columns of the
+task table at every access. A TaskRow keeps the values with a {name: position}
+index, built once per answer (and shared by all the rows of a bulk answer),
+parses the columns holding python literals (like tm_task_warnings) only when
+they are used, and has typed accessors for the conventions of the task table
+('None' for null values, 'T'/'F' for booleans).
+"""
+
+from ast import literal_eval
+
+## The index of the last list of columns, to make getColumn-like lookups of many
+## columns of the same answer build it only once: (columns list, {name: position}).
+_lastIndex = (None, {})
+
+
+def columnIndex(columns):
+    """
+    Return {column name: position} for a list of columns.
+    """
+    global _lastIndex
+    lastColumns, lastIndex = _lastIndex
+    if lastColumns is columns:
+        return lastIndex
+    index = dict((name, position) for position, name in enumerate(columns))
+    _lastIndex = (columns, index)
+    return index
+
+
+class TaskRow(object):
+    """
+    The values of one task, accessed by column name.
+    """
+
+    __slots__ = ['index', 'values', 'parsed']
+
+
+    def __init__(self, index, values):
+        self.index = index
+        self.values = values
+        ## The columns already parsed with literal_eval.
+        self.parsed = None
+
+
+    @classmethod
+    def fromResult(cls, dictresult):
+        """
+        The row of the answer of the 'search' subresource.
+        """
+        return cls(columnIndex(dictresult['desc']['columns']), dictresult['result'])
+
+
+    @classmethod
+    def fromResults(cls, dictresult):
+        """
+        The rows of an answer with one list of values per task (like the 'bulksearch' subresource).
+        """
+        index = columnIndex(dictresult['desc']['columns'])
+        return [cls(index, values) for values in dictresult['result']]
+
+
+    @property
+    def columns(self):
+        return sorted(self.index, key = self.index.get)
+
+
+    def toResult(self):
+        """
+        The row in the format of the answer of the 'search' subresource.
+        """
+        return {'desc': {'columns': self.columns}, 'result': list(self.values)}
+
+
+    def project(self, columns):
+        """
+        A row with only the given columns (the ones that this row has).
+        """
+        columns = [name for name in columns if name in self.index]
+        return TaskRow(columnIndex(columns), [self.values[self.index[name]] for name in columns])
+
+
+    def __contains__(self, name):
+        return name in self.index
+
+
+    def __getitem__(self, name):
+        """
+        The value of the column as it was returned by the server.
+        """
+        return self.values[self.index[name]]
+
+
+    def get(self, name, default = None):
+        """
+        The value of the column, or default if the row does not have it or it is null ('None').
+        """
+        position = self.index.get(name)
+        if position is None:
+            return default
+        value = self.values[position]
+        return default if value is None or value == 'None' else value
+
+
+    def getInt(self, name, default = None):
+        value = self.get(name)
+        return default if value is None else int(value)
+
+
+    def getBool(self, name, default = None):
+        """
+        The value of a 'T'/'F' column as True/False.
+        """
+        value = self.get(name)
+        if value is None:
+            return default
+        return value in ['T', True]
+
+
+    def getLiteral(self, name, default = None):
+        """
+        The value of a column holding a python literal (e.g. tm_task_warnings, tm_outfiles),
+        parsed the first time it is asked.
+        """
+        if self.parsed is None:
+            self.parsed = {}
+        if name not in self.parsed:
+            value = self.get(name)
+            if isinstance(value, basestring):
+                value = literal_eval(value)
+            self.parsed[name] = value
+        value = self.parsed[name]
+        return default if value is None else value
+
+
+    def __repr__(self):
+        return "TaskRow(%s)" % dict((name, self.values[position]) for name, position in self.index.iteritems())
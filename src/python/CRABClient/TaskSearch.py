@@ -0,0 +1,158 @@
+"""
+Lookup of the task database rows of many tasks.
+
+The 'search' subresource of the task resource returns all the columns of one
+task, so a command (or a script using CRABAPI) working on many tasks does one
+round trip per task and transfers every column of every task. The 'bulksearch'
+subresource takes many workflow names and the columns that are needed, and
+returns only those columns for all the tasks in one request:
+    GET task?subresource=bulksearch&workflow=A&workflow=B&column=tm_taskname&column=tm_task_status
+    {'desc': {'columns': ['tm_taskname', 'tm_task_status']}, 'result': [['A', 'SUBMITTED'], ['B', 'NEW']]}
+
+The servers that do not have it answer to the first request with an error telling
+that the subresource is unknown (see bulkSearchUnsupported); TaskSearch then falls
+back to one 'search' request per task, several at a time, and keeps only the
+requested columns. Either way, the row of each task is a TaskRow.
+"""
+
+import urllib
+from httplib import HTTPException
+
+from CRABClient.TaskRow import TaskRow
+from CRABClient.TransferEngines import ThreadEngine, STOP_MESSAGE
+
+## The maximum number of tasks asked in one bulk request (to keep the URL short).
+BULK_SEARCH_BATCH = 100
+## The number of 'search' requests done at the same time when the server has no bulk search.
+SEARCH_PARALLEL = 10
+## The HTTP codes with which a server rejects a subresource it does not know.
+## A 400 can also be a bad parameter (e.g. a malformed workflow name), see bulkSearchUnsupported.
+UNSUPPORTED_CODES = [404, 405, 501]
+
+
+def bulkSearchQuery(tasknames, columns = None):
+    query = [('subresource', 'bulksearch')] + [('workflow', taskname) for taskname in tasknames]
+    if columns is not None:
+        query += [('column', column) for column in ['tm_taskname'] + [c for c in columns if c != 'tm_taskname']]
+    return urllib.urlencode(query)
+
+
+def bulkSearchUnsupported(ex):
+    """
+    Whether the HTTPException ex tells that the server does not have the bulk search:
+    a code in UNSUPPORTED_CODES, or a 400 whose error headers name the subresource.
+    """
+    status = getattr(ex, 'status', None)
+    if status in UNSUPPORTED_CODES:
+        return True
+    if status != 400:
+        return False
+    headers = getattr(ex, 'headers', None) or {}
+    reason = ' '.join(str(headers.get(name, '')) for name in ['X-Error-Detail', 'X-Error-Info'])
+    return 'subresource' in reason or 'bulksearch' in reason
+
+
+class TaskSearch(object):
+    """
+    Get the task database rows of many tasks, with one bulk request per BULK_SEARCH_BATCH
+    tasks, or with concurrent 'search' requests if the server does not have the bulk search.
+
+    serverFactory() must return a new REST client (each thread needs its own).
+    bulk tells whether the bulk search should be tried (False if it is known that the server
+    does not have it); after search() it tells whether the server had it.
+    """
+
+    def __init__(self, serverFactory, uri, bulk = True, nparallel = SEARCH_PARALLEL, logger = None):
+        self.serverFactory = serverFactory
+        self.uri = uri
+        self.bulk = bulk
+        self.nparallel = nparallel
+        self.logger = logger
+        ## The rows of the tasks retrieved by the last search, {taskname: row}.
+        self.results = {}
+        ## The tasks that could not be retrieved by the last search, {taskname: error message}.
+        self.errors = {}
+        ## The number of requests done by the last search.
+        self.requests = 0
+
+
+    def search(self, tasknames, columns = None):
+        """
+        Return {taskname: TaskRow} for the given tasks, with only the given columns (also kept in
+        self.results). The tasks that could not be retrieved are in self.errors.
+        """
+        tasknames = list(tasknames)
+        self.results, self.errors, self.requests = {}, {}, 0
+        if self.bulk:
+            try:
+                self.results = self._bulkSearch(tasknames, columns)
+                return self.results
+            except HTTPException as hte:
+                if not bulkSearchUnsupported(hte):
+                    raise
+                if self.logger:
+                    self.logger.debug("The server does not have the bulk search of the tasks (%s), searching them one by one" % hte)
+                self.bulk = False
+                self.errors = {}
+        self.results = self._singleSearch(tasknames, columns)
+        return self.results
+
+
+    def _bulkSearch(self, tasknames, columns):
+        """
+        Raise the HTTPException of the first request, which tells whether the server has the
+        bulk search. The tasks of a later request that fails are put in self.errors, and the
+        rows already retrieved are kept.
+        """
+        results = {}
+        server = self.serverFactory()
+        for i in xrange(0, len(tasknames), BULK_SEARCH_BATCH):
+            batch = tasknames[i:i+BULK_SEARCH_BATCH]
+            try:
+                dictresult, _, _ = server.get(self.uri, data = bulkSearchQuery(batch, columns))
+            except HTTPException as hte:
+                if i == 0:
+                    raise
+                self.requests += 1
+                for taskname in batch:
+                    self.errors[taskname] = str(hte).split('\n')[0] or hte.__class__.__name__
+                continue
+            self.requests += 1
+            for row in TaskRow.fromResults(dictresult):
+                results[row['tm_taskname']] = row
+        for taskname in tasknames:
+            if taskname not in results and taskname not in self.errors:
+                self.errors[taskname] = "Task not found"
+        return results
+
+
+    def _singleSearch(self, tasknames, columns):
+        results = {}
+        engine = ThreadEngine(max(1, min(self.nparallel, len(tasknames))))
+        engine.start(self._searchWorker, (results, columns))
+        for taskname in tasknames:
+            engine.put(taskname)
+        if engine.stop():
+            raise KeyboardInterrupt
+        self.requests += len(tasknames)
+        for taskname in tasknames:
+            if isinstance(results.get(taskname), basestring):
+                self.errors[taskname] = results.pop(taskname)
+            elif taskname not in results:
+                self.errors[taskname] = "Task not found"
+        return results
+
+
+    def _searchWorker(self, inputq, results, columns):
+        server = self.serverFactory()
+        while True:
+            taskname = inputq.get()
+            if taskname == STOP_MESSAGE:
+                break
+            try:
+                dictresult, _, _ = server.get(self.uri, data = {'subresource': 'search', 'workflow': taskname})
+                if dictresult.get('result'):
+                    row = TaskRow.fromResult(dictresult)
+                    results[taskname] = row.project(columns) if columns is not None else row
+            except Exception as ex:
+                results[taskname] = str(ex).split('\n')[0] or ex.__class__.__name__
@@ -0,0 +1,248 @@
+"""
+Backends used by remote_copy to copy the files from the storage to the local disk.
+
+Each backend copies a list of (source, destination) pairs and returns, for each
+of them, a (returncode, stdout, stderr) tuple in the same form as the copy commands.
+Available backends:
+ - 'GFALPY': in-process copies through the gfal2 python bindings. One gfal2
+   context is reused by each worker and the files are sent in bulk requests,
+   so there is no fork/exec and no new handshake per file.
+ - 'GFAL': one `gfal-copy` command per file.
+ - 'LCG': one `lcg-cp` command per file.
+ - 'FAKE': local copies with shutil, for tests without grid middleware.
+When no backend is requested, the first available one in AUTO_BACKENDS is used.
+"""
+
+import os
+import re
+import shutil
+import threading
+import subprocess
+
+from CRABClient.ClientUtilities import cmd_exist
+
+try:
+    import gfal2
+except ImportError:
+    gfal2 = None
+
+
+class TransferBackend(object):
+    """
+    Base class of the transfer backends.
+    """
+
+    name = None
+    ## Short description used in the log messages.
+    description = None
+    ## Maximum number of files passed at once to copy().
+    bulkSize = 1
+
+    def __init__(self, proxyfilename, checksum = None, waittime = None):
+        self.proxyfilename = proxyfilename
+        self.checksum = checksum
+        ## Connection timeout, in seconds.
+        self.connectTimeout = 1800 if waittime == None else 1800 + int(waittime)
+
+
+    @classmethod
+    def available(cls):
+        """
+        Return True if the backend can be used on this machine.
+        """
+        return False
+
+
+    def copy(self, transfers, timeout, logger):
+        """
+        Copy each (source, destination) pair of transfers, with a timeout in seconds per file.
+        Return a list with a (returncode, stdout, stderr) tuple per transfer.
+        """
+        raise NotImplementedError
+
+
+class CommandBackend(TransferBackend):
+    """
+    Run a copy command per file in a subprocess.
+    """
+
+    ## Name of the executable and option used to pass the timeout of the transfer.
+    executable = None
+    timeoutOption = None
+
+    def __init__(self, proxyfilename, checksum = None, waittime = None):
+        TransferBackend.__init__(self, proxyfilename, checksum, waittime)
+        self.command = self.createCommand()
+
+
+    @classmethod
+    def available(cls):
+        return cmd_exist(cls.executable)
+
+
+    def createCommand(self):
+        """
+        Return the copy command, without the timeout, the source and the destination.
+        """
+        raise NotImplementedError
+
+
+    def copy(self, transfers, timeout, logger):
+        results = []
+        for source, destination in transfers:
+            command = '%s %s %s %s' % (self.command, self.timeoutOption + str(timeout) + ' ', source, destination)
+            logger.debug("Executing %s" % command)
+            pipe = subprocess.Popen(command, stdout = subprocess.PIPE,
+                                    stderr = subprocess.PIPE, shell = True)
+            stdout, stderr = pipe.communicate()
+            results.append((pipe.returncode, stdout, stderr))
+        return results
+
+
+class GFALBackend(CommandBackend):
+
+    name = 'GFAL'
+    description = '`gfal-copy` command'
+    executable = 'gfal-copy'
+    timeoutOption = ' -t '
+
+    def createCommand(self):
+        command = "env -i X509_USER_PROXY=%s gfal-copy -v " % os.path.abspath(self.proxyfilename)
+        if self.checksum:
+            command += "-K %s " % self.checksum
+        command += " -T %s" % self.connectTimeout
+        return command
+
+
+class LCGBackend(CommandBackend):
+
+    name = 'LCG'
+    description = '`lcg-cp` command'
+    executable = 'lcg-cp'
+    timeoutOption = ' --srm-timeout '
+
+    def createCommand(self):
+        command = "lcg-cp --connect-timeout 20 --verbose -b -D srmv2"
+        if self.checksum:
+            command += " --checksum-type %s " % self.checksum
+        command += " --sendreceive-timeout %s" % self.connectTimeout
+        return command
+
+
+class Gfal2Backend(TransferBackend):
+    """
+    Copy the files in process with the gfal2 python bindings.
+    Each thread (or process) creates its own gfal2 context the first time it
+    copies something and then reuses it for all the following bulk requests.
+    """
+
+    name = 'GFALPY'
+    description = 'gfal2 python bindings'
+    bulkSize = 20
+
+    def __init__(self, proxyfilename, checksum = None, waittime = None):
+        TransferBackend.__init__(self, proxyfilename, checksum, waittime)
+        self.local = threading.local()
+        ## Fail now, and let getTransferBackend fall back to the next backend, if gfal2 is not usable.
+        self.createContext()
+
+
+    @classmethod
+    def available(cls):
+        return gfal2 is not None
+
+
+    def createContext(self):
+        context = gfal2.creat_context()
+        proxy = os.path.abspath(self.proxyfilename)
+        context.set_opt_string("X509", "CERT", proxy)
+        context.set_opt_string("X509", "KEY", proxy)
+        context.set_opt_integer("SRM PLUGIN", "OPERATION_TIMEOUT", self.connectTimeout)
+        return context
+
+
+    def getContext(self):
+        if getattr(self.local, 'context', None) is None:
+            self.local.context = self.createContext()
+        return self.local.context
+
+
+    def copy(self, transfers, timeout, logger):
+        context = self.getContext()
+        params = context.transfer_parameters()
+        params.timeout = timeout
+        if self.checksum:
+            ## Same as `gfal-copy -K`, older bindings do not have set_checksum.
+            if hasattr(params, 'set_checksum'):
+                params.set_checksum(gfal2.checksum_mode.both, self.checksum, '')
+            else:
+                params.checksum_check = True
+                params.set_user_defined_checksum(self.checksum, '')
+        sources = [source for source, _ in transfers]
+        destinations = [destination for _, destination in transfers]
+        logger.debug("Copying %s files with gfal2 (timeout %s): %s" % (len(transfers), timeout, sources))
+        try:
+            errors = context.filecopy(params, sources, destinations)
+        except gfal2.GError as ex:
+            errors = [ex] * len(transfers)
+        results = []
+        for error in errors:
+            if error is None:
+                results.append((0, '', ''))
+            else:
+                results.append((1, '', 'gfal2 error: %s' % getattr(error, 'message', str(error))))
+        return results
+
+
+class FakeBackend(TransferBackend):
+    """
+    Copy local files (plain paths or file:// URLs) with shutil.
+    Never selected automatically, only meant for the tests.
+    """
+
+    name = 'FAKE'
+    description = 'fake local copies'
+    bulkSize = 5
+
+    @classmethod
+    def available(cls):
+        return True
+
+
+    def copy(self, transfers, timeout, logger):
+        results = []
+        for source, destination in transfers:
+            source = re.sub('^file://', '', source)
+            destination = re.sub('^file://', '', destination)
+            logger.debug("Copying %s to %s" % (source, destination))
+            try:
+                shutil.copyfile(source, destination)
+            except (IOError, OSError) as ex:
+                results.append((1, '', 'fake copy error: %s' % ex.strerror.lower()))
+            else:
+                results.append((0, '', ''))
+        return results
+
+
+BACKENDS = dict((backend.name, backend) for backend in [Gfal2Backend, GFALBackend, LCGBackend, FakeBackend])
+
+## The backends tried, in this order, when none is requested.
+AUTO_BACKENDS = ['GFALPY', 'GFAL', 'LCG']
+
+
+def getTransferBackend(name, proxyfilename, checksum = None, waittime = None, logger = None):
+    """
+    Return an instance of the backend called name. If name is None, return the
+    first of AUTO_BACKENDS that is available and can be set up. Return None if
+    there is no usable backend.
+    """
+    for candidate in ([name] if name else AUTO_BACKENDS):
+        backendclass = BACKENDS[candidate]
+        if not backendclass.available():
+            continue
+        try:
+            return backendclass(proxyfilename, checksum, waittime)
+        except Exception as ex:
+            if logger:
+                logger.debug("Cannot use the %s for the transfers: %s" % (backendclass.description, ex))
+    return None
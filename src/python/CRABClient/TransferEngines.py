@@ -0,0 +1,262 @@
+"""
+Worker pools used by remote_copy to run the file transfers in parallel.
+
+Two engines are available:
+ - 'thread': a pool of threads sharing plain dictionaries for the results.
+   The workers only wait on the copy subprocesses, so threads give the same
+   parallelism as processes without the fork and IPC overhead.
+ - 'process': the original pool of multiprocessing.Process workers, with the
+   results stored in Manager().dict() proxies. Kept as a fallback.
+
+The AdaptiveConcurrency controller measures the throughput of the completed
+transfers and adjusts the number of copies allowed in flight (AIMD-style).
+"""
+
+import time
+import Queue
+import threading
+import multiprocessing
+
+## The message sent to the workers to tell them to exit.
+STOP_MESSAGE = ('-1', 'STOP')
+
+DEFAULT_ENGINE = 'thread'
+
+
+class ThreadEngine(object):
+    """
+    Run the workers as threads of the current process.
+    """
+
+    name = 'thread'
+    ## The workers can log directly through the logger of the command.
+    inProcess = True
+
+    def __init__(self, nworkers):
+        self.nworkers = nworkers
+        self.inputq = None
+        self.workers = []
+
+
+    def newResultDict(self):
+        return {}
+
+
+    def start(self, target, args = ()):
+        """
+        Create the input queue and start the workers. Each worker is called
+        as target(inputq, *args).
+        """
+        self.inputq = Queue.Queue()
+        for _ in xrange(self.nworkers):
+            worker = threading.Thread(target = target, args = (self.inputq,) + tuple(args))
+            ## Do not keep the client alive if the user hits ctrl-C.
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+        return self.inputq
+
+
+    def put(self, item):
+        self.inputq.put(item)
+
+
+    def stop(self):
+        """
+        Send a STOP message to each worker and wait for them to exit.
+        Return True if ctrl-C has been hit.
+        """
+        result = False
+        for _ in range(len(self.workers)):
+            self.inputq.put(STOP_MESSAGE)
+        try:
+            for worker in self.workers:
+                ## Thread.join() without a timeout can not be interrupted by ctrl-C.
+                while worker.is_alive():
+                    worker.join(1)
+        except KeyboardInterrupt:
+            result = True
+        return result
+
+
+class ProcessEngine(object):
+    """
+    Run the workers as separate processes. The results are shared through a
+    multiprocessing Manager, which is only started if result dicts are requested.
+    """
+
+    name = 'process'
+    ## The workers must set up their own logging (see remote_copy.setSubprocessLog).
+    inProcess = False
+
+    def __init__(self, nworkers):
+        self.nworkers = nworkers
+        self.inputq = None
+        self.workers = []
+        self.manager = None
+
+
+    def newResultDict(self):
+        if self.manager is None:
+            self.manager = multiprocessing.Manager()
+        return self.manager.dict()
+
+
+    def start(self, target, args = ()):
+        """
+        Create the input queue and start the workers. Each worker is called
+        as target(inputq, *args).
+        """
+        self.inputq = multiprocessing.Queue()
+        for _ in xrange(self.nworkers):
+            worker = multiprocessing.Process(target = target, args = (self.inputq,) + tuple(args))
+            worker.start()
+            self.workers.append(worker)
+        return self.inputq
+
+
+    def put(self, item):
+        self.inputq.put(item)
+
+
+    def stop(self):
+        """
+        Send a STOP message to each worker and wait for them to exit.
+        Return True if ctrl-C has been hit.
+        """
+        result = False
+        try:
+            for _ in range(len(self.workers)):
+                self.inputq.put(STOP_MESSAGE)
+        finally:
+            # giving the time to the sub-process to exit
+            for worker in self.workers:
+                try:
+                    worker.join()
+                except KeyboardInterrupt:
+                    result = True
+        return result
+
+
+ENGINES = {ThreadEngine.name: ThreadEngine,
+           ProcessEngine.name: ProcessEngine}
+
+
+def getTransferEngine(name, nworkers):
+    """
+    Return an instance of the engine called name (the default engine if name is None).
+    """
+    return ENGINES[name or DEFAULT_ENGINE](nworkers)
+
+
+class AdaptiveConcurrency(object):
+    """
+    Limit the number of transfers in flight and adapt the limit to the measured throughput.
+
+    Every time 'limit' transfers have completed (a round), the aggregate throughput
+    of the round is compared with the one of the previous round:
+     - if it improved by more than INCREASE_THRESHOLD times the gain expected from
+       one more stream (1/limit), one more transfer is allowed (additive increase);
+     - if it dropped by more than DECREASE_THRESHOLD, the limit is multiplied by BACKOFF (multiplicative decrease);
+     - otherwise the link is considered saturated and the limit is kept.
+    A failed transfer also triggers a multiplicative decrease.
+
+    The per-file speed of the successful transfers (exponentially weighted average)
+    is available through speed(), to compute the transfer timeouts.
+
+    The clock can be replaced to test the controller against a simulated link.
+    """
+
+    INCREASE_THRESHOLD = 0.5
+    DECREASE_THRESHOLD = 0.20
+    BACKOFF = 0.5
+    ## Weight of the last measurement in the average per-file speed.
+    SPEED_WEIGHT = 0.2
+
+    def __init__(self, initial, maximum, minimum = 1, defaultspeed = float(250*1024), minspeed = 20*1024., clock = time.time):
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.limit = min(max(initial, minimum), self.maximum)
+        self.defaultspeed = defaultspeed
+        self.minspeed = minspeed
+        self.clock = clock
+        self.inflight = 0
+        self.measuredspeed = None
+        self.maxlimit = self.limit
+        self.lastrate = None
+        self.lastlimit = self.limit
+        self.cond = threading.Condition()
+        self._newRound()
+
+
+    def _newRound(self):
+        self.roundstart = self.clock()
+        self.roundbytes = 0
+        self.roundcount = 0
+
+
+    def acquire(self):
+        """
+        Wait until one more transfer is allowed to be in flight.
+        """
+        with self.cond:
+            while self.inflight >= self.limit:
+                self.cond.wait(1)
+            self.inflight += 1
+
+
+    def release(self, size, duration, success = True):
+        """
+        Record the result of a transfer of size bytes that took duration seconds.
+        """
+        with self.cond:
+            self.inflight -= 1
+            self.record(size, duration, success)
+            self.cond.notify_all()
+
+
+    def record(self, size, duration, success = True):
+        """
+        Update the speed measurement and the limit. Does not change the transfers in flight.
+        """
+        if not success:
+            self._decrease()
+            return
+        if size and duration > 0:
+            speed = size / float(duration)
+            if self.measuredspeed is None:
+                self.measuredspeed = speed
+            else:
+                self.measuredspeed += self.SPEED_WEIGHT * (speed - self.measuredspeed)
+        self.roundbytes += size or 0
+        self.roundcount += 1
+        if self.roundcount < self.limit:
+            return
+        elapsed = self.clock() - self.roundstart
+        if elapsed <= 0 or not self.roundbytes:
+            self._newRound()
+            return
+        rate = self.roundbytes / float(elapsed)
+        limit = self.limit
+        if self.lastrate is None or rate > self.lastrate * (1 + self.INCREASE_THRESHOLD / self.lastlimit):
+            self.limit = min(self.limit + 1, self.maximum)
+        elif rate < self.lastrate * (1 - self.DECREASE_THRESHOLD):
+            self.limit = max(int(self.limit * self.BACKOFF), self.minimum)
+        self.maxlimit = max(self.maxlimit, self.limit)
+        self.lastrate = rate
+        self.lastlimit = limit
+        self._newRound()
+
+
+    def _decrease(self):
+        self.limit = max(int(self.limit * self.BACKOFF), self.minimum)
+        self.lastrate = None
+        self._newRound()
+
+
+    def speed(self):
+        """
+        Return the per-file download speed to use for the timeouts, in bytes per second.
+        """
+        speed = self.defaultspeed if self.measuredspeed is None else self.measuredspeed
+        return max(speed, self.minspeed)
@@ -0,0 +1,133 @@
+"""
+Journal of the files retrieved by remote_copy, kept in the results directory of the CRAB project.
+
+The journal is an append-only file with one JSON record per line:
+    {"pfn": ..., "destination": ..., "size": ..., "adler32": ..., "state": ..., "attempts": ..., "verified": ...}
+When it is loaded the last record of each PFN wins, so an interrupted client
+loses at most the line it was writing. Records are appended with a single
+os.write on a file opened with O_APPEND, so threads and processes of the
+transfer engines can all write to it.
+
+It allows getoutput2/getlog2 --resume to skip the files already retrieved
+without looking at them on disk, and to retry only the failed ones.
+"""
+
+import os
+import json
+import time
+import threading
+
+## File name of the journal in the results directory of the project.
+JOURNAL_NAME = '.transfers.journal'
+
+## States of the files in the journal.
+DONE = 'done'
+FAILED = 'failed'
+
+## The journal is rewritten with only the last record of each file when it
+## has more than COMPACT_FACTOR lines per file (and at least COMPACT_MIN lines).
+COMPACT_FACTOR = 2
+COMPACT_MIN = 1000
+
+
+class TransferJournal(object):
+    """
+    Read and append the records of the transfer journal.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.fd = None
+        self.lock = threading.Lock()
+        self.load()
+
+
+    def load(self):
+        """
+        Read the journal, keeping the last record of each PFN.
+        """
+        nlines = 0
+        if os.path.isfile(self.path):
+            with open(self.path) as fd:
+                for line in fd:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        ## The last line can be truncated if the client was killed while writing it.
+                        continue
+                    self.entries[entry['pfn']] = entry
+                    nlines += 1
+        if nlines > max(COMPACT_FACTOR * len(self.entries), COMPACT_MIN):
+            self.compact()
+
+
+    def compact(self):
+        """
+        Rewrite the journal with one record per file.
+        """
+        self.close()
+        tmppath = self.path + '.tmp'
+        with open(tmppath, 'w') as fd:
+            for entry in self.entries.itervalues():
+                fd.write(json.dumps(entry) + '\n')
+        os.rename(tmppath, self.path)
+
+
+    def get(self, pfn):
+        return self.entries.get(pfn)
+
+
+    def isDone(self, pfn, destination, size = None, verified = False):
+        """
+        Return True if the file has already been retrieved to destination
+        (with the expected size, if known), and its checksum verified if verified.
+        """
+        entry = self.entries.get(pfn)
+        if entry is None or entry['state'] != DONE or entry['destination'] != destination:
+            return False
+        if verified and not entry.get('verified'):
+            return False
+        return not size or entry['size'] == size
+
+
+    def record(self, pfn, destination, state, size = None, adler32 = None, attempted = True, verified = None):
+        """
+        Append a record for the file. attempted tells if a copy has been tried
+        (otherwise the number of attempts is not increased). verified tells if the
+        local checksum has been checked against adler32; a new copy resets it.
+        """
+        with self.lock:
+            previous = self.entries.get(pfn, {})
+            if verified is None:
+                verified = False if attempted else previous.get('verified', False)
+            entry = {'pfn': pfn,
+                     'destination': destination,
+                     'size': size if size is not None else previous.get('size'),
+                     'adler32': adler32 if adler32 is not None else previous.get('adler32'),
+                     'state': state,
+                     'attempts': previous.get('attempts', 0) + (1 if attempted else 0),
+                     'verified': verified,
+                     'time': int(time.time())}
+            self.entries[pfn] = entry
+            if self.fd is None:
+                self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            os.write(self.fd, json.dumps(entry) + '\n')
+        return entry
+
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def catalogAdler32(myfile):
+    """
+    Return the ADLER32 checksum of a file as given by the server in the file
+    metadata (a 'checksum' dictionary), or None if it is not known.
+    """
+    checksum = myfile.get('checksum')
+    if isinstance(checksum, dict):
+        return checksum.get('adler32')
+    return None
@@ -0,0 +1,97 @@
+"""
+Local ADLER32 verification of the files retrieved by remote_copy.
+
+The checksums are computed on a pool of processes, reading the files with
+large buffers: zlib.adler32 holds the GIL, so threads would use only one core.
+The pool works in the background, so the verification of the files already
+retrieved overlaps with the copy of the others.
+"""
+
+import zlib
+import threading
+import multiprocessing
+
+## Size of the reads when computing a checksum.
+READ_BUFFER = 8 * 1024 * 1024
+
+
+def adler32(path, bufsize = READ_BUFFER):
+    """
+    Return the ADLER32 checksum of the file as an 8 digits hexadecimal string.
+    """
+    value = 1
+    with open(path, 'rb') as fd:
+        while True:
+            data = fd.read(bufsize)
+            if not data:
+                break
+            value = zlib.adler32(data, value)
+    return '%08x' % (value & 0xffffffff)
+
+
+def sameAdler32(local, catalog):
+    """
+    Compare two hexadecimal checksums (the catalog ones can miss the leading zeros).
+    """
+    try:
+        return int(local, 16) == int(catalog, 16)
+    except (TypeError, ValueError):
+        return False
+
+
+def computeAdler32(path):
+    """
+    Return (checksum, None), or (None, error message) if the file can not be read.
+    """
+    try:
+        return adler32(path), None
+    except (IOError, OSError) as ex:
+        return None, str(ex)
+
+
+class VerificationPool(object):
+    """
+    Compute the ADLER32 checksum of files on a pool of processes and compare
+    them with the expected ones.
+
+    The pool must be created before starting any thread, because it forks.
+    submit() can then be called from any thread of the process.
+    """
+
+    def __init__(self, nprocs = None):
+        self.pool = multiprocessing.Pool(nprocs or multiprocessing.cpu_count())
+        self.lock = threading.Lock()
+        self.pending = []
+
+
+    def submit(self, key, path, expected, payload = None):
+        """
+        Queue the verification of the file at path. payload is given back with the result.
+        """
+        result = self.pool.apply_async(computeAdler32, (path,))
+        with self.lock:
+            self.pending.append((key, path, expected, payload, result))
+
+
+    def wait(self):
+        """
+        Wait for the verifications submitted so far and return a dictionary
+        key -> {'path', 'expected', 'adler32', 'error', 'ok', 'payload'}.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, []
+        results = {}
+        for key, path, expected, payload, result in pending:
+            checksum, error = result.get()
+            results[key] = {'path': path,
+                            'expected': expected,
+                            'adler32': checksum,
+                            'error': error,
+                            'ok': error is None and sameAdler32(checksum, expected),
+                            'payload': payload}
+        return results
+
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
@@ -0,0 +1,207 @@
+"""
+Download of files from the web servers of the schedds (status_cache, short logs,
+lumi files, ...), the primitive behind UserUtilities.getFileFromURL.
+
+A PersistentURLFetcher keeps one HTTP(S) connection per server open between the
+requests, reads the answer in large chunks (DOWNLOAD_CHUNK_SIZE), writes it to
+a temporary file which is renamed to the final name only once the whole file
+is there, can ask for a gzip-compressed answer, and records the size and time
+of each transfer. A file is never left half written: either the previous
+version or the new one is found under the final name.
+
+The connections of a fetcher must be used by one thread at a time;
+sharedFetcher() returns a fetcher per thread (and proxy), kept for the next
+downloads of the same thread.
+"""
+
+import os
+import time
+import zlib
+import httplib
+import logging
+import threading
+import socket as socketlib
+from urlparse import urlparse
+
+from CRABClient.ClientExceptions import ClientException
+
+## The size of the reads from the connection and of the writes to the file.
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_TIMEOUT = 60
+## The schemes handled by PersistentURLFetcher (the other ones go through urllib).
+FETCHER_SCHEMES = ['http', 'https']
+
+
+class PersistentURLFetcher(object):
+    """
+    Retrieve URLs over one HTTP(S) connection per server, kept open between the requests.
+
+    metrics holds the totals over all the requests of the fetcher:
+        {'requests': n, 'connections': n, 'bytes': written, 'wireBytes': received, 'seconds': s}
+    and lastTransfer the details of the last request:
+        {'url': ..., 'status': HTTP code, 'bytes': written, 'wireBytes': received (less than
+         bytes if the answer was compressed), 'firstByte': s until the headers, 'seconds': s}
+    """
+
+    def __init__(self, proxyfilename = None, timeout = DOWNLOAD_TIMEOUT, chunksize = DOWNLOAD_CHUNK_SIZE, gzip = False):
+        self.proxyfilename = proxyfilename
+        self.timeout = timeout
+        self.chunksize = chunksize
+        self.gzip = gzip
+        self.connections = {}
+        self.metrics = {'requests': 0, 'connections': 0, 'bytes': 0, 'wireBytes': 0, 'seconds': 0.0}
+        self.lastTransfer = None
+
+
+    def _connection(self, scheme, netloc):
+        key = (scheme, netloc)
+        if key not in self.connections:
+            if scheme == 'https':
+                self.connections[key] = httplib.HTTPSConnection(netloc, key_file = self.proxyfilename,
+                                                                cert_file = self.proxyfilename, timeout = self.timeout)
+            else:
+                self.connections[key] = httplib.HTTPConnection(netloc, timeout = self.timeout)
+            self.metrics['connections'] += 1
+        return self.connections[key]
+
+
+    def _request(self, parsedurl, headers):
+        """
+        Send the request and return the response. If the kept connection was closed by
+        the server in the meantime, reconnect and try once more.
+        """
+        path = parsedurl.path + ('?' + parsedurl.query if parsedurl.query else '')
+        for attempt in [1, 2]:
+            conn = self._connection(parsedurl.scheme, parsedurl.netloc)
+            try:
+                conn.request('GET', path, headers = headers)
+                return conn.getresponse()
+            except (httplib.HTTPException, socketlib.error):
+                self.close(parsedurl.scheme, parsedurl.netloc)
+                if attempt == 2:
+                    raise
+
+
+    def _copy(self, response, f, transfer):
+        """
+        Copy the body of the response into the file f, uncompressing it if needed.
+        """
+        decoder = None
+        if (response.getheader('Content-Encoding') or '').lower() in ['gzip', 'x-gzip']:
+            decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        while True:
+            piece = response.read(self.chunksize)
+            if not piece:
+                break
+            transfer['wireBytes'] += len(piece)
+            if decoder:
+                piece = decoder.decompress(piece)
+            f.write(piece)
+            transfer['bytes'] += len(piece)
+        ## httplib returns what it got if the server closes the connection before
+        ## the end of the file (it does not raise IncompleteRead when reading by chunks).
+        if response.length:
+            raise httplib.IncompleteRead('', response.length)
+        if decoder:
+            piece = decoder.flush()
+            f.write(piece)
+            transfer['bytes'] += len(piece)
+
+
+    def _fetch(self, url, filename, headers):
+        """
+        Retrieve url into filename. Return the response (already read), or None if the
+        server answered 304 (not modified). Raise ClientException in case of errors
+        (with a status attribute if the server answered with an error code).
+        """
+        parsedurl = urlparse(url)
+        if self.gzip:
+            headers['Accept-Encoding'] = 'gzip'
+        tmpfilename = "%s.%s" % (filename, os.getpid())
+        transfer = {'url': url, 'status': None, 'bytes': 0, 'wireBytes': 0, 'firstByte': None, 'seconds': None}
+        start = time.time()
+        try:
+            response = self._request(parsedurl, headers)
+            transfer['status'] = response.status
+            transfer['firstByte'] = time.time() - start
+            if response.status == 304:
+                response.read()
+                return None
+            if response.status != 200:
+                content = response.read()
+                exc = ClientException("Unable to retrieve the file from %s. HTTP status code %s. HTTP content: %s" % (url, response.status, content))
+                exc.status = response.status
+                raise exc
+            with open(tmpfilename, 'wb') as f:
+                self._copy(response, f, transfer)
+            os.rename(tmpfilename, filename)
+        except (httplib.HTTPException, socketlib.error, IOError, zlib.error) as ex:
+            if os.path.isfile(tmpfilename):
+                os.remove(tmpfilename)
+            self.close(parsedurl.scheme, parsedurl.netloc)
+            msg = "Error while trying to retrieve file from %s: %s" % (url, ex)
+            msg += "\nMake sure the URL is correct."
+            raise ClientException(msg)
+        finally:
+            transfer['seconds'] = time.time() - start
+            self.lastTransfer = transfer
+            self.metrics['requests'] += 1
+            for key in ['bytes', 'wireBytes', 'seconds']:
+                self.metrics[key] += transfer[key]
+        logging.getLogger('CRAB3').debug("Retrieved %s: %d bytes (%d transferred) in %.3f s" \
+                                         % (url, transfer['bytes'], transfer['wireBytes'], transfer['seconds']))
+        return response
+
+
+    def fetch(self, url, filename = None):
+        """
+        Retrieve url into filename (by default, the file name in the url) and return filename.
+        Raise ClientException in case of errors (a status attribute is added if the error is an http one).
+        """
+        if filename is None:
+            filename = os.path.basename(urlparse(url).path)
+        self._fetch(url, filename, {})
+        return filename
+
+
+    def fetchIfModified(self, url, filename, etag = None, lastmodified = None):
+        """
+        Retrieve url into filename, unless it did not change since it was retrieved with the given
+        validators (the ETag and Last-Modified headers of the previous answer).
+        Return (changed, etag, lastmodified) or raise ClientException.
+        """
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if lastmodified:
+            headers['If-Modified-Since'] = lastmodified
+        response = self._fetch(url, filename, headers)
+        if response is None:
+            return False, etag, lastmodified
+        return True, response.getheader('ETag'), response.getheader('Last-Modified')
+
+
+    def close(self, scheme = None, netloc = None):
+        """
+        Close the connection to the given server (all of them by default).
+        """
+        for key in self.connections.keys():
+            if scheme is None or key == (scheme, netloc):
+                self.connections.pop(key).close()
+
+
+## The fetchers of each thread, {proxyfilename: PersistentURLFetcher}.
+_threadFetchers = threading.local()
+
+
+def sharedFetcher(proxyfilename = None):
+    """
+    Return the fetcher of the current thread for the given proxy, so that the
+    successive downloads of a thread reuse the same connections.
+    """
+    fetchers = getattr(_threadFetchers, 'fetchers', None)
+    if fetchers is None:
+        fetchers = _threadFetchers.fetchers = {}
+    if proxyfilename not in fetchers:
+        fetchers[proxyfilename] = PersistentURLFetcher(proxyfilename)
+    return fetchers[proxyfilename]
@@ -17,6 +17,8 @@ from WMCore.Configuration import Configuration
 from WMCore.DataStructs.LumiList import LumiList
 
 ## CRAB dependencies
+from CRABClient.TaskRow import TaskRow
+from CRABClient.URLFetcher import sharedFetcher, FETCHER_SCHEMES, DOWNLOAD_CHUNK_SIZE
 from CRABClient.ClientUtilities import DBSURLS, LOGLEVEL_MUTE, colors
 from CRABClient.ClientExceptions import ClientException, UsernameException, ProxyException
 
@@ -121,43 +123,65 @@ def getFileFromURL(url, filename = None, proxyfilename = None):
     filename: the local filename where the url is saved to. Defaults to the filename in the url
     proxyfilename: the x509 proxy certificate to be used in case auth is required
 
+    The http(s) URLs are retrieved over the connections kept by the current thread (see
+    URLFetcher.sharedFetcher). The file is replaced only once it is completely retrieved.
+
     Return the filename used to save the file or raises ClientException in case of errors (a status attribute is added if the error is an http one).
     """
     parsedurl = urlparse(url)
     if filename == None:
         path = parsedurl.path
         filename = os.path.basename(path)
+    if parsedurl.scheme in FETCHER_SCHEMES:
+        return sharedFetcher(proxyfilename).fetch(url, filename)
+    _getFileWithURLopener(url, filename, proxyfilename)
+    return filename
+
+
+def getFileFromURLIfModified(url, filename, proxyfilename = None, etag = None, lastmodified = None):
+    """
+    Retrieve the content of a URL into a file, unless it did not change since it was retrieved
+    with the given validators (the ETag and Last-Modified headers of the previous answer).
+    The file is replaced only once it is completely retrieved.
+
+    Return (changed, etag, lastmodified) or raises ClientException in case of errors (a status
+    attribute is added if the error is an http one).
+    """
+    if urlparse(url).scheme in FETCHER_SCHEMES:
+        return sharedFetcher(proxyfilename).fetchIfModified(url, filename, etag, lastmodified)
+    headers = _getFileWithURLopener(url, filename, proxyfilename)
+    return True, headers.getheader('ETag'), headers.getheader('Last-Modified')
+
+
+def _getFileWithURLopener(url, filename, proxyfilename):
+    """
+    Retrieve the URLs of the schemes that PersistentURLFetcher does not handle (e.g. file://).
+    Return the headers of the answer.
+    """
+    tmpfilename = "%s.%s" % (filename, os.getpid())
     try:
         opener = urllib.URLopener(key_file = proxyfilename, cert_file = proxyfilename)
         socket = opener.open(url)
-        status = socket.getcode()
-        # Read the file by chunks instead of all at once, appending each chunk to the final result.
-        # This lowers the memory overhead, which can be a problem with big files.
-        with open (filename, 'a') as f:
-            f.seek(0)
-            f.truncate()
+        headers = socket.info()
+        with open(tmpfilename, 'wb') as f:
             while True:
-                piece = socket.read(1024)
+                piece = socket.read(DOWNLOAD_CHUNK_SIZE)
                 if not piece:
                     break
                 f.write(piece)
+        os.rename(tmpfilename, filename)
     except IOError as ioex:
+        if os.path.isfile(tmpfilename):
+            os.remove(tmpfilename)
         msg = "Error while trying to retrieve file from %s: %s" % (url, ioex)
         msg += "\nMake sure the URL is correct."
-        exc = ClientException(msg)
-        if ioex[0] == 'http error':
-            exc.status = ioex[1]
-        raise exc
+        raise ClientException(msg)
     except Exception as ex:
         tblogger = logging.getLogger('CRAB3')
         tblogger.exception(ex)
         msg = "Unexpected error while trying to retrieve file from %s: %s" % (url, ex)
         raise ClientException(msg)
-    if status != 200 and parsedurl.scheme in ['http', 'https']:
-        exc = ClientException("Unable to retieve the file from %s. HTTP status code %s. HTTP content: %s" % (url, status, socket.info()))
-        exc.status = status
-        raise exc
-    return filename
+    return headers
 
 
 def getLumiListInValidFiles(dataset, dbsurl = 'phys03'):
@@ -226,9 +250,8 @@ def getMutedStatusInfo(logger):
     return crabDBInfo, shortResult
 
 def getColumn(dictresult, columnName):
-    columnIndex = dictresult['desc']['columns'].index(columnName)
-    value = dictresult['result'][columnIndex]
-    if value=='None':
-        return None
-    else:
-        return value
+    """
+    Return the value of a column of a task database row (None if it is null).
+    To read many columns, TaskRow.fromResult(dictresult) is handier.
+    """
+    return TaskRow.fromResult(dictresult).get(columnName)
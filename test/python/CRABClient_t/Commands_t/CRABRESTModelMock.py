@@ -1,6 +1,7 @@
 from WMCore.WebTools.RESTModel import RESTModel
 import WMCore
 
+import re
 import threading
 import cherrypy
 import imp
@@ -14,6 +15,17 @@ SI_RESULT['my_proxy'] = 'myproxy.cern.ch'
 
 FILE_NAME = 'src_output.root'
 goodLumisResult = '{"1":[ [1,15],  [30,50] ], "3":[ [10,15], [30,50] ]}'
+## The task database rows returned by the 'search' and 'bulksearch' subresources of the task resource.
+TASK_COLUMNS = ['tm_taskname', 'tm_task_status', 'tm_task_command', 'tm_username', 'tm_schedd', 'clusterid',
+                'tm_user_webdir', 'tm_user_sandbox', 'tm_save_logs', 'tm_transfer_outputs', 'tm_edm_outfiles',
+                'tm_tfile_outfiles', 'tm_outfiles', 'tm_task_warnings', 'tm_task_failure']
+TASK_ROWS = {'170101_000000:mmascher_crab_MyAnalysis1': ['170101_000000:mmascher_crab_MyAnalysis1', 'SUBMITTED', 'SUBMIT', 'mmascher',
+                                                         'crab3@vocms0199.cern.ch', '1234567', 'https://vocms0199.cern.ch/mon/cms1425/170101_000000:mmascher_crab_MyAnalysis1',
+                                                         'abcdef.tar.gz', 'T', 'T', "['output.root']", '[]', '[]', '[]', 'None'],
+             '170101_000001:mmascher_crab_MyAnalysis2': ['170101_000001:mmascher_crab_MyAnalysis2', 'COMPLETED', 'SUBMIT', 'mmascher',
+                                                         'crab3@vocms0155.cern.ch', '1234568', 'https://vocms0155.cern.ch/mon/cms1425/170101_000001:mmascher_crab_MyAnalysis2',
+                                                         '012345.tar.gz', 'F', 'T', '[]', "['histo.root']", '[]', '[]', 'None'],
+            }
 publishResult   = {u'status': True, u'message': 'Publication completed for campaign ewv_crab_something_1_111229_140959', u'summary': {u'/primary/secondary-out1-v1/USER': {u'files': 10, u'blocks': 1, u'existingFiles': 10}, u'/primary/secondary-out2-v1/USER': {u'files': 10, u'blocks': 1, u'existingFiles': 10}}}
 
 
@@ -37,9 +49,9 @@ class CRABRESTModelMock(RESTModel):
                         args=['requestID'],
                         validation=[self.isalnum])
 
-        self._addMethod('GET', 'task', self.getTaskStatus,
-                        args=['requestID'],
-                        validation=[self.isalnum])
+        self._addMethod('GET', 'task', self.getTask,
+                        args=['requestID', 'subresource', 'workflow', 'column'],
+                        validation=[self.validateTaskQuery])
         #/data
         self._addMethod('GET', 'data', self.getDataLocation,
                        args=['requestID','jobRange'], validation=[self.isalnum])
@@ -87,6 +99,19 @@ class CRABRESTModelMock(RESTModel):
 
 
 
+    def validateTaskQuery(self, call_input):
+        """
+        The workflow and column parameters of the searches can be repeated (lists).
+        """
+        for key, value in call_input.items():
+            for v in (value if isinstance(value, list) else [value]):
+                if key == 'workflow':
+                    assert re.match(r'^[a-zA-Z0-9\-_:.]+$', v), "Invalid workflow name: %s" % v
+                else:
+                    WMCore.Lexicon.identifier(v)
+        return call_input
+
+
     def initThread(self, thread_index):
         """
         The ReqMgr expects the DBI to be contained in the Thread
@@ -105,6 +130,34 @@ class CRABRESTModelMock(RESTModel):
         return SI_RESULT
 
 
+    def getTask(self, requestID = None, subresource = None, workflow = None, column = None):
+        if subresource == 'search':
+            return self.search(workflow)
+        if subresource == 'bulksearch':
+            return self.bulkSearch(workflow, column)
+        return self.getTaskStatus(requestID)
+
+
+    def search(self, workflow):
+        """
+        All the columns of one task.
+        """
+        return {'desc': {'columns': TASK_COLUMNS}, 'result': TASK_ROWS.get(workflow, [])}
+
+
+    def bulkSearch(self, workflow, column = None):
+        """
+        The given columns (all if none is given) of the given tasks, one row per task found.
+        """
+        workflows = workflow if isinstance(workflow, list) else [workflow]
+        columns = TASK_COLUMNS
+        if column:
+            columns = column if isinstance(column, list) else [column]
+        indices = [TASK_COLUMNS.index(c) for c in columns]
+        return {'desc': {'columns': columns},
+                'result': [[TASK_ROWS[w][i] for i in indices] for w in workflows if w in TASK_ROWS]}
+
+
     def getTaskStatus(self, requestID):
         return {u'workflows': [{u'request': u'cinquilli.nocern_crab_TESTME_1_111025_181202',
                   u'requestDetails': {u'RequestMessages': [], u'RequestStatus': u'aborted'},
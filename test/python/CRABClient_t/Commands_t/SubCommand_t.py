@@ -0,0 +1,95 @@
+#! /usr/bin/env python
+
+"""
+_SubCommand_t_
+
+Unittests for the use of the cache of the server information by the commands
+"""
+
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+from httplib import HTTPException
+
+import CRABClient.Commands.SubCommand
+from CRABClient.Commands.SubCommand import SubCommand
+from CRABClient.ServerInfoCache import ServerInfoCache
+
+SERVER = 'cmsweb.cern.ch'
+
+
+class CachedSubCommand(SubCommand):
+    """
+    A SubCommand with only what serverInfo needs, the cache being in cachepath.
+    """
+
+    def __init__(self, cachepath):
+        class Options(object):
+            nocache = False
+        self.options = Options()
+        self.logger = logging.getLogger()
+        self.instance, self.serverurl, self.proxyfilename = 'prod', SERVER, None
+        self.cachepath = cachepath
+        self.cachedServerInfo = {}
+
+    def crabcachepath(self):
+        return self.cachepath
+
+
+class SubCommandServerInfoTest(unittest.TestCase):
+    """
+    unittest for the use of the cache of the server information by the commands
+    """
+    backendurls = {'cacheSSL': 'https://cmsweb.cern.ch/crabcache', 'htcondorSchedds': {}}
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.queries = []
+        def server_info(subresource, serverurl, proxyfilename, baseurl, **kwargs):
+            self.queries.append(subresource)
+            return {'version': ['3.3.16.*'], 'backendurls': self.backendurls}[subresource]
+        self.previousServerInfo = CRABClient.Commands.SubCommand.server_info
+        CRABClient.Commands.SubCommand.server_info = server_info
+
+
+    def tearDown(self):
+        CRABClient.Commands.SubCommand.server_info = self.previousServerInfo
+        shutil.rmtree(self.tmpdir)
+
+
+    def httpException(self, url, status = 400, headers = None):
+        ex = HTTPException("The server answered with an error")
+        ex.url, ex.status, ex.headers = url, status, headers or {}
+        return ex
+
+
+    def testServerInfo(self):
+        cachepath = os.path.join(self.tmpdir, '.crab3')
+        command = CachedSubCommand(cachepath)
+        self.assertEqual(command.serverInfo('backendurls', 'https://cmsweb.cern.ch/crabserver/prod/info'), self.backendurls)
+        ## Nothing was taken from the cache: no error can be caused by it.
+        self.assertFalse(command.serverInfoMayBeStale(self.httpException('https://cmsweb.cern.ch/crabcache/file')))
+        command = CachedSubCommand(cachepath)
+        command.serverInfo('backendurls', 'https://cmsweb.cern.ch/crabserver/prod/info')
+        self.assertEqual(self.queries, ['backendurls'])
+        self.assertTrue(command.serverInfoMayBeStale(self.httpException('https://cmsweb.cern.ch/crabcache/file')))
+        ## A bad task name or a frontend down do not make the cached information stale.
+        self.assertFalse(command.serverInfoMayBeStale(self.httpException('https://cmsweb.cern.ch/crabserver/prod/workflow')))
+        self.assertFalse(command.serverInfoMayBeStale(self.httpException('https://cmsweb.cern.ch/crabserver/prod/workflow', 503)))
+
+
+    def testVersionMismatch(self):
+        cachepath = os.path.join(self.tmpdir, '.crab3')
+        CachedSubCommand(cachepath).serverInfo('version', 'https://cmsweb.cern.ch/crabserver/prod/info')
+        command = CachedSubCommand(cachepath)
+        command.serverInfo('version', 'https://cmsweb.cern.ch/crabserver/prod/info')
+        mismatch = self.httpException('https://cmsweb.cern.ch/crabserver/prod/workflow', headers = {'X-Error-Info': 'Incompatible client version'})
+        self.assertTrue(command.serverInfoMayBeStale(mismatch))
+        command.invalidateServerInfo()
+        self.assertEqual(ServerInfoCache(cachepath + '_serverinfo').get('prod', SERVER, 'version'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+
+"""
+_getlog2_t_
+
+Unittests for the retrieval of the short logs of the getlog2 command
+"""
+
+import Queue
+import shutil
+import logging
+import tempfile
+import unittest
+
+import CRABClient.Commands.getlog2
+from CRABClient.Commands.getlog2 import getlog2
+from CRABClient.TransferEngines import STOP_MESSAGE
+from CRABClient.ClientExceptions import ClientException
+
+
+class getlog2Worker(getlog2):
+    """
+    The getlog2 worker alone, without the rest of the SubCommand initialization.
+    """
+
+    def __init__(self, dest):
+        self.dest = dest
+        self.logger = logging.getLogger()
+
+
+class FakeFetcher(object):
+    """
+    A fetcher giving the retries in found, not found (404) for the next ones, or
+    failing with error (without status) for all of them if given.
+    """
+    calls = []
+    found = 0
+    error = None
+
+    def __init__(self, proxyfilename = None):
+        pass
+
+    def fetchIfModified(self, url, filename):
+        FakeFetcher.calls.append(url.rsplit('/', 1)[1])
+        if len(FakeFetcher.calls) > 100:
+            raise AssertionError("Too many fetches")
+        if FakeFetcher.error:
+            raise ClientException(FakeFetcher.error)
+        if int(url.rsplit('.', 2)[1]) >= FakeFetcher.found:
+            ex = ClientException("Not found")
+            ex.status = 404
+            raise ex
+
+    def close(self):
+        pass
+
+
+class getlog2Test(unittest.TestCase):
+    """
+    unittest for the short log worker of getlog2
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        FakeFetcher.calls, FakeFetcher.found, FakeFetcher.error = [], 0, None
+        self.previousFetcher = CRABClient.Commands.getlog2.PersistentURLFetcher
+        CRABClient.Commands.getlog2.PersistentURLFetcher = FakeFetcher
+
+
+    def tearDown(self):
+        CRABClient.Commands.getlog2.PersistentURLFetcher = self.previousFetcher
+        shutil.rmtree(self.tmpdir)
+
+
+    def shortLogs(self, jobs):
+        inputq = Queue.Queue()
+        for job in jobs:
+            inputq.put(job)
+        inputq.put(STOP_MESSAGE)
+        results = {}
+        getlog2Worker(self.tmpdir).shortLogWorker(inputq, 'https://host/webdir', None, results)
+        return results
+
+
+    def testProbeRetries(self):
+        FakeFetcher.found = 2
+        results = self.shortLogs([('1', None)])
+        self.assertEqual(results, {'1': [('job_out.1.0.txt', None), ('job_out.1.1.txt', None)]})
+        self.assertEqual(FakeFetcher.calls, ['job_out.1.0.txt', 'job_out.1.1.txt', 'job_out.1.2.txt'])
+
+
+    def testKnownRetries(self):
+        FakeFetcher.error = "Connection refused"
+        results = self.shortLogs([('1', 2)])
+        self.assertEqual(results, {'1': [('job_out.1.%d.txt' % retry, "Connection refused") for retry in range(3)]})
+
+
+    def testUnknownRetriesFailure(self):
+        ## Without the number of retries, a failure other than 404 ends the probing.
+        FakeFetcher.error = "Connection refused"
+        results = self.shortLogs([('1', None), ('2', None)])
+        self.assertEqual(results, {'1': [('job_out.1.0.txt', "Connection refused")],
+                                   '2': [('job_out.2.0.txt', "Connection refused")]})
+        self.assertEqual(FakeFetcher.calls, ['job_out.1.0.txt', 'job_out.2.0.txt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+#! /usr/bin/env python
+
+"""
+_remote_copy_t_
+
+Unittests for the copy workers of the remote_copy command
+"""
+
+import os
+import time
+import Queue
+import shutil
+import logging
+import tempfile
+import unittest
+
+from CRABClient.Commands.remote_copy import remote_copy
+from CRABClient.TransferEngines import AdaptiveConcurrency
+from CRABClient.TransferJournal import TransferJournal, DONE, FAILED
+
+
+class remote_copyWorker(remote_copy):
+    """
+    The remote_copy worker alone, without the rest of the SubCommand initialization.
+    """
+
+    def __init__(self, destination):
+        class Options(object):
+            pass
+        self.options = Options()
+        self.options.destination = destination
+        self.logger = logging.getLogger()
+
+
+class FailingBackend(object):
+    """
+    A transfer backend whose copy raises, as when the copy command can not be started.
+    """
+    bulkSize = 2
+
+    def __init__(self):
+        self.batches = []
+
+    def copy(self, transfers, timeout, logger):
+        self.batches.append(transfers)
+        raise OSError(2, "No such file or directory: 'gfal-copy'")
+
+
+class FakeJournal(object):
+
+    def __init__(self):
+        self.records = []
+
+    def record(self, pfn, localFilename, state, size, adler32):
+        self.records.append((pfn, state))
+
+
+class FakeEngine(object):
+    """
+    A transfer engine only recording the files queued.
+    """
+    inProcess = True
+
+    def __init__(self):
+        self.queued = []
+
+    def put(self, item):
+        self.queued.append(item[0]['pfn'])
+
+
+class FakeVerifier(object):
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, key, path, expected, payload = None):
+        self.submitted.append(key)
+
+
+class remote_copyTest(unittest.TestCase):
+    """
+    unittest for the failures of the transfer backend in the remote_copy workers
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        ## Do not wait after the failed copies.
+        self.previousSleep = time.sleep
+        time.sleep = lambda seconds: None
+
+
+    def tearDown(self):
+        time.sleep = self.previousSleep
+        shutil.rmtree(self.tmpdir)
+
+
+    def testBackendException(self):
+        input_ = Queue.Queue()
+        for i in range(3):
+            input_.put(({'pfn': 'srm://site/store/file%d.root' % i, 'size': 100}, 'cmd'))
+        input_.put((None, 'STOP'))
+        controller = AdaptiveConcurrency(2, 4)
+        backend = FailingBackend()
+        journal = FakeJournal()
+        successfiles, failedfiles = {}, {}
+        worker = remote_copyWorker(self.tmpdir)
+        worker.processWorker(input_, successfiles, failedfiles, logging.getLogger(), controller, backend, journal, None)
+        ## The worker survived the failure of the first batch and copied the second one.
+        self.assertEqual([len(batch) for batch in backend.batches], [2, 1])
+        self.assertEqual(controller.inflight, 0)
+        self.assertEqual(successfiles, {})
+        self.assertEqual(sorted(failedfiles), ['file0.root', 'file1.root', 'file2.root'])
+        self.assertTrue('gfal-copy' in failedfiles['file0.root'])
+        self.assertEqual(sorted(journal.records), [('srm://site/store/file%d.root' % i, FAILED) for i in range(3)])
+
+
+    def testResumeVerify(self):
+        files = [{'pfn': 'srm://site/store/file%d.root' % i, 'size': 100, 'checksum': {'adler32': '0a0b0c0d'}} for i in range(5)]
+        journal = TransferJournal(os.path.join(self.tmpdir, '.transfers.journal'))
+        ## file0 copied and verified, file1 copied before the client was stopped, file2 failed.
+        journal.record(files[0]['pfn'], os.path.join(self.tmpdir, 'file0.root'), DONE, 100)
+        journal.record(files[0]['pfn'], os.path.join(self.tmpdir, 'file0.root'), DONE, 100, attempted = False, verified = True)
+        journal.record(files[1]['pfn'], os.path.join(self.tmpdir, 'file1.root'), DONE, 100)
+        journal.record(files[2]['pfn'], os.path.join(self.tmpdir, 'file2.root'), FAILED, 100)
+        ## file3 is already on disk.
+        with open(os.path.join(self.tmpdir, 'file3.root'), 'w') as fd:
+            fd.write('x' * 100)
+        worker = remote_copyWorker(self.tmpdir)
+        engine, verifier = FakeEngine(), FakeVerifier()
+        resumed, _ = worker.queueFiles(engine, files, journal, verifier, True)
+        self.assertEqual(resumed, 2)
+        self.assertEqual(engine.queued, [files[2]['pfn'], files[4]['pfn']])
+        ## The files retrieved before and not verified are verified, not copied again.
+        self.assertEqual(verifier.submitted, ['file1.root', 'file3.root'])
+        self.assertTrue(journal.isDone(files[3]['pfn'], os.path.join(self.tmpdir, 'file3.root'), 100))
+        ## Without verification, they are skipped.
+        engine, verifier = FakeEngine(), FakeVerifier()
+        resumed, _ = worker.queueFiles(engine, files, journal, None, True)
+        self.assertEqual(resumed, 3)
+        self.assertEqual(engine.queued, [files[2]['pfn'], files[4]['pfn']])
+        journal.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+#! /usr/bin/env python
+
+"""
+_status2_t_
+
+Unittests for the options of the status2 command
+"""
+
+import unittest
+from optparse import OptionParser
+
+from CRABClient.Commands.status2 import status2, expandWatchOption, WATCH_INTERVAL
+
+
+class status2Options(status2):
+    """
+    The status2 options alone, without the rest of the SubCommand initialization.
+    """
+
+    def __init__(self):
+        self.parser = OptionParser()
+        self.parser.add_option('-d', '--dir', dest = 'projdir')
+        self.setOptions()
+
+
+class status2OptionsTest(unittest.TestCase):
+    """
+    unittest for the --watch option of status2, which may be given without a value
+    """
+
+    def parse(self, cmdargs):
+        return status2Options().parser.parse_args(expandWatchOption(cmdargs))
+
+
+    def testWatchAlone(self):
+        options, args = self.parse(['--watch', '-d', 'x'])
+        self.assertEqual(options.watch, WATCH_INTERVAL)
+        self.assertEqual(options.projdir, 'x')
+        self.assertEqual(args, [])
+        options, args = self.parse(['-d', 'x', '--watch'])
+        self.assertEqual((options.watch, options.projdir), (WATCH_INTERVAL, 'x'))
+
+
+    def testWatchInterval(self):
+        options, _ = self.parse(['--watch', '30', '-d', 'x'])
+        self.assertEqual(options.watch, 30)
+        options, _ = self.parse(['--watch=120', '-d', 'x'])
+        self.assertEqual(options.watch, 120)
+        options, _ = self.parse(['-d', 'x'])
+        self.assertEqual(options.watch, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+
+"""
+_DelegationLedger_t_
+
+Unittests for DelegationLedger module
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from CRABClient.DelegationLedger import credentialHash, DelegationLedger
+
+MYPROXY = 'myproxy.cern.ch'
+SERVER = 'cmsweb.cern.ch'
+SERVERDN = '/DC=ch/DC=cern/OU=computers/CN=vocms052.cern.ch'
+
+
+class DelegationLedgerTest(unittest.TestCase):
+    """
+    unittest for the ledger of the myproxy delegations
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, '.crab3_delegations')
+        self.cert = os.path.join(self.tmpdir, 'usercert.pem')
+        with open(self.cert, 'w') as fd:
+            fd.write('-----BEGIN CERTIFICATE-----\nMIIx\n-----END CERTIFICATE-----\n')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+    def testCredentialHash(self):
+        proxyhash = credentialHash(self.cert, '', 'NULL')
+        self.assertEqual(proxyhash, credentialHash(self.cert, '', 'NULL'))
+        self.assertNotEqual(proxyhash, credentialHash(self.cert, 'becms', 'NULL'))
+        self.assertEqual(credentialHash(os.path.join(self.tmpdir, 'missing.pem'), '', 'NULL'), None)
+
+
+    def testTimeLeft(self):
+        proxyhash = credentialHash(self.cert, '', 'NULL')
+        ledger = DelegationLedger(self.path)
+        self.assertEqual(ledger.timeLeft(MYPROXY, SERVER, SERVERDN, proxyhash), 0)
+        ledger.record(MYPROXY, SERVER, SERVERDN, proxyhash, 20 * 24 * 3600)
+        ledger.save()
+
+        ledger = DelegationLedger(self.path)
+        self.assertTrue(ledger.timeLeft(MYPROXY, SERVER, SERVERDN, proxyhash) > 19 * 24 * 3600)
+        ## Another credential, server or account is not known
+        self.assertEqual(ledger.timeLeft(MYPROXY, SERVER, SERVERDN, credentialHash(self.cert, 'becms', 'NULL')), 0)
+        self.assertEqual(ledger.timeLeft(MYPROXY, SERVER, SERVERDN + '2', proxyhash), 0)
+        self.assertEqual(ledger.timeLeft(MYPROXY, 'cmsweb-testbed.cern.ch', SERVERDN, proxyhash), 0)
+        self.assertEqual(ledger.timeLeft(MYPROXY, SERVER, SERVERDN, None), 0)
+
+        ## Expired credentials have no time left
+        ledger.record(MYPROXY, SERVER, SERVERDN, proxyhash, -10)
+        self.assertEqual(ledger.timeLeft(MYPROXY, SERVER, SERVERDN, proxyhash), 0)
+
+
+    def testForget(self):
+        proxyhash = credentialHash(self.cert, '', 'NULL')
+        ledger = DelegationLedger(self.path)
+        ledger.record(MYPROXY, SERVER, SERVERDN, proxyhash, 3600)
+        ledger.record(MYPROXY, 'cmsweb-testbed.cern.ch', SERVERDN, proxyhash, 3600)
+        ledger.forget(SERVER)
+        ledger.save()
+        ledger = DelegationLedger(self.path)
+        self.assertEqual(ledger.timeLeft(MYPROXY, SERVER, SERVERDN, proxyhash), 0)
+        self.assertTrue(ledger.timeLeft(MYPROXY, 'cmsweb-testbed.cern.ch', SERVERDN, proxyhash) > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+#! /usr/bin/env python
+
+"""
+_DependencyGraph_t_
+
+Unittests for DependencyGraph module
+"""
+
+import time
+import unittest
+
+from CRABClient.DependencyGraph import DependencyGraph, DONE, FAILED, SKIPPED
+
+
+def sleeping(seconds, value):
+    def step(results):
+        time.sleep(seconds)
+        return value
+    return step
+
+
+class DependencyGraphTest(unittest.TestCase):
+    """
+    unittest for the concurrent steps with dependencies
+    """
+
+    def testConcurrent(self):
+        graph = DependencyGraph(4)
+        graph.add('a', sleeping(0.3, 1))
+        graph.add('b', sleeping(0.3, 2))
+        graph.add('c', lambda results: results['a'] + results['b'], ['a', 'b'])
+        def fanOut(results):
+            for i in range(3):
+                graph.add('d%d' % i, sleeping(0.3, results['c'] * i), ['c'])
+            return 'added'
+        graph.add('fanout', fanOut, ['c'])
+        start = time.time()
+        results = graph.run()
+        elapsed = time.time() - start
+        self.assertEqual(results, {'a': 1, 'b': 2, 'c': 3, 'fanout': 'added', 'd0': 0, 'd1': 3, 'd2': 6})
+        ## Two rounds of 0.3 s steps, not five.
+        self.assertTrue(elapsed < 0.9, elapsed)
+        self.assertTrue(graph.timings['c'][0] >= max(graph.timings['a'][1], graph.timings['b'][1]))
+
+
+    def testFailure(self):
+        graph = DependencyGraph(2)
+        graph.add('fails', lambda results: 1/0)
+        graph.add('independent', sleeping(0.1, 'ok'))
+        graph.add('dependent', lambda results: results['fails'], ['fails'])
+        graph.add('indirect', lambda results: results['dependent'], ['dependent', 'independent'])
+        self.assertRaises(ZeroDivisionError, graph.run)
+        self.assertEqual(graph.results, {'independent': 'ok'})
+        self.assertEqual(graph.states, {'fails': FAILED, 'independent': DONE, 'dependent': SKIPPED, 'indirect': SKIPPED})
+        self.assertRaises(ValueError, graph.add, 'other', lambda results: None, ['unknown'])
+
+
+if __name__ == '__main__':
+    unittest.main()
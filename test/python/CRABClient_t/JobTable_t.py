@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+
+"""
+_JobTable_t_
+
+Unittests for JobTable module
+"""
+
+import unittest
+
+from CRABClient.JobTable import JobTable, jobIdKey, stateSnapshot, stateTransitions, PROBE, JOB, COMPLETING
+
+STATUS = {'0': {'State': 'finished', 'SiteHistory': ['T2_XX_Site'], 'WallDurations': [60]},
+          '10': {'State': 'failed', 'SiteHistory': ['T2_XX_Site', 'T2_YY_Site'], 'WallDurations': [10, 20],
+                 'ResidentSetSize': [1000, 2048], 'Error': [8021, 'FileReadError'], 'Retries': 1},
+          '2': {'State': 'failed', 'Error': [8021, 'FileReadError']},
+          '1': {'State': 'finished', 'SiteHistory': ['T2_YY_Site'], 'WallDurations': [100],
+                'TotalSysCpuTimeHistory': [5], 'TotalUserCpuTimeHistory': [45], 'JobIds': ['123.0']},
+          '1-1': {'State': 'running', 'SiteHistory': ['T2_XX_Site'], 'WallDurations': [5]},
+          'DagStatus': {'DagStatus': 1},
+         }
+
+
+class JobTableTest(unittest.TestCase):
+    """
+    unittest for the columnar table of the jobs
+    """
+
+    def testColumns(self):
+        table = JobTable(STATUS)
+        self.assertEqual(table.jobids, ['0', '1', '1-1', '2', '10'])
+        self.assertEqual(table.kind, [PROBE, JOB, COMPLETING, JOB, JOB])
+        self.assertEqual([table.states[state] for state in table.state], ['finished', 'finished', 'running', 'failed', 'failed'])
+        self.assertEqual([table.sites[site] if site is not None else None for site in table.site],
+                         ['T2_XX_Site', 'T2_YY_Site', 'T2_XX_Site', None, 'T2_YY_Site'])
+        self.assertEqual(table.wall, [60, 100, 5, None, 20])
+        self.assertEqual(table.waste, [0, 0, 0, 0, 10])
+        self.assertEqual(table.rss, [None, None, None, None, 2048])
+        self.assertEqual(table.cpu, [None, 50, None, None, None])
+        self.assertEqual(table.exitcode, [None, None, None, 8021, 8021])
+        self.assertEqual(table.errors[table.error[4]], 'FileReadError')
+        self.assertEqual(table.siteHistory[4], ['T2_XX_Site', 'T2_YY_Site'])
+        self.assertEqual(table.retries, [0, 0, 0, 0, 1])
+        self.assertEqual(table.clusterids[1], ['123.0'])
+
+
+    def testGroupBy(self):
+        table = JobTable(STATUS)
+        failed = table.states.indices['failed']
+        self.assertEqual(table.rows(table.state, failed), [3, 4])
+        self.assertEqual(table.group([table.exitcode], table.rows(table.state, failed)), {(8021,): [3, 4]})
+        counts = table.count([table.kind, table.state])
+        self.assertEqual(counts[(JOB, failed)], 2)
+        self.assertEqual(counts[(JOB, table.states.indices['finished'])], 1)
+        self.assertEqual(sum(counts.values()), len(table))
+
+
+    def testJobIdKey(self):
+        self.assertEqual(sorted(['10', '2', '1-10', '1-2', '1'], key = jobIdKey), ['1', '1-2', '1-10', '2', '10'])
+
+
+    def testTransitions(self):
+        previous = stateSnapshot(JobTable(STATUS))
+        self.assertEqual(previous['10'], 'failed')
+        current = dict(previous)
+        current.update({'1-1': 'finished', '2': 'running', '10': 'running', '3': 'idle'})
+        self.assertEqual(stateTransitions(previous, current),
+                         {('running', 'finished'): ['1-1'], ('failed', 'running'): ['2', '10'], (None, 'idle'): ['3']})
+        self.assertEqual(stateTransitions(current, current), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#! /usr/bin/env python
+
+"""
+_ParallelGzip_t_
+
+Unittests for ParallelGzip module
+"""
+
+import os
+import gzip
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from CRABClient.JobType.ParallelGzip import ParallelGzipFile
+
+
+class ParallelGzipTest(unittest.TestCase):
+    """
+    unittest for the gzip files compressed by several threads
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+    def testRoundTrip(self):
+        data = ''.join('line %d of the file\n' % i for i in range(50000)) + os.urandom(100000)
+        for content in ['', 'x', data]:
+            filename = os.path.join(self.tmpdir, 'file.gz')
+            with ParallelGzipFile(filename, nthreads = 3, blocksize = 10000) as gz:
+                ## Writes of various sizes, across the blocks.
+                for start in range(0, len(content), 7777):
+                    gz.write(content[start:start + 7777])
+                self.assertEqual(gz.tell(), len(content))
+            with gzip.open(filename) as fd:
+                self.assertEqual(fd.read(), content)
+        ## The independent blocks cost little compared to one stream.
+        single = os.path.join(self.tmpdir, 'single.gz')
+        with gzip.open(single, 'wb') as fd:
+            fd.write(data)
+        self.assertTrue(os.path.getsize(filename) < 1.05 * os.path.getsize(single))
+
+
+    def testTarfile(self):
+        source = os.path.join(self.tmpdir, 'source')
+        os.makedirs(source)
+        for i in range(20):
+            with open(os.path.join(source, 'file%d' % i), 'wb') as fd:
+                fd.write(os.urandom(5000) + 'text ' * 5000)
+        filename = os.path.join(self.tmpdir, 'sandbox.tar.gz')
+        tar = tarfile.TarFile(fileobj = ParallelGzipFile(filename, nthreads = 4, blocksize = 8192), mode = 'w')
+        tar._extfileobj = False
+        tar.add(source, 'source')
+        tar.close()
+        tar = tarfile.open(filename, 'r:gz')
+        self.assertEqual(len(tar.getnames()), 21)
+        self.assertEqual(tar.extractfile('source/file7').read(), open(os.path.join(source, 'file7'), 'rb').read())
+        tar.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
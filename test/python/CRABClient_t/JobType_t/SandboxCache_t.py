@@ -0,0 +1,153 @@
+#! /usr/bin/env python
+
+"""
+_SandboxCache_t_
+
+Unittests for SandboxCache module
+"""
+
+import os
+import time
+import shutil
+import logging
+import tarfile
+import tempfile
+import unittest
+
+import CRABClient.Emulator
+from CRABClient.JobType.SandboxCache import SandboxCache, CachedTarFile, defaultCacheDir, cacheMaxSize, CACHE_MIN_SIZE, CACHE_MAX_SIZE, PIECE_TTL
+
+
+class FakeREST(object):
+    """
+    A CRAB cache REST interface which has the files in FakeREST.hashkeys.
+    """
+    hashkeys = []
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get(self, uri, data = None):
+        return {'result': [{'exists': data['hashkey'] in self.hashkeys}]}, 200, 'OK'
+
+
+class SandboxCacheTest(unittest.TestCase):
+    """
+    unittest for the sandbox assembled from cached pieces
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.area = os.path.join(self.tmpdir, 'CMSSW_X')
+        os.makedirs(os.path.join(self.area, 'lib', 'arch'))
+        os.makedirs(os.path.join(self.area, 'src', 'A', 'B', 'data'))
+        with open(os.path.join(self.area, 'lib', 'arch', 'libBig.so'), 'wb') as fd:
+            fd.write(os.urandom(CACHE_MIN_SIZE + 1))
+        with open(os.path.join(self.area, 'lib', 'arch', 'libSmall.so'), 'wb') as fd:
+            fd.write('small library')
+        with open(os.path.join(self.area, 'src', 'A', 'B', 'data', 'input.txt'), 'w') as fd:
+            fd.write('data file')
+        self.cache = SandboxCache(os.path.join(self.tmpdir, 'cache'), logging.getLogger('SandboxCacheTest'))
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        CRABClient.Emulator.clearEmulators()
+
+
+    def makeTarball(self, name):
+        tarball = CachedTarFile(os.path.join(self.tmpdir, name), self.cache, logging.getLogger('SandboxCacheTest'))
+        tarball.add(os.path.join(self.area, 'lib'), 'lib', recursive = True)
+        tarball.add(os.path.join(self.area, 'src', 'A', 'B', 'data'), 'src/A/B/data', recursive = True)
+        tarball.close()
+        return tarball
+
+
+    def testAssemble(self):
+        first = self.makeTarball('first.tgz')
+        self.assertEqual(first.stats, {'cached': 0, 'new': 1, 'direct': 1})
+        second = self.makeTarball('second.tgz')
+        self.assertEqual(second.stats, {'cached': 1, 'new': 0, 'direct': 1})
+        self.assertEqual(first.fingerprint, second.fingerprint)
+        self.assertEqual(open(first.name, 'rb').read(), open(second.name, 'rb').read())
+
+        tar = tarfile.open(second.name, 'r:gz')
+        self.assertEqual(sorted(tar.getnames()), sorted(second.getnames()))
+        self.assertEqual(tar.extractfile('src/A/B/data/input.txt').read(), 'data file')
+        self.assertEqual(tar.extractfile('lib/arch/libSmall.so').read(), 'small library')
+        self.assertEqual(dict((m.name, m.size) for m in tar.getmembers()), dict((m.name, m.size) for m in second.getmembers()))
+        tar.close()
+
+        ## A changed file changes the piece and the fingerprint.
+        with open(os.path.join(self.area, 'lib', 'arch', 'libSmall.so'), 'wb') as fd:
+            fd.write('changed library')
+        third = self.makeTarball('third.tgz')
+        self.assertEqual(third.stats, {'cached': 0, 'new': 1, 'direct': 1})
+        self.assertNotEqual(third.fingerprint, first.fingerprint)
+        tar = tarfile.open(third.name, 'r:gz')
+        self.assertEqual(tar.extractfile('lib/arch/libSmall.so').read(), 'changed library')
+        tar.close()
+
+
+    def testPrune(self):
+        self.makeTarball('first.tgz')
+        with open(os.path.join(self.area, 'lib', 'arch', 'libSmall.so'), 'wb') as fd:
+            fd.write('changed library')
+        self.makeTarball('second.tgz')
+        pieces = sorted(name for name in os.listdir(self.cache.directory) if name.endswith('.tgz'))
+        self.assertEqual(len(pieces), 2)
+        old = time.time() - PIECE_TTL - 1
+        os.utime(os.path.join(self.cache.directory, pieces[0]), (old, old))
+        self.cache.prune()
+        self.assertEqual(sorted(name for name in os.listdir(self.cache.directory) if name.endswith('.tgz')), pieces[1:])
+
+
+    def testMaxSize(self):
+        self.makeTarball('first.tgz')
+        with open(os.path.join(self.area, 'lib', 'arch', 'libSmall.so'), 'wb') as fd:
+            fd.write('changed library')
+        self.makeTarball('second.tgz')
+        pieces = sorted((os.path.getmtime(os.path.join(self.cache.directory, name)), name)
+                        for name in os.listdir(self.cache.directory) if name.endswith('.tgz'))
+        old = time.time() - 10
+        os.utime(os.path.join(self.cache.directory, pieces[0][1]), (old, old))
+        ## Room for one piece only: the least recently used one goes.
+        self.cache.maxsize = os.path.getsize(os.path.join(self.cache.directory, pieces[1][1]))
+        self.cache.prune()
+        self.assertEqual([name for name in os.listdir(self.cache.directory) if name.endswith('.tgz')], [pieces[1][1]])
+
+
+    def testSettings(self):
+        previous = dict((name, os.environ.get(name)) for name in ['CRAB3_SANDBOX_CACHE', 'CRAB3_SANDBOX_CACHE_SIZE', 'CRAB3_CACHE_FILE'])
+        try:
+            for name in previous:
+                os.environ.pop(name, None)
+            os.environ['CRAB3_CACHE_FILE'] = os.path.join(self.tmpdir, '.crab3')
+            self.assertEqual(defaultCacheDir(), os.path.join(self.tmpdir, '.crab3_sandbox'))
+            self.assertEqual(cacheMaxSize(), CACHE_MAX_SIZE)
+            os.environ['CRAB3_SANDBOX_CACHE'] = os.path.join(self.tmpdir, 'scratch')
+            os.environ['CRAB3_SANDBOX_CACHE_SIZE'] = '50'
+            self.assertEqual(defaultCacheDir(), os.path.join(self.tmpdir, 'scratch'))
+            self.assertEqual(SandboxCache(defaultCacheDir(), logging.getLogger('SandboxCacheTest')).maxsize, 50 * 1024 * 1024)
+        finally:
+            for name, value in previous.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+
+    def testUploads(self):
+        url = 'https://cmsweb.cern.ch/crabcache'
+        self.assertEqual(self.cache.uploadedHashkey(url, 'fingerprint'), None)
+        self.cache.recordUpload(url, 'fingerprint', 'hashkey')
+        self.assertEqual(self.cache.uploadedHashkey(url, 'fingerprint'), 'hashkey')
+        self.assertEqual(self.cache.uploadedHashkey('https://other/crabcache', 'fingerprint'), None)
+        CRABClient.Emulator.setEmulator('rest', FakeREST)
+        FakeREST.hashkeys = ['hashkey']
+        self.assertTrue(self.cache.existsInCRABCache(url, 'hashkey', 'proxy'))
+        self.assertFalse(self.cache.existsInCRABCache(url, 'other', 'proxy'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#! /usr/bin/env python
+
+"""
+_SandboxEstimator_t_
+
+Unittests for SandboxEstimator module
+"""
+
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from CRABClient.JobType.TreeWalk import walkTree
+from CRABClient.JobType.SandboxEstimator import SandboxEstimate, fileType, sandboxLimit, knownSandboxLimit, recordSandboxLimit, DEFAULT_SANDBOX_LIMIT
+
+
+class SandboxEstimatorTest(unittest.TestCase):
+    """
+    unittest for the estimate of the sandbox size
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.previousCacheFile = os.environ.get('CRAB3_CACHE_FILE')
+        os.environ['CRAB3_CACHE_FILE'] = os.path.join(self.tmpdir, '.crab3')
+        self.area = os.path.join(self.tmpdir, 'area')
+        os.makedirs(os.path.join(self.area, 'lib'))
+        os.makedirs(os.path.join(self.area, 'data'))
+        for i in range(5):
+            with open(os.path.join(self.area, 'lib', 'libA%d.so' % i), 'wb') as fd:
+                fd.write(os.urandom(300000) + ''.join('_ZN3edm%dsymbol%dEv\0' % (i, j) for j in range(20000)))
+        for i in range(20):
+            with open(os.path.join(self.area, 'data', 'table%d.txt' % i), 'w') as fd:
+                fd.write(''.join('%d %f %f\n' % (j, j * 0.5, i * 0.25) for j in range(5000)))
+
+
+    def tearDown(self):
+        if self.previousCacheFile is None:
+            del os.environ['CRAB3_CACHE_FILE']
+        else:
+            os.environ['CRAB3_CACHE_FILE'] = self.previousCacheFile
+        shutil.rmtree(self.tmpdir)
+
+
+    def testEstimate(self):
+        trees = [walkTree(os.path.join(self.area, 'lib'), 'lib'), walkTree(os.path.join(self.area, 'data'), 'data')]
+        estimate = SandboxEstimate(trees)
+        self.assertEqual(len(estimate.files), 25)
+        self.assertEqual(sorted(estimate.types), ['.so', '.txt'])
+        tarball = os.path.join(self.tmpdir, 'sandbox.tgz')
+        tar = tarfile.open(tarball, 'w:gz')
+        tar.add(os.path.join(self.area, 'lib'), 'lib')
+        tar.add(os.path.join(self.area, 'data'), 'data')
+        tar.close()
+        actual = os.path.getsize(tarball)
+        self.assertTrue(abs(estimate.estimatedSize - actual) < 0.15 * actual, (estimate.estimatedSize, actual))
+        report = estimate.report(limit = 1024 * 1024, top = 3).splitlines()
+        self.assertTrue('the limit is 1.0 MB' in report[0])
+        self.assertTrue(report[5].endswith('.so'), report[5])
+        self.assertEqual(report[-1], '... and 22 more files')
+
+
+    def testFileType(self):
+        self.assertEqual(fileType('lib/libA.so'), '.so')
+        self.assertEqual(fileType('lib/libA.so.1.2'), '.so')
+        self.assertEqual(fileType('data/README'), '(none)')
+        self.assertEqual(fileType('data/Table.TXT'), '.txt')
+
+
+    def testLimit(self):
+        self.assertEqual(sandboxLimit('https://cache1/crabcache'), DEFAULT_SANDBOX_LIMIT)
+        ## The default limit is not one told by a CRAB cache.
+        self.assertEqual(knownSandboxLimit('https://cache1/crabcache'), None)
+        self.assertEqual(knownSandboxLimit(), None)
+        recordSandboxLimit('https://cache1/crabcache', 50)
+        recordSandboxLimit('https://cache2/crabcache', 80)
+        self.assertEqual(sandboxLimit('https://cache1/crabcache'), 50)
+        self.assertEqual(sandboxLimit('https://cache2/crabcache'), 80)
+        self.assertEqual(sandboxLimit('https://cache3/crabcache'), DEFAULT_SANDBOX_LIMIT)
+        self.assertEqual(knownSandboxLimit('https://cache1/crabcache'), 50)
+        self.assertEqual(knownSandboxLimit('https://cache3/crabcache'), None)
+        self.assertEqual(sandboxLimit(), 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,228 @@
+#! /usr/bin/env python
+
+"""
+_SandboxUpload_t_
+
+Unittests for SandboxUpload module
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tarfile
+import tempfile
+import unittest
+import threading
+import BaseHTTPServer
+
+from CRABClient.JobType.TreeWalk import walkTree, addEntries
+from CRABClient.JobType.SandboxUpload import StreamPipe, ResultThread, SandboxChecksum, streamUpload, sandboxChecksum, sortedEntries
+
+try:
+    from WMCore.Services.UserFileCache.UserFileCache import calculateChecksum
+except ImportError:
+    calculateChecksum = None
+
+
+class FileCacheHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    A CRAB cache file resource accepting chunked multipart uploads.
+    """
+
+    def do_PUT(self):
+        body = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                ## The client gave up before the end of the upload.
+                return
+            size = int(line.strip(), 16)
+            if size == 0:
+                self.rfile.readline()
+                break
+            body.append(self.rfile.read(size))
+            self.rfile.readline()
+        body = ''.join(body)
+        boundary = self.headers['Content-Type'].split('boundary=')[1]
+        fields = {}
+        for part in body.split('--' + boundary)[1:-1]:
+            headers, value = part.split('\r\n\r\n', 1)
+            name = headers.split('name="')[1].split('"')[0]
+            fields[name] = value[:-len('\r\n')]
+        self.server.received.append((self.path, self.headers.get('Transfer-Encoding'), fields))
+        if self.server.status != 200:
+            self.send_response(self.server.status)
+            self.send_header('X-Error-Info', 'Too big')
+            self.end_headers()
+            return
+        response = json.dumps({'result': [{'hashkey': fields['hashkey'], 'size': len(fields['inputfile'])}]})
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+class SandboxUploadTest(unittest.TestCase):
+    """
+    unittest for the streamed upload of the sandbox
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.area = os.path.join(self.tmpdir, 'area')
+        os.makedirs(os.path.join(self.area, 'lib', 'sub'))
+        for i in range(4):
+            with open(os.path.join(self.area, 'lib', 'lib%d.so' % i), 'wb') as fd:
+                fd.write(os.urandom(400000))
+        with open(os.path.join(self.area, 'lib', 'sub', 'table.txt'), 'w') as fd:
+            fd.write('1 2 3\n' * 1000)
+        with open(os.path.join(self.area, 'PSet.py'), 'w') as fd:
+            fd.write('process = None\n')
+        self.trees = [walkTree(os.path.join(self.area, 'lib'), 'lib'), walkTree(os.path.join(self.area, 'PSet.py'), 'PSet.py')]
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), FileCacheHandler)
+        self.server.received = []
+        self.server.status = 200
+        self.serverThread = threading.Thread(target = self.server.serve_forever)
+        self.serverThread.daemon = True
+        self.serverThread.start()
+        self.url = 'http://127.0.0.1:%d/crabcache' % self.server.server_port
+
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+
+    def produce(self, pipe):
+        tar = tarfile.open(name = 'sandbox.tar.gz', mode = 'w:gz', fileobj = pipe)
+        for entries in self.trees:
+            addEntries(tar, entries)
+        tar.close()
+        pipe.close()
+
+
+    def testChecksum(self):
+        tarball = os.path.join(self.tmpdir, 'reference.tar.gz')
+        tar = tarfile.open(tarball, 'w:gz')
+        for entries in self.trees:
+            addEntries(tar, entries)
+        tar.close()
+        ## As calculateChecksum of WMCore, from the tarball.
+        hasher = hashlib.sha256()
+        tar = tarfile.open(tarball)
+        for member in sorted(tar.getmembers(), key = lambda m: m.name):
+            if member.name in ['PSet.py']:
+                continue
+            hasher.update(member.name)
+            if member.isreg():
+                hasher.update(tar.extractfile(member).read())
+        tar.close()
+        self.assertEqual(sandboxChecksum(self.trees, ['PSet.py']), hasher.hexdigest())
+        self.assertNotEqual(sandboxChecksum(self.trees), hasher.hexdigest())
+
+
+    def testChecksumOnTheFly(self):
+        ## A name sorted before 'lib/' but after 'lib' in the tarball.
+        with open(os.path.join(self.area, 'lib-extra.txt'), 'w') as fd:
+            fd.write('extra\n')
+        trees = self.trees + [walkTree(os.path.join(self.area, 'lib-extra.txt'), 'lib-extra.txt')]
+        tarball = os.path.join(self.tmpdir, 'sorted.tar.gz')
+        checksum = SandboxChecksum(['PSet.py'])
+        tar = tarfile.open(tarball, 'w:gz')
+        addEntries(tar, sortedEntries(trees), checksum)
+        tar.close()
+        self.assertEqual(checksum.hexdigest(), sandboxChecksum(trees, ['PSet.py']))
+        tar = tarfile.open(tarball)
+        names = tar.getnames()
+        self.assertEqual(names, sorted(names))
+        self.assertEqual(tar.extractfile('lib-extra.txt').read(), 'extra\n')
+        tar.close()
+        ## The members must be given in the order of the hash key.
+        tar = tarfile.open(os.path.join(self.tmpdir, 'unsorted.tar.gz'), 'w:gz')
+        self.assertRaises(ValueError, addEntries, tar, list(reversed(sortedEntries(trees))), SandboxChecksum())
+        tar.close()
+
+
+    def testWMCoreChecksum(self):
+        if calculateChecksum is None:
+            self.skipTest("WMCore is not available")
+        exclude = ['PSet.py']
+        walked = os.path.join(self.tmpdir, 'walked.tar.gz')
+        tar = tarfile.open(walked, 'w:gz')
+        for entries in self.trees:
+            addEntries(tar, entries)
+        tar.close()
+        self.assertEqual(sandboxChecksum(self.trees, exclude), calculateChecksum(walked, exclude))
+        ## As the streamed upload makes it.
+        streamed = os.path.join(self.tmpdir, 'streamed.tar.gz')
+        checksum = SandboxChecksum(exclude)
+        tar = tarfile.open(streamed, 'w:gz')
+        addEntries(tar, sortedEntries(self.trees), checksum)
+        tar.close()
+        self.assertEqual(checksum.hexdigest(), calculateChecksum(streamed, exclude))
+
+
+    def testStreamUpload(self):
+        copyname = os.path.join(self.tmpdir, 'sandbox.tar.gz')
+        pipe = StreamPipe(copyname, chunksize = 64 * 1024, maxchunks = 2)
+        producer = ResultThread(self.produce, pipe)
+        checksum = ResultThread(sandboxChecksum, self.trees)
+        def hashkey():
+            producer.result()
+            return checksum.result()
+        result = streamUpload(self.url, pipe, hashkey, 'sandbox.tar.gz')
+        self.assertEqual(result['hashkey'], sandboxChecksum(self.trees))
+        path, encoding, fields = self.server.received[0]
+        self.assertEqual(path, '/crabcache/file')
+        self.assertEqual(encoding, 'chunked')
+        with open(copyname, 'rb') as fd:
+            self.assertEqual(fields['inputfile'], fd.read())
+        tar = tarfile.open(copyname)
+        self.assertEqual(len(tar.getnames()), 8)
+        self.assertEqual(tar.extractfile('lib/sub/table.txt').read(), '1 2 3\n' * 1000)
+        tar.close()
+
+
+    def testRefused(self):
+        self.server.status = 400
+        pipe = StreamPipe()
+        producer = ResultThread(self.produce, pipe)
+        try:
+            streamUpload(self.url, pipe, lambda: producer.result() or 'abc')
+            self.fail("The upload was not refused")
+        except Exception as ex:
+            self.assertEqual(ex.status, 400)
+            self.assertEqual(ex.headers['X-Error-Info'], 'Too big')
+
+
+    def testProducerFailure(self):
+        pipe = StreamPipe(chunksize = 1024, maxchunks = 1)
+        def produce():
+            try:
+                pipe.write('x' * 4096)
+                raise IOError("Cannot read a file")
+            finally:
+                pipe.close()
+        producer = ResultThread(produce)
+        self.assertRaises(IOError, streamUpload, self.url, pipe, producer.result)
+        self.assertEqual(self.server.received, [])
+
+
+    def testAbort(self):
+        pipe = StreamPipe(chunksize = 10, maxchunks = 1)
+        pipe.write('x' * 100)
+        ## The queue is full: the writer waits for the reader.
+        writer = ResultThread(pipe.write, 'y' * 100)
+        writer.join(0.1)
+        self.assertTrue(writer.isAlive())
+        pipe.abort()
+        self.assertRaises(IOError, writer.result)
+
+
+if __name__ == '__main__':
+    unittest.main()
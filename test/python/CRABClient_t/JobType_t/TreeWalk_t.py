@@ -0,0 +1,83 @@
+#! /usr/bin/env python
+
+"""
+_TreeWalk_t_
+
+Unittests for TreeWalk module
+"""
+
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from CRABClient.ClientExceptions import EnvironmentException
+from CRABClient.JobType.TreeWalk import walkTree, addEntries, findDirectories
+
+
+class TreeWalkTest(unittest.TestCase):
+    """
+    unittest for the single pass traversal of the sandbox directories
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmpdir, 'src')
+        for directory in ['A/B/data/sub', 'A/B/data/sub/data', 'A/B/interface', 'A/C/python', 'shared']:
+            os.makedirs(os.path.join(self.src, directory))
+        for filename in ['A/B/data/table.txt', 'A/B/data/sub/deep.txt', 'A/B/interface/Header.h', 'shared/file.txt']:
+            with open(os.path.join(self.src, filename), 'w') as fd:
+                fd.write(filename * 10)
+        os.chmod(os.path.join(self.src, 'A/B/data/table.txt'), 0o751)
+        ## Two links to the same directory are not a loop.
+        os.symlink(os.path.join(self.src, 'shared'), os.path.join(self.src, 'A/B/data/link1'))
+        os.symlink(os.path.join(self.src, 'shared'), os.path.join(self.src, 'A/B/data/link2'))
+        ## A link called data is not followed when looking for the data directories.
+        os.symlink(os.path.join(self.src, 'shared'), os.path.join(self.src, 'A/C/data'))
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+    def testSameAsTarfile(self):
+        path = os.path.join(self.src, 'A/B/data')
+        entries = walkTree(path, 'src/A/B/data')
+        self.assertEqual(entries[0].arcname, 'src/A/B/data')
+        mine = os.path.join(self.tmpdir, 'mine.tar')
+        tar = tarfile.open(mine, 'w')
+        addEntries(tar, entries)
+        tar.close()
+        reference = os.path.join(self.tmpdir, 'reference.tar')
+        tar = tarfile.open(reference, 'w', dereference = True)
+        tar.add(path, 'src/A/B/data')
+        tar.close()
+        def members(filename):
+            tar = tarfile.open(filename)
+            result = sorted((m.name, m.type, m.size, m.mode, int(m.mtime), m.uname, m.gname) for m in tar.getmembers())
+            tar.close()
+            return result
+        self.assertEqual(members(mine), members(reference))
+        self.assertEqual(len(members(mine)), 9)
+        tar = tarfile.open(mine)
+        self.assertEqual(tar.extractfile('src/A/B/data/link2/file.txt').read(), 'shared/file.txt' * 10)
+        tar.close()
+
+
+    def testLoop(self):
+        os.symlink(os.path.join(self.src, 'A'), os.path.join(self.src, 'A/B/data/sub/back'))
+        self.assertRaises(EnvironmentException, walkTree, os.path.join(self.src, 'A'), 'src/A')
+        os.remove(os.path.join(self.src, 'A/B/data/sub/back'))
+        os.symlink(os.path.join(self.src, 'missing'), os.path.join(self.src, 'A/B/data/sub/broken'))
+        self.assertRaises(EnvironmentException, walkTree, os.path.join(self.src, 'A'), 'src/A')
+        self.assertEqual(len(walkTree(os.path.join(self.src, 'A'), 'src/A', recursive = False)), 1)
+
+
+    def testFindDirectories(self):
+        found = findDirectories(self.src, 'src', ['data', 'interface'])
+        self.assertEqual([arcname for _, arcname in found], ['src/A/B/data', 'src/A/B/interface'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,14 +8,25 @@ Unittests for ScramEnvironment module
 
 import logging
 import os
+import shutil
+import socket
 import subprocess
 import tarfile
+import tempfile
 import unittest
+from httplib import HTTPException
 
+import CRABClient.Emulator
+import CRABClient.JobType.UserTarball
 from CRABClient.JobType.UserTarball import UserTarball
+from CRABClient.JobType.TreeWalk import walkTree
+from CRABClient.JobType.SandboxCache import sandboxFingerprint
+from CRABClient.JobType.SandboxUpload import sandboxChecksum
 from WMCore.Configuration import Configuration
 from CRABClient.ClientExceptions import InputFileNotFoundException
 
+from ServerUtilities import NEW_USER_SANDBOX_EXCLUSIONS
+
 testWMConfig = Configuration()
 
 testWMConfig.section_("JobType")
@@ -189,6 +200,152 @@ class UserTarballTest(unittest.TestCase):
         self.assertTrue(len(result['hashkey']) > 0)
 
 
+class FakeUFC(object):
+    """
+    The UserFileCache emulator, checking the tarball it uploads.
+    """
+    uploads = []
+
+    def __init__(self, config):
+        pass
+
+    def upload(self, name, excludeList = None):
+        tar = tarfile.open(name)
+        FakeUFC.uploads.append(sorted(tar.getnames()))
+        tar.close()
+        return {'hashkey': 'fromfile'}
+
+
+class StreamUploadTest(unittest.TestCase):
+    """
+    unittest for UserTarball.streamUpload, with SandboxUpload.streamUpload and the ufc emulator stubbed
+    """
+    url = 'https://cmsweb.cern.ch/crabcache'
+    members = ['lib', 'lib/libA.so', 'lib/libB.so', 'lib/table.txt']
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.previousEnv = dict((name, os.environ.get(name)) for name in ['SCRAM_ARCH', 'CMSSW_BASE', 'CMSSW_VERSION'])
+        os.environ.update({'SCRAM_ARCH': 'slc6_amd64_gcc493', 'CMSSW_BASE': self.tmpdir, 'CMSSW_VERSION': 'CMSSW_8_0_0'})
+        os.makedirs(os.path.join(self.tmpdir, 'lib'))
+        ## Big enough to fill the pipe, so that the tarball is still being made when the upload fails.
+        for name in ['libA.so', 'libB.so']:
+            with open(os.path.join(self.tmpdir, 'lib', name), 'wb') as fd:
+                fd.write(os.urandom(6 * 1024 * 1024))
+        with open(os.path.join(self.tmpdir, 'lib', 'table.txt'), 'w') as fd:
+            fd.write('1 2 3\n' * 1000)
+        self.trees = [walkTree(os.path.join(self.tmpdir, 'lib'), 'lib')]
+        self.name = os.path.join(self.tmpdir, 'default.tgz')
+        self.streamCalls = 0
+        self.streamed = None
+        FakeUFC.uploads = []
+        CRABClient.Emulator.setEmulator('ufc', FakeUFC)
+        self.previousStreamUpload = CRABClient.JobType.UserTarball.streamUpload
+
+
+    def tearDown(self):
+        CRABClient.JobType.UserTarball.streamUpload = self.previousStreamUpload
+        CRABClient.Emulator.clearEmulators()
+        for name, value in self.previousEnv.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        shutil.rmtree(self.tmpdir)
+
+
+    def config(self, localCopy = True):
+        config = Configuration()
+        config.section_('JobType')
+        config.JobType.sandboxLocalCopy = localCopy
+        return config
+
+
+    def stubStreamUpload(self, failure = None):
+        """
+        Replace streamUpload by one reading the pipe, and raising failure after the first chunk if given.
+        """
+        def streamUpload(filecacheurl, pipe, hashkey, filename = None, proxyfilename = None, logger = None):
+            self.streamCalls += 1
+            data = []
+            for chunk in pipe.chunks():
+                data.append(chunk)
+                if failure:
+                    raise failure
+            self.streamed = ''.join(data)
+            return {'hashkey': hashkey()}
+        CRABClient.JobType.UserTarball.streamUpload = streamUpload
+
+
+    def testStreamed(self):
+        self.stubStreamUpload()
+        with UserTarball(name=self.name, logger=logging.getLogger(), config=self.config(), streamed=True) as tb:
+            tb.addFiles(trees=self.trees)
+            self.assertEqual(tb.upload(self.url), sandboxChecksum(self.trees, NEW_USER_SANDBOX_EXCLUSIONS))
+        with open(self.name, 'rb') as fd:
+            self.assertEqual(fd.read(), self.streamed)
+        tar = tarfile.open(self.name)
+        self.assertEqual(sorted(tar.getnames()), self.members)
+        tar.close()
+        self.assertEqual(FakeUFC.uploads, [])
+
+
+    def testStreamedCached(self):
+        ## The tarball is assembled from the pieces of the cache: the hash key is computed apart.
+        self.stubStreamUpload()
+        cachedir = os.path.join(self.tmpdir, 'cache')
+        with UserTarball(name=self.name, logger=logging.getLogger(), config=self.config(), cachedir=cachedir, streamed=True) as tb:
+            tb.addFiles(trees=self.trees)
+            self.assertEqual(tb.upload(self.url), sandboxChecksum(self.trees, NEW_USER_SANDBOX_EXCLUSIONS))
+        tar = tarfile.open(self.name)
+        self.assertEqual(sorted(tar.getnames()), self.members)
+        tar.close()
+
+
+    def testRefused(self):
+        refusal = HTTPException("The CRAB cache refused the sandbox: 400 Bad Request")
+        refusal.status, refusal.headers = 400, {'X-Error-Info': 'File size is 2B. This is bigger than the maximum allowed size of 1B.'}
+        self.stubStreamUpload(refusal)
+        with UserTarball(name=self.name, logger=logging.getLogger(), config=self.config(), streamed=True) as tb:
+            tb.addFiles(trees=self.trees)
+            self.assertRaises(HTTPException, tb.upload, self.url)
+            self.assertTrue(tb.pipe.aborted)
+        ## The same sandbox would be refused again: the local copy is not uploaded.
+        self.assertEqual(FakeUFC.uploads, [])
+
+
+    def testLocalCopyFallback(self):
+        self.stubStreamUpload(socket.error(104, "Connection reset by peer"))
+        with UserTarball(name=self.name, logger=logging.getLogger(), config=self.config(), streamed=True) as tb:
+            tb.addFiles(trees=self.trees)
+            self.assertEqual(tb.upload(self.url), 'fromfile')
+            self.assertTrue(tb.pipe.detached)
+        ## The local copy was finished after the failure, and uploaded instead.
+        self.assertEqual(FakeUFC.uploads, [self.members])
+
+
+    def testNoLocalCopy(self):
+        self.stubStreamUpload(socket.error(104, "Connection reset by peer"))
+        with UserTarball(name=self.name, logger=logging.getLogger(), config=self.config(localCopy=False), streamed=True) as tb:
+            tb.addFiles(trees=self.trees)
+            self.assertRaises(socket.error, tb.upload, self.url)
+        self.assertEqual(FakeUFC.uploads, [])
+        self.assertFalse(os.path.exists(self.name))
+
+
+    def testCacheHit(self):
+        self.stubStreamUpload()
+        cachedir = os.path.join(self.tmpdir, 'cache')
+        with UserTarball(name=self.name, logger=logging.getLogger(), config=self.config(), cachedir=cachedir, streamed=True) as tb:
+            tb.addFiles(trees=self.trees)
+            tb.cache.recordUpload(self.url, sandboxFingerprint(self.trees), 'known')
+            tb.cache.existsInCRABCache = lambda filecacheurl, hashkey: hashkey == 'known'
+            self.assertEqual(tb.upload(self.url), 'known')
+        self.assertEqual(self.streamCalls, 0)
+        self.assertEqual(FakeUFC.uploads, [])
+        ## No empty local copy is left behind.
+        self.assertFalse(os.path.exists(self.name))
+
+
 if __name__ == '__main__':
     unittest.main()
-
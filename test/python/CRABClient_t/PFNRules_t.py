@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+
+"""
+_PFNRules_t_
+
+Unittests for PFNRules module
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from CRABClient.PFNRules import deriveRule, PFNRuleCache
+
+SRM = 'srm://srm.site.example:8443/srm/managerv2?SFN=/pnfs/site.example/data/cms'
+
+
+class PFNRulesTest(unittest.TestCase):
+    """
+    unittest for the LFN to PFN rule cache
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, '.crab3_pfnrules')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+    def testDeriveRule(self):
+        lfn = '/store/user/jdoe/GenericTTbar/test/160101_000000/0000/output_1.root'
+        self.assertEqual(deriveRule(lfn, SRM + lfn), ('/store/user/', SRM + '/store/user/'))
+        ## The mapping can rename the first directories
+        self.assertEqual(deriveRule('/store/temp/user/jdoe.1234/output_1.root', SRM + '/tmp/user/jdoe.1234/output_1.root'),
+                         ('/store/temp/', SRM + '/tmp/'))
+        self.assertEqual(deriveRule('/store/output_1.root', SRM + '/store/output_1.root'), None)
+
+
+    def testLookup(self):
+        cache = PFNRuleCache(self.path)
+        lfn = '/store/user/jdoe/test/0000/output_1.root'
+        cache.learn('T2_XX_Site', lfn, SRM + lfn)
+        cache.save()
+
+        cache = PFNRuleCache(self.path)
+        other = '/store/user/jdoe/test/0001/output_1001.root'
+        self.assertEqual(cache.lookup('T2_XX_Site', other), SRM + other)
+        self.assertEqual(cache.lookup('T2_XX_Site', '/store/temp/user/jdoe.1234/output_1.root'), None)
+        self.assertEqual(cache.lookup('T2_YY_Site', other), None)
+
+        ## The most specific rule wins
+        cache.learn('T2_XX_Site', '/store/user/jdoe/x.root', 'root://other/store/user/jdoe/x.root')
+        self.assertEqual(cache.lookup('T2_XX_Site', other), 'root://other/store/user/jdoe/test/0001/output_1001.root')
+
+        ## Expired rules are not used
+        cache = PFNRuleCache(self.path, ttl = 0)
+        time.sleep(0.01)
+        self.assertEqual(cache.lookup('T2_XX_Site', other), None)
+
+
+    def testBrokenCache(self):
+        with open(self.path, 'w') as fd:
+            fd.write('{"T2_XX')
+        cache = PFNRuleCache(self.path)
+        self.assertEqual(cache.lookup('T2_XX_Site', '/store/user/jdoe/test/output_1.root'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+#! /usr/bin/env python
+
+"""
+_RESTSessions_t_
+
+Unittests for RESTSessions module
+"""
+
+import os
+import tempfile
+import unittest
+
+import pycurl
+from WMCore.Services.pycurl_manager import RequestHandler
+
+import CRABClient.RESTSessions as RESTSessions
+from CRABClient.RESTSessions import SessionManager, PooledHTTPRequests, getSessionManager
+
+
+class FakeCurl(object):
+    """
+    A curl handle recording its options, having made connects new connections.
+    """
+
+    def __init__(self, connects):
+        self.options = {}
+        self.connects = connects
+
+    def setopt(self, option, value):
+        self.options[option] = value
+
+    def getinfo(self, info):
+        if info == pycurl.NUM_CONNECTS:
+            return self.connects
+        raise pycurl.error("Unknown information %s" % info)
+
+
+class RESTSessionsTest(unittest.TestCase):
+    """
+    unittest for the REST session pool, with the curl handles stubbed
+    """
+
+    def setUp(self):
+        self.previousManager = RESTSessions._sessionManager
+        RESTSessions._sessionManager = SessionManager()
+        self.previousCertDir = os.environ.get('X509_CERT_DIR')
+        os.environ['X509_CERT_DIR'] = tempfile.gettempdir()
+        self.previousRequest = RequestHandler.request
+        self.previousSetOpts = RequestHandler.set_opts
+        ## The number of new connections of each request in turn, and the curl handles used.
+        self.connects = []
+        self.curls = []
+        test = self
+        def request(handler, url, params, *args, **kwargs):
+            curl = FakeCurl(test.connects.pop(0))
+            test.curls.append(curl)
+            handler.set_opts(curl, url, params, {})
+            if url.endswith('/fail'):
+                raise pycurl.error("Connection refused")
+            return None, '{"result": []}'
+        RequestHandler.request = request
+        RequestHandler.set_opts = lambda handler, curl, *args, **kwargs: None
+
+
+    def tearDown(self):
+        RequestHandler.request = self.previousRequest
+        RequestHandler.set_opts = self.previousSetOpts
+        RESTSessions._sessionManager = self.previousManager
+        if self.previousCertDir is None:
+            del os.environ['X509_CERT_DIR']
+        else:
+            os.environ['X509_CERT_DIR'] = self.previousCertDir
+
+
+    def testSessionReuse(self):
+        first = PooledHTTPRequests('cmsweb.cern.ch', '/tmp/proxy1', '/tmp/proxy1')
+        second = PooledHTTPRequests('https://cmsweb.cern.ch/crabserver', '/tmp/proxy1', '/tmp/proxy1')
+        otherCert = PooledHTTPRequests('cmsweb.cern.ch', '/tmp/proxy2', '/tmp/proxy2')
+        otherHost = PooledHTTPRequests('cmsweb-testbed.cern.ch', '/tmp/proxy1', '/tmp/proxy1')
+        self.assertTrue(first.session is second.session)
+        self.assertTrue(first.getUrlOpener() is second.getUrlOpener())
+        self.assertFalse(first.session is otherCert.session)
+        self.assertFalse(first.session is otherHost.session)
+        self.assertEqual(sorted(getSessionManager().stats()),
+                         [('cmsweb-testbed.cern.ch', '/tmp/proxy1'), ('cmsweb.cern.ch', '/tmp/proxy1'), ('cmsweb.cern.ch', '/tmp/proxy2')])
+
+
+    def testShareAttached(self):
+        session = getSessionManager().getSession('cmsweb.cern.ch', '/tmp/proxy1')
+        self.connects = [1, 0]
+        session.handler.request('https://cmsweb.cern.ch/crabserver/prod/task', {})
+        session.handler.request('https://cmsweb.cern.ch/crabserver/prod/task', {})
+        for curl in self.curls:
+            self.assertTrue(curl.options[pycurl.SHARE] is session.share)
+            self.assertEqual(curl.options[pycurl.FORBID_REUSE], 0)
+            self.assertEqual(curl.options[pycurl.FRESH_CONNECT], 0)
+
+
+    def testCount(self):
+        manager = getSessionManager()
+        session1 = manager.getSession('cmsweb.cern.ch', '/tmp/proxy1')
+        session2 = manager.getSession('cmsweb.cern.ch', '/tmp/proxy2')
+        self.connects = [1, 0, 0, 1, 1]
+        for _ in range(3):
+            session1.handler.request('https://cmsweb.cern.ch/crabserver/prod/task', {})
+        session2.handler.request('https://cmsweb.cern.ch/crabserver/prod/task', {})
+        ## A failed request is counted too.
+        self.assertRaises(pycurl.error, session2.handler.request, 'https://cmsweb.cern.ch/fail', {})
+        self.assertEqual(manager.stats(), {('cmsweb.cern.ch', '/tmp/proxy1'): {'requests': 3, 'handshakes': 1},
+                                           ('cmsweb.cern.ch', '/tmp/proxy2'): {'requests': 2, 'handshakes': 2}})
+        self.assertEqual(manager.totals(), (5, 3))
+
+
+    def testCountWithoutCurl(self):
+        ## A request failing before its curl handle is set up counts no connection.
+        def request(handler, url, params, *args, **kwargs):
+            raise ValueError("Bad parameters")
+        RequestHandler.request = request
+        session = getSessionManager().getSession('cmsweb.cern.ch', '/tmp/proxy1')
+        self.assertRaises(ValueError, session.handler.request, 'https://cmsweb.cern.ch/crabserver/prod/task', {})
+        self.assertEqual(getSessionManager().totals(), (1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
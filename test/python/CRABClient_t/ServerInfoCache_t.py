@@ -0,0 +1,77 @@
+#! /usr/bin/env python
+
+"""
+_ServerInfoCache_t_
+
+Unittests for ServerInfoCache module
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from CRABClient.ServerInfoCache import ServerInfoCache
+
+SERVER = 'cmsweb.cern.ch'
+
+
+class ServerInfoCacheTest(unittest.TestCase):
+    """
+    unittest for the cache of the server information
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, '.crab3_serverinfo')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+    def testGetSet(self):
+        cache = ServerInfoCache(self.path)
+        self.assertEqual(cache.get('prod', SERVER, 'version'), None)
+        cache.set('prod', SERVER, 'version', ['3.3.16.*'])
+        cache.set('prod', SERVER, 'backendurls', {'cacheSSL': 'https://cmsweb.cern.ch/crabcache'})
+        ## Only the known subresources are cached
+        cache.set('prod', SERVER, 'scheddaddress', 'crab3@vocms0122.cern.ch')
+        cache.save()
+
+        cache = ServerInfoCache(self.path)
+        self.assertEqual(cache.get('prod', SERVER, 'version'), ['3.3.16.*'])
+        self.assertEqual(cache.get('prod', SERVER, 'backendurls')['cacheSSL'], 'https://cmsweb.cern.ch/crabcache')
+        self.assertEqual(cache.get('prod', SERVER, 'scheddaddress'), None)
+        self.assertEqual(cache.get('preprod', SERVER, 'version'), None)
+        self.assertEqual(cache.get('prod', 'cmsweb-testbed.cern.ch', 'version'), None)
+
+        ## Expired information is not used
+        cache = ServerInfoCache(self.path, ttls = {'version': 0})
+        time.sleep(0.01)
+        self.assertEqual(cache.get('prod', SERVER, 'version'), None)
+
+
+    def testInvalidate(self):
+        cache = ServerInfoCache(self.path)
+        cache.set('prod', SERVER, 'version', ['3.3.16.*'])
+        cache.set('preprod', SERVER, 'version', ['3.3.17.*'])
+        cache.save()
+
+        cache.invalidate('prod', SERVER)
+        self.assertEqual(cache.get('prod', SERVER, 'version'), None)
+        self.assertEqual(cache.get('preprod', SERVER, 'version'), ['3.3.17.*'])
+        cache.invalidate()
+        cache.save()
+        self.assertEqual(ServerInfoCache(self.path).get('preprod', SERVER, 'version'), None)
+
+
+    def testBrokenCache(self):
+        with open(self.path, 'w') as fd:
+            fd.write('{"prod')
+        self.assertEqual(ServerInfoCache(self.path).get('prod', SERVER, 'version'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#! /usr/bin/env python
+
+"""
+_StatusCache_t_
+
+Unittests for StatusCache module
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from CRABClient.ClientExceptions import ClientException
+from CRABClient.StatusCache import readStatusCache, writeStatusCache, parseHeader, LocalStatusCache, LEGACY, JSON, COLUMNAR
+
+STATUS = {'1': {'State': 'finished', 'SiteHistory': ['T2_XX_Site'], 'WallDurations': [120], 'Retries': 0},
+          '2': {'State': 'failed', 'SiteHistory': ['T2_XX_Site', 'T2_YY_Site'], 'WallDurations': [10, 20],
+                'Error': [8021, 'FileReadError'], 'Retries': 1},
+          '3': {'State': 'idle'},
+          '1-1': {'State': 'running', 'SiteHistory': ['T2_YY_Site'], 'WallDurations': [5]},
+          'DagStatus': {'DagStatus': 1, 'NodesTotal': 4},
+         }
+
+
+class StatusCacheTest(unittest.TestCase):
+    """
+    unittest for the status_cache readers
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'status_cache')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+    def testRoundTrip(self):
+        for fmt in [LEGACY, JSON, COLUMNAR]:
+            writeStatusCache(self.path, STATUS, fmt, checkpoint = '12345')
+            self.assertEqual(readStatusCache(self.path), STATUS, fmt)
+
+
+    def testFields(self):
+        for fmt in [LEGACY, JSON, COLUMNAR]:
+            writeStatusCache(self.path, STATUS, fmt)
+            result = readStatusCache(self.path, ['State', 'Error'])
+            self.assertEqual(result['1'], {'State': 'finished'}, fmt)
+            self.assertEqual(result['2'], {'State': 'failed', 'Error': [8021, 'FileReadError']}, fmt)
+            self.assertEqual(result['3'], {'State': 'idle'}, fmt)
+            ## The records that are not jobs are always complete
+            self.assertEqual(result['DagStatus'], STATUS['DagStatus'], fmt)
+
+
+    def testHeader(self):
+        self.assertEqual(parseHeader('12345\n'), (LEGACY, 0, '12345'))
+        self.assertEqual(parseHeader('#CRAB_STATUS_CACHE json 1 12345\n'), (JSON, 1, '12345'))
+        self.assertEqual(parseHeader('#CRAB_STATUS_CACHE columnar 1\n'), (COLUMNAR, 1, ''))
+        self.assertRaises(ClientException, parseHeader, '#CRAB_STATUS_CACHE json 99 12345\n')
+        self.assertRaises(ClientException, parseHeader, '#CRAB_STATUS_CACHE msgpack 1\n')
+        self.assertRaises(ClientException, parseHeader, '#CRAB_STATUS_CACHE\n')
+
+
+    def testLocalStatusCache(self):
+        """
+        The file is parsed again only when the fetch says it changed, or when
+        the previous parse did not keep the requested fields.
+        """
+        url = 'https://vocms0199.cern.ch/mon/cms1425/170101_000000:jdoe_crab_test/status_cache'
+        writeStatusCache(self.path, STATUS, JSON)
+        fetches = []
+        def fetch(url, filename, etag, lastmodified):
+            fetches.append((etag, lastmodified))
+            if etag == '"v1"':
+                return False, etag, lastmodified
+            shutil.copy(self.path, filename)
+            return True, '"v1"', 'Mon, 01 Jan 2017 00:00:00 GMT'
+
+        cache = LocalStatusCache(self.tmpdir)
+        self.assertEqual(cache.get(url, fetch, ['State']), readStatusCache(self.path, ['State']))
+        self.assertEqual(fetches[-1], (None, None))
+        ## Not changed: the parsed status is taken from the pickle
+        os.remove(self.path)
+        self.assertEqual(LocalStatusCache(self.tmpdir).get(url, fetch, ['State'])['2'], {'State': 'failed'})
+        self.assertEqual(fetches[-1], ('"v1"', 'Mon, 01 Jan 2017 00:00:00 GMT'))
+        ## More fields are needed: the local file is parsed again
+        self.assertEqual(LocalStatusCache(self.tmpdir).get(url, fetch), STATUS)
+        self.assertEqual(LocalStatusCache(self.tmpdir).get(url, fetch, ['State', 'Error'])['2'],
+                         {'State': 'failed', 'Error': [8021, 'FileReadError']})
+        ## Another URL is not conditional
+        writeStatusCache(self.path, STATUS, COLUMNAR)
+        LocalStatusCache(self.tmpdir).get(url + '2', fetch)
+        self.assertEqual(fetches[-1], (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
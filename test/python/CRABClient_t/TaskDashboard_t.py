@@ -0,0 +1,72 @@
+#! /usr/bin/env python
+
+"""
+_TaskDashboard_t_
+
+Unittests for TaskDashboard module
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from CRABClient.TaskDashboard import findProjectDirs, newRow, aggregate, formatDashboard, dashboardStates
+
+
+def row(projdir, schedd, latency, **counts):
+    result = newRow(projdir)
+    result.update({'taskStatus': 'SUBMITTED', 'schedd': schedd, 'restLatency': 0.1, 'scheddLatency': latency, 'jobsPerStatus': counts})
+    return result
+
+
+class TaskDashboardTest(unittest.TestCase):
+    """
+    unittest for the aggregation of the status of many tasks
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+    def testFindProjectDirs(self):
+        for name in ['crab_a', 'crab_b', 'crab_c', 'other']:
+            os.makedirs(os.path.join(self.tmpdir, name))
+            if name != 'crab_c':
+                open(os.path.join(self.tmpdir, name, '.requestcache'), 'w').close()
+        expected = [os.path.join(self.tmpdir, name) for name in ['crab_a', 'crab_b']]
+        self.assertEqual(findProjectDirs([os.path.join(self.tmpdir, 'crab_*')]), expected)
+        ## Paths given explicitly (or already expanded by the shell) are merged with the pattern.
+        self.assertEqual(findProjectDirs([os.path.join(self.tmpdir, 'crab_b'), os.path.join(self.tmpdir, 'crab_*')]), expected)
+        self.assertEqual(findProjectDirs([os.path.join(self.tmpdir, 'nothing_*')]), [])
+
+
+    def testAggregate(self):
+        rows = [row('crab_a', 'schedd1', 2.0, running = 3, finished = 7),
+                row('crab_b', 'schedd1', 1.0, finished = 5, held = 1),
+                row('crab_c', 'schedd2', 0.5, idle = 4)]
+        failed = newRow('crab_d')
+        failed['error'] = 'HTTP Error 500'
+        rows.append(failed)
+        totals = aggregate(rows)
+        self.assertEqual(totals['tasks'], 4)
+        self.assertEqual(totals['failedQueries'], 1)
+        self.assertEqual(totals['jobs'], 20)
+        self.assertEqual(totals['jobsPerStatus'], {'running': 3, 'finished': 12, 'held': 1, 'idle': 4})
+        self.assertEqual(totals['taskStatus'], {'SUBMITTED': 3, 'UNKNOWN': 1})
+        self.assertEqual(totals['schedds'], {'schedd1': {'tasks': 2, 'maxLatency': 2.0, 'aveLatency': 1.5},
+                                             'schedd2': {'tasks': 1, 'maxLatency': 0.5, 'aveLatency': 0.5}})
+        self.assertEqual(dashboardStates(rows), ['idle', 'running', 'held', 'finished'])
+        lines = formatDashboard(rows, totals)
+        self.assertEqual(len(lines), 1 + len(rows) + 1 + 5 + 3)
+        self.assertTrue(lines[5].startswith('Total (4 tasks)'))
+        self.assertTrue(lines[9].startswith('schedd1'))
+        self.assertEqual(lines[-1], '  crab_d: HTTP Error 500')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+#! /usr/bin/env python
+
+"""
+_TaskRow_t_
+
+Unittests for TaskRow module
+"""
+
+import unittest
+
+from CRABClient.TaskRow import TaskRow, columnIndex
+
+SEARCH = {'desc': {'columns': ['tm_taskname', 'tm_task_status', 'tm_publication', 'tm_task_warnings', 'tm_task_failure', 'clusterid']},
+          'result': ['170101_000000:jdoe_crab_test', 'SUBMITTED', 'T', "['Some warning']", 'None', '1234567']}
+
+
+class TaskRowTest(unittest.TestCase):
+    """
+    unittest for the rows of the task database
+    """
+
+    def testAccessors(self):
+        row = TaskRow.fromResult(SEARCH)
+        self.assertEqual(row['tm_task_status'], 'SUBMITTED')
+        self.assertEqual(row['tm_task_failure'], 'None')
+        self.assertEqual(row.get('tm_task_failure'), None)
+        self.assertEqual(row.get('tm_task_failure', ''), '')
+        self.assertEqual(row.get('tm_no_such_column', 'default'), 'default')
+        self.assertRaises(KeyError, row.__getitem__, 'tm_no_such_column')
+        self.assertTrue('clusterid' in row)
+        self.assertEqual(row.getInt('clusterid'), 1234567)
+        self.assertEqual(row.getBool('tm_publication'), True)
+        self.assertEqual(row.getLiteral('tm_task_warnings'), ['Some warning'])
+        self.assertTrue(row.getLiteral('tm_task_warnings') is row.getLiteral('tm_task_warnings'))
+        self.assertEqual(row.getLiteral('tm_task_failure', []), [])
+        self.assertEqual(row.toResult(), SEARCH)
+        self.assertEqual(row.project(['clusterid', 'tm_task_status', 'tm_no_such_column']).toResult(),
+                         {'desc': {'columns': ['clusterid', 'tm_task_status']}, 'result': ['1234567', 'SUBMITTED']})
+
+
+    def testSharedIndex(self):
+        bulk = {'desc': {'columns': ['tm_taskname', 'tm_task_status']}, 'result': [['a', 'NEW'], ['b', 'SUBMITTED']]}
+        rows = TaskRow.fromResults(bulk)
+        self.assertEqual([(row['tm_taskname'], row['tm_task_status']) for row in rows], [('a', 'NEW'), ('b', 'SUBMITTED')])
+        self.assertTrue(rows[0].index is rows[1].index)
+        self.assertTrue(columnIndex(bulk['desc']['columns']) is rows[0].index)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#! /usr/bin/env python
+
+"""
+_TaskSearch_t_
+
+Unittests for TaskSearch module
+"""
+
+import urlparse
+import unittest
+from httplib import HTTPException
+
+from CRABClient.TaskSearch import TaskSearch, BULK_SEARCH_BATCH
+
+COLUMNS = ['tm_taskname', 'tm_task_status', 'tm_schedd', 'tm_user_webdir']
+ROWS = dict(('task%d' % i, ['task%d' % i, 'SUBMITTED', 'schedd%d' % (i % 3), 'https://schedd/task%d' % i]) for i in range(250))
+
+
+class FakeServer(object):
+    """
+    The task resource of a server, with or without the bulk search.
+    """
+
+    def __init__(self, bulk, requests, status = 400):
+        self.bulk = bulk
+        self.requests = requests
+        ## The code with which the bulk search is rejected, without it.
+        self.status = status
+
+
+    def get(self, uri, data):
+        self.requests.append(data)
+        if isinstance(data, dict):
+            if data['workflow'] == 'broken':
+                raise HTTPException("HTTP 500 Internal Server Error")
+            return {'desc': {'columns': COLUMNS}, 'result': ROWS.get(data['workflow'], [])}, 200, ''
+        query = urlparse.parse_qs(data)
+        if not self.bulk:
+            exc = HTTPException("Invalid subresource")
+            exc.status = self.status
+            exc.headers = {'X-Error-Detail': 'Invalid input parameter', 'X-Error-Info': "Incorrect 'subresource' parameter"}
+            raise exc
+        if 'malformed' in query['workflow']:
+            exc = HTTPException("Invalid workflow")
+            exc.status = 400
+            exc.headers = {'X-Error-Detail': 'Invalid input parameter', 'X-Error-Info': "Incorrect 'workflow' parameter"}
+            raise exc
+        columns = query.get('column', COLUMNS)
+        indices = [COLUMNS.index(column) for column in columns]
+        return {'desc': {'columns': columns},
+                'result': [[ROWS[w][i] for i in indices] for w in query['workflow'] if w in ROWS]}, 200, ''
+
+
+class TaskSearchTest(unittest.TestCase):
+    """
+    unittest for the lookup of many tasks
+    """
+
+    def testBulk(self):
+        requests = []
+        search = TaskSearch(lambda: FakeServer(True, requests), '/crabserver/prod/task')
+        results = search.search(sorted(ROWS) + ['unknown'], ['tm_task_status', 'tm_schedd'])
+        self.assertTrue(search.bulk)
+        self.assertEqual(len(requests), (len(ROWS) + 1 + BULK_SEARCH_BATCH - 1) / BULK_SEARCH_BATCH)
+        self.assertEqual(search.requests, len(requests))
+        self.assertEqual(results['task4'].columns, ['tm_taskname', 'tm_task_status', 'tm_schedd'])
+        self.assertEqual((results['task4']['tm_task_status'], results['task4']['tm_schedd']), ('SUBMITTED', 'schedd1'))
+        self.assertEqual(len(results), len(ROWS))
+        self.assertEqual(search.errors.keys(), ['unknown'])
+
+
+    def testFallback(self):
+        requests = []
+        search = TaskSearch(lambda: FakeServer(False, requests), '/crabserver/prod/task', nparallel = 4)
+        results = search.search(['task1', 'task2', 'unknown', 'broken'], ['tm_schedd'])
+        self.assertFalse(search.bulk)
+        ## The bulk request, then one search per task.
+        self.assertEqual(len(requests), 5)
+        self.assertEqual(dict((name, row.toResult()) for name, row in results.iteritems()),
+                         {'task1': {'desc': {'columns': ['tm_schedd']}, 'result': ['schedd1']},
+                          'task2': {'desc': {'columns': ['tm_schedd']}, 'result': ['schedd2']}})
+        self.assertEqual(sorted(search.errors), ['broken', 'unknown'])
+        ## Once known, the bulk search is not tried anymore.
+        del requests[:]
+        search.search(['task1'])
+        self.assertEqual(requests, [{'subresource': 'search', 'workflow': 'task1'}])
+        self.assertEqual(search.results['task1'].columns, COLUMNS)
+
+
+    def testFallbackNotFound(self):
+        requests = []
+        search = TaskSearch(lambda: FakeServer(False, requests, 404), '/crabserver/prod/task')
+        results = search.search(['task1'])
+        self.assertFalse(search.bulk)
+        self.assertEqual(sorted(results), ['task1'])
+
+
+    def testBadParameter(self):
+        ## A bad workflow name in the first request is not a missing bulk search.
+        requests = []
+        search = TaskSearch(lambda: FakeServer(True, requests), '/crabserver/prod/task')
+        self.assertRaises(HTTPException, search.search, ['malformed'] + sorted(ROWS))
+        self.assertTrue(search.bulk)
+        self.assertEqual(len(requests), 1)
+        ## In a later request, the rows already retrieved are kept.
+        del requests[:]
+        tasknames = sorted(ROWS)
+        tasknames.insert(BULK_SEARCH_BATCH + 1, 'malformed')
+        results = search.search(tasknames)
+        self.assertTrue(search.bulk)
+        self.assertEqual(len(requests), 3)
+        failed = tasknames[BULK_SEARCH_BATCH:2 * BULK_SEARCH_BATCH]
+        self.assertEqual(sorted(search.errors), sorted(failed))
+        self.assertEqual(search.errors['malformed'], "Invalid workflow")
+        self.assertEqual(sorted(results), sorted(set(ROWS) - set(failed)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#! /usr/bin/env python
+
+"""
+_TransferBackends_t_
+
+Unittests for TransferBackends module
+"""
+
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+
+from CRABClient import TransferBackends
+from CRABClient.TransferBackends import BACKENDS, getTransferBackend
+
+
+class TransferBackendsTest(unittest.TestCase):
+    """
+    unittest for the remote_copy transfer backends
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.logger = logging.getLogger('TransferBackendsTest')
+        self.available = dict((name, backend.__dict__.get('available')) for name, backend in BACKENDS.items())
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        for name, available in self.available.items():
+            if available is None:
+                if 'available' in BACKENDS[name].__dict__:
+                    del BACKENDS[name].available
+            else:
+                BACKENDS[name].available = available
+
+
+    def testFakeBackend(self):
+        """
+        The fake backend copies local files and reports the errors like the copy commands
+        """
+        source = os.path.join(self.tmpdir, 'source.root')
+        with open(source, 'w') as fd:
+            fd.write('x' * 1000)
+        backend = getTransferBackend('FAKE', '/tmp/proxy')
+        self.assertEqual(backend.bulkSize, 5)
+        results = backend.copy([('file://' + source, 'file://' + os.path.join(self.tmpdir, 'dest.root')),
+                                (os.path.join(self.tmpdir, 'missing.root'), os.path.join(self.tmpdir, 'missing_dest.root'))],
+                               60, self.logger)
+        self.assertEqual(results[0], (0, '', ''))
+        self.assertEqual(os.path.getsize(os.path.join(self.tmpdir, 'dest.root')), 1000)
+        self.assertEqual(results[1][0], 1)
+        self.assertTrue('no such file or directory' in results[1][2])
+
+
+    def testCommandBackends(self):
+        """
+        The command backends build the same commands as the previous remote_copy
+        """
+        gfal = BACKENDS['GFAL']('/tmp/proxy', 'ADLER32', 60)
+        self.assertEqual(gfal.command, 'env -i X509_USER_PROXY=/tmp/proxy gfal-copy -v -K ADLER32  -T 1860')
+        lcg = BACKENDS['LCG']('/tmp/proxy')
+        self.assertEqual(lcg.command, 'lcg-cp --connect-timeout 20 --verbose -b -D srmv2 --sendreceive-timeout 1800')
+
+
+    def testAutomaticSelection(self):
+        """
+        Without a requested backend the first available one is used, the fake one is never selected
+        """
+        for name in BACKENDS:
+            BACKENDS[name].available = classmethod(lambda cls: False)
+        self.assertEqual(getTransferBackend(None, '/tmp/proxy'), None)
+        BACKENDS['LCG'].available = classmethod(lambda cls: True)
+        self.assertEqual(getTransferBackend(None, '/tmp/proxy').name, 'LCG')
+        BACKENDS['GFAL'].available = classmethod(lambda cls: True)
+        self.assertEqual(getTransferBackend(None, '/tmp/proxy').name, 'GFAL')
+        self.assertEqual(getTransferBackend('LCG', '/tmp/proxy').name, 'LCG')
+        self.assertEqual(getTransferBackend('GFALPY', '/tmp/proxy'), None)
+
+
+    def testGfal2Fallback(self):
+        """
+        If the gfal2 context can not be created the next backend is used
+        """
+        class BrokenGfal2(object):
+            def creat_context(self):
+                raise RuntimeError("no gfal2 plugins")
+        gfal2 = TransferBackends.gfal2
+        TransferBackends.gfal2 = BrokenGfal2()
+        try:
+            BACKENDS['GFAL'].available = classmethod(lambda cls: True)
+            self.assertEqual(getTransferBackend(None, '/tmp/proxy').name, 'GFAL')
+        finally:
+            TransferBackends.gfal2 = gfal2
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+#! /usr/bin/env python
+
+"""
+_TransferEngines_t_
+
+Unittests for TransferEngines module
+"""
+
+import heapq
+import unittest
+
+from CRABClient.TransferEngines import ENGINES, getTransferEngine, AdaptiveConcurrency
+
+
+def echoWorker(input_, successfiles, failedfiles):
+    while True:
+        myfile, work = input_.get()
+        if work == 'STOP':
+            break
+        if work == 'fail':
+            failedfiles[myfile['pfn']] = 'Failed'
+        else:
+            successfiles[myfile['pfn']] = 'Successfully retrieved'
+
+
+class SimulatedLink(object):
+    """
+    Simulate copies of nfiles of the given size, with a fixed latency per copy,
+    a maximum bandwidth per stream and a total bandwidth shared by all the streams.
+    """
+
+    def __init__(self, latency, streambw, linkbw):
+        self.latency = latency
+        self.streambw = streambw
+        self.linkbw = linkbw
+        self.now = 0.0
+
+
+    def clock(self):
+        return self.now
+
+
+    def run(self, controller, nfiles, size):
+        inflight = []
+        started = 0
+        while started < nfiles or inflight:
+            while started < nfiles and len(inflight) < controller.limit:
+                share = min(self.streambw, self.linkbw / float(len(inflight) + 1))
+                duration = self.latency + size / share
+                heapq.heappush(inflight, (self.now + duration, duration))
+                started += 1
+            end, duration = heapq.heappop(inflight)
+            self.now = end
+            controller.record(size, duration)
+        return self.now
+
+
+class TransferEnginesTest(unittest.TestCase):
+    """
+    unittest for the remote_copy transfer engines
+    """
+
+    def runEngine(self, name):
+        engine = getTransferEngine(name, 4)
+        successfiles = engine.newResultDict()
+        failedfiles = engine.newResultDict()
+        engine.start(echoWorker, (successfiles, failedfiles))
+        for i in range(100):
+            engine.put(({'pfn': 'file_%d' % i}, 'fail' if i % 10 == 0 else 'copy'))
+        self.assertFalse(engine.stop())
+        self.assertEqual(len(successfiles), 90)
+        self.assertEqual(len(failedfiles), 10)
+        self.assertTrue('file_10' in failedfiles)
+
+
+    def testThreadEngine(self):
+        """
+        The default engine runs the workers in threads and uses plain dicts
+        """
+        engine = getTransferEngine(None, 1)
+        self.assertEqual(engine.name, 'thread')
+        self.assertTrue(isinstance(engine.newResultDict(), dict))
+        self.runEngine('thread')
+
+
+    def testProcessEngine(self):
+        """
+        Test the process pool fallback
+        """
+        self.runEngine('process')
+
+
+    def testUnknownEngine(self):
+        self.assertRaises(KeyError, getTransferEngine, 'unknown', 1)
+        self.assertEqual(sorted(ENGINES), ['process', 'thread'])
+
+
+    def runSimulation(self, latency, streambw, linkbw, initial, maximum, nfiles = 2000, size = 100e6):
+        link = SimulatedLink(latency, streambw, linkbw)
+        controller = AdaptiveConcurrency(initial, maximum, clock = link.clock)
+        elapsed = link.run(controller, nfiles, size)
+        return controller, elapsed
+
+
+    def testAdaptiveIncrease(self):
+        """
+        With a link that fits 20 streams the limit grows from 4 towards 20 and stays there
+        """
+        controller, elapsed = self.runSimulation(1, 10e6, 200e6, 4, 50)
+        self.assertTrue(18 <= controller.limit <= 24, controller.limit)
+        ## 4 fixed streams would need 2000*11/4 = 5500 seconds
+        self.assertTrue(elapsed < 1.3 * 2000 * 100e6 / 200e6, elapsed)
+        self.assertTrue(controller.speed() > 8e6)
+
+
+    def testAdaptiveMaximum(self):
+        """
+        The limit never goes above the maximum, even if the link could take more streams
+        """
+        controller, _ = self.runSimulation(0.1, 10e6, 1e9, 4, 30)
+        self.assertEqual(controller.maxlimit, 30)
+        self.assertEqual(controller.limit, 30)
+
+
+    def testAdaptiveFailure(self):
+        """
+        A failed transfer halves the limit, and the speed falls back to the default
+        until a successful transfer is measured
+        """
+        controller = AdaptiveConcurrency(20, 50, clock = lambda: 0)
+        self.assertEqual(controller.speed(), 250*1024)
+        controller.record(0, 10, success = False)
+        self.assertEqual(controller.limit, 10)
+        for _ in range(5):
+            controller.record(0, 10, success = False)
+        self.assertEqual(controller.limit, 1)
+        controller.record(1000, 1)
+        self.assertEqual(controller.speed(), 20*1024)
+
+
+    def testAdaptiveAcquire(self):
+        controller = AdaptiveConcurrency(2, 2)
+        controller.acquire()
+        controller.acquire()
+        self.assertEqual(controller.inflight, 2)
+        controller.release(100, 1)
+        self.assertEqual(controller.inflight, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#! /usr/bin/env python
+
+"""
+_TransferJournal_t_
+
+Unittests for TransferJournal module
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from CRABClient import TransferJournal
+from CRABClient.TransferJournal import TransferJournal as Journal, DONE, FAILED, catalogAdler32
+
+
+class TransferJournalTest(unittest.TestCase):
+    """
+    unittest for the remote_copy transfer journal
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, TransferJournal.JOURNAL_NAME)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+    def testRecordAndResume(self):
+        """
+        The last record of each file is used when the journal is read again
+        """
+        journal = Journal(self.path)
+        journal.record('srm://site/a.root', '/res/a.root', FAILED, 100, '0a0b0c0d')
+        journal.record('srm://site/a.root', '/res/a.root', DONE, 100)
+        journal.record('srm://site/b.root', '/res/b.root', FAILED, 200)
+        journal.record('srm://site/c.root', '/res/c.root', DONE, 300, attempted = False)
+        journal.close()
+        ## A line truncated by a crash is ignored
+        with open(self.path, 'a') as fd:
+            fd.write('{"pfn": "srm://site/b.root", "sta')
+
+        journal = Journal(self.path)
+        self.assertTrue(journal.isDone('srm://site/a.root', '/res/a.root', 100))
+        self.assertFalse(journal.isDone('srm://site/a.root', '/res/a.root', 101))
+        self.assertFalse(journal.isDone('srm://site/a.root', '/other/a.root', 100))
+        self.assertFalse(journal.isDone('srm://site/b.root', '/res/b.root'))
+        self.assertFalse(journal.isDone('srm://site/d.root', '/res/d.root'))
+        self.assertTrue(journal.isDone('srm://site/c.root', '/res/c.root'))
+        self.assertEqual(journal.get('srm://site/a.root')['attempts'], 2)
+        self.assertEqual(journal.get('srm://site/a.root')['adler32'], '0a0b0c0d')
+        self.assertEqual(journal.get('srm://site/c.root')['attempts'], 0)
+        ## A new copy resets the verification
+        self.assertFalse(journal.isDone('srm://site/c.root', '/res/c.root', verified = True))
+        journal.record('srm://site/c.root', '/res/c.root', DONE, attempted = False, verified = True)
+        self.assertTrue(journal.get('srm://site/c.root')['verified'])
+        self.assertTrue(journal.isDone('srm://site/c.root', '/res/c.root', verified = True))
+        journal.record('srm://site/c.root', '/res/c.root', DONE, 300)
+        self.assertFalse(journal.get('srm://site/c.root')['verified'])
+        journal.close()
+
+
+    def testCompact(self):
+        """
+        The journal is rewritten when most of its lines are superseded
+        """
+        journal = Journal(self.path)
+        for _ in range(TransferJournal.COMPACT_MIN):
+            journal.record('srm://site/a.root', '/res/a.root', FAILED, 100)
+        journal.record('srm://site/a.root', '/res/a.root', DONE, 100)
+        journal.close()
+        journal = Journal(self.path)
+        with open(self.path) as fd:
+            self.assertEqual(len(fd.readlines()), 1)
+        self.assertTrue(journal.isDone('srm://site/a.root', '/res/a.root', 100))
+        self.assertEqual(journal.get('srm://site/a.root')['attempts'], TransferJournal.COMPACT_MIN + 1)
+
+
+    def testCatalogAdler32(self):
+        self.assertEqual(catalogAdler32({'checksum': {'adler32': '0a0b0c0d', 'cksum': '1'}}), '0a0b0c0d')
+        self.assertEqual(catalogAdler32({'pfn': 'srm://site/a.root'}), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+
+"""
+_TransferVerification_t_
+
+Unittests for TransferVerification module
+"""
+
+import os
+import zlib
+import shutil
+import tempfile
+import unittest
+
+from CRABClient.TransferVerification import adler32, sameAdler32, VerificationPool
+
+
+class TransferVerificationTest(unittest.TestCase):
+    """
+    unittest for the local checksum verification of the retrieved files
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.data = os.urandom(3 * 1024 * 1024 + 17)
+        self.path = os.path.join(self.tmpdir, 'output_1.root')
+        with open(self.path, 'wb') as fd:
+            fd.write(self.data)
+        self.expected = '%08x' % (zlib.adler32(self.data) & 0xffffffff)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+    def testAdler32(self):
+        """
+        The checksum does not depend on the size of the reads
+        """
+        self.assertEqual(adler32(self.path), self.expected)
+        self.assertEqual(adler32(self.path, bufsize = 1000), self.expected)
+        self.assertTrue(sameAdler32('0000abcd', 'abcd'))
+        self.assertFalse(sameAdler32('0000abcd', 'abce'))
+        self.assertFalse(sameAdler32(None, 'abcd'))
+
+
+    def testVerificationPool(self):
+        pool = VerificationPool(2)
+        try:
+            pool.submit('good', self.path, self.expected, {'pfn': 'srm://site/output_1.root'})
+            pool.submit('bad', self.path, '00000001')
+            pool.submit('missing', os.path.join(self.tmpdir, 'missing.root'), self.expected)
+            results = pool.wait()
+        finally:
+            pool.close()
+        self.assertTrue(results['good']['ok'])
+        self.assertEqual(results['good']['payload'], {'pfn': 'srm://site/output_1.root'})
+        self.assertFalse(results['bad']['ok'])
+        self.assertEqual(results['bad']['adler32'], self.expected)
+        self.assertFalse(results['missing']['ok'])
+        self.assertTrue(results['missing']['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
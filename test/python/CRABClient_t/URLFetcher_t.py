@@ -0,0 +1,153 @@
+#! /usr/bin/env python
+
+"""
+_URLFetcher_t_
+
+Unittests for URLFetcher module
+"""
+
+import os
+import gzip
+import shutil
+import hashlib
+import tempfile
+import unittest
+import threading
+import BaseHTTPServer
+import SocketServer
+from StringIO import StringIO
+
+from CRABClient.URLFetcher import PersistentURLFetcher, sharedFetcher
+from CRABClient.ClientExceptions import ClientException
+
+CONTENT = ''.join('line %d of the file\n' % i for i in range(20000))
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serve CONTENT at /file (gzipped if asked), the first half of it at /truncated, 404 otherwise.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+
+    def do_GET(self):
+        etag = '"%s"' % hashlib.md5(CONTENT).hexdigest()
+        if self.path == '/file' and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path not in ['/file', '/truncated']:
+            self.send_response(404)
+            self.send_header('Content-Length', '9')
+            self.end_headers()
+            self.wfile.write('Not found')
+            return
+        data = CONTENT
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            buf = StringIO()
+            with gzip.GzipFile(fileobj = buf, mode = 'wb') as gz:
+                gz.write(CONTENT)
+            data = buf.getvalue()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if self.path == '/truncated':
+            self.wfile.write(data[:len(data)//2])
+            self.close_connection = 1
+        else:
+            self.wfile.write(data)
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    connections = 0
+
+
+class URLFetcherTest(unittest.TestCase):
+    """
+    unittest for the downloads over kept connections
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.server = Server(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target = self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+
+    def testFetch(self):
+        fetcher = PersistentURLFetcher(chunksize = 4096)
+        filename = os.path.join(self.tmpdir, 'file')
+        for _ in range(3):
+            self.assertEqual(fetcher.fetch(self.url + '/file', filename), filename)
+            self.assertEqual(open(filename).read(), CONTENT)
+        changed, etag, _ = fetcher.fetchIfModified(self.url + '/file', filename)
+        self.assertTrue(changed)
+        self.assertEqual(fetcher.fetchIfModified(self.url + '/file', filename, etag), (False, etag, None))
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(fetcher.metrics['requests'], 5)
+        self.assertEqual(fetcher.metrics['bytes'], 4 * len(CONTENT))
+        self.assertEqual(fetcher.lastTransfer['status'], 304)
+        with self.assertRaises(ClientException) as cm:
+            fetcher.fetch(self.url + '/missing', filename)
+        self.assertEqual(cm.exception.status, 404)
+        self.assertEqual(os.listdir(self.tmpdir), ['file'])
+        fetcher.close()
+
+
+    def testGzip(self):
+        fetcher = PersistentURLFetcher(gzip = True)
+        filename = fetcher.fetch(self.url + '/file', os.path.join(self.tmpdir, 'file'))
+        self.assertEqual(open(filename).read(), CONTENT)
+        self.assertEqual(fetcher.lastTransfer['bytes'], len(CONTENT))
+        self.assertTrue(fetcher.lastTransfer['wireBytes'] < len(CONTENT) / 2)
+        fetcher.close()
+
+
+    def testTruncated(self):
+        ## The previous version of the file stays if the new one is not completely retrieved.
+        filename = os.path.join(self.tmpdir, 'file')
+        with open(filename, 'w') as fd:
+            fd.write('previous')
+        fetcher = PersistentURLFetcher()
+        self.assertRaises(ClientException, fetcher.fetch, self.url + '/truncated', filename)
+        self.assertEqual(open(filename).read(), 'previous')
+        self.assertEqual(os.listdir(self.tmpdir), ['file'])
+        ## The connection is opened again for the next request.
+        fetcher.fetch(self.url + '/file', filename)
+        self.assertEqual(open(filename).read(), CONTENT)
+        fetcher.close()
+
+
+    def testSharedFetcher(self):
+        fetchers = []
+        thread = threading.Thread(target = lambda: fetchers.append(sharedFetcher('proxy')))
+        thread.start()
+        thread.join()
+        self.assertTrue(sharedFetcher('proxy') is sharedFetcher('proxy'))
+        self.assertFalse(sharedFetcher('proxy') is fetchers[0])
+        self.assertFalse(sharedFetcher('proxy') is sharedFetcher(None))
+
+
+if __name__ == '__main__':
+    unittest.main()